@@ -1,5 +1,7 @@
 from __future__ import annotations
-from datetime import datetime, date, timedelta
+from datetime import datetime, date
+
+from business_calendar import is_working_day
 
 A3P_TOTAL_HOURS = 328
 A3P_FORBIDDEN_TERMS = ("APS", "e-learning", "distanciel", "175h")
@@ -38,31 +40,6 @@ def _day_label(iso: str) -> str:
     weekday = ["Lundi","Mardi","Mercredi","Jeudi","Vendredi","Samedi","Dimanche"][d.weekday()]
     return f"{weekday} {d.strftime('%d/%m/%Y')}"
 
-def _easter_date(year: int) -> date:
-    a = year % 19
-    b = year // 100
-    c = year % 100
-    d = b // 4
-    e = b % 4
-    f = (b + 8) // 25
-    g = (b - f + 1) // 3
-    h = (19 * a + b - d - g + 15) % 30
-    i = c // 4
-    k = c % 4
-    l = (32 + 2 * e + 2 * i - h - k) % 7
-    m = (a + 11 * h + 22 * l) // 451
-    month = (h + l - 7 * m + 114) // 31
-    day = ((h + l - 7 * m + 114) % 31) + 1
-    return date(year, month, day)
-
-def _french_public_holidays(year: int) -> set[date]:
-    easter = _easter_date(year)
-    return {
-        date(year, 1, 1), date(year, 5, 1), date(year, 5, 8), date(year, 7, 14),
-        date(year, 8, 15), date(year, 11, 1), date(year, 11, 11), date(year, 12, 25),
-        easter + timedelta(days=1), easter + timedelta(days=39), easter + timedelta(days=50),
-    }
-
 def _day_training_slots(day):
     start = day.get("dayStart") or day.get("morningStart")
     end = day.get("dayEnd") or day.get("afternoonEnd") or day.get("morningEnd")
@@ -100,7 +77,7 @@ def a3p_summary_from_planning(planning):
 
 def is_a3p_non_working_day(day: date) -> bool:
     """Return True when A3P must not schedule training on this French calendar day."""
-    return day.weekday() >= 5 or day in _french_public_holidays(day.year)
+    return not is_working_day(day)
 
 def is_a3p_training_day(day: date) -> bool:
     return not is_a3p_non_working_day(day)
@@ -1,4 +1,5 @@
 import os
+import copy
 import json
 import uuid
 from decimal import Decimal, ROUND_HALF_UP
@@ -9,7 +10,6 @@ import zipfile
 import hashlib
 import hmac
 import importlib.util
-import smtplib
 import urllib.parse
 import urllib.request
 import urllib.error
@@ -19,25 +19,40 @@ import subprocess
 import secrets
 from io import BytesIO
 from datetime import datetime, timedelta, date, time as dt_time
-from functools import wraps
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.application import MIMEApplication
+from functools import lru_cache, wraps
 import logging
 import math
 import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 from flask import (
     Flask, render_template, request, redirect, url_for,
     abort, flash, send_file, send_from_directory, session, Response, jsonify, current_app
 )
+from werkzeug.security import safe_join
 from werkzeug.utils import secure_filename
 
-from yousign_service import YousignClient, YousignError, detect_yousign_environment, get_yousign_config, is_yousign_configured, mask_phone_number, normalizeFrenchPhoneNumber, sanitize_yousign_external_id, test_yousign_connection, yousign_config_diagnostics, yousign_service_access_message
-
-from prospecting import prospecting_bp
+from yousign_service import YOUSIGN_DOWNLOAD_CHUNK_SIZE, YousignClient, YousignError, detect_yousign_environment, get_yousign_call_metrics, get_yousign_config, is_yousign_configured, mask_phone_number, normalizeFrenchPhoneNumber, sanitize_yousign_external_id, test_yousign_connection, yousign_config_diagnostics, yousign_service_access_message
+
+import business_calendar
+import planning_feasibility
+from planning_feasibility import PeriodRequirement, days_for
+from prospecting import prospecting_bp, run_scan as run_prospect_scan
+from services import document_bundle
+from services import invoice_numbers
+from services import job_scheduler
+from services import outbound_mail
+from services import pdf_fragments
+from services import pdf_parallel
+from services import pdf_resources
+from services import price_adaptator_store
+from services import trainee_lists
+from services import yousign_webhook_inbox as yousign_inbox
+from services import xlsx_templates
 from a3p_program import A3P_TOTAL_HOURS, A3P_MODULES, A3P_FORBIDDEN_TERMS, generateA3pSchedule, validate_a3p_planning, is_a3p_non_working_day
-from desp_program import DESP_LABEL, DESP_TOTAL_HOURS, DESP_ELEARNING_HOURS, DESP_PRESENTIEL_HOURS, generate_desp_planning, desp_summary_from_planning
+from desp_program import DESP_LABEL, DESP_TOTAL_HOURS, DESP_ELEARNING_HOURS, DESP_PRESENTIEL_HOURS, DESP_ELEARNING_MAX_DAILY_MINUTES, DESP_PRESENTIEL_MAX_DAILY_MINUTES, generate_desp_planning, desp_summary_from_planning
 
 from services.afc_france_travail_attendance import (
     is_afc_session as ft_is_afc_session,
@@ -434,6 +449,11 @@ def yousign_health():
     return jsonify(diagnostic), http_status
 
 
+@app.get("/api/yousign/metrics")
+def yousign_metrics():
+    return jsonify({"ok": True, **get_yousign_call_metrics()})
+
+
 # --- Filtres Jinja ---
 def format_date(value):
     try:
@@ -512,6 +532,9 @@ app.jinja_env.globals['get_status_label'] = get_status_label
 # --- Persistance ---
 SESSIONS_FILE = os.path.join(DATA_DIR, "sessions.json")
 PRICE_ADAPTATOR_FILE = os.path.join(DATA_DIR, "price_adaptator.json")
+PRICE_ADAPTATOR_DB = os.path.join(os.environ.get("PERSIST_DIR") or DATA_DIR, price_adaptator_store.STORE_DB_NAME)
+PRICE_ADAPTATOR_IMPORT_DIR = os.path.join(DATA_DIR, "price_adaptator_imports")
+PRICE_ADAPTATOR_IMPORT_CHUNK_ROWS = int(os.environ.get("PRICE_ADAPTATOR_IMPORT_CHUNK_ROWS", "2000"))
 
 PRICE_ADAPTATOR_DEFAULT_DISCOUNT = 30
 PRICE_ADAPTATOR_FOLLOWUP_DAYS = 21
@@ -547,6 +570,8 @@ APS_ATTENDANCE_DIR = os.path.join(DATA_DIR, "aps_attendance_sheets")
 os.makedirs(APS_ATTENDANCE_DIR, exist_ok=True)
 A3P_DOC_DIR = os.path.join(DATA_DIR, "a3p_documents")
 os.makedirs(A3P_DOC_DIR, exist_ok=True)
+DOCUMENT_BUNDLE_DIR = os.path.join(DATA_DIR, "document_bundles")
+os.makedirs(DOCUMENT_BUNDLE_DIR, exist_ok=True)
 APS_CONVOCATION_TEMPLATE = os.path.join(BASE_DIR, "gestionstagiaires", "templates_word", "convocationaps.docx")
 
 APS_TOTAL_HOURS = 175
@@ -734,41 +759,17 @@ APS_RECAP_ROWS = [
     ("UV14", "Industriel spécifique"),
 ]
 
-def easter_date(year):
-    """Retourne la date du dimanche de Pâques (algorithme de Meeus/Jones/Butcher)."""
-    a = year % 19
-    b = year // 100
-    c = year % 100
-    d = b // 4
-    e = b % 4
-    f = (b + 8) // 25
-    g = (b - f + 1) // 3
-    h = (19 * a + b - d - g + 15) % 30
-    i = c // 4
-    k = c % 4
-    l = (32 + 2 * e + 2 * i - h - k) % 7
-    m = (a + 11 * h + 22 * l) // 451
-    month = (h + l - 7 * m + 114) // 31
-    day = ((h + l - 7 * m + 114) % 31) + 1
-    return date(year, month, day)
+FRENCH_CALENDAR = business_calendar.get_calendar()
 
 def french_holidays(year):
-    easter = easter_date(year)
-    return {
-        easter + timedelta(days=1),
-        date(year, 5, 1),
-        date(year, 5, 8),
-        easter + timedelta(days=39),
-        easter + timedelta(days=50),
-        date(year, 7, 14),
-        date(year, 8, 15),
-        date(year, 11, 1),
-        date(year, 11, 11),
-        date(year, 12, 25),
-    }
+    return business_calendar.french_public_holidays(year)
 
 def is_french_working_day(day):
-    return day.weekday() < 5 and day not in french_holidays(day.year)
+    return FRENCH_CALENDAR.is_working_day(day)
+
+def aps_training_calendar(exam_iso=""):
+    """Jours ouvrés français hors date d'examen (calendrier mémoïsé)."""
+    return business_calendar.get_calendar(excluded_days=business_calendar.exam_excluded_days(exam_iso))
 
 def aps_local_date_iso(value):
     """Return a YYYY-MM-DD string without timezone conversion."""
@@ -783,13 +784,10 @@ def aps_local_date_iso(value):
     return parsed.strftime("%Y-%m-%d") if parsed else text[:10]
 
 def is_aps_training_day(day, exam_iso=""):
-    return is_french_working_day(day) and day.isoformat() != exam_iso
+    return aps_training_calendar(exam_iso).is_working_day(day)
 
 def next_aps_training_day(day, exam_iso=""):
-    day += timedelta(days=1)
-    while not is_aps_training_day(day, exam_iso):
-        day += timedelta(days=1)
-    return day
+    return aps_training_calendar(exam_iso).next_working_day(day)
 
 def add_hours_to_time(start_time, hours):
     base = datetime.combine(date.today(), start_time)
@@ -800,10 +798,7 @@ def add_minutes_to_time(start_time, minutes):
     return (base + timedelta(minutes=minutes)).time()
 
 def next_french_working_day(day):
-    day += timedelta(days=1)
-    while not is_french_working_day(day):
-        day += timedelta(days=1)
-    return day
+    return FRENCH_CALENDAR.next_working_day(day)
 
 def format_duration_from_minutes(minutes):
     hours = minutes // 60
@@ -816,13 +811,7 @@ def is_ssiap1_exam_part(part):
 def aps_working_days_between(start_date, end_date, exam_iso=""):
     if not start_date or not end_date or start_date > end_date:
         return []
-    days = []
-    current = start_date
-    while current <= end_date:
-        if is_aps_training_day(current, exam_iso):
-            days.append(current)
-        current += timedelta(days=1)
-    return days
+    return aps_training_calendar(exam_iso).working_days(start_date, end_date)
 
 def aps_impossible_period_message(start_date, end_date, available_minutes, required_minutes, extended_minutes=None):
     if extended_minutes is not None:
@@ -858,20 +847,45 @@ def log_aps_generation_diagnostics(session_id=None, planning_mode="full_presenti
         day_distribution or [],
     )
 
+# Besoin en jours ouvrés de chaque type de planning (oracle de faisabilité).
+PLANNING_REQUIREMENTS = {
+    "aps_full_presentiel": PeriodRequirement("APS 100 % présentiel", days_for(APS_TOTAL_MINUTES, APS_MAX_DAILY_MINUTES)),
+    "aps_elearning_presentiel": PeriodRequirement(
+        "APS e-learning + présentiel",
+        days_for(APS_ELEARNING_MINUTES, APS_MAX_DAILY_MINUTES) + days_for(APS_PRESENTIEL_MINUTES, APS_EXTENDED_DAILY_MINUTES),
+    ),
+    "ssiap1": PeriodRequirement("SSIAP 1", 2 + days_for(SSIAP1_TOTAL_MINUTES, APS_MAX_DAILY_MINUTES), exact=True, lead_days=3),
+    "a3p": PeriodRequirement("A3P", days_for(A3P_TOTAL_HOURS * 60, 8 * 60)),
+    "desp_elearning": PeriodRequirement("DESP distanciel", days_for(DESP_ELEARNING_HOURS * 60, DESP_ELEARNING_MAX_DAILY_MINUTES)),
+    # Le présentiel DESP se répartit en journées de 6h à 8h : trop de journées rend la période infaisable.
+    "desp_presentiel": PeriodRequirement("DESP présentiel", days_for(DESP_PRESENTIEL_HOURS * 60, DESP_PRESENTIEL_MAX_DAILY_MINUTES), max_days=DESP_PRESENTIEL_HOURS * 60 // (6 * 60)),
+}
+PLANNING_FEASIBILITY_FORMATIONS = {"APS": "aps_full_presentiel", "SSIAP": "ssiap1", "A3P": "a3p"}
+
+
+def planning_feasibility_calendar(kind, exam_iso="", allow_saturday=False, excluded_dates=None):
+    excluded = set(business_calendar.exam_excluded_days(exam_iso))
+    for value in excluded_dates or []:
+        parsed = parse_date(value)
+        if parsed:
+            excluded.add(parsed.date())
+    return business_calendar.get_calendar(allow_saturday=allow_saturday and kind == "desp_presentiel", excluded_days=excluded)
+
+
 def build_aps_planning(start_date, end_date=None, exam_iso=""):
     modules = [{"name": name, "hours": float(hours), "remaining": float(hours)} for name, hours in APS_MODULES]
     module_idx = 0
     days = []
     totals = {}
     total_hours = 0.0
-    current_day = start_date
+    calendar = aps_training_calendar(exam_iso)
+    if end_date and not planning_feasibility.check_period(PLANNING_REQUIREMENTS["aps_full_presentiel"], start_date, end_date, calendar)["feasible"]:
+        raise ValueError("La période disponible avant l’examen ne permet pas de placer toutes les heures de formation APS. Merci d’avancer la date de début ou de reculer la date d’examen.")
+    current_day = calendar.nth_working_day(start_date, 1)
 
     while round(total_hours, 2) < APS_TOTAL_HOURS:
         if end_date and current_day > end_date:
             raise ValueError("La période disponible avant l’examen ne permet pas de placer toutes les heures de formation APS. Merci d’avancer la date de début ou de reculer la date d’examen.")
-        if not is_aps_training_day(current_day, exam_iso):
-            current_day += timedelta(days=1)
-            continue
 
         day_blocks = []
         for slot_start, slot_hours in ((dt_time(8, 30), 4.0), (dt_time(13, 30), 3.0)):
@@ -900,7 +914,7 @@ def build_aps_planning(start_date, end_date=None, exam_iso=""):
                 break
         if day_blocks:
             days.append({"date": current_day, "blocks": day_blocks})
-        current_day += timedelta(days=1)
+        current_day = calendar.next_working_day(current_day)
 
     return days, totals, total_hours
 
@@ -1042,13 +1056,10 @@ def _ssiap1_role_trainer(exam_payload, role, fallback=""):
     return (exam_payload or {}).get(role) or fallback or ""
 
 def _ssiap1_next_training_days(start_date, count, exam_iso=""):
-    days = []
-    current = start_date
-    while len(days) < count:
-        if is_aps_training_day(current, exam_iso):
-            days.append(current)
-        current += timedelta(days=1)
-    return days
+    if count <= 0:
+        return []
+    calendar = aps_training_calendar(exam_iso)
+    return calendar.working_days(start_date, calendar.nth_working_day(start_date, count))
 
 def _ssiap1_day_slot(date_value, start, minutes, *, uv, part, title, items, trainer, room, modality, content=None):
     end = add_minutes_to_time(start, minutes)
@@ -1274,54 +1285,47 @@ def ssiap1_summary_from_data(planning_data):
 
 def find_center_image(*keywords):
     normalized_keywords = tuple((keyword or "").lower() for keyword in keywords)
-    explicit_assets = (
-        os.path.join(BASE_DIR, "templates", "signature"),
-        os.path.join(BASE_DIR, "templates", "signature.png"),
-        os.path.join(BASE_DIR, "templates", "Tampon.png"),
-        os.path.join(BASE_DIR, "templates", "tampon.png"),
-    )
-    for asset_path in explicit_assets:
-        name = os.path.basename(asset_path).lower()
-        if os.path.isfile(asset_path) and any(keyword in name for keyword in normalized_keywords):
-            return asset_path
-
+    templates_dir = os.path.join(BASE_DIR, "templates")
     image_dir = os.path.join(BASE_DIR, "static", "img")
-    if not os.path.isdir(image_dir):
+
+    def scan():
+        explicit_assets = (
+            os.path.join(templates_dir, "signature"),
+            os.path.join(templates_dir, "signature.png"),
+            os.path.join(templates_dir, "Tampon.png"),
+            os.path.join(templates_dir, "tampon.png"),
+        )
+        for asset_path in explicit_assets:
+            name = os.path.basename(asset_path).lower()
+            if os.path.isfile(asset_path) and any(keyword in name for keyword in normalized_keywords):
+                return asset_path
+
+        if not os.path.isdir(image_dir):
+            return None
+        for entry in os.scandir(image_dir):
+            if not entry.is_file():
+                continue
+            name = entry.name.lower()
+            extension = name.rsplit(".", 1)[-1] if "." in name else ""
+            if any(keyword in name for keyword in normalized_keywords) and extension in {"png", "jpg", "jpeg"}:
+                return entry.path
         return None
-    for entry in os.scandir(image_dir):
-        if not entry.is_file():
-            continue
-        name = entry.name.lower()
-        extension = name.rsplit(".", 1)[-1] if "." in name else ""
-        if any(keyword in name for keyword in normalized_keywords) and extension in {"png", "jpg", "jpeg"}:
-            return entry.path
-    return None
 
-def wrap_text_lines(text, max_width, font="Helvetica", size=9):
-    from reportlab.pdfbase.pdfmetrics import stringWidth
-    words = str(text or "").split()
-    lines = []
-    current = ""
-    for word in words:
-        candidate = f"{current} {word}".strip()
-        if stringWidth(candidate, font, size) <= max_width:
-            current = candidate
-        else:
-            if current:
-                lines.append(current)
-            current = word
-    if current:
-        lines.append(current)
-    return lines
+    return pdf_resources.locate(("center_image", normalized_keywords), (templates_dir, image_dir), scan)
 
-def draw_wrapped_text(canvas, text, x, y, max_width, font="Helvetica", size=9, leading=11):
+@lru_cache(maxsize=65536)
+def text_width(text, font="Helvetica", size=9):
     from reportlab.pdfbase.pdfmetrics import stringWidth
-    words = text.split()
+    return stringWidth(text, font, size)
+
+
+@lru_cache(maxsize=16384)
+def _wrapped_text_lines(text, max_width, font, size):
     lines = []
     current = ""
-    for word in words:
+    for word in text.split():
         candidate = f"{current} {word}".strip()
-        if stringWidth(candidate, font, size) <= max_width:
+        if text_width(candidate, font, size) <= max_width:
             current = candidate
         else:
             if current:
@@ -1329,6 +1333,16 @@ def draw_wrapped_text(canvas, text, x, y, max_width, font="Helvetica", size=9, l
             current = word
     if current:
         lines.append(current)
+    return tuple(lines)
+
+
+def wrap_text_lines(text, max_width, font="Helvetica", size=9):
+    # Mémorisé par (texte, largeur, police, taille) : la pagination et le
+    # dessin des PDF coupent les mêmes libellés plusieurs fois.
+    return list(_wrapped_text_lines(str(text or ""), max_width, font, size))
+
+
+def draw_text_lines(canvas, lines, x, y, font="Helvetica", size=9, leading=11):
     canvas.setFont(font, size)
     for line in lines:
         canvas.drawString(x, y, line)
@@ -1336,6 +1350,10 @@ def draw_wrapped_text(canvas, text, x, y, max_width, font="Helvetica", size=9, l
     return y
 
 
+def draw_wrapped_text(canvas, text, x, y, max_width, font="Helvetica", size=9, leading=11):
+    return draw_text_lines(canvas, wrap_text_lines(text, max_width, font, size), x, y, font, size, leading)
+
+
 def split_uv_title(module_name):
     parts = (module_name or "").split(" ", 1)
     uv = parts[0].strip() if parts else ""
@@ -1385,7 +1403,23 @@ def generateApsElearningPresentielPlanning(start_date, formateur, salle, end_dat
         raise ValueError("Configuration APS incohérente : la répartition e-learning / présentiel ne correspond pas au total attendu.")
 
     idx = 0
-    current_day = start_date
+    calendar = aps_training_calendar(exam_iso)
+    if end_date and not planning_feasibility.check_period(PLANNING_REQUIREMENTS["aps_elearning_presentiel"], start_date, end_date, calendar)["feasible"]:
+        # Refus immédiat via les sommes préfixes, avec les mêmes messages que le placement jour par jour.
+        elearning_days = days_for(APS_ELEARNING_MINUTES, APS_MAX_DAILY_MINUTES)
+        available_days = calendar.count_between(start_date, end_date)
+        if available_days < elearning_days:
+            log_aps_generation_diagnostics(session_id, "elearning_presentiel", start_date, end_date, exam_iso, available_days, available_days * APS_MAX_DAILY_MINUTES, APS_ELEARNING_MINUTES, APS_PRESENTIEL_MINUTES, APS_TOTAL_MINUTES)
+            raise ValueError(aps_impossible_period_message(start_date, end_date, available_days * APS_MAX_DAILY_MINUTES, APS_TOTAL_MINUTES))
+        presentiel_start = calendar.nth_working_day(start_date, elearning_days + 1)
+        presentiel_days = available_days - elearning_days
+        log_aps_generation_diagnostics(
+            session_id, "elearning_presentiel", start_date, end_date, exam_iso,
+            presentiel_days, presentiel_days * APS_MAX_DAILY_MINUTES, APS_ELEARNING_MINUTES,
+            APS_PRESENTIEL_MINUTES, APS_TOTAL_MINUTES, presentiel_days * APS_EXTENDED_DAILY_MINUTES,
+        )
+        raise ValueError(aps_impossible_period_message(presentiel_start, end_date, presentiel_days * APS_MAX_DAILY_MINUTES, APS_PRESENTIEL_MINUTES, presentiel_days * APS_EXTENDED_DAILY_MINUTES))
+    current_day = calendar.nth_working_day(start_date, 1)
     planning = []
     totals = {}
 
@@ -1395,9 +1429,6 @@ def generateApsElearningPresentielPlanning(start_date, formateur, salle, end_dat
             available_days = aps_working_days_between(start_date, end_date, exam_iso)
             log_aps_generation_diagnostics(session_id, "elearning_presentiel", start_date, end_date, exam_iso, len(available_days), len(available_days) * APS_MAX_DAILY_MINUTES, APS_ELEARNING_MINUTES, APS_PRESENTIEL_MINUTES, APS_TOTAL_MINUTES)
             raise ValueError(aps_impossible_period_message(start_date, end_date, len(available_days) * APS_MAX_DAILY_MINUTES, APS_TOTAL_MINUTES))
-        if not is_aps_training_day(current_day, exam_iso):
-            current_day += timedelta(days=1)
-            continue
         slots = []
         for slot_start, slot_minutes in ((dt_time(8, 30), 240), (dt_time(13, 30), 180)):
             cursor = slot_start
@@ -1422,12 +1453,10 @@ def generateApsElearningPresentielPlanning(start_date, formateur, salle, end_dat
                 break
         if slots:
             planning.append({"date": current_day.isoformat(), "dayLabel": aps_day_label(current_day), "slots": slots})
-        current_day += timedelta(days=1)
+        current_day = calendar.next_working_day(current_day)
 
     # 2) Le présentiel démarre après l'e-learning et doit tenir jusqu'à la fin réelle de formation.
     presentiel_start = current_day
-    while not is_aps_training_day(presentiel_start, exam_iso):
-        presentiel_start += timedelta(days=1)
     presentiel_end = end_date
     if not presentiel_end:
         presentiel_end = presentiel_start + timedelta(days=60)
@@ -1576,13 +1605,13 @@ def generate_a3p_planning_pdf(session_data, output_path):
     shared_session, converted = _a3p_session_for_shared_docs(session_data)
     return generate_aps_planning_pdf(shared_session, session_data.get("a3pTrainerName") or "", output_path, planning_data=converted, planning_mode="full_presentiel", document_profile=_a3p_document_profile(summary, planning))
 
-def generate_a3p_attendance_pdf(session_data, output_path):
+def generate_a3p_attendance_pdf(session_data, output_path, fragment_dir=None):
     planning = session_data.get("a3pPlanningData") or []
     errors, _summary = validate_a3p_planning(planning, session_data.get("date_exam"))
     if errors:
         raise ValueError(" ".join(errors))
     shared_session, _converted = _a3p_session_for_shared_docs(session_data)
-    return generate_attendance_pdf_common(shared_session, output_path, training_type="A3P", subtitle="TFP Agent de Protection Physique des Personnes (A3P)")
+    return generate_attendance_pdf_common(shared_session, output_path, training_type="A3P", subtitle="TFP Agent de Protection Physique des Personnes (A3P)", fragment_dir=fragment_dir)
 
 def _a3p_trainer_contract_data(session_data, contract):
     shared_session, converted = _a3p_session_for_shared_docs(session_data)
@@ -1730,9 +1759,6 @@ def afc_dsf_module_for_slot(slot):
         return category
     return None
 
-def afc_dsf_slot_key(session_id, student_id, day, slot, module):
-    return "|".join([str(session_id), str(student_id), day.get("date", ""), slot.get("start", ""), slot.get("end", ""), module])
-
 def afc_dsf_planned_slots(session_data, start_iso=None, end_iso=None, modules=None):
     modules = set(modules or AFC_DSF_MODULES)
     slots = []
@@ -1751,13 +1777,6 @@ def afc_dsf_planned_slots(session_data, start_iso=None, end_iso=None, modules=No
 def afc_dsf_finalized(dsfs):
     return [d for d in dsfs or [] if d.get("status") == AFC_DSF_STATUS_FINALIZED]
 
-def afc_dsf_billed_keys(dsfs):
-    keys = set()
-    for dsf in afc_dsf_finalized(dsfs):
-        for key in dsf.get("billedSlotKeys") or []:
-            keys.add(key)
-    return keys
-
 def afc_dsf_next_number(session_data):
     return max([int(d.get("number") or 0) for d in session_data.get("afcDsfs") or []] or [0]) + 1
 
@@ -1767,13 +1786,125 @@ def afc_dsf_effective_start(period_start, student):
         return max(period_start, entry)
     return period_start
 
-def afc_dsf_billed_hours_by_student(session_data):
-    students = afc_dsf_students(session_data)
+AFC_DSF_STATE_CACHE_SIZE = 64
+_afc_dsf_state_cache = OrderedDict()
+_afc_dsf_state_cache_lock = threading.Lock()
+
+def _afc_dsf_cached(key, build):
+    with _afc_dsf_state_cache_lock:
+        value = _afc_dsf_state_cache.get(key)
+        if value is not None:
+            _afc_dsf_state_cache.move_to_end(key)
+            return value
+    value = build()
+    with _afc_dsf_state_cache_lock:
+        _afc_dsf_state_cache[key] = value
+        while len(_afc_dsf_state_cache) > AFC_DSF_STATE_CACHE_SIZE:
+            _afc_dsf_state_cache.popitem(last=False)
+    return value
+
+def afc_dsf_session_revision(session_data, students=None, slots=None):
+    """Empreinte de tout ce qui entre dans l'état de facturation DSF d'une session.
+
+    Planning (créneaux facturables), stagiaires et DSF finalisées, sérialisés en
+    entier : toute modification d'une entrée, même au milieu d'un registre ou
+    d'une liste de créneaux facturés, change l'empreinte.
+    """
+    students = afc_dsf_students(session_data) if students is None else students
+    slots = afc_dsf_planned_slots(session_data) if slots is None else slots
+    payload = json.dumps([
+        session_data.get("id"), session_data.get("date_debut"),
+        students,
+        [(slot["date"], slot["start"], slot["end"], slot["module"], slot["minutes"]) for slot in slots],
+        afc_dsf_finalized(session_data.get("afcDsfs") or []),
+    ], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+def afc_dsf_slot_span(slot):
+    """Identité d'un créneau dans sa journée : `début-fin`."""
+    return f"{slot['start'] or ''}-{slot['end'] or ''}"
+
+class AfcDsfHoursIndex:
+    """Heures planifiées d'un module : cumul par date (sommes préfixes) et détail par créneau."""
+
+    def __init__(self, hours_by_slot):
+        self.slots = hours_by_slot
+        self.dates = sorted(hours_by_slot)
+        self.prefix = [Decimal("0")]
+        for d in self.dates:
+            self.prefix.append(self.prefix[-1] + sum(hours_by_slot[d].values(), Decimal("0")))
+
+    def _bounds(self, start_iso=None, end_iso=None):
+        lo = bisect_left(self.dates, start_iso) if start_iso else 0
+        hi = bisect_right(self.dates, end_iso) if end_iso else len(self.dates)
+        return lo, hi
+
+    def between(self, start_iso=None, end_iso=None):
+        lo, hi = self._bounds(start_iso, end_iso)
+        return self.prefix[hi] - self.prefix[lo] if hi > lo else Decimal("0")
+
+    def billed(self, billed_by_date, start_iso=None, end_iso=None):
+        """Heures des créneaux encore planifiés qui figurent au registre ({date: {créneau}}), dans [start_iso, end_iso]."""
+        total = Decimal("0")
+        for d, spans in billed_by_date.items():
+            if (start_iso and d < start_iso) or (end_iso and d > end_iso):
+                continue
+            planned = self.slots.get(d)
+            if planned:
+                total += sum((planned[span] for span in spans if span in planned), Decimal("0"))
+        return total
+
+    def unbilled(self, start_iso=None, end_iso=None, billed_by_date=None):
+        """Créneaux planifiés de la plage absents du registre : {date: [créneau, …]}."""
+        lo, hi = self._bounds(start_iso, end_iso)
+        billed_by_date = billed_by_date or {}
+        result = {}
+        for d in self.dates[lo:hi]:
+            done = billed_by_date.get(d) or ()
+            spans = [span for span in self.slots[d] if span not in done]
+            if spans:
+                result[d] = spans
+        return result
+
+def afc_dsf_planned_index(slots):
+    planned = {m: {} for m in AFC_DSF_MODULES}
+    for slot in slots:
+        by_slot = planned[slot["module"]].setdefault(slot["date"], {})
+        span = afc_dsf_slot_span(slot)
+        by_slot[span] = by_slot.get(span, Decimal("0")) + afc_dsf_decimal(Decimal(slot["minutes"]) / Decimal(60))
+    return {m: AfcDsfHoursIndex(by_slot) for m, by_slot in planned.items()}
+
+def afc_dsf_ledger_from_slot_keys(session_data, keys):
+    """Lit les anciennes clés de créneau (`session|stagiaire|date|début|fin|module`) comme un registre.
+
+    Toutes les clés sont reprises : comme avant, seules celles qui désignent un
+    créneau du planning actuel comptent au moment du calcul.
+    """
+    prefix = f"{session_data.get('id')}|"
+    ledger = {}
+    for key in keys:
+        parts = key.rsplit("|", 4)
+        if len(parts) != 5 or not parts[0].startswith(prefix):
+            continue
+        owner, day, start, end, module = parts
+        ledger.setdefault(owner[len(prefix):], {}).setdefault(module, {}).setdefault(day, []).append(f"{start}-{end}")
+    return ledger
+
+def afc_dsf_dsf_ledger(session_data, dsf):
+    """Registre des créneaux facturés par une DSF : {stagiaire: {module: {date: ["début-fin", …]}}}."""
+    if "billedLedger" in dsf:
+        return dsf.get("billedLedger") or {}
+    return afc_dsf_ledger_from_slot_keys(session_data, dsf.get("billedSlotKeys") or [])
+
+def afc_dsf_billed_hours_by_student(session_data, students):
     billed = {st["id"]: {m: Decimal("0") for m in AFC_DSF_MODULES} for st in students}
-    billed_keys = set()
+    ledger = {}
     for dsf in afc_dsf_finalized(session_data.get("afcDsfs") or []):
-        for key in dsf.get("billedSlotKeys") or []:
-            billed_keys.add(key)
+        for sid, modules in afc_dsf_dsf_ledger(session_data, dsf).items():
+            for m, by_date in modules.items():
+                merged = ledger.setdefault(sid, {}).setdefault(m, {})
+                for d, spans in by_date.items():
+                    merged.setdefault(d, set()).update(spans)
         for row in dsf.get("students") or []:
             sid = row.get("id")
             if sid not in billed:
@@ -1781,9 +1912,25 @@ def afc_dsf_billed_hours_by_student(session_data):
             for m, h in (row.get("modules") or {}).items():
                 if m in billed[sid]:
                     billed[sid][m] += afc_dsf_decimal(h)
-    return billed, billed_keys
+    return billed, ledger
+
+def afc_dsf_billing_context(session_data):
+    """Stagiaires, index des heures planifiées et registre facturé d'une session, par révision."""
+    students = afc_dsf_students(session_data)
+    slots = afc_dsf_planned_slots(session_data)
+    revision = afc_dsf_session_revision(session_data, students, slots)
+
+    def build():
+        billed_hours, ledger = afc_dsf_billed_hours_by_student(session_data, students)
+        return {"revision": revision, "students": students, "plannedIndex": afc_dsf_planned_index(slots), "billedHours": billed_hours, "ledger": ledger}
+
+    return _afc_dsf_cached(("context", revision), build)
 
 def afc_dsf_build_invoice_state(session_data, billing_until=None, period_start=None, period_end=None, hourly_rate=None):
+    """État de facturation DSF, mémorisé par (révision de session, période, tarif).
+
+    L'état renvoyé est partagé entre les appels : il ne doit pas être modifié.
+    """
     if not is_afc_aps_ssiap_session(session_data):
         raise ValueError("Session AFC France Travail APS + SSIAP requise.")
     today = datetime.now().date().isoformat()
@@ -1792,29 +1939,31 @@ def afc_dsf_build_invoice_state(session_data, billing_until=None, period_start=N
     if period_start and period_start > period_end:
         raise ValueError("La date de début ne peut pas être postérieure à la date de fin.")
     rate = afc_dsf_rate(hourly_rate)
-    students = afc_dsf_students(session_data)
-    all_slots = afc_dsf_planned_slots(session_data)
-    billed_by_student, billed_keys = afc_dsf_billed_hours_by_student(session_data)
-    planned_by_student = {st["id"]: {m: Decimal("0") for m in AFC_DSF_MODULES} for st in students}
-    billable_by_student = {st["id"]: {m: Decimal("0") for m in AFC_DSF_MODULES} for st in students}
-    unbilled_billable_by_student = {st["id"]: {m: Decimal("0") for m in AFC_DSF_MODULES} for st in students}
-    session_id = session_data.get("id")
+    context = afc_dsf_billing_context(session_data)
+    return _afc_dsf_cached(
+        ("state", context["revision"], cutoff, period_start or "", period_end, str(rate)),
+        lambda: _afc_dsf_compute_invoice_state(session_data, context, cutoff, period_start, period_end, rate),
+    )
+
+def _afc_dsf_compute_invoice_state(session_data, context, cutoff, period_start, period_end, rate):
+    students = context["students"]
+    planned_index = context["plannedIndex"]
+    billed_by_student = context["billedHours"]
+    planned_by_student = {}
+    billable_by_student = {}
+    unbilled_billable_by_student = {}
     for st in students:
         sid = st["id"]
         effective_start = afc_dsf_effective_start(period_start or "0000-00-00", st)
         entry = st.get("entryDate") or session_data.get("date_debut") or ""
-        for slot in all_slots:
-            if entry and slot["date"] < entry:
-                continue
-            module = slot["module"]
-            hours = afc_dsf_decimal(Decimal(slot["minutes"]) / Decimal(60))
-            planned_by_student[sid][module] += hours
-            if slot["date"] < effective_start or slot["date"] > period_end:
-                continue
-            billable_by_student[sid][module] += hours
-            key = afc_dsf_slot_key(session_id, sid, {"date": slot["date"]}, slot, module)
-            if key not in billed_keys:
-                unbilled_billable_by_student[sid][module] += hours
+        billable_start = max(entry, effective_start)
+        student_ledger = context["ledger"].get(sid) or {}
+        planned_by_student[sid], billable_by_student[sid], unbilled_billable_by_student[sid] = {}, {}, {}
+        for m in AFC_DSF_MODULES:
+            billable = planned_index[m].between(billable_start, period_end)
+            planned_by_student[sid][m] = planned_index[m].between(entry or None)
+            billable_by_student[sid][m] = billable
+            unbilled_billable_by_student[sid][m] = billable - planned_index[m].billed(student_ledger.get(m) or {}, billable_start, period_end)
 
     module_totals = {m: {"planned": Decimal("0"), "billable": Decimal("0"), "billed": Decimal("0"), "toInvoice": Decimal("0"), "remaining": Decimal("0"), "advanceOver": Decimal("0"), "definitiveOver": Decimal("0")} for m in AFC_DSF_MODULES}
     detail = []
@@ -1863,27 +2012,24 @@ def afc_dsf_compute(session_data, start_iso, end_iso, modules, excluded_students
     if any(m not in AFC_DSF_MODULES for m in modules): raise ValueError("Module DSF invalide.")
     rate = afc_dsf_rate(hourly_rate)
     state = afc_dsf_build_invoice_state(session_data, billing_until=end_iso, period_start=start_iso, period_end=end_iso, hourly_rate=rate)
+    context = afc_dsf_billing_context(session_data)
     excluded_students = set(excluded_students or [])
-    billed_keys = afc_dsf_billed_keys(session_data.get("afcDsfs") or [])
-    students=[]; billed_slot_keys=[]; billed_slots=[]; totals={m:0 for m in modules}
-    slots=afc_dsf_planned_slots(session_data, start_iso, end_iso, modules)
+    students=[]; billed_ledger={}; totals={m:0 for m in modules}
     for row in state["detail"]:
         st=row["student"]
         if st["id"] in excluded_students: continue
         out={"id":st["id"],"lastName":st["lastName"],"firstName":st["firstName"],"displayName":st["displayName"],"entryDate":st.get("entryDate") or "","modules":{m:float(row["modules"][m]["toInvoice"]) for m in modules},"totalHours":float(sum(row["modules"][m]["toInvoice"] for m in modules)),"amountToInvoice":str(afc_dsf_amount(sum(row["modules"][m]["toInvoice"] for m in modules), rate))}
         if out["totalHours"] <= 0: continue
-        for slot in slots:
-            if slot["module"] not in modules or slot["date"] < (st.get("entryDate") or ""):
-                continue
-            key=afc_dsf_slot_key(session_data.get("id"), st["id"], {"date": slot["date"]}, slot, slot["module"])
-            if key not in billed_keys:
-                billed_slot_keys.append(key); billed_slots.append({**slot,"studentId":st["id"],"studentName":st["displayName"]})
+        already_billed = context["ledger"].get(st["id"]) or {}
+        for m in modules:
+            spans = context["plannedIndex"][m].unbilled(max(start_iso or "", st.get("entryDate") or ""), end_iso or None, already_billed.get(m))
+            if spans:
+                billed_ledger.setdefault(st["id"], {})[m] = spans
         for m in modules: totals[m]+=out["modules"][m]
         students.append(out)
     total=round(sum(totals.values()),2)
     if total <= 0: raise ValueError("Aucune heure restante à facturer pour les modules et la période sélectionnés.")
-    return {"periodStart":start_iso,"periodEnd":end_iso,"billingUntil":end_iso,"modules":modules,"students":students,"studentCount":len(students),"moduleTotals":{m:round(totals[m],2) for m in modules},"totalHours":total,"amountTotal":str(afc_dsf_amount(total, rate)),"billedSlotKeys":billed_slot_keys,"billedSlots":billed_slots,"hoursPerStudent":{m:round(totals[m]/max(len(students),1),2) for m in modules},"requestedHours":{m:round(totals[m],2) for m in modules},"alreadyBilledHours":{m:0 for m in modules},"hasAlreadyBilled":False,"anomalies":[a for r in state["detail"] for a in r["anomalies"]]}
-
+    return {"periodStart":start_iso,"periodEnd":end_iso,"billingUntil":end_iso,"modules":modules,"students":students,"studentCount":len(students),"moduleTotals":{m:round(totals[m],2) for m in modules},"totalHours":total,"amountTotal":str(afc_dsf_amount(total, rate)),"billedLedger":billed_ledger,"hoursPerStudent":{m:round(totals[m]/max(len(students),1),2) for m in modules},"requestedHours":{m:round(totals[m],2) for m in modules},"alreadyBilledHours":{m:0 for m in modules},"hasAlreadyBilled":False,"anomalies":[a for r in state["detail"] for a in r["anomalies"]]}
 
 def afc_dsf_session_snapshot(session_data, dsf_result, number, hourly_rate):
     ft = session_data.get("france_travail") or {}
@@ -1979,25 +2125,15 @@ def afc_dsf_invoice_exists(sess, dsf_id):
     dsf = afc_dsf_find(sess, dsf_id)
     return bool((dsf or {}).get('invoice'))
 
-def afc_dsf_invoice_number_used(data, invoice_number, current_dsf_id=None):
-    text = str(invoice_number or '').strip()
-    for s in data.get('sessions') or []:
-        for d in s.get('afcDsfs') or []:
-            inv = d.get('invoice') or {}
-            if current_dsf_id and d.get('id') == current_dsf_id:
-                continue
-            if str(inv.get('invoice_number') or '').strip() == text:
-                return True
-    return False
+def afc_invoice_next_number():
+    return invoice_numbers.next_number(INVOICE_NUMBERS_DB)
 
-def afc_invoice_next_number(data):
-    nums = []
+def afc_invoice_registered_numbers(data):
     for s in data.get('sessions') or []:
         for d in s.get('afcDsfs') or []:
-            n = str(((d.get('invoice') or {}).get('invoice_number')) or '')
-            if n.isdigit():
-                nums.append(int(n))
-    return str((max(nums) + 1) if nums else int(datetime.now().strftime('%Y0001')))
+            n = str(((d.get('invoice') or {}).get('invoice_number')) or '').strip()
+            if n:
+                yield n, s.get('id'), d.get('id')
 
 def afc_invoice_default_place(sess):
     return os.environ.get('ORGANISME_VILLE') or (sess.get('ville') or 'PUGET SUR ARGENS')
@@ -2025,7 +2161,7 @@ def afc_invoice_preview_payload(data, sess, dsf):
         'periodStart': snap.get('periodStart') or dsf.get('periodStart'), 'periodEnd': snap.get('periodEnd') or dsf.get('periodEnd'),
         'studentCount': snap.get('studentCount') or dsf.get('studentCount'), 'totalHours': snap.get('totalHours') or dsf.get('totalHours'),
         'hourlyRate': snap.get('hourlyRate'), 'amountTotal': dsf.get('amountTotal'), 'moduleTotals': snap.get('moduleTotals') or dsf.get('moduleTotals'),
-        'invoiceType': '', 'invoiceNumber': afc_invoice_next_number(data),
+        'invoiceType': '', 'invoiceNumber': afc_invoice_next_number(),
         'invoiceDate': datetime.now().date().isoformat(), 'invoicePlace': afc_invoice_default_place(sess),
         'kairosEngagementReference': afc_invoice_default_kairos_reference(sess, dsf),
     }
@@ -2065,11 +2201,15 @@ def parse_interruption_ranges(value):
             ranges.append((start.date(), end.date()))
     return ranges
 
+def afc_calendar(interruptions=None):
+    """Jours ouvrés français hors périodes d'interruption AFC (calendrier mémoïsé)."""
+    return business_calendar.get_calendar(interruptions or [])
+
 def is_interrupted_day(day, interruptions):
-    return any(start <= day <= end for start, end in (interruptions or []))
+    return afc_calendar(interruptions).is_interrupted(day)
 
 def is_afc_working_day(day, interruptions=None):
-    return is_french_working_day(day) and not is_interrupted_day(day, interruptions or [])
+    return afc_calendar(interruptions).is_working_day(day)
 
 def afc_minutes_to_hhmm(minute):
     return f"{minute//60:02d}:{minute%60:02d}"
@@ -2103,26 +2243,12 @@ def afc_slot_from_module(day, start, end, module, trainer, room):
     return slot
 
 def afc_active_weeks(start_date, interruptions, count):
-    weeks, seen, day = [], set(), start_date
-    while len(weeks) < count:
-        if is_afc_working_day(day, interruptions):
-            key = day.isocalendar()[:2]
-            if key not in seen:
-                seen.add(key); weeks.append(key)
-        day += timedelta(days=1)
-    return weeks
+    return afc_calendar(interruptions).active_weeks(start_date, count)
 
 def afc_nth_working_day(start_date, interruptions=None, count=57):
     if not start_date:
         return None
-    remaining, day = count, start_date
-    while remaining > 0:
-        if is_afc_working_day(day, interruptions or []):
-            remaining -= 1
-            if remaining == 0:
-                return day
-        day += timedelta(days=1)
-    return None
+    return afc_calendar(interruptions).nth_working_day(start_date, count)
 
 def build_afc_aps_ssiap_planning_data(start_date, trainer="", room="", interruptions=None, contractual_end_date=None):
     """Génère le parcours AFC APS + SSIAP en réservant d'abord les blocs métier indivisibles."""
@@ -2133,10 +2259,7 @@ def build_afc_aps_ssiap_planning_data(start_date, trainer="", room="", interrupt
     if not end_date:
         raise ValueError("La date de fin contractuelle AFC est invalide.")
 
-    eligible_dates, day = [], start_date
-    while day <= end_date:
-        if is_afc_working_day(day, interruptions): eligible_dates.append(day)
-        day += timedelta(days=1)
+    eligible_dates = afc_calendar(interruptions).working_days(start_date, end_date)
     if len(eligible_dates) != 57:
         raise ValueError("La période sélectionnée ne contient pas les 57 jours prévus par la commande France Travail.")
     if eligible_dates[-1] != end_date:
@@ -2294,10 +2417,7 @@ def afc_aps_ssiap_summary_from_data(planning_data, interruptions=None, contractu
     if planning_data:
         first = parse_date(planning_data[0].get("date")); last = parse_date((contractual_end_date.isoformat() if hasattr(contractual_end_date, "isoformat") else contractual_end_date) or planning_data[-1].get("date"))
         if first and last:
-            cur = first.date(); end = last.date()
-            while cur <= end:
-                if is_afc_working_day(cur, interruptions or []): eligible_dates.append(cur.isoformat())
-                cur += timedelta(days=1)
+            eligible_dates = [d.isoformat() for d in afc_calendar(interruptions).working_days(first.date(), last.date())]
             programmed_dates = sorted({d.get("date") for d in planning_data or [] if d.get("slots")})
             if len(eligible_dates) != 57: errors.append(f"La période AFC doit contenir exactement 57 dates admissibles (actuel: {len(eligible_dates)}).")
             if len(programmed_dates) != 57: errors.append(f"Le planning AFC doit contenir exactement 57 dates programmées (actuel: {len(programmed_dates)}).")
@@ -2776,10 +2896,14 @@ def validate_aps_elearning_presentiel_rules(planning_data, summary=None):
 
 def aps_pdf_logo_path():
     public_logo = os.path.join(BASE_DIR, "public", "logo-integrale-academy.png")
-    if os.path.exists(public_logo):
-        return public_logo
     static_logo = os.path.join(BASE_DIR, "static", "img", "logo-integrale.png")
-    return static_logo if os.path.exists(static_logo) else None
+
+    def resolve():
+        if os.path.exists(public_logo):
+            return public_logo
+        return static_logo if os.path.exists(static_logo) else None
+
+    return pdf_resources.locate("aps_pdf_logo", (os.path.dirname(public_logo), os.path.dirname(static_logo)), resolve)
 
 def append_planning_history(session_data, label):
     now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -2862,21 +2986,42 @@ def planning_slot_title(slot):
     return f"{slot.get('uv')} — {slot.get('title')}"
 
 
-def planning_card_height(slot, printable_width):
+def planning_card_layout(slot, printable_width, salle=""):
+    """Mise en page d'une carte du planning : hauteur et lignes déjà coupées.
+
+    Calculée une fois par créneau, elle sert à la pagination puis au dessin.
+    """
     if slot.get("partNumber") and slot.get("sequenceNumber"):
         text_w = printable_width - 32
-        title_lines = max(1, len(wrap_text_lines(planning_slot_title(slot), text_w, "Helvetica-Bold", 9.4)))
+        title_lines = wrap_text_lines(planning_slot_title(slot), text_w, "Helvetica-Bold", 9.4)
+        items = slot.get("subpartDisplayItems") or slot.get("subpartItems") or []
         items_h = 0
-        for item in slot.get("subpartDisplayItems") or slot.get("subpartItems") or []:
+        for item in items:
             items_h += max(1, len(wrap_text_lines(f"• {item}", text_w - 14, "Helvetica", 8.7))) * 10
         progress_h = 10 if slot.get("subpartProgressLabel") else 0
         meta_lines = max(1, len(wrap_text_lines(f"Formateur : {slot.get('trainer') or '—'} • Salle : {slot.get('room') or '—'}", text_w, "Helvetica", 7.8)))
-        return max(90, 16 + title_lines * 11 + 13 + 16 + progress_h + 8 + items_h + 8 + meta_lines * 9 + 8)
+        return {
+            "kind": "sequence",
+            "height": max(90, 16 + max(1, len(title_lines)) * 11 + 13 + 16 + progress_h + 8 + items_h + 8 + meta_lines * 9 + 8),
+            "title": title_lines,
+            "progress": wrap_text_lines(slot.get("subpartProgressLabel"), text_w - 12, "Helvetica-Oblique", 7.6) if slot.get("subpartProgressLabel") else [],
+            "items": [wrap_text_lines(f"• {item}", text_w - 12, "Helvetica", 8.7) for item in items],
+            "meta": wrap_text_lines(f"Formateur : {slot.get('trainer') or '—'} • Salle : {slot.get('room') or salle}", text_w - 112, "Helvetica", 7.8),
+        }
     title_w = printable_width - 225
-    title_lines = max(1, len(wrap_text_lines(planning_slot_title(slot), title_w, "Helvetica-Bold", 8.2)))
-    title_h = title_lines * 9
+    title_lines = wrap_text_lines(planning_slot_title(slot), title_w, "Helvetica-Bold", 8.2)
+    title_h = max(1, len(title_lines)) * 9
     meta_h = 14 if (slot.get("modality") or "presentiel") != "elearning" else 0
-    return max(44, 12 + title_h + 8 + meta_h + 14)
+    return {
+        "kind": "module",
+        "height": max(44, 12 + title_h + 8 + meta_h + 14),
+        "title": title_lines,
+        "meta": wrap_text_lines(f"Salle : {slot.get('room') or salle} • Formateur : {slot.get('trainer') or '—'}", printable_width - 112, "Helvetica", 8) if slot.get("modality") != "elearning" else [],
+    }
+
+
+def planning_card_height(slot, printable_width):
+    return planning_card_layout(slot, printable_width)["height"]
 
 
 def planning_day_height(day, current_part, planning_mode, printable_width):
@@ -2893,8 +3038,9 @@ def planning_day_height(day, current_part, planning_mode, printable_width):
     return needed, first_part
 
 
-def generate_aps_planning_pdf(session_data, formateur, output_path, planning_data=None, planning_mode="full_presentiel", document_profile=None):
+def generate_aps_planning_pdf(session_data, formateur, output_path, planning_data=None, planning_mode="full_presentiel", document_profile=None, page_range=None, workers=None, edited_at=None):
     document_profile = document_profile or {}
+    source_profile = document_profile
     if planning_mode not in {"full_presentiel", "elearning_presentiel", "desp", "ssiap1"}:
         raise ValueError("Le type de planning est obligatoire.")
     if document_profile.get("validate") == "ssiap1":
@@ -2958,7 +3104,7 @@ def generate_aps_planning_pdf(session_data, formateur, output_path, planning_dat
     printable_width = width - 2 * margin
     logo_path = aps_pdf_logo_path()
     title = document_profile.get("planning_title") or "PLANNING DE FORMATION APS"
-    edited = datetime.now().strftime("%d/%m/%Y à %H:%M")
+    edited = edited_at or datetime.now().strftime("%d/%m/%Y à %H:%M")
     computed_end = (planning_data[-1].get("date") if planning_data else session_data.get("date_fin"))
     period = f"Du {format_date(session_data.get('date_debut'))} au {format_date(session_data.get('date_fin') or computed_end) if (session_data.get('date_fin') or computed_end) else '—'}"
     trainers = sorted({(slot.get("trainer") or "").strip() for day in planning_data for slot in day.get("slots", []) if (slot.get("modality") or "presentiel") == "presentiel" and (slot.get("trainer") or "").strip()})
@@ -2991,6 +3137,9 @@ def generate_aps_planning_pdf(session_data, formateur, output_path, planning_dat
         return f"{base} — {date_range} — {hours:g}h" if date_range else f"{base} — {hours:g}h"
 
     first_content_y = height - (146 if planning_mode in {"elearning_presentiel", "desp", "ssiap1"} else 122)
+    # Mise en page des cartes (planning_card_layout), partagée par la pagination et le dessin.
+    card_layouts = {}
+
     def build_pages():
         built_pages, current_page, current_part = [], [], None
         planning_day_height_helper = planning_day_height
@@ -3003,10 +3152,11 @@ def generate_aps_planning_pdf(session_data, formateur, output_path, planning_dat
             current_fragment = None
             for slot in day.get("slots", []):
                 _ = planning_day_height_helper
+                layout = card_layouts[id(slot)] = planning_card_layout(slot, printable_width, salle)
                 slot_part = slot.get("part")
                 band_needed = 34 if planning_mode in {"elearning_presentiel", "desp", "ssiap1"} and slot_part and slot_part != current_part else 0
                 header_needed = 0 if day_started_on_page and current_fragment is not None else day_header_needed
-                needed = header_needed + band_needed + planning_card_height(slot, printable_width) + 5
+                needed = header_needed + band_needed + layout["height"] + 5
                 if current_page and y - needed < bottom_limit:
                     built_pages.append(current_page)
                     current_page, current_part = [], None
@@ -3015,7 +3165,7 @@ def generate_aps_planning_pdf(session_data, formateur, output_path, planning_dat
                     day_started_on_page = False
                     band_needed = 34 if planning_mode in {"elearning_presentiel", "desp", "ssiap1"} and slot_part else 0
                     header_needed = day_header_needed
-                    needed = header_needed + band_needed + planning_card_height(slot, printable_width) + 5
+                    needed = header_needed + band_needed + layout["height"] + 5
                 if current_fragment is None:
                     current_fragment = {**day, "slots": []}
                     current_page.append(current_fragment)
@@ -3025,7 +3175,7 @@ def generate_aps_planning_pdf(session_data, formateur, output_path, planning_dat
                     y -= band_needed
                     current_part = slot_part
                 current_fragment["slots"].append(slot)
-                y -= planning_card_height(slot, printable_width) + 5
+                y -= layout["height"] + 5
             if current_fragment:
                 y -= 2
         if current_page or not built_pages:
@@ -3040,7 +3190,7 @@ def generate_aps_planning_pdf(session_data, formateur, output_path, planning_dat
 
     def draw_header_footer(page_no, total_pages):
         if logo_path:
-            c.drawImage(logo_path, margin, height - 72, width=72, height=49, preserveAspectRatio=True, mask="auto")
+            c.drawImage(pdf_resources.logo(logo_path), margin, height - 72, width=72, height=49, preserveAspectRatio=True, mask="auto")
         c.setFillColor(colors.HexColor("#111827")); c.setFont("Helvetica-Bold", 16)
         c.drawString(margin + 88, height - 35, title)
         c.setFont("Helvetica", 9); c.setFillColor(colors.HexColor("#4b5563"))
@@ -3095,6 +3245,9 @@ def generate_aps_planning_pdf(session_data, formateur, output_path, planning_dat
     def draw_planning_pages(total_pages):
         nonlocal page_no
         for page_days in pages:
+            if not pdf_parallel.in_range(page_range, page_no):
+                page_no += 1
+                continue
             draw_header_footer(page_no, total_pages)
             y = first_content_y if page_no == 1 else height - 122
             if page_no == 1 and planning_mode in {"elearning_presentiel", "desp", "ssiap1"}:
@@ -3116,7 +3269,8 @@ def generate_aps_planning_pdf(session_data, formateur, output_path, planning_dat
                         c.setFillColor(colors.HexColor(band_color)); c.roundRect(margin, y - 20, printable_width, 24, 6, fill=1, stroke=0)
                         c.setFillColor(colors.white); c.setFont("Helvetica-Bold", 10); c.drawString(margin + 10, y - 12, period_title(slot_part))
                         y -= 34
-                    h = planning_card_height(slot, printable_width)
+                    layout = card_layouts[id(slot)]
+                    h = layout["height"]
                     c.setFillColor(colors.white); c.setStrokeColor(colors.HexColor("#d1d5db")); c.roundRect(margin, y - h + 5, printable_width, h, 6, fill=1, stroke=1)
                     if document_profile.get("validate") == "afc_aps_ssiap":
                         modality_color = AFC_CATEGORY_COLORS.get(slot.get("afcCategory"), "#0d9488")
@@ -3133,8 +3287,8 @@ def generate_aps_planning_pdf(session_data, formateur, output_path, planning_dat
                         c.drawCentredString(badge_x + 38, badge_y + 4, modality_label)
 
                     if slot.get("partNumber") and slot.get("sequenceNumber"):
-                        text_x = margin + 16; text_w = printable_width - 32
-                        cursor_y = draw_wrapped_text(c, planning_slot_title(slot), text_x, y - 8, text_w, "Helvetica-Bold", 9.4, 11)
+                        text_x = margin + 16
+                        cursor_y = draw_text_lines(c, layout["title"], text_x, y - 8, "Helvetica-Bold", 9.4, 11)
                         c.setFont("Helvetica", 8); c.setFillColor(colors.HexColor("#374151"))
                         c.drawString(text_x, cursor_y, f"Durée totale de la séquence : {format_duration_from_minutes(int(slot.get('totalSequenceDurationMinutes') or 0))}")
                         badge_y = cursor_y - 16
@@ -3144,20 +3298,19 @@ def generate_aps_planning_pdf(session_data, formateur, output_path, planning_dat
                         c.drawRightString(margin + printable_width - 10, badge_y + 1, f"{slot.get('start')} - {slot.get('end')} ({format_duration_from_minutes(int(slot.get('durationMinutes') or 0))})")
                         item_y = badge_y - 13
                         if slot.get("subpartProgressLabel"):
-                            item_y = draw_wrapped_text(c, slot.get("subpartProgressLabel"), text_x + 8, item_y, text_w - 12, "Helvetica-Oblique", 7.6, 9)
-                        for item in slot.get("subpartDisplayItems") or slot.get("subpartItems") or []:
-                            item_y = draw_wrapped_text(c, f"• {item}", text_x + 8, item_y, text_w - 12, "Helvetica", 8.7, 10)
-                        draw_wrapped_text(c, f"Formateur : {slot.get('trainer') or '—'} • Salle : {slot.get('room') or salle}", text_x, y - h + 19, text_w - 112, "Helvetica", 7.8, 9)
+                            item_y = draw_text_lines(c, layout["progress"], text_x + 8, item_y, "Helvetica-Oblique", 7.6, 9)
+                        for item_lines in layout["items"]:
+                            item_y = draw_text_lines(c, item_lines, text_x + 8, item_y, "Helvetica", 8.7, 10)
+                        draw_text_lines(c, layout["meta"], text_x, y - h + 19, "Helvetica", 7.8, 9)
                         draw_modality_badge(width - margin - 86, y - h + 14)
                     else:
-                        title_w = printable_width - 225
-                        draw_wrapped_text(c, planning_slot_title(slot), margin + 16, y - 8, title_w, "Helvetica-Bold", 8.2, 9)
+                        draw_text_lines(c, layout["title"], margin + 16, y - 8, "Helvetica-Bold", 8.2, 9)
                         c.setFont("Helvetica", 8); c.setFillColor(colors.HexColor("#374151"))
                         c.drawString(width - margin - 168, y - 8, f"{slot.get('start')} - {slot.get('end')} ({format_duration_from_minutes(int(slot.get('durationMinutes') or 0))})")
                         draw_modality_badge(width - margin - 86, y - h + 14)
                         if slot.get("modality") != "elearning":
                             c.setFillColor(colors.HexColor("#374151")); c.setFont("Helvetica", 8)
-                            draw_wrapped_text(c, f"Salle : {slot.get('room') or salle} • Formateur : {slot.get('trainer') or '—'}", margin + 14, y - h + 19, printable_width - 112, "Helvetica", 8, 9)
+                            draw_text_lines(c, layout["meta"], margin + 14, y - h + 19, "Helvetica", 8, 9)
                     y -= h + 5
                 y -= 2
             page_no += 1
@@ -3203,7 +3356,7 @@ def generate_aps_planning_pdf(session_data, formateur, output_path, planning_dat
             box_w=(printable_width-18)/2
             for idx_label,(label,img) in enumerate((("Signature",signature_image),("Tampon",stamp_image))):
                 x=margin+idx_label*(box_w+18); c.setFillColor(colors.white); c.setStrokeColor(colors.HexColor("#d1d5db")); c.roundRect(x,y-64,box_w,64,6,fill=1,stroke=1); c.setFillColor(colors.HexColor("#374151")); c.setFont("Helvetica-Bold",9); c.drawString(x+10,y-16,label)
-                if img: c.drawImage(img,x+12,y-58,width=box_w-24,height=40,preserveAspectRatio=True,mask="auto")
+                if img: c.drawImage(pdf_resources.image(img),x+12,y-58,width=box_w-24,height=40,preserveAspectRatio=True,mask="auto")
             page_no += 1
             return
         if document_profile.get("validate") == "ssiap1":
@@ -3289,7 +3442,7 @@ def generate_aps_planning_pdf(session_data, formateur, output_path, planning_dat
             c.setFillColor(colors.white); c.setStrokeColor(colors.HexColor("#d1d5db")); c.roundRect(x, y - signature_box_h, box_w, signature_box_h, 6, fill=1, stroke=1)
             c.setFillColor(colors.HexColor("#374151")); c.setFont("Helvetica-Bold", 9); c.drawString(x + 10, y - 16, label)
             if image_path:
-                c.drawImage(image_path, x + 12, y - signature_box_h + 8, width=box_w - 24, height=signature_box_h - signature_label_h - 10, preserveAspectRatio=True, mask="auto")
+                c.drawImage(pdf_resources.image(image_path), x + 12, y - signature_box_h + 8, width=box_w - 24, height=signature_box_h - signature_label_h - 10, preserveAspectRatio=True, mask="auto")
         y -= signature_box_h + 25
         c.setFont("Helvetica-Bold", 9); c.drawString(margin, y, "Informations légales")
         y -= 14
@@ -3327,16 +3480,25 @@ def generate_aps_planning_pdf(session_data, formateur, output_path, planning_dat
             calendar_month_count += 1; _cur = date(_cur.year + (1 if _cur.month==12 else 0), 1 if _cur.month==12 else _cur.month+1, 1)
     extra_calendar_pages = 1 if document_profile.get("validate") == "afc_aps_ssiap" and calendar_month_count else 0
     total_pages = len(pages) + compute_summary_page_count() + extra_calendar_pages
+    result = {"planning_data": planning_data, "totals": summary["uv_totals"], "total_hours": summary["total_hours"], "summary": summary}
+    if page_range is None and pdf_parallel.enabled(total_pages, workers):
+        # Chaque processus refait la même pagination et ne dessine que sa plage ;
+        # récapitulatif et calendrier restent dans la dernière plage.
+        render_kwargs = {"session_data": session_data, "formateur": formateur, "planning_data": planning_data, "planning_mode": planning_mode, "document_profile": source_profile, "edited_at": edited}
+        pdf_parallel.render(generate_aps_planning_pdf, render_kwargs, output_path, total_pages, splittable=len(pages), workers=workers)
+        return result
+    draw_tail = pdf_parallel.in_range(page_range, len(pages) + 1)
     draw_planning_pages(total_pages)
-    draw_summary_pages(total_pages)
-    if document_profile.get("validate") == "afc_aps_ssiap":
+    if draw_tail:
+        draw_summary_pages(total_pages)
+    if draw_tail and document_profile.get("validate") == "afc_aps_ssiap":
         c.showPage(); page_no += 1
         from reportlab.lib.pagesizes import landscape, A3
         import calendar
         c.setPageSize(landscape(A3)); lw, lh = landscape(A3)
         logo_path = find_center_image("logo")
         if logo_path:
-            c.drawImage(logo_path, 36, lh-58, width=72, height=34, preserveAspectRatio=True, mask="auto")
+            c.drawImage(pdf_resources.logo(logo_path), 36, lh-58, width=72, height=34, preserveAspectRatio=True, mask="auto")
         c.setFillColor(colors.HexColor("#111827")); c.setFont("Helvetica-Bold", 15)
         c.drawString(118, lh-35, "CALENDRIER RÉCAPITULATIF")
         c.setFont("Helvetica-Bold", 12); c.drawString(118, lh-52, "AFC France Travail APS + SSIAP")
@@ -3398,7 +3560,7 @@ def generate_aps_planning_pdf(session_data, formateur, output_path, planning_dat
             c.drawCentredString(lw/2, 18, "Intégrale Academy — calendrier récapitulatif AFC")
             c.drawRightString(lw-36, 18, f"Page {page_no - 1} / {total_pages}")
     c.save()
-    return {"planning_data": planning_data, "totals": summary["uv_totals"], "total_hours": summary["total_hours"], "summary": summary}
+    return result
 
 def _money(value):
     try:
@@ -3462,21 +3624,20 @@ def trainer_contract_intervention_location(session_data, interventions):
     return aps_trainer_contract_location_label(interventions)
 
 
-def aps_trainer_interventions(planning_data, trainer_name):
-    interventions = []
-    total_hours = 0.0
-    dates = set()
+def aps_trainer_interventions_by_trainer(planning_data):
+    """Interventions facturables de chaque formateur du planning, en un seul parcours."""
+    grouped = {}
     for day in planning_data or []:
         day_date = day.get("date") or ""
         for slot in day.get("slots", []):
             if not aps_is_contract_billable_slot(slot):
                 continue
-            if (slot.get("trainer") or "").strip() != trainer_name:
-                continue
+            trainer_name = (slot.get("trainer") or "").strip()
+            entry = grouped.setdefault(trainer_name, {"interventions": [], "totalHours": 0.0, "dates": set()})
             duration = round(float(slot.get("duration") or 0), 2)
-            total_hours = round(total_hours + duration, 2)
-            dates.add(day_date)
-            interventions.append({
+            entry["totalHours"] = round(entry["totalHours"] + duration, 2)
+            entry["dates"].add(day_date)
+            entry["interventions"].append({
                 "date": day_date,
                 "dateLabel": format_date(day_date),
                 "hours": duration,
@@ -3486,8 +3647,14 @@ def aps_trainer_interventions(planning_data, trainer_name):
                 "modality": "E-learning" if slot.get("modality") == "elearning" else "Présentiel",
                 "room": slot.get("room") or "—",
             })
-    calculated_days = round(total_hours / 7, 2) if total_hours else 0
-    return {"interventions": interventions, "totalHours": total_hours, "calendarDays": len(dates), "calculatedDays": calculated_days}
+    return {
+        trainer_name: {"interventions": entry["interventions"], "totalHours": entry["totalHours"], "calendarDays": len(entry["dates"]), "calculatedDays": round(entry["totalHours"] / 7, 2) if entry["totalHours"] else 0}
+        for trainer_name, entry in grouped.items()
+    }
+
+
+def aps_trainer_interventions(planning_data, trainer_name):
+    return aps_trainer_interventions_by_trainer(planning_data).get(trainer_name) or {"interventions": [], "totalHours": 0.0, "calendarDays": 0, "calculatedDays": 0}
 
 
 def generate_aps_trainer_contract_pdf(session_data, contract, output_path):
@@ -3560,7 +3727,7 @@ def generate_aps_trainer_contract_pdf(session_data, contract, output_path):
         page_width, page_height = document.pagesize
         canvas.saveState()
         if logo_path:
-            canvas.drawImage(logo_path, doc.leftMargin, page_height - 18 * mm, width=24 * mm, height=12 * mm, preserveAspectRatio=True, mask="auto")
+            canvas.drawImage(pdf_resources.logo(logo_path), doc.leftMargin, page_height - 18 * mm, width=24 * mm, height=12 * mm, preserveAspectRatio=True, mask="auto")
         canvas.setFillColor(colors.HexColor("#111827")); canvas.setFont("Helvetica-Bold", 9.5)
         canvas.drawString(doc.leftMargin + 29 * mm, page_height - 10 * mm, "CONTRAT D’INTERVENTION FORMATEUR")
         canvas.setFillColor(colors.HexColor("#6b7280")); canvas.setFont("Helvetica", 7.2)
@@ -3643,7 +3810,7 @@ def generate_aps_trainer_contract_pdf(session_data, contract, output_path):
 
     story = []
     if logo_path:
-        story.append(Image(logo_path, width=34 * mm, height=16 * mm, kind="proportional", hAlign="CENTER"))
+        story.append(pdf_resources.image_flowable(logo_path, width=34 * mm, height=16 * mm, kind="proportional", hAlign="CENTER", max_px=pdf_resources.PDF_LOGO_MAX_PX))
         story.append(Spacer(1, 3))
     story += [p("Contrat d’intervention formateur", "CoverTitle"), p("Contrat de prestation de services / sous-traitance pédagogique", "CoverSubtitle")]
     cover_cards = [
@@ -3735,7 +3902,7 @@ def generate_aps_trainer_contract_pdf(session_data, contract, output_path):
     def signature_zone(label, image_path=None, height_mm=31):
         content = [p(label, "SignLabel")]
         if image_path:
-            content.append(Image(image_path, width=42 * mm, height=(18 if "Signature" in label else 24) * mm, kind="proportional", hAlign="CENTER"))
+            content.append(pdf_resources.image_flowable(image_path, width=42 * mm, height=(18 if "Signature" in label else 24) * mm, kind="proportional", hAlign="CENTER"))
         else:
             content.append(p("<br/><br/>", "Body"))
         tbl = Table([[content]], colWidths=[75 * mm], rowHeights=[height_mm * mm])
@@ -3798,108 +3965,14 @@ def _period_label(slots, morning=True):
     return " / ".join(f"{_hhmm_to_fr(s.get('start'))} - {_hhmm_to_fr(s.get('end'))}" for s in selected)
 
 
-def _aps_normalize_student_name(value, uppercase=False):
-    cleaned = re.sub(r"[^A-Za-zÀ-ÿ' ,\-]", "", value or "")
-    cleaned = re.sub(r"\s+", " ", cleaned).strip(" ,\t;-')(")
-    if uppercase:
-        return cleaned.upper()
-    return cleaned
-
-
-def _aps_extract_phone_from_line(line):
-    phone_pattern = re.compile(r"(?<!\d)((?:\+33|0)\s*[1-9](?:[\s.\-]*\d{2}){4})(?!\d)")
-    match = phone_pattern.search(line)
-    if not match:
-        return "", line
-    phone = re.sub(r"\D+", "", match.group(1))
-    if phone.startswith("33") and len(phone) == 11:
-        phone = "0" + phone[2:]
-    if len(phone) == 10:
-        phone = " ".join([phone[:2], phone[2:4], phone[4:6], phone[6:8], phone[8:]])
-    remaining = (line[:match.start()] + " " + line[match.end():]).strip()
-    return phone, remaining
-
-
-def aps_extract_students_from_text(text):
-    students = []
-    seen = set()
-    email_pattern = re.compile(r"[A-Z0-9._%+\-]+@[A-Z0-9.\-]+\.[A-Z]{2,}", re.IGNORECASE)
-
-    for raw_line in (text or "").splitlines():
-        line = re.sub(r"\s+", " ", raw_line).strip(" -\t;")
-        if not line:
-            continue
-
-        numbered_match = re.match(r"^(\d{1,3})\s+(.+)$", line)
-        if not numbered_match:
-            continue
-
-        candidate = numbered_match.group(2).strip()
-        lowered = candidate.lower()
-        if any(fragment in lowered for fragment in (
-            "numéros trouvés", "numero trouves", "numéro trouvé", "# nom", "nom prénom",
-            "email téléphone", "liste stagiaires", "http://", "https://", "page "
-        )):
-            continue
-
-        email = ""
-        email_match = email_pattern.search(candidate)
-        if email_match:
-            email = email_match.group(0).strip()
-            candidate = (candidate[:email_match.start()] + " " + candidate[email_match.end():]).strip()
-
-        phone, candidate = _aps_extract_phone_from_line(candidate)
-        name_part = re.sub(r"\s+", " ", candidate).strip(" -\t;")
-        parts = name_part.split()
-        if len(parts) < 2:
-            continue
-
-        last_parts = []
-        for part in parts:
-            comparable = re.sub(r"[^A-Za-zÀ-ÿ]", "", part)
-            if comparable and comparable.upper() == comparable:
-                last_parts.append(part)
-            else:
-                break
-        if not last_parts or len(last_parts) >= len(parts):
-            continue
-
-        last = _aps_normalize_student_name(" ".join(last_parts), uppercase=True)
-        first = _aps_normalize_student_name(" ".join(parts[len(last_parts):]))
-        if not last or not first:
-            continue
-
-        student = {"lastName": last, "firstName": first}
-        if email:
-            student["email"] = email
-        if phone:
-            student["phone"] = phone
-        key = (last, first, email, phone)
-        if key not in seen:
-            seen.add(key)
-            students.append(student)
-    return students
+_aps_normalize_student_name = trainee_lists.normalize_name
+_aps_extract_phone_from_line = trainee_lists.extract_phone
+aps_extract_students_from_text = trainee_lists.students_from_text
 
 
 def aps_extract_students_from_pdf(file_storage):
-    suffix = os.path.splitext(file_storage.filename or "")[-1].lower()
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix or ".pdf") as tmp:
-        file_storage.save(tmp.name)
-        tmp_path = tmp.name
-    try:
-        try:
-            from pypdf import PdfReader
-        except ImportError as exc:
-            raise RuntimeError("La dépendance pypdf est requise pour lire le texte PDF.") from exc
-        reader = PdfReader(tmp_path)
-        text = "\n".join((page.extract_text() or "") for page in reader.pages)
-        return aps_extract_students_from_text(text), bool(text.strip())
-    finally:
-        try:
-            os.remove(tmp_path)
-        except OSError:
-            pass
-
+    """Stagiaires d'une liste importée (PDF, CSV ou XLSX), lue en mémoire sans fichier temporaire."""
+    return trainee_lists.students_from_upload(file_storage.filename, file_storage.stream)
 
 
 def attendance_header_layout(page_width, page_height, margin, string_width, title="FEUILLE DE PRÉSENCE", subtitle=None):
@@ -3927,7 +4000,7 @@ def desp_attendance_header_layout(page_width, page_height, margin, string_width)
     """Compatibility wrapper: DESP now uses the shared APS header layout."""
     return attendance_header_layout(page_width, page_height, margin, string_width, subtitle=DESP_LABEL)
 
-def generate_attendance_pdf_common(session_data, output_path, training_type=None, subtitle=None):
+def generate_attendance_pdf_common(session_data, output_path, training_type=None, subtitle=None, page_range=None, workers=None, fragment_dir=None):
     try:
         from reportlab.lib import colors
         from reportlab.lib.pagesizes import A4
@@ -3982,7 +4055,6 @@ def generate_attendance_pdf_common(session_data, output_path, training_type=None
         if desp_hours["presentiel"] != DESP_PRESENTIEL_HOURS:
             raise ValueError(f"Impossible de générer les feuilles de présence DESP : le planning présentiel contient {desp_hours['presentiel']:g}h alors que {DESP_PRESENTIEL_HOURS}h sont attendues.")
 
-    c = canvas.Canvas(output_path, pagesize=A4)
     width, height = A4
     margin = 10 * mm
     FOOTER_RESERVED_HEIGHT = 16 * mm
@@ -3996,6 +4068,34 @@ def generate_attendance_pdf_common(session_data, output_path, training_type=None
     raw_session_name = (session_data.get("display_name") or session_data.get("name") or "").strip()
     session_id = str(session_data.get("id") or "").strip()
     session_name = raw_session_name if raw_session_name and raw_session_name != f"Session {session_id}" else (session_id or raw_session_name or "—")
+    if page_range is None and fragment_dir:
+        # Pages en cache dans `fragment_dir`, une empreinte par page : seules
+        # les journées modifiées (créneaux, stagiaires présents) sont redessinées.
+        render_kwargs = {"session_data": session_data, "training_type": training_type, "subtitle": subtitle}
+        context = {
+            "renderer": pdf_fragments.code_fingerprint(generate_attendance_pdf_common),
+            "training_type": training_type, "subtitle": subtitle, "session": session_name, "total_pages": total_pages,
+            "session_fields": [session_data.get(key) for key in ("date_debut", "date_fin", "date_exam", "exam_room", "salle")],
+            "legal": [APS_LEGAL_LINES, SSIAP1_AGREMENT_LINE],
+            "logo": pdf_fragments.file_signature(logo_path), "stamp": pdf_fragments.file_signature(stamp_image),
+        }
+        page_keys = [pdf_fragments.page_key(context, page_number, "day", day, students_for_day(day.get("date"))) for page_number, day in enumerate(presentiel_days, 1)]
+        page_keys += [pdf_fragments.page_key(context, page_number, "exam", exam_day, students_for_day(exam_day.get("date")), students) for page_number, exam_day in enumerate(exam_days, len(page_keys) + 1)]
+        if include_summary_page:
+            page_keys.append(pdf_fragments.page_key(context, total_pages, "summary", presentiel_days, exam_days, students))
+
+        def render_range(run, path):
+            if pdf_parallel.enabled(run[1] - run[0], workers):
+                pdf_parallel.render(generate_attendance_pdf_common, render_kwargs, path, run[1] - run[0], workers=workers, first_page=run[0])
+            else:
+                generate_attendance_pdf_common(**render_kwargs, output_path=path, page_range=run)
+
+        return pdf_fragments.assemble(fragment_dir, page_keys, output_path, render_range)
+    if page_range is None and pdf_parallel.enabled(total_pages, workers):
+        # Une page par journée : chaque processus dessine sa plage de journées.
+        pdf_parallel.render(generate_attendance_pdf_common, {"session_data": session_data, "training_type": training_type, "subtitle": subtitle}, output_path, total_pages, workers=workers)
+        return
+    c = canvas.Canvas(output_path, pagesize=A4)
 
     def reset_graphics_state(fill=colors.black, stroke=colors.black, line_width=0.75):
         if hasattr(c, "setFillAlpha"):
@@ -4029,7 +4129,7 @@ def generate_attendance_pdf_common(session_data, output_path, training_type=None
         c.restoreState()
         reset_graphics_state(fill=colors.black, stroke=colors.black, line_width=0.75)
         if logo_path:
-            c.saveState(); c.drawImage(logo_path, margin, height - 72, width=91, height=55, preserveAspectRatio=True, mask="auto"); c.restoreState()
+            c.saveState(); c.drawImage(pdf_resources.logo(logo_path), margin, height - 72, width=91, height=55, preserveAspectRatio=True, mask="auto"); c.restoreState()
         reset_graphics_state(fill=colors.HexColor("#111827"), stroke=colors.black, line_width=0.75)
         c.setFont("Helvetica-Bold", 16 if exam else 17)
         c.drawCentredString(width / 2, height - 38, title)
@@ -4171,7 +4271,7 @@ def generate_attendance_pdf_common(session_data, output_path, training_type=None
         y-=bh+10; bw=(width-2*margin-gap)/2
         for i,lab in enumerate(["Observations éventuelles","Cachet du centre"]):
             x=margin+i*(bw+gap); reset_graphics_state(fill=colors.black, stroke=colors.black, line_width=0.75); c.rect(x,y-bh,bw,bh); c.setFont("Helvetica-Bold",8); c.drawString(x+8,y-14,lab)
-            if i==1 and stamp_image: c.drawImage(stamp_image,x+14,y-bh+10,width=bw-28,height=bh-22,preserveAspectRatio=True,anchor="c",mask="auto")
+            if i==1 and stamp_image: c.drawImage(pdf_resources.image(stamp_image),x+14,y-bh+10,width=bw-28,height=bh-22,preserveAspectRatio=True,anchor="c",mask="auto")
         bottom = y-bh
         if bottom < content_bottom_limit - 0.1:
             raise ValueError("Chevauchement détecté entre les cadres bas et la zone footer réservée.")
@@ -4194,6 +4294,9 @@ def generate_attendance_pdf_common(session_data, output_path, training_type=None
 
     page_no=1
     for day in presentiel_days:
+        if not pdf_parallel.in_range(page_range, page_no):
+            page_no+=1
+            continue
         slots=day.get("slots") or []; date_label=format_date(day.get("date"));
         if is_ssiap1 and all((slot.get("modality") or "") == "sst" for slot in slots):
             page_title = "FEUILLE DE PRÉSENCE — FORMATION SST"; page_subtitle = "Formation intégrée au parcours SSIAP 1"
@@ -4225,6 +4328,9 @@ def generate_attendance_pdf_common(session_data, output_path, training_type=None
         footer(page_no); c.showPage(); page_no+=1
 
     for exam_day in exam_days:
+        if not pdf_parallel.in_range(page_range, page_no):
+            page_no+=1
+            continue
         slots=exam_day.get("slots") or []; date_label=format_date(exam_day.get("date")); y=draw_header("FEUILLE DE PRÉSENCE - EXAMEN SSIAP 1", date_label, slots, page_no, exam=True)
         c.setFont("Helvetica-Bold",8.8); c.drawString(margin,y,"Épreuve(s) d’examen"); y-=12
         for slot in slots: y=draw_wrapped_text(c, f"{_hhmm_to_fr(slot.get('start'))} - {_hhmm_to_fr(slot.get('end'))} : {slot.get('title') or 'EXAMEN SSIAP 1'}", margin+8, y, width-2*margin-8, "Helvetica", 8.5, 10)
@@ -4233,9 +4339,9 @@ def generate_attendance_pdf_common(session_data, output_path, training_type=None
         if is_ssiap1 and len(students)<=6 and y-102>footer_top_y+10: y=draw_summary(y)
         footer(page_no); c.showPage(); page_no+=1
 
-    if include_summary_page:
+    if include_summary_page and pdf_parallel.in_range(page_range, page_no):
         y=height-70
-        if logo_path: c.drawImage(logo_path, margin, height - 72, width=91, height=55, preserveAspectRatio=True, mask="auto")
+        if logo_path: c.drawImage(pdf_resources.logo(logo_path), margin, height - 72, width=91, height=55, preserveAspectRatio=True, mask="auto")
         c.setFont("Helvetica-Bold",16)
         title_x = margin + 100 if logo_path else margin
         c.drawString(title_x, y, "Synthèse des feuilles de présence SSIAP 1" if is_ssiap1 else "Synthèse des feuilles de présence"); y-=28
@@ -4243,7 +4349,7 @@ def generate_attendance_pdf_common(session_data, output_path, training_type=None
     c.save()
 
 
-def generate_aps_attendance_pdf(session_data, output_path):
+def generate_aps_attendance_pdf(session_data, output_path, fragment_dir=None):
     if is_ssiap1_session(session_data):
         training_type = "SSIAP1"
         subtitle = "Service de Sécurité Incendie et d’Assistance à Personnes - Niveau 1"
@@ -4251,26 +4357,14 @@ def generate_aps_attendance_pdf(session_data, output_path):
         code = normalize_training_code(session_data)
         training_type = "AFC_APS_SSIAP" if code == "AFC_APS_SSIAP" else ("DESP" if (session_data.get("formation") or "").upper() in {"DESP", "DIRIGEANT"} else "APS")
         subtitle = AFC_APS_SSIAP_LABEL if training_type == "AFC_APS_SSIAP" else (DESP_LABEL if training_type == "DESP" else None)
-    return generate_attendance_pdf_common(session_data, output_path, training_type=training_type, subtitle=subtitle)
+    return generate_attendance_pdf_common(session_data, output_path, training_type=training_type, subtitle=subtitle, fragment_dir=fragment_dir)
 
 
 def send_email_with_attachments(to_email, subject, body, attachments):
-    smtp_config = get_smtp_config() if 'get_smtp_config' in globals() else {"server": SMTP_SERVER, "port": SMTP_PORT, "username": FROM_EMAIL, "password": EMAIL_PASSWORD, "from_email": FROM_EMAIL}
-    if not smtp_config.get("from_email") or not smtp_config.get("username") or not smtp_config.get("password"):
-        return False, "SMTP non configuré."
-    msg = MIMEMultipart(); msg["From"] = smtp_config["from_email"]; msg["To"] = to_email; msg["Subject"] = subject
-    msg.attach(MIMEText(body, "plain", "utf-8"))
-    for path, filename in attachments:
-        with open(path, "rb") as f:
-            part = MIMEApplication(f.read(), _subtype="pdf")
-        part.add_header("Content-Disposition", "attachment", filename=filename)
-        msg.attach(part)
-    try:
-        with smtplib.SMTP(smtp_config["server"], smtp_config["port"]) as server:
-            server.starttls(); server.login(smtp_config["username"], smtp_config["password"]); server.sendmail(smtp_config["from_email"], [to_email], msg.as_string())
+    result = send_outbound_email(to_email, subject, body, subtype="plain", attachments=attachments, category="attachments", queue_on_failure=False)
+    if result.ok:
         return True, "Email envoyé"
-    except Exception as exc:
-        return False, f"Erreur email: {exc}"
+    return False, email_delivery_error(result)
 
 # -----------------------
 # Convocation APS depuis modèle Word officiel
@@ -4467,6 +4561,28 @@ def set_planning_for_session(sid, filename):
     return True
 
 
+def aps_planning_refresh_filename(session_data, sid):
+    return f"planning_{'ssiap1' if is_ssiap1_session(session_data) else 'aps'}_session_{sid}.pdf"
+
+
+def aps_planning_refresh_options(session_data):
+    planning_data = session_data.get("apsPlanningData") or []
+    planning_mode = session_data.get("apsPlanningMode") or (
+        "ssiap1" if is_ssiap1_session(session_data) else
+        "elearning_presentiel"
+        if any(slot.get("modality") == "elearning" for day in planning_data for slot in day.get("slots", []))
+        else "full_presentiel"
+    )
+    # A plan edited in the APS editor may intentionally depart from
+    # the automatic e-learning/presentiel sequence.  It was already
+    # checked on save for real scheduling issues (times, overlaps,
+    # lunch break and known course content), so refreshing its PDF
+    # must use the same rescheduling validation rather than reject a
+    # deliberate manual modification with the generator rules.
+    document_profile = {"validate": "ssiap1"} if is_ssiap1_session(session_data) else {"validate": "rescheduling"}
+    return planning_mode, document_profile
+
+
 def refresh_aps_planning_pdf_file(session_data, sid):
     if (session_data.get("formation") or "").upper() != "APS" and not is_ssiap1_session(session_data):
         return session_data.get("planning_pdf")
@@ -4474,15 +4590,10 @@ def refresh_aps_planning_pdf_file(session_data, sid):
     if not planning_data:
         return session_data.get("planning_pdf")
 
-    filename = f"planning_{'ssiap1' if is_ssiap1_session(session_data) else 'aps'}_session_{sid}.pdf"
+    filename = aps_planning_refresh_filename(session_data, sid)
     output_path = os.path.join(PLANNING_DIR, filename)
     temp_path = f"{output_path}.tmp"
-    planning_mode = session_data.get("apsPlanningMode") or (
-        "ssiap1" if is_ssiap1_session(session_data) else
-        "elearning_presentiel"
-        if any(slot.get("modality") == "elearning" for day in planning_data for slot in day.get("slots", []))
-        else "full_presentiel"
-    )
+    planning_mode, document_profile = aps_planning_refresh_options(session_data)
     try:
         result = generate_aps_planning_pdf(
             session_data,
@@ -4490,17 +4601,7 @@ def refresh_aps_planning_pdf_file(session_data, sid):
             temp_path,
             planning_data=planning_data,
             planning_mode=planning_mode,
-            # A plan edited in the APS editor may intentionally depart from
-            # the automatic e-learning/presentiel sequence.  It was already
-            # checked on save for real scheduling issues (times, overlaps,
-            # lunch break and known course content), so refreshing its PDF
-            # must use the same rescheduling validation rather than reject a
-            # deliberate manual modification with the generator rules.
-            document_profile=(
-                {"validate": "ssiap1"}
-                if is_ssiap1_session(session_data)
-                else {"validate": "rescheduling"}
-            ),
+            document_profile=document_profile,
         )
         os.replace(temp_path, output_path)
         session_data["planning_pdf"] = filename
@@ -4545,6 +4646,21 @@ BREVO_SENDER_EMAIL = os.environ.get("BREVO_SENDER_EMAIL")
 BREVO_SENDER_NAME = os.environ.get("BREVO_SENDER_NAME")
 BREVO_API_KEY = os.environ.get("BREVO_API_KEY")
 BREVO_SMS_SENDER = os.environ.get("BREVO_SMS_SENDER")
+BREVO_API_BASE_URL = (os.environ.get("BREVO_API_BASE_URL") or "https://api.brevo.com").rstrip("/")
+MAIL_OUTBOX_DB = os.path.join(os.environ.get("PERSIST_DIR") or DATA_DIR, outbound_mail.OUTBOX_DB_NAME)
+INVOICE_NUMBERS_DB = os.path.join(os.environ.get("PERSIST_DIR") or DATA_DIR, invoice_numbers.INVOICE_NUMBERS_DB_NAME)
+# Transport imposé à tous les emails (`brevo` ou `smtp`) ; vide : les invitations et rappels
+# jury passent par Brevo quand il est configuré, tous les autres emails par SMTP.
+MAIL_TRANSPORT = (os.environ.get("MAIL_TRANSPORT") or "").strip().lower()
+MAIL_OUTBOX_POLL_SECONDS = int(os.environ.get("MAIL_OUTBOX_POLL_SECONDS", "60"))
+MAIL_OUTBOX_MAX_ATTEMPTS = int(os.environ.get("MAIL_OUTBOX_MAX_ATTEMPTS", str(outbound_mail.DEFAULT_MAX_ATTEMPTS)))
+SMTP_CONNECTION_POOL = outbound_mail.SmtpConnectionPool(
+    max_idle=int(os.environ.get("SMTP_POOL_MAX_IDLE", "2")),
+    idle_timeout=int(os.environ.get("SMTP_POOL_IDLE_SECONDS", "240")),
+)
+_mail_outbox_wakeup = threading.Event()
+_mail_outbox_worker_lock = threading.Lock()
+_mail_outbox_worker_pid = None
 
 # -----------------------
 # Utils persistance
@@ -4705,14 +4821,29 @@ def load_sessions():
     return {"sessions": [], "jurys": []}
 
 def save_sessions(data):
-    tmp_path = SESSIONS_FILE + ".tmp"
+    # un fichier temporaire par worker/thread : deux écritures simultanées ne
+    # doivent jamais s'entrelacer dans le même .tmp (JSON corrompu = sessions perdues)
+    tmp_path = f"{SESSIONS_FILE}.{os.getpid()}.{threading.get_ident()}.tmp"
     with open(tmp_path, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
         f.flush()
         os.fsync(f.fileno())
     os.replace(tmp_path, SESSIONS_FILE)
 
-def load_price_adaptator_data():
+def migrate_sessions_storage():
+    """Migrations ponctuelles de sessions.json, appliquées au démarrage si nécessaire."""
+    try:
+        data = load_sessions()
+        added = invoice_numbers.sync(INVOICE_NUMBERS_DB, afc_invoice_registered_numbers(data))
+        if added:
+            app.logger.info("Registre des numéros de facture : %s numéro(s) repris de sessions.json.", added)
+    except Exception:
+        app.logger.exception("Migration de sessions.json impossible")
+
+migrate_sessions_storage()
+
+def load_legacy_price_adaptator_data():
+    """Ancien stockage JSON, lu une seule fois pour la reprise dans `price_adaptator.db`."""
     if os.path.exists(PRICE_ADAPTATOR_FILE):
         try:
             with open(PRICE_ADAPTATOR_FILE, "r", encoding="utf-8") as f:
@@ -4725,10 +4856,6 @@ def load_price_adaptator_data():
             pass
     return {"prospects": [], "dates": {}}
 
-def save_price_adaptator_data(data):
-    with open(PRICE_ADAPTATOR_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-
 def normalize_price_adaptator_discount(value):
     try:
         parsed = float(value)
@@ -4756,6 +4883,72 @@ def normalize_price_adaptator_formation(value):
     return PRICE_ADAPTATOR_ALLOWED_FORMATIONS.get(cleaned)
 
 
+_price_adaptator_lock = threading.Lock()
+_price_adaptator_ready = set()
+
+
+def price_adaptator_index_columns(prospect, dates):
+    """Colonnes indexées d'un prospect : clés de déduplication (email, téléphone
+    normalisé, nom + prénom + formation), tri, recherche, envoi et date de relance."""
+    email = (prospect.get("email") or "").strip().lower()
+    phone = normalize_phone_number((prospect.get("telephone") or "").strip()) or ""
+    nom = normalize_price_adaptator_nom(prospect.get("nom")).lower()
+    prenom = normalize_price_adaptator_prenom(prospect.get("prenom")).lower()
+    formation = (prospect.get("formation") or "").strip()
+    try:
+        cpf = float(prospect.get("cpf") or 0)
+    except (TypeError, ValueError):
+        cpf = 0.0
+    pending = not (prospect.get("sent") or prospect.get("manual_sent"))
+    followup_date = get_price_adaptator_followup_date(dates, formation) if pending else None
+    return {
+        "email_key": email,
+        "phone_key": phone,
+        "name_key": f"{nom}|{prenom}|{formation}" if nom and prenom and formation else "",
+        "formation": formation,
+        "cpf": cpf,
+        "sort_name": f"{nom} {prenom}".strip(),
+        "search": "\n".join(value for value in (nom, prenom, email) if value),
+        "sent": int(bool(prospect.get("sent"))),
+        "followup_pending": int(pending),
+        "followup_due": followup_date.isoformat() if followup_date else None,
+    }
+
+
+def price_adaptator_db():
+    """Base des prospects ; l'ancien fichier JSON y est repris au premier accès."""
+    if PRICE_ADAPTATOR_DB in _price_adaptator_ready:
+        return PRICE_ADAPTATOR_DB
+    with _price_adaptator_lock:
+        if PRICE_ADAPTATOR_DB not in _price_adaptator_ready:
+            if not price_adaptator_store.is_migrated(PRICE_ADAPTATOR_DB):
+                legacy = load_legacy_price_adaptator_data()
+                dates = legacy.get("dates") or {}
+                entries = []
+                for prospect in legacy.get("prospects") or []:
+                    if isinstance(prospect, dict):
+                        prospect.setdefault("id", str(uuid.uuid4()))
+                        entries.append((prospect, price_adaptator_index_columns(prospect, dates)))
+                if price_adaptator_store.migrate(PRICE_ADAPTATOR_DB, entries, dates) and entries:
+                    logger.info("Price adaptator : %s prospects repris depuis %s", len(entries), PRICE_ADAPTATOR_FILE)
+            _price_adaptator_ready.add(PRICE_ADAPTATOR_DB)
+    return PRICE_ADAPTATOR_DB
+
+
+def add_price_adaptator_prospects(prospects):
+    """Ajoute des prospects en une transaction ; renvoie le numéro de révision."""
+    db_path = price_adaptator_db()
+    dates = price_adaptator_store.get_dates(db_path)
+    return price_adaptator_store.add_prospects(db_path, [(prospect, price_adaptator_index_columns(prospect, dates)) for prospect in prospects])
+
+
+def update_price_adaptator_prospect(prospect, dates=None):
+    """Enregistre un prospect modifié ; renvoie la révision, ou `None` s'il a été supprimé entre-temps."""
+    db_path = price_adaptator_db()
+    if dates is None:
+        dates = price_adaptator_store.get_dates(db_path)
+    return price_adaptator_store.update_prospect(db_path, prospect, price_adaptator_index_columns(prospect, dates))
+
 def normalize_price_adaptator_proposed_price(price_value):
     try:
         return max(float(price_value), 0.0)
@@ -4917,39 +5110,56 @@ def build_price_adaptator_message(prospect, dates, price_override=None):
         "date_text": date_text,
     }
 
+def attempt_price_adaptator_sends(prospects, dates, price_overrides=None):
+    """Envoie la proposition à plusieurs prospects ; les emails partent en un seul lot."""
+    price_overrides = price_overrides or [None] * len(prospects)
+    messages = [
+        build_price_adaptator_message(prospect, dates, price_override=price_override)
+        for prospect, price_override in zip(prospects, price_overrides)
+    ]
+    emails = [(prospect.get("email") or "").strip() for prospect in prospects]
+    email_outcomes = {}
+    with_email = [index for index, email in enumerate(emails) if email]
+    if with_email and not email_transport_configured():
+        email_outcomes = {index: (False, "SMTP non configuré") for index in with_email}
+    elif with_email:
+        batch = [build_price_adaptator_email(emails[index], messages[index]["subject"], messages[index]["html"]) for index in with_email]
+        # Pas de boîte d'envoi : la relance automatique rejoue elle-même les prospects non envoyés.
+        for index, result in zip(with_email, send_outbound_emails(batch, queue_on_failure=False)):
+            if not result.ok:
+                print("❌ Erreur envoi mail price adaptator :", result.error)
+            email_outcomes[index] = (result.ok, None if result.ok else result.error)
+
+    results = []
+    for index, prospect in enumerate(prospects):
+        email_sent, email_error = email_outcomes.get(index, (False, None))
+        sms_sent = False
+        sms_error = None
+        phone = (prospect.get("telephone") or "").strip()
+        if phone:
+            sms_sent, sms_error = send_price_adaptator_sms(phone, messages[index]["sms"])
+        results.append({
+            "email_sent": email_sent,
+            "sms_sent": sms_sent,
+            "email_error": email_error,
+            "sms_error": sms_error,
+            "price": messages[index]["price"],
+        })
+    return results
+
+
 def attempt_price_adaptator_send(prospect, dates, price_override=None):
-    message = build_price_adaptator_message(prospect, dates, price_override=price_override)
-    email_sent = False
-    email_error = None
-    sms_sent = False
-    sms_error = None
-    email = (prospect.get("email") or "").strip()
-    phone = (prospect.get("telephone") or "").strip()
-    if email:
-        email_sent, email_error = send_price_adaptator_email(email, message["subject"], message["html"])
-    if phone:
-        sms_sent, sms_error = send_price_adaptator_sms(phone, message["sms"])
-    return {
-        "email_sent": email_sent,
-        "sms_sent": sms_sent,
-        "email_error": email_error,
-        "sms_error": sms_error,
-        "price": message["price"],
-    }
+    return attempt_price_adaptator_sends([prospect], dates, [price_override])[0]
 
 def process_price_adaptator_followups():
-    data = load_price_adaptator_data()
-    today = datetime.now().date()
-    updated = False
-    for prospect in data.get("prospects", []):
-        if prospect.get("sent") or prospect.get("manual_sent"):
-            continue
-        followup_date = get_price_adaptator_followup_date(data.get("dates"), prospect.get("formation"))
-        if not followup_date or followup_date > today:
-            continue
-        price_override = prospect.get("proposed_price")
-        with app.app_context():
-            result = attempt_price_adaptator_send(prospect, data.get("dates"), price_override=price_override)
+    db_path = price_adaptator_db()
+    due = price_adaptator_store.due_prospects(db_path, datetime.now().date().isoformat())
+    if not due:
+        return
+    dates = price_adaptator_store.get_dates(db_path)
+    with app.app_context():
+        results = attempt_price_adaptator_sends(due, dates, [prospect.get("proposed_price") for prospect in due])
+    for prospect, result in zip(due, results):
         prospect["last_attempt_at"] = datetime.now().isoformat()
         prospect["last_error"] = result["email_error"] or result["sms_error"]
         prospect["proposed_price"] = result["price"]
@@ -4957,24 +5167,124 @@ def process_price_adaptator_followups():
             prospect["sent"] = True
             prospect["sentAt"] = datetime.now().isoformat()
             prospect["last_sent_price"] = result["price"]
-        updated = True
-    if updated:
-        save_price_adaptator_data(data)
+        update_price_adaptator_prospect(prospect, dates)
 
-def price_adaptator_scheduler_loop():
-    while True:
+SCHEDULER_DB = os.path.join(os.environ.get("PERSIST_DIR") or DATA_DIR, job_scheduler.SCHEDULER_DB_NAME)
+SCHEDULER_MAX_WORKERS = int(os.environ.get("SCHEDULER_MAX_WORKERS", str(job_scheduler.DEFAULT_MAX_WORKERS)))
+SCHEDULER_POLL_SECONDS = int(os.environ.get("SCHEDULER_POLL_SECONDS", str(job_scheduler.DEFAULT_POLL_SECONDS)))
+SCHEDULER_LEASE_SECONDS = int(os.environ.get("SCHEDULER_LEASE_SECONDS", str(job_scheduler.DEFAULT_LEASE_SECONDS)))
+# Adresse publique utilisée pour les liens des rappels jury quand la tâche n'est pas déclenchée par /cron-check.
+APP_BASE_URL = (os.environ.get("APP_BASE_URL") or "").rstrip("/")
+_job_scheduler_lock = threading.Lock()
+_job_scheduler_pid = None
+
+
+def scheduled_price_adaptator_followups(payload):
+    process_price_adaptator_followups()
+
+
+def scheduled_price_adaptator_imports(payload):
+    return run_pending_price_adaptator_imports()
+
+
+def scheduled_sessions_check(payload):
+    """Archivage automatique des sessions terminées et rappels jury."""
+    base_url = (payload.get("base_url") or APP_BASE_URL).rstrip("/")
+    with app.test_request_context("/", base_url=base_url or None):
+        data = load_sessions()
+        for session in data["sessions"]:
+            auto_archive_if_all_done(session)
+        if base_url:
+            reminded = send_jury_reminders(data, base_url)
+        else:
+            reminded = []
+            logger.warning("Rappels jury ignorés : APP_BASE_URL non configurée")
+        save_sessions(data)
+    return {"reminded": reminded}
+
+
+def scheduled_formateur_expiration_alerts(payload):
+    return {"alerts": send_formateur_expiration_alerts()}
+
+
+def scheduled_daily_overdue_summary(payload):
+    send_daily_overdue_summary()
+
+
+def scheduled_prospect_scan(payload):
+    return run_prospect_scan()
+
+
+SCHEDULED_JOBS = {
+    "price_adaptator_followups": scheduled_price_adaptator_followups,
+    "price_adaptator_imports": scheduled_price_adaptator_imports,
+    "sessions_check": scheduled_sessions_check,
+    "formateur_expiration_alerts": scheduled_formateur_expiration_alerts,
+    "daily_overdue_summary": scheduled_daily_overdue_summary,
+    "prospect_scan": scheduled_prospect_scan,
+}
+
+
+def scheduler_recurrences():
+    """Récurrences actives : relances price adaptator si l'envoi automatique est activé, et
+    `SCHEDULER_RECURRENCES="sessions_check=07:00,prospect_scan=6h"` pour le reste."""
+    recurrences = {}
+    if os.environ.get("ENABLE_PRICE_ADAPTATOR_AUTOSEND", "").lower() == "true":
+        recurrences["price_adaptator_followups"] = job_scheduler.Every(30 * 60)
+    for item in (os.environ.get("SCHEDULER_RECURRENCES") or "").split(","):
+        job, _, value = item.partition("=")
+        if not job.strip() or not value.strip():
+            continue
         try:
-            process_price_adaptator_followups()
-        except Exception as exc:
-            logging.exception("[price-adaptator] Scheduler error: %s", exc)
-        time.sleep(60 * 30)
+            recurrences[job.strip()] = job_scheduler.parse_recurrence(value)
+        except ValueError:
+            logger.warning("Récurrence du planificateur invalide ignorée : %s", item)
+    return recurrences
 
-def start_price_adaptator_scheduler():
-    if os.environ.get("ENABLE_PRICE_ADAPTATOR_AUTOSEND", "").lower() != "true":
-        return
+
+def _run_scheduled_job(func):
+    def run(payload):
+        with app.app_context():
+            return func(payload)
+    return run
+
+
+job_scheduler_instance = job_scheduler.Scheduler(
+    SCHEDULER_DB,
+    {name: _run_scheduled_job(func) for name, func in SCHEDULED_JOBS.items()},
+    scheduler_recurrences(),
+    max_workers=SCHEDULER_MAX_WORKERS,
+    lease_seconds=SCHEDULER_LEASE_SECONDS,
+    poll_seconds=SCHEDULER_POLL_SECONDS,
+)
+app.extensions["job_scheduler"] = job_scheduler_instance
+
+
+def start_job_scheduler():
+    """Démarre (une fois par processus gunicorn) la boucle du planificateur ; seul le détenteur du bail exécute les tâches."""
+    global _job_scheduler_pid
     if app.debug and os.environ.get("WERKZEUG_RUN_MAIN") != "true":
         return
-    thread = threading.Thread(target=price_adaptator_scheduler_loop, daemon=True)
+    with _job_scheduler_lock:
+        if _job_scheduler_pid == os.getpid():
+            return
+        _job_scheduler_pid = os.getpid()
+    thread = threading.Thread(target=job_scheduler_instance.loop, name="job-scheduler", daemon=True)
+    thread.start()
+
+
+def enqueue_scheduled_job(job, payload=None, source="cron"):
+    entry_id, created = job_scheduler_instance.enqueue(job, payload, source)
+    return {"job": job, "id": entry_id, "created": created}
+
+
+FRANCE_TRAVAIL_EXCEL_TEMPLATES = ("dsf.xlsx", "facture.xlsx", "tableau.xlsx")
+
+
+def start_excel_templates_warm_up():
+    """Analyse les modèles Excel France Travail en arrière-plan pour que le premier export ne paie pas le parsing."""
+    paths = [os.path.join(BASE_DIR, "static", "upload", name) for name in FRANCE_TRAVAIL_EXCEL_TEMPLATES]
+    thread = threading.Thread(target=xlsx_templates.warm_up, args=(paths,), name="xlsx-templates", daemon=True)
     thread.start()
 
 def ensure_jury_defaults(session):
@@ -5476,26 +5786,148 @@ def get_smtp_config():
         "from_email": FROM_EMAIL,
     }
 
-def send_daily_overdue_summary():
+
+def get_brevo_email_settings():
+    return outbound_mail.BrevoSettings(
+        api_key=BREVO_API_KEY or "",
+        sender_email=BREVO_SENDER_EMAIL or BREVO_FROM_EMAIL or FROM_EMAIL or "",
+        sender_name=BREVO_SENDER_NAME or "Intégrale Academy",
+        api_url=f"{BREVO_API_BASE_URL}/v3/smtp/email",
+    )
+
+
+def get_smtp_settings():
     smtp_config = get_smtp_config()
-    if not smtp_config["login"] or not smtp_config["password"]:
-        print("⚠️ EMAIL non configuré")
+    return outbound_mail.SmtpSettings(
+        server=smtp_config["server"],
+        port=smtp_config["port"],
+        login=smtp_config["login"] or "",
+        password=smtp_config["password"] or "",
+        from_email=smtp_config["from_email"] or "",
+    )
+
+
+def get_mailbox_smtp_settings():
+    """Compte SMTP de `FROM_EMAIL`, utilisé par les messages `mailbox` même quand un relais Brevo SMTP est configuré."""
+    return outbound_mail.SmtpSettings(
+        server=SMTP_SERVER,
+        port=SMTP_PORT,
+        login=FROM_EMAIL or "",
+        password=EMAIL_PASSWORD or "",
+        from_email=FROM_EMAIL or "",
+    )
+
+
+def email_transport_configured(transport=outbound_mail.TRANSPORT_SMTP):
+    if outbound_mail.uses_brevo(transport, get_brevo_email_settings(), MAIL_TRANSPORT):
+        return True
+    settings = get_mailbox_smtp_settings() if transport == outbound_mail.TRANSPORT_MAILBOX else get_smtp_settings()
+    return bool(settings.login and settings.password)
+
+
+def deliver_emails(messages):
+    """Envoie un lot d'`OutboundEmail` (API Brevo groupée pour les messages qui la demandent, pool SMTP sinon)
+    et renvoie un résultat par message."""
+    return outbound_mail.deliver(
+        messages,
+        get_smtp_settings(),
+        get_brevo_email_settings(),
+        SMTP_CONNECTION_POOL,
+        mail_transport=MAIL_TRANSPORT,
+        mailbox=get_mailbox_smtp_settings(),
+    )
+
+
+def send_outbound_emails(messages, queue_on_failure=True):
+    """Envoie un lot ; les échecs transitoires sont placés en boîte d'envoi si `queue_on_failure`.
+
+    Les appelants qui suivent eux-mêmes l'état d'envoi (relances prix, rappels
+    jury) passent `queue_on_failure=False` pour ne pas doubler les relances.
+    """
+    results = deliver_emails(messages)
+    for message, result in zip(messages, results):
+        if result.ok:
+            continue
+        logger.warning("MAIL SEND FAILED category=%s to=%s transport=%s error=%s", message.category, ", ".join(message.to), result.transport, result.error)
+        if queue_on_failure and result.retryable:
+            result.outbox_id = outbound_mail.enqueue(MAIL_OUTBOX_DB, message, attempts=1, error=result.error)
+            result.queued = True
+    return results
+
+
+def send_outbound_email(to, subject, body, subtype="html", cc=None, attachments=None, category="", queue_on_failure=True, transport=outbound_mail.TRANSPORT_SMTP):
+    message = outbound_mail.OutboundEmail(
+        to=[to] if isinstance(to, str) else list(to),
+        subject=subject,
+        body=body,
+        subtype=subtype,
+        cc=list(cc or []),
+        attachments=list(attachments or []),
+        category=category,
+        transport=transport,
+    )
+    return send_outbound_emails([message], queue_on_failure=queue_on_failure)[0]
+
+
+def process_mail_outbox(limit=50):
+    """Renvoie en un lot les messages échus de la boîte d'envoi. Renvoie le nombre de messages réservés."""
+    entries = outbound_mail.claim_due(MAIL_OUTBOX_DB, limit=limit)
+    if not entries:
+        return 0
+    results = deliver_emails([entry["message"] for entry in entries])
+    for entry, result in zip(entries, results):
+        if result.ok:
+            outbound_mail.mark_sent(MAIL_OUTBOX_DB, entry["id"], result.transport)
+            continue
+        status = outbound_mail.mark_failed(MAIL_OUTBOX_DB, entry["id"], entry["attempts"], result.error, MAIL_OUTBOX_MAX_ATTEMPTS, result.retryable)
+        log = logger.error if status == outbound_mail.STATUS_FAILED else logger.warning
+        log("MAIL OUTBOX SEND FAILED id=%s category=%s attempts=%s status=%s error=%s", entry["id"], entry["category"], entry["attempts"], status, result.error)
+    return len(entries)
+
+
+def mail_outbox_worker_loop():
+    # Vide d'abord la boîte d'envoi au démarrage : les messages mis en file avant un
+    # redémarrage n'attendent pas le prochain envoi.
+    while True:
+        try:
+            while process_mail_outbox():
+                pass
+        except Exception as exc:
+            logging.exception("[mail-outbox] Worker error: %s", exc)
+        _mail_outbox_wakeup.wait(MAIL_OUTBOX_POLL_SECONDS)
+        _mail_outbox_wakeup.clear()
+
+
+def start_mail_outbox_worker():
+    """Démarre (une fois par processus gunicorn) le thread qui vide la boîte d'envoi."""
+    global _mail_outbox_worker_pid
+    with _mail_outbox_worker_lock:
+        if _mail_outbox_worker_pid == os.getpid():
+            return
+        _mail_outbox_worker_pid = os.getpid()
+    thread = threading.Thread(target=mail_outbox_worker_loop, name="mail-outbox", daemon=True)
+    thread.start()
+
+
+def send_daily_overdue_summary():
+    if not email_transport_configured():
+        print("⚠️ EMAIL non configuré")
         return
     data = load_sessions()
     sessions = data["sessions"]
     html = generate_daily_overdue_email(sessions)
-    msg = MIMEText(html, "html", _charset="utf-8")
-    msg["Subject"] = "⚠️ Récapitulatif des retards — Intégrale Academy"
-    msg["From"] = smtp_config["from_email"]
-    msg["To"] = "clement@integraleacademy.com"
-    try:
-        with smtplib.SMTP(smtp_config["server"], smtp_config["port"]) as server:
-            server.starttls()
-            server.login(smtp_config["login"], smtp_config["password"])
-            server.sendmail(smtp_config["from_email"], ["clement@integraleacademy.com"], msg.as_string())
+    result = send_outbound_email(
+        "clement@integraleacademy.com",
+        "⚠️ Récapitulatif des retards — Intégrale Academy",
+        html,
+        category="daily-overdue",
+    )
+    if result.ok:
         print("✅ Mail quotidien envoyé avec succès")
-    except Exception as e:
-        print("❌ Erreur envoi mail quotidien :", e)
+    elif result.queued:
+        print("⏳ Mail quotidien en boîte d'envoi :", result.error)
+    else:
+        print("❌ Erreur envoi mail quotidien :", result.error)
 
 
 def _list_formateur_expired_documents(formateurs):
@@ -5532,8 +5964,7 @@ def _list_formateur_expired_documents(formateurs):
 
 
 def send_formateur_expiration_alerts():
-    smtp_config = get_smtp_config()
-    if not smtp_config["login"] or not smtp_config["password"]:
+    if not email_transport_configured():
         print("⚠️ SMTP non configuré pour les alertes formateurs")
         return 0
 
@@ -5559,31 +5990,25 @@ def send_formateur_expiration_alerts():
     </div>
     """
 
-    msg = MIMEText(html, "html", _charset="utf-8")
-    msg["Subject"] = "⚠️ Alerte expiration documents formateurs"
-    msg["From"] = smtp_config["from_email"]
-    msg["To"] = "clement@integraleacademy.com"
-
-    try:
-        with smtplib.SMTP(smtp_config["server"], smtp_config["port"]) as server:
-            server.starttls()
-            server.login(smtp_config["login"], smtp_config["password"])
-            server.sendmail(
-                smtp_config["from_email"],
-                ["clement@integraleacademy.com"],
-                msg.as_string(),
-            )
+    result = send_outbound_email(
+        "clement@integraleacademy.com",
+        "⚠️ Alerte expiration documents formateurs",
+        html,
+        category="formateur-expiration",
+    )
+    # Un message en boîte d'envoi sera renvoyé : l'alerte est considérée comme
+    # partie pour ne pas la dupliquer au prochain passage du cron.
+    if not result.ok and not result.queued:
+        print("❌ Erreur envoi alertes expiration formateurs :", result.error)
+        return 0
 
-        for item in expired_docs:
-            item["doc"]["expiration_alert_sent_for"] = item["expiration"]
-            item["doc"]["expiration_alert_sent_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        save_formateurs(formateurs)
+    for item in expired_docs:
+        item["doc"]["expiration_alert_sent_for"] = item["expiration"]
+        item["doc"]["expiration_alert_sent_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    save_formateurs(formateurs)
 
-        print(f"✅ Alertes expiration formateurs envoyées ({len(expired_docs)} document(s))")
-        return len(expired_docs)
-    except Exception as e:
-        print("❌ Erreur envoi alertes expiration formateurs :", e)
-        return 0
+    print(f"✅ Alertes expiration formateurs envoyées ({len(expired_docs)} document(s))")
+    return len(expired_docs)
 
 
 def build_jury_invitation_html(session, jury, yes_url, no_url):
@@ -5615,68 +6040,30 @@ def build_jury_invitation_html(session, jury, yes_url, no_url):
     """
 
 
+def email_delivery_error(result):
+    if not result.transport:
+        return result.error
+    return f"Erreur email: {result.error}"
+
+
 def send_jury_invitation_email(session, jury, yes_url, no_url):
     to_email = jury.get("email", "").strip()
     if not to_email:
         print("[jury email] Email jury manquant")
         return False, "Email jury manquant"
-    html = build_jury_invitation_html(session, jury, yes_url, no_url)
-    if BREVO_API_KEY and (BREVO_SENDER_EMAIL or BREVO_FROM_EMAIL or FROM_EMAIL):
-        print("[jury email] Envoi via Brevo API")
-        sender_email = BREVO_SENDER_EMAIL or BREVO_FROM_EMAIL or FROM_EMAIL
-        sender_name = BREVO_SENDER_NAME or "Intégrale Academy"
-        payload = json.dumps({
-            "sender": {"email": sender_email, "name": sender_name},
-            "to": [{"email": to_email}],
-            "subject": f"Invitation jury — Session {session.get('formation', 'Formation')}",
-            "htmlContent": html,
-        }).encode("utf-8")
-        request_obj = urllib.request.Request("https://api.brevo.com/v3/smtp/email")
-        request_obj.add_header("Content-Type", "application/json")
-        request_obj.add_header("api-key", BREVO_API_KEY)
-        try:
-            with urllib.request.urlopen(request_obj, data=payload, timeout=10) as response:
-                if 200 <= response.status < 300:
-                    print("[jury email] Brevo API OK", response.status)
-                    return True, "Email envoyé"
-                body = response.read().decode("utf-8")
-                print("[jury email] Brevo API erreur", response.status, body)
-                return False, f"Erreur email: {response.status} {body}"
-        except Exception as e:
-            print("[jury email] Brevo API exception", e)
-            return False, f"Erreur email: {e}"
-    if BREVO_API_KEY and not (BREVO_SENDER_EMAIL or BREVO_FROM_EMAIL or FROM_EMAIL):
-        print("[jury email] Brevo API configurée mais expéditeur manquant")
-
-    smtp_config = get_smtp_config()
-    if not smtp_config["login"] or not smtp_config["password"]:
-        print("[jury email] SMTP non configuré", {
-            "server": smtp_config["server"],
-            "login_set": bool(smtp_config["login"]),
-            "password_set": bool(smtp_config["password"]),
-            "from_set": bool(smtp_config["from_email"]),
-        })
-        return False, "EMAIL non configuré"
-    msg = MIMEText(html, "html", _charset="utf-8")
-    msg["Subject"] = f"Invitation jury — Session {session.get('formation', 'Formation')}"
-    msg["From"] = smtp_config["from_email"]
-    msg["To"] = to_email
-    try:
-        print("[jury email] Envoi via SMTP", {
-            "server": smtp_config["server"],
-            "port": smtp_config["port"],
-            "from": smtp_config["from_email"],
-            "to": to_email,
-        })
-        with smtplib.SMTP(smtp_config["server"], smtp_config["port"]) as server:
-            server.starttls()
-            server.login(smtp_config["login"], smtp_config["password"])
-            server.sendmail(smtp_config["from_email"], [to_email], msg.as_string())
-        print("[jury email] SMTP OK")
+    result = send_outbound_email(
+        to_email,
+        f"Invitation jury — Session {session.get('formation', 'Formation')}",
+        build_jury_invitation_html(session, jury, yes_url, no_url),
+        category="jury-invitation",
+        queue_on_failure=False,
+        transport=outbound_mail.TRANSPORT_BREVO,
+    )
+    if result.ok:
+        print("[jury email] Envoi OK", result.transport)
         return True, "Email envoyé"
-    except Exception as e:
-        print("[jury email] SMTP exception", e)
-        return False, f"Erreur email: {e}"
+    print("[jury email] Erreur", result.transport or "-", result.error)
+    return False, email_delivery_error(result)
 
 
 def send_jury_sms(session, jury, yes_url, no_url):
@@ -5709,7 +6096,7 @@ def send_jury_sms(session, jury, yes_url, no_url):
             "content": message,
             "type": "transactional",
         }).encode("utf-8")
-        request_obj = urllib.request.Request("https://api.brevo.com/v3/transactionalSMS/sms")
+        request_obj = urllib.request.Request(f"{BREVO_API_BASE_URL}/v3/transactionalSMS/sms")
         request_obj.add_header("Content-Type", "application/json")
         request_obj.add_header("api-key", BREVO_API_KEY)
         try:
@@ -5779,68 +6166,30 @@ def build_jury_reminder_html(session, jury, yes_url, no_url):
     </div>
     """
 
+def build_jury_reminder_email(session, jury, yes_url, no_url):
+    return outbound_mail.OutboundEmail(
+        to=[jury.get("email", "").strip()],
+        subject=f"Rappel jury — Session {session.get('formation', 'Formation')}",
+        body=build_jury_reminder_html(session, jury, yes_url, no_url),
+        category="jury-reminder",
+        transport=outbound_mail.TRANSPORT_BREVO,
+    )
+
+
+def jury_reminder_email_outcome(result):
+    if result.ok:
+        print("[jury reminder email] Envoi OK", result.transport)
+        return True, "Email rappel envoyé"
+    print("[jury reminder email] Erreur", result.transport or "-", result.error)
+    return False, email_delivery_error(result)
+
+
 def send_jury_reminder_email(session, jury, yes_url, no_url):
-    to_email = jury.get("email", "").strip()
-    if not to_email:
+    if not jury.get("email", "").strip():
         print("[jury reminder email] Email jury manquant")
         return False, "Email jury manquant"
-    html = build_jury_reminder_html(session, jury, yes_url, no_url)
-    if BREVO_API_KEY and (BREVO_SENDER_EMAIL or BREVO_FROM_EMAIL or FROM_EMAIL):
-        print("[jury reminder email] Envoi via Brevo API")
-        sender_email = BREVO_SENDER_EMAIL or BREVO_FROM_EMAIL or FROM_EMAIL
-        sender_name = BREVO_SENDER_NAME or "Intégrale Academy"
-        payload = json.dumps({
-            "sender": {"email": sender_email, "name": sender_name},
-            "to": [{"email": to_email}],
-            "subject": f"Rappel jury — Session {session.get('formation', 'Formation')}",
-            "htmlContent": html,
-        }).encode("utf-8")
-        request_obj = urllib.request.Request("https://api.brevo.com/v3/smtp/email")
-        request_obj.add_header("Content-Type", "application/json")
-        request_obj.add_header("api-key", BREVO_API_KEY)
-        try:
-            with urllib.request.urlopen(request_obj, data=payload, timeout=10) as response:
-                if 200 <= response.status < 300:
-                    print("[jury reminder email] Brevo API OK", response.status)
-                    return True, "Email rappel envoyé"
-                body = response.read().decode("utf-8")
-                print("[jury reminder email] Brevo API erreur", response.status, body)
-                return False, f"Erreur email: {response.status} {body}"
-        except Exception as e:
-            print("[jury reminder email] Brevo API exception", e)
-            return False, f"Erreur email: {e}"
-    if BREVO_API_KEY and not (BREVO_SENDER_EMAIL or BREVO_FROM_EMAIL or FROM_EMAIL):
-        print("[jury reminder email] Brevo API configurée mais expéditeur manquant")
-
-    smtp_config = get_smtp_config()
-    if not smtp_config["login"] or not smtp_config["password"]:
-        print("[jury reminder email] SMTP non configuré", {
-            "server": smtp_config["server"],
-            "login_set": bool(smtp_config["login"]),
-            "password_set": bool(smtp_config["password"]),
-            "from_set": bool(smtp_config["from_email"]),
-        })
-        return False, "EMAIL non configuré"
-    msg = MIMEText(html, "html", _charset="utf-8")
-    msg["Subject"] = f"Rappel jury — Session {session.get('formation', 'Formation')}"
-    msg["From"] = smtp_config["from_email"]
-    msg["To"] = to_email
-    try:
-        print("[jury reminder email] Envoi via SMTP", {
-            "server": smtp_config["server"],
-            "port": smtp_config["port"],
-            "from": smtp_config["from_email"],
-            "to": to_email,
-        })
-        with smtplib.SMTP(smtp_config["server"], smtp_config["port"]) as server:
-            server.starttls()
-            server.login(smtp_config["login"], smtp_config["password"])
-            server.sendmail(smtp_config["from_email"], [to_email], msg.as_string())
-        print("[jury reminder email] SMTP OK")
-        return True, "Email rappel envoyé"
-    except Exception as e:
-        print("[jury reminder email] SMTP exception", e)
-        return False, f"Erreur email: {e}"
+    message = build_jury_reminder_email(session, jury, yes_url, no_url)
+    return jury_reminder_email_outcome(send_outbound_emails([message], queue_on_failure=False)[0])
 
 def send_jury_reminder_sms(session, jury, yes_url, no_url):
     to_number = jury.get("telephone", "").strip()
@@ -5866,7 +6215,7 @@ def send_jury_reminder_sms(session, jury, yes_url, no_url):
             "content": message,
             "type": "transactional",
         }).encode("utf-8")
-        request_obj = urllib.request.Request("https://api.brevo.com/v3/transactionalSMS/sms")
+        request_obj = urllib.request.Request(f"{BREVO_API_BASE_URL}/v3/transactionalSMS/sms")
         request_obj.add_header("Content-Type", "application/json")
         request_obj.add_header("api-key", BREVO_API_KEY)
         try:
@@ -5918,6 +6267,7 @@ def send_jury_reminder_sms(session, jury, yes_url, no_url):
 def send_jury_reminders(data, base_url):
     today = datetime.now().date()
     reminded = []
+    pending = []
     for session in data.get("sessions", []):
         if session.get("archived"):
             continue
@@ -5936,11 +6286,19 @@ def send_jury_reminders(data, base_url):
             jury["token"] = token
             yes_url = f"{base_url}{url_for('jury_response', sid=session['id'], jid=jury['id'], response='present')}?token={token}"
             no_url = f"{base_url}{url_for('jury_response', sid=session['id'], jid=jury['id'], response='absent')}?token={token}"
-            email_ok, _ = send_jury_reminder_email(session, jury, yes_url, no_url)
-            sms_ok, _ = send_jury_reminder_sms(session, jury, yes_url, no_url)
-            if email_ok or sms_ok:
-                jury["reminded_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                reminded.append(f"{jury.get('prenom','')} {jury.get('nom','')}")
+            pending.append((session, jury, yes_url, no_url))
+
+    # Tous les rappels du jour partent en un seul lot (un appel Brevo ou une connexion SMTP).
+    with_email = [item for item in pending if item[1].get("email", "").strip()]
+    results = send_outbound_emails([build_jury_reminder_email(*item) for item in with_email], queue_on_failure=False)
+    email_results = {id(item[1]): result for item, result in zip(with_email, results)}
+    for session, jury, yes_url, no_url in pending:
+        result = email_results.get(id(jury))
+        email_ok = jury_reminder_email_outcome(result)[0] if result else False
+        sms_ok, _ = send_jury_reminder_sms(session, jury, yes_url, no_url)
+        if email_ok or sms_ok:
+            jury["reminded_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            reminded.append(f"{jury.get('prenom','')} {jury.get('nom','')}")
     return reminded
 
 # ------------------------------------------------------------
@@ -6119,8 +6477,20 @@ def price_adaptator():
 
 @app.route("/price-adaptator/data")
 def price_adaptator_data():
-    data = load_price_adaptator_data()
-    return {"prospects": data.get("prospects", []), "dates": data.get("dates", {})}
+    db_path = price_adaptator_db()
+    return {"dates": price_adaptator_store.get_dates(db_path), "revision": price_adaptator_store.current_revision(db_path)}
+
+
+@app.route("/price-adaptator/prospects")
+def price_adaptator_list_prospects():
+    result = price_adaptator_store.list_prospects(
+        price_adaptator_db(),
+        formation=(request.args.get("formation") or "").strip(),
+        search=request.args.get("q") or "",
+        page=request.args.get("page", 1, type=int),
+        per_page=request.args.get("per_page", 50, type=int),
+    )
+    return {"ok": True, **result}
 
 
 @app.route("/price-adaptator/prospects", methods=["POST"])
@@ -6143,7 +6513,6 @@ def price_adaptator_add_prospect():
     except (TypeError, ValueError):
         return {"ok": False, "error": "Montant CPF invalide"}, 400
 
-    data = load_price_adaptator_data()
     prospect = {
         "id": str(uuid.uuid4()),
         "nom": nom,
@@ -6159,29 +6528,172 @@ def price_adaptator_add_prospect():
         "last_attempt_at": None,
         "created_at": datetime.now().isoformat(),
     }
-    data["prospects"].insert(0, prospect)
-    save_price_adaptator_data(data)
-    return {"ok": True, "prospects": data["prospects"]}
+    revision = add_price_adaptator_prospects([prospect])
+    return {"ok": True, "prospect": prospect, "revision": revision}
 
 
 @app.route("/price-adaptator/prospects/<prospect_id>", methods=["DELETE"])
 def price_adaptator_delete_prospect(prospect_id):
-    data = load_price_adaptator_data()
-    prospects = data.get("prospects", [])
-    updated = [prospect for prospect in prospects if prospect.get("id") != prospect_id]
-    if len(updated) == len(prospects):
+    revision = price_adaptator_store.delete_prospect(price_adaptator_db(), prospect_id)
+    if revision is None:
         return {"ok": False, "error": "Prospect introuvable"}, 404
-    data["prospects"] = updated
-    save_price_adaptator_data(data)
-    return {"ok": True, "prospects": data["prospects"]}
+    return {"ok": True, "deleted": prospect_id, "revision": revision}
 
 
 @app.route("/price-adaptator/prospects", methods=["DELETE"])
 def price_adaptator_clear_prospects():
-    data = load_price_adaptator_data()
-    data["prospects"] = []
-    save_price_adaptator_data(data)
-    return {"ok": True, "prospects": data["prospects"]}
+    return {"ok": True, "revision": price_adaptator_store.clear_prospects(price_adaptator_db())}
+
+
+def normalize_price_adaptator_import_phone(raw_value):
+    if raw_value is None:
+        return ""
+    value = str(raw_value).strip()
+    if not value:
+        return ""
+    if value.startswith("+") or value.startswith("00") or value.startswith("0"):
+        return value
+    return f"0{value}"
+
+
+def parse_price_adaptator_import_row(idx, row):
+    """Valide une ligne (formation, nom, prénom, CPF, email, téléphone) du fichier importé.
+
+    Renvoie `(prospect, issue, message)` ; `prospect` vaut `None` pour une ligne
+    vide, en erreur ou ignorée.
+    """
+    values = list(row[:6]) if row else []
+    values += [None] * (6 - len(values))
+    formation_raw, nom, prenom, cpf, email, telephone = values
+    if not any([formation_raw, nom, prenom, cpf, email, telephone]):
+        return None, None, ""
+
+    formation = normalize_price_adaptator_formation(formation_raw)
+    if not formation:
+        return None, price_adaptator_store.LINE_ERROR, f"Ligne {idx}: formation invalide"
+
+    nom_value = normalize_price_adaptator_nom(nom)
+    prenom_value = normalize_price_adaptator_prenom(prenom)
+    if not nom_value or not prenom_value:
+        return None, price_adaptator_store.LINE_ERROR, f"Ligne {idx}: nom/prénom manquants"
+
+    if cpf is None or (isinstance(cpf, str) and not cpf.strip()):
+        cpf_value = 0.0
+    else:
+        try:
+            cpf_value = float(cpf)
+            if cpf_value < 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            return None, price_adaptator_store.LINE_ERROR, f"Ligne {idx}: montant CPF invalide"
+    formation_price = PRICE_ADAPTATOR_FORMATION_PRICES.get(formation)
+    if formation_price is not None and cpf_value > formation_price:
+        return None, price_adaptator_store.LINE_SKIPPED, f"Ligne {idx}: montant CPF supérieur au montant de la formation"
+
+    prospect = {
+        "id": str(uuid.uuid4()),
+        "nom": nom_value,
+        "prenom": prenom_value,
+        "cpf": cpf_value,
+        "email": str(email).strip() if email is not None else "",
+        "telephone": normalize_price_adaptator_import_phone(telephone),
+        "formation": formation,
+        "sent": False,
+        "sentAt": None,
+        "proposed_price": None,
+        "last_error": None,
+        "last_attempt_at": None,
+        "created_at": datetime.now().isoformat(),
+    }
+    return prospect, price_adaptator_store.LINE_ADDED, f"Ligne {idx}: {prenom_value} {nom_value} ({formation})"
+
+
+def run_price_adaptator_import(job_id, path, chunk_rows=None):
+    """Importe le fichier Excel d'un job en lecture seule, ligne à ligne, par lots.
+
+    Chaque lot (prospects ajoutés, résultat des lignes, avancement) est
+    enregistré dans une seule transaction : un gros fichier ne tient jamais
+    entièrement en mémoire et l'import peut être suivi pendant qu'il tourne.
+    """
+    chunk_rows = max(int(chunk_rows or PRICE_ADAPTATOR_IMPORT_CHUNK_ROWS), 1)
+    connection = price_adaptator_store.connect(price_adaptator_db())
+    workbook = None
+    try:
+        from openpyxl import load_workbook
+
+        price_adaptator_store.start_job(connection, job_id)
+        dates = price_adaptator_store.get_dates(PRICE_ADAPTATOR_DB)
+        workbook = load_workbook(filename=path, read_only=True, data_only=True)
+        pending_keys = set()
+        chunk, lines = [], []
+        processed = 0
+
+        def commit():
+            price_adaptator_store.record_chunk(connection, job_id, processed, lines, chunk)
+            chunk.clear()
+            lines.clear()
+            pending_keys.clear()
+
+        for idx, row in enumerate(workbook.active.iter_rows(values_only=True), start=1):
+            processed = idx
+            prospect, outcome, message = parse_price_adaptator_import_row(idx, row)
+            if prospect:
+                columns = price_adaptator_index_columns(prospect, dates)
+                keys = {(column, columns[column]) for column in price_adaptator_store.DEDUP_COLUMNS if columns[column]}
+                if pending_keys.intersection(keys) or price_adaptator_store.find_duplicate(connection, columns):
+                    prospect, outcome, message = None, price_adaptator_store.LINE_SKIPPED, f"Ligne {idx}: prospect déjà existant"
+                else:
+                    pending_keys.update(keys)
+                    chunk.append((prospect, columns))
+            if outcome:
+                lines.append((idx, outcome, message, prospect["id"] if prospect else ""))
+            if idx % chunk_rows == 0:
+                commit()
+        commit()
+        price_adaptator_store.finish_job(connection, job_id)
+    except Exception as exc:
+        logger.exception("Price adaptator : import %s interrompu", job_id)
+        price_adaptator_store.finish_job(connection, job_id, str(exc) or exc.__class__.__name__)
+    finally:
+        if workbook is not None:
+            workbook.close()
+        connection.close()
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def price_adaptator_import_path(job_id):
+    return os.path.join(PRICE_ADAPTATOR_IMPORT_DIR, f"{job_id}.xlsx")
+
+
+def run_pending_price_adaptator_imports():
+    """Exécute les imports en attente, un à la fois, dans l'ordre d'envoi.
+
+    Tâche `price_adaptator_imports` du planificateur, qui ne l'exécute jamais
+    deux fois en parallèle et la relance si le worker qui la portait s'arrête.
+    Un import encore « en cours » à son démarrage a donc été interrompu : il
+    passe en échec et son fichier est supprimé.
+    """
+    db_path = price_adaptator_db()
+    interrupted = price_adaptator_store.fail_interrupted_jobs(db_path, "Import interrompu par l'arrêt du serveur, fichier à renvoyer")
+    for job_id in interrupted:
+        logger.warning("Price adaptator : import %s interrompu, passé en échec", job_id)
+        try:
+            os.remove(price_adaptator_import_path(job_id))
+        except OSError:
+            pass
+    imported = []
+    # un fichier envoyé pendant l'exécution est traité dans la même tâche
+    while True:
+        jobs = price_adaptator_store.pending_jobs(db_path)
+        if not jobs:
+            break
+        for job in jobs:
+            run_price_adaptator_import(job["id"], price_adaptator_import_path(job["id"]))
+            imported.append(job["id"])
+    return {"interrupted": interrupted, "imported": imported}
 
 
 @app.route("/price-adaptator/import", methods=["POST"])
@@ -6195,137 +6707,43 @@ def price_adaptator_import():
     except ImportError:
         return {"ok": False, "error": "La bibliothèque openpyxl est manquante"}, 500
 
+    os.makedirs(PRICE_ADAPTATOR_IMPORT_DIR, exist_ok=True)
+    job_id = uuid.uuid4().hex
+    path = price_adaptator_import_path(job_id)
+    upload.save(path)
     try:
-        workbook = load_workbook(filename=BytesIO(upload.read()), data_only=True)
+        workbook = load_workbook(filename=path, read_only=True, data_only=True)
+        total_rows = workbook.active.max_row
+        workbook.close()
     except Exception:
+        os.remove(path)
         return {"ok": False, "error": "Impossible de lire le fichier Excel"}, 400
 
-    sheet = workbook.active
-    data = load_price_adaptator_data()
-    prospects = data.get("prospects", [])
-
-    existing_emails = {p.get("email", "").strip().lower() for p in prospects if p.get("email")}
-    existing_phones = set()
-    existing_names = set()
-    for prospect in prospects:
-        normalized_phone = normalize_phone_number((prospect.get("telephone") or "").strip())
-        if normalized_phone:
-            existing_phones.add(normalized_phone)
-        nom = normalize_price_adaptator_nom(prospect.get("nom")).lower()
-        prenom = normalize_price_adaptator_prenom(prospect.get("prenom")).lower()
-        formation = (prospect.get("formation") or "").strip()
-        if nom and prenom and formation:
-            existing_names.add((nom, prenom, formation))
-
-    added_prospects = []
-    seen_emails = set()
-    seen_phones = set()
-    seen_names = set()
-    skipped = 0
-    errors = []
-
-    def normalize_import_phone(raw_value):
-        if raw_value is None:
-            return ""
-        value = str(raw_value).strip()
-        if not value:
-            return ""
-        if value.startswith("+") or value.startswith("00") or value.startswith("0"):
-            return value
-        return f"0{value}"
-
-    for idx, row in enumerate(sheet.iter_rows(values_only=True), start=1):
-        values = list(row[:6]) if row else []
-        values += [None] * (6 - len(values))
-        formation_raw, nom, prenom, cpf, email, telephone = values
-        if not any([formation_raw, nom, prenom, cpf, email, telephone]):
-            continue
-
-        formation = normalize_price_adaptator_formation(formation_raw)
-        if not formation:
-            errors.append(f"Ligne {idx}: formation invalide")
-            continue
-
-        nom_value = normalize_price_adaptator_nom(nom)
-        prenom_value = normalize_price_adaptator_prenom(prenom)
-        if not nom_value or not prenom_value:
-            errors.append(f"Ligne {idx}: nom/prénom manquants")
-            continue
-
-        if cpf is None or (isinstance(cpf, str) and not cpf.strip()):
-            cpf_value = 0.0
-        else:
-            try:
-                cpf_value = float(cpf)
-                if cpf_value < 0:
-                    raise ValueError
-            except (TypeError, ValueError):
-                errors.append(f"Ligne {idx}: montant CPF invalide")
-                continue
-        formation_price = PRICE_ADAPTATOR_FORMATION_PRICES.get(formation)
-        if formation_price is not None and cpf_value > formation_price:
-            skipped += 1
-            errors.append(
-                f"Ligne {idx}: montant CPF supérieur au montant de la formation"
-            )
-            continue
-
-        email_value = str(email).strip() if email is not None else ""
-        email_key = email_value.lower() if email_value else ""
-        telephone_value = normalize_import_phone(telephone)
-        phone_key = normalize_phone_number(telephone_value) or ""
-
-        name_key = (nom_value.lower(), prenom_value.lower(), formation)
-
-        if (
-            (email_key and (email_key in existing_emails or email_key in seen_emails))
-            or (phone_key and (phone_key in existing_phones or phone_key in seen_phones))
-            or (name_key in existing_names or name_key in seen_names)
-        ):
-            skipped += 1
-            errors.append(f"Ligne {idx}: prospect déjà existant")
-            continue
-
-        prospect = {
-            "id": str(uuid.uuid4()),
-            "nom": nom_value,
-            "prenom": prenom_value,
-            "cpf": cpf_value,
-            "email": email_value,
-            "telephone": telephone_value,
-            "formation": formation,
-            "sent": False,
-            "sentAt": None,
-            "proposed_price": None,
-            "last_error": None,
-            "last_attempt_at": None,
-            "created_at": datetime.now().isoformat(),
-        }
-        added_prospects.append(prospect)
-        if email_key:
-            seen_emails.add(email_key)
-        if phone_key:
-            seen_phones.add(phone_key)
-        seen_names.add(name_key)
-
-    if added_prospects:
-        data["prospects"] = added_prospects[::-1] + prospects
-        save_price_adaptator_data(data)
-
-    return {
-        "ok": True,
-        "added": len(added_prospects),
-        "skipped": skipped,
-        "errors": errors,
-        "prospects": data.get("prospects", prospects),
-    }
+    # le fichier est en place avant le job : la tâche ne voit jamais un job sans fichier
+    job = price_adaptator_store.create_job(price_adaptator_db(), upload.filename, total_rows, job_id=job_id)
+    enqueue_scheduled_job("price_adaptator_imports", source="upload")
+    return {"ok": True, "job": job}, 202
+
+
+@app.route("/price-adaptator/import/<job_id>")
+def price_adaptator_import_status(job_id):
+    job = price_adaptator_store.get_job(price_adaptator_db(), job_id)
+    if not job:
+        return {"ok": False, "error": "Import introuvable"}, 404
+    lines = price_adaptator_store.job_lines(
+        PRICE_ADAPTATOR_DB,
+        job_id,
+        outcome=request.args.get("outcome", ""),
+        page=request.args.get("page", 1, type=int),
+        per_page=request.args.get("per_page", 50, type=int),
+    )
+    return {"ok": True, "job": job, "lines": lines}
 
 
 @app.route("/price-adaptator/dates", methods=["POST"])
 def price_adaptator_save_dates():
     payload = request.get_json(silent=True) or {}
     dates = payload.get("dates", {})
-    data = load_price_adaptator_data()
     cleaned = {}
     for formation, range_data in (dates or {}).items():
         if not isinstance(range_data, dict):
@@ -6335,9 +6753,13 @@ def price_adaptator_save_dates():
             "end": range_data.get("end"),
             "discount": normalize_price_adaptator_discount(range_data.get("discount")),
         }
-    data["dates"] = cleaned
-    save_price_adaptator_data(data)
-    return {"ok": True, "dates": data["dates"]}
+
+    def followup_for(formation):
+        followup_date = get_price_adaptator_followup_date(cleaned, formation)
+        return followup_date.isoformat() if followup_date else None
+
+    revision = price_adaptator_store.save_dates(price_adaptator_db(), cleaned, followup_for)
+    return {"ok": True, "dates": cleaned, "revision": revision}
 
 
 @app.route("/price-adaptator/prospects/<prospect_id>/proposal", methods=["POST"])
@@ -6353,16 +6775,17 @@ def price_adaptator_save_proposal(prospect_id):
     except (TypeError, ValueError):
         return {"ok": False, "error": "Prix invalide"}, 400
 
-    data = load_price_adaptator_data()
-    prospect = next((item for item in data.get("prospects", []) if item.get("id") == prospect_id), None)
+    prospect = price_adaptator_store.get_prospect(price_adaptator_db(), prospect_id)
     if not prospect:
         return {"ok": False, "error": "Prospect introuvable"}, 404
 
     price_value = normalize_price_adaptator_proposed_price(price_value)
     prospect["proposed_price"] = price_value
-    save_price_adaptator_data(data)
+    revision = update_price_adaptator_prospect(prospect)
+    if revision is None:
+        return {"ok": False, "error": "Prospect introuvable"}, 404
 
-    return {"ok": True, "prospects": data.get("prospects", [])}
+    return {"ok": True, "prospect": prospect, "revision": revision}
 
 
 @app.route("/price-adaptator/send", methods=["POST"])
@@ -6379,13 +6802,14 @@ def price_adaptator_send():
     except (TypeError, ValueError):
         return {"ok": False, "error": "Prix invalide"}, 400
 
-    data = load_price_adaptator_data()
-    prospect = next((item for item in data.get("prospects", []) if item.get("id") == prospect_id), None)
+    db_path = price_adaptator_db()
+    prospect = price_adaptator_store.get_prospect(db_path, prospect_id)
     if not prospect:
         return {"ok": False, "error": "Prospect introuvable"}, 404
 
+    dates = price_adaptator_store.get_dates(db_path)
     price_value = normalize_price_adaptator_proposed_price(price_value)
-    result = attempt_price_adaptator_send(prospect, data.get("dates"), price_override=price_value)
+    result = attempt_price_adaptator_send(prospect, dates, price_override=price_value)
     prospect["last_attempt_at"] = datetime.now().isoformat()
     prospect["last_error"] = result["email_error"] or result["sms_error"]
     prospect["proposed_price"] = result["price"]
@@ -6395,7 +6819,7 @@ def price_adaptator_send():
         prospect["sent"] = True
         prospect["sentAt"] = datetime.now().isoformat()
         prospect["last_sent_price"] = result["price"]
-    save_price_adaptator_data(data)
+    revision = update_price_adaptator_prospect(prospect, dates)
 
     return {
         "ok": True,
@@ -6403,14 +6827,15 @@ def price_adaptator_send():
         "sms_sent": result["sms_sent"],
         "email_error": result["email_error"],
         "sms_error": result["sms_error"],
-        "prospects": data.get("prospects", []),
+        "prospect": prospect,
+        "revision": revision,
     }
 
 
 @app.route("/price-adaptator/prospects/<prospect_id>/preview")
 def price_adaptator_preview(prospect_id):
-    data = load_price_adaptator_data()
-    prospect = next((item for item in data.get("prospects", []) if item.get("id") == prospect_id), None)
+    db_path = price_adaptator_db()
+    prospect = price_adaptator_store.get_prospect(db_path, prospect_id)
     if not prospect:
         return {"ok": False, "error": "Prospect introuvable"}, 404
 
@@ -6420,7 +6845,7 @@ def price_adaptator_preview(prospect_id):
     if price_override is not None:
         price_override = normalize_price_adaptator_proposed_price(price_override)
 
-    message = build_price_adaptator_message(prospect, data.get("dates"), price_override=price_override)
+    message = build_price_adaptator_message(prospect, price_adaptator_store.get_dates(db_path), price_override=price_override)
     return {
         "ok": True,
         "subject": message["subject"],
@@ -6665,7 +7090,7 @@ def generate_afc_dsf_pdf(session_data, dsf, output_path):
     normal = styles['BodyText']
     logo = aps_pdf_logo_path()
     header = []
-    if logo: header.append(Image(logo, width=34*mm, height=16*mm, kind='proportional'))
+    if logo: header.append(pdf_resources.image_flowable(logo, width=34*mm, height=16*mm, kind='proportional', max_px=pdf_resources.PDF_LOGO_MAX_PX))
     header.append(Paragraph(f"<b>Demande de service fait</b><br/>{dsf['label']}<br/>{session_data.get('display_name') or session_data.get('formation') or AFC_APS_SSIAP_LABEL}<br/>Session {session_data.get('id')} — période du {format_date(dsf['periodStart'])} au {format_date(dsf['periodEnd'])}", title))
     body.append(Table([header], colWidths=[45*mm, 220*mm] if logo else [265*mm])); body.append(Spacer(1, 8))
     module_labels = [AFC_DSF_MODULES[m]['label'] for m in dsf['modules']]
@@ -6791,6 +7216,15 @@ def preview_afc_dsf_invoice(sid, dsf_id):
         return jsonify({'ok':True,'exists':True,'invoice':dsf.get('invoice')})
     return jsonify({'ok':True,'exists':False,'preview':afc_invoice_preview_payload(data, sess, dsf)})
 
+def afc_invoice_restore_reservation(sid, dsf_id):
+    """Après un échec : le registre reprend le numéro de la facture enregistrée, ou libère la DSF."""
+    sess=find_session(load_sessions(),sid)
+    invoice=(afc_dsf_find(sess, dsf_id) or {}).get('invoice') if sess else None
+    if invoice and invoice.get('invoice_number'):
+        invoice_numbers.reserve(INVOICE_NUMBERS_DB, sid, dsf_id, invoice['invoice_number'])
+    else:
+        invoice_numbers.release(INVOICE_NUMBERS_DB, sid, dsf_id)
+
 @app.post('/api/sessions/<sid>/afc-dsf/<dsf_id>/invoice')
 @login_required
 def create_afc_dsf_invoice(sid, dsf_id):
@@ -6800,18 +7234,26 @@ def create_afc_dsf_invoice(sid, dsf_id):
         if not sess or not is_afc_aps_ssiap_session(sess): return jsonify({'ok':False,'error':'Session AFC introuvable'}),404
         dsf=afc_dsf_find(sess, dsf_id)
         if not dsf: return jsonify({'ok':False,'error':'DSF introuvable'}),404
+        reserved=False
         try:
             if dsf.get('status') != AFC_DSF_STATUS_FINALIZED: raise ValueError('La DSF doit être finalisée.')
             if dsf.get('invoice'): raise ValueError('Une facture existe déjà pour cette DSF.')
             number=str(payload.get('invoice_number') or '').strip()
             if not number: raise ValueError('Le numéro de facture est obligatoire.')
-            if afc_dsf_invoice_number_used(data, number): raise ValueError('Ce numéro de facture est déjà utilisé.')
             invoice_date=str(payload.get('invoice_date') or '').strip()
             datetime.strptime(invoice_date, '%Y-%m-%d')
             invoice_type=str(payload.get('invoice_type') or '').strip()
             if invoice_type not in ('intermediate','final'):
                 raise ValueError('Veuillez sélectionner Facture intermédiaire ou Facture de solde.')
             if not os.path.exists(os.path.join(current_app.root_path, 'static', 'upload', 'facture.xlsx')): raise FileNotFoundError('Modèle de facture introuvable.')
+            # réservation atomique entre workers : un numéro ne peut servir qu'à une DSF
+            invoice_numbers.reserve(INVOICE_NUMBERS_DB, sid, dsf_id, number); reserved=True
+            # le verrou ne couvre que ce worker : relecture après réservation, un autre
+            # worker a pu enregistrer une facture pour cette DSF entre-temps
+            data=load_sessions(); sess=find_session(data,sid)
+            dsf=afc_dsf_find(sess, dsf_id) if sess else None
+            if not dsf or dsf.get('status') != AFC_DSF_STATUS_FINALIZED: raise ValueError('DSF introuvable ou non finalisée.')
+            if dsf.get('invoice'): raise ValueError('Une facture existe déjà pour cette DSF.')
             invoice_payload={
                 'invoice_number': number,
                 'invoice_date': invoice_date,
@@ -6829,9 +7271,16 @@ def create_afc_dsf_invoice(sid, dsf_id):
             save_sessions(data)
             return jsonify({'ok':True,'invoice':dsf['invoice'],'downloadUrl':url_for('download_afc_dsf_invoice', sid=sid, dsf_id=dsf_id)})
         except Exception as exc:
+            if reserved:
+                afc_invoice_restore_reservation(sid, dsf_id)
             app.logger.exception('Erreur génération facture DSF AFC')
             return jsonify({'ok':False,'error':str(exc)}),400
 
+@app.get('/api/afc-invoices/numbering')
+@login_required
+def afc_invoice_numbering():
+    return jsonify({'ok':True,'nextNumber':afc_invoice_next_number(),'gaps':invoice_numbers.gaps(INVOICE_NUMBERS_DB)})
+
 @app.get('/sessions/<sid>/afc-dsf/<dsf_id>/invoice.xlsx')
 @login_required
 def download_afc_dsf_invoice(sid, dsf_id):
@@ -6869,6 +7318,8 @@ def api_afc_dsf_delete(sid, dsf_id):
     pdf_filename=os.path.basename(dsf.get('pdfFilename',''))
     sess['afcDsfs']=[d for d in dsfs if d.get('id')!=dsf_id]
     save_sessions(data)
+    if dsf.get('invoice'):
+        invoice_numbers.release(INVOICE_NUMBERS_DB, sid, dsf_id)
     if pdf_filename:
         pdf_path=os.path.join(DSF_DIR, pdf_filename)
         try:
@@ -7223,8 +7674,13 @@ def rename_session(sid):
 @app.route("/sessions/<sid>/delete", methods=["POST"])
 def delete_session(sid):
     data = load_sessions()
+    deleted = find_session(data, sid)
     data["sessions"] = [s for s in data["sessions"] if s["id"]!=sid]
     save_sessions(data)
+    # les numéros de facture des DSF de la session ne doivent pas rester réservés
+    for dsf in (deleted or {}).get("afcDsfs") or []:
+        if dsf.get("id"):
+            invoice_numbers.release(INVOICE_NUMBERS_DB, sid, dsf["id"])
     flash("Session supprimée.","ok")
     return redirect(url_for("sessions_home"))
 
@@ -7295,12 +7751,7 @@ def generate_aps_planning_route(sid):
                 contractual_date = auto_end_date
             else:
                 contractual_date = contractual_dt.date()
-                eligible_count = 0
-                day = start_dt.date()
-                while day <= contractual_date:
-                    if is_afc_working_day(day, interruptions):
-                        eligible_count += 1
-                    day += timedelta(days=1)
+                eligible_count = afc_calendar(interruptions).count_between(start_dt.date(), contractual_date)
                 if eligible_count != 57 or not is_afc_working_day(contractual_date, interruptions):
                     contractual_date = auto_end_date
             session_data["contractual_end_date"] = contractual_date.isoformat()
@@ -7435,12 +7886,17 @@ def generate_aps_trainer_contracts(sid):
     if not session_data.get("planning_pdf") or not planning_data: return jsonify({"ok": False, "error": "Veuillez générer le planning APS avant de générer un contrat formateur."}), 400
     payload = request.get_json(silent=True) or {}; trainers = payload.get("trainers") or []
     if not trainers: return jsonify({"ok": False, "error": "Aucun formateur sélectionné."}), 400
-    saved = []
+    # Un seul parcours du planning et une seule lecture de formateurs.json pour
+    # tout le lot ; les PDF sont ensuite rendus ensemble, en séquentiel sauf si
+    # PDF_PARALLEL_WORKERS active le pool (forkserver, jamais fork).
+    interventions_by_trainer = aps_trainer_interventions_by_trainer(planning_data)
+    formateurs = load_formateurs()
+    batch = []
     for trainer in trainers:
         name = (trainer.get("name") or "").strip(); planning_name = (trainer.get("planningName") or name).strip(); daily_rate = float(trainer.get("dailyRate") or 0)
         if not name or daily_rate <= 0: return jsonify({"ok": False, "error": "Le nom et un tarif journalier HT supérieur à 0 sont obligatoires."}), 400
-        calc = aps_trainer_interventions(planning_data, planning_name)
-        if not calc["interventions"]: return jsonify({"ok": False, "error": f"Aucun créneau trouvé pour {planning_name}."}), 400
+        calc = interventions_by_trainer.get(planning_name)
+        if not calc: return jsonify({"ok": False, "error": f"Aucun créneau trouvé pour {planning_name}."}), 400
         billed_days = float(trainer.get("billedDays") or calc["calculatedDays"] or 0)
         trainer_attends_exam = bool(trainer.get("trainerAttendsExam") or trainer.get("trainer_attends_exam"))
         exam_trainer_hours = float(trainer.get("examTrainerHours") or trainer.get("exam_trainer_hours") or 0) if trainer_attends_exam else 0.0
@@ -7449,9 +7905,12 @@ def generate_aps_trainer_contracts(sid):
         vat_enabled = bool(trainer.get("vatEnabled")); vat_rate = float(trainer.get("vatRate") or 20)
         total_ht = round((billed_days * daily_rate) + exam_trainer_amount, 2); vat_amount = round(total_ht * vat_rate / 100, 2) if vat_enabled else 0; total_ttc = round(total_ht + vat_amount, 2)
         contract_id = str(uuid.uuid4()); filename = f"contrat_formateur_aps_{sid}_{contract_id}.pdf"; path = os.path.join(APS_CONTRACT_DIR, filename)
-        trainer = merge_formateur_contract_defaults(trainer, find_formateur_by_identity(name=name, email=trainer.get("email")))
+        trainer = merge_formateur_contract_defaults(trainer, find_formateur_by_identity(name=name, email=trainer.get("email"), formateurs=formateurs))
         contract = {"id": contract_id, "trainerName": name, "trainerEmail": (trainer.get("email") or "").strip(), "trainerPhone": (trainer.get("phone") or "").strip(), "dailyRate": daily_rate, "calculatedHours": calc["totalHours"], "calendarDays": calc["calendarDays"], "calculatedDays": calc["calculatedDays"], "billedDays": billed_days, "trainerAttendsExam": trainer_attends_exam, "examTrainerHours": exam_trainer_hours, "examTrainerRate": exam_trainer_rate, "examTrainerAmount": exam_trainer_amount, "totalHT": total_ht, "vatEnabled": vat_enabled, "vatRate": vat_rate, "vatAmount": vat_amount, "totalTTC": total_ttc, "address": (trainer.get("address") or "").strip(), "siret": (trainer.get("siret") or "").strip(), "status": (trainer.get("status") or "").strip(), "commercialName": (trainer.get("commercialName") or "").strip(), "activityDeclaration": (trainer.get("activityDeclaration") or "").strip(), "vatNumber": (trainer.get("vatNumber") or "").strip(), "vatMention": (trainer.get("vatMention") or "").strip(), "rcPro": (trainer.get("rcPro") or "").strip(), "urssafVigilance": (trainer.get("urssafVigilance") or "").strip(), "rneKbis": (trainer.get("rneKbis") or "").strip(), "rib": (trainer.get("rib") or "").strip(), "diplomas": (trainer.get("diplomas") or "").strip(), "cv": (trainer.get("cv") or "").strip(), "interventions": calc["interventions"], "pdfFilename": filename, "pdfUrl": url_for("view_aps_trainer_contract", sid=sid, contract_id=contract_id), "generatedAt": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "sentAt": None}
-        generate_aps_trainer_contract_pdf(session_data, contract, path)
+        batch.append((planning_name, contract, path))
+    pdf_parallel.render_each(generate_aps_trainer_contract_pdf, [(session_data, contract, path) for _, contract, path in batch])
+    saved = []
+    for planning_name, contract, path in batch:
         existing_contracts = session_data.setdefault("apsTrainerContracts", [])
         kept_contracts = []
         for existing in existing_contracts:
@@ -7535,27 +7994,33 @@ def validate_aps_trainer_signature_field(field_payload, page_count):
     return True
 
 
-@app.post("/api/sessions/<sid>/aps-trainer-contracts/<contract_id>/yousign/send")
-def send_aps_trainer_contract_yousign(sid, contract_id):
-    data = load_sessions(); session_data = find_session(data, sid)
-    if not session_data: return jsonify({"ok": False, "error": "Session introuvable."}), 404
-    contract = next((c for c in session_data.get("apsTrainerContracts", []) if c.get("id") == contract_id), None)
-    if not contract: return jsonify({"ok": False, "error": "Contrat introuvable."}), 404
+YOUSIGN_ACTIVE_STATUSES = {"draft", "approval", "ongoing"}
+YOUSIGN_BULK_SEND_WORKERS = int(os.environ.get("YOUSIGN_BULK_SEND_WORKERS", "4"))
+
+
+def send_aps_trainer_contract_to_yousign(session_data, contract, client=None, force=False):
+    """Envoie un contrat formateur APS à Yousign et met à jour le contrat en mémoire.
+
+    Ne charge ni n'enregistre les sessions : l'appelant persiste `session_data`.
+    Renvoie `(réponse JSON, statut HTTP)`.
+    """
+    sid = session_data.get("id")
+    contract_id = contract.get("id")
     email = (contract.get("trainerEmail") or "").strip()
-    if not re.match(r"^[^@\s]+@[^@\s]+\.[^@\s]+$", email): return jsonify({"ok": False, "error": "Email formateur invalide ou manquant."}), 400
-    if not is_yousign_configured(): return jsonify({"ok": False, "error": "Yousign n'est pas configuré: renseignez YOUSIGN_API_KEY côté serveur."}), 400
+    if not re.match(r"^[^@\s]+@[^@\s]+\.[^@\s]+$", email): return {"ok": False, "error": "Email formateur invalide ou manquant."}, 400
+    if not is_yousign_configured(): return {"ok": False, "error": "Yousign n'est pas configuré: renseignez YOUSIGN_API_KEY côté serveur."}, 400
 
     state = normalize_yousign_state(contract.get("yousign"))
-    if state.get("signatureRequestId") and state.get("status") in {"draft", "approval", "ongoing"} and not request.args.get("force"):
-        return jsonify({"ok": False, "error": "Une demande Yousign active existe déjà pour ce contrat."}), 409
+    if state.get("signatureRequestId") and state.get("status") in YOUSIGN_ACTIVE_STATUSES and not force:
+        return {"ok": False, "error": "Une demande Yousign active existe déjà pour ce contrat."}, 409
 
     try:
         contract_path = ensure_aps_trainer_contract_pdf(session_data, contract)
     except Exception as exc:
         app.logger.exception("Régénération contrat APS impossible avant envoi Yousign session=%s contrat=%s", sid, contract_id)
-        return jsonify({"ok": False, "error": f"PDF contrat introuvable et régénération impossible: {exc}"}), 400
+        return {"ok": False, "error": f"PDF contrat introuvable et régénération impossible: {exc}"}, 400
 
-    client = YousignClient()
+    client = client or YousignClient()
     now = datetime.now().isoformat(timespec="seconds")
     try:
         trainer_name = contract.get("trainerName") or email
@@ -7623,15 +8088,102 @@ def send_aps_trainer_contract_yousign(sid, contract_id):
             "error": None,
         })
         mirror_yousign_state_on_contract(contract)
-        save_sessions(data)
-        return jsonify({"ok": True, "status": status, "sentAt": now, "signatureUrl": signature_url})
+        return {"ok": True, "status": status, "sentAt": now, "signatureUrl": signature_url}, 200
     except YousignError as exc:
         logger.error("Réponse exacte Yousign APS contract 400/erreur status=%s payload=%r", exc.status_code, exc.payload)
         user_error = yousign_service_access_message(exc.status_code, exc.payload)
         contract["yousign"] = normalize_yousign_state({**state, "status": "error", "lastSyncedAt": now, "lastEvent": "api.error", "lastEventAt": now, "error": user_error, "errorPayload": exc.payload})
         mirror_yousign_state_on_contract(contract)
+        return {"ok": False, "error": user_error, "errorPayload": exc.payload, "yousignStatus": exc.status_code}, 502
+
+
+@app.post("/api/sessions/<sid>/aps-trainer-contracts/<contract_id>/yousign/send")
+def send_aps_trainer_contract_yousign(sid, contract_id):
+    data = load_sessions(); session_data = find_session(data, sid)
+    if not session_data: return jsonify({"ok": False, "error": "Session introuvable."}), 404
+    contract = next((c for c in session_data.get("apsTrainerContracts", []) if c.get("id") == contract_id), None)
+    if not contract: return jsonify({"ok": False, "error": "Contrat introuvable."}), 404
+    result, http_status = send_aps_trainer_contract_to_yousign(session_data, contract, force=bool(request.args.get("force")))
+    if http_status in {200, 502}:
         save_sessions(data)
-        return jsonify({"ok": False, "error": user_error, "errorPayload": exc.payload, "yousignStatus": exc.status_code}), 502
+    return jsonify(result), http_status
+
+
+@app.post("/api/sessions/<sid>/aps-trainer-contracts/yousign/send-all")
+def send_all_aps_trainer_contracts_yousign(sid):
+    """Envoie en signature tous les contrats de la session avec un pool borné, puis enregistre une seule fois.
+
+    Les PDF manquants sont rendus un par un avant le pool : seuls les appels
+    Yousign partent en parallèle. À la fin, les sessions sont relues et seul
+    l'état Yousign des contrats envoyés y est reporté, pour ne pas écraser les
+    modifications faites pendant l'envoi.
+    """
+    data = load_sessions(); session_data = find_session(data, sid)
+    if not session_data: return jsonify({"ok": False, "error": "Session introuvable."}), 404
+    if not is_yousign_configured(): return jsonify({"ok": False, "error": "Yousign n'est pas configuré: renseignez YOUSIGN_API_KEY côté serveur."}), 400
+    payload = request.get_json(silent=True) or {}
+    wanted_ids = {str(value) for value in payload.get("contractIds") or []}
+    force = bool(payload.get("force") or request.args.get("force"))
+    results = []
+    to_send = []
+    for contract in session_data.get("apsTrainerContracts", []):
+        if wanted_ids and str(contract.get("id")) not in wanted_ids:
+            continue
+        state = normalize_yousign_state(contract.get("yousign"))
+        status = state.get("status")
+        if status in {"done", "signed"} or (status in YOUSIGN_ACTIVE_STATUSES and state.get("signatureRequestId") and not force):
+            results.append({"contractId": contract.get("id"), "trainerName": contract.get("trainerName"), "ok": True, "skipped": True, "status": status})
+            continue
+        to_send.append(contract)
+    if not to_send and not results: return jsonify({"ok": False, "error": "Aucun contrat à envoyer."}), 400
+
+    rendered = []
+    for contract in to_send:
+        try:
+            ensure_aps_trainer_contract_pdf(session_data, contract)
+        except Exception as exc:
+            app.logger.exception("Régénération contrat APS impossible avant envoi Yousign session=%s contrat=%s", sid, contract.get("id"))
+            results.append({"contractId": contract.get("id"), "trainerName": contract.get("trainerName"), "httpStatus": 400, "ok": False, "error": f"PDF contrat introuvable et régénération impossible: {exc}"})
+            continue
+        rendered.append(contract)
+    to_send = rendered
+
+    client = YousignClient()
+
+    def send_one(contract):
+        started = time.perf_counter()
+        try:
+            result, http_status = send_aps_trainer_contract_to_yousign(session_data, contract, client=client, force=force)
+        except Exception as exc:
+            app.logger.exception("Envoi Yousign groupé impossible session=%s contrat=%s", sid, contract.get("id"))
+            result, http_status = {"ok": False, "error": str(exc)}, 500
+        return {
+            "contractId": contract.get("id"),
+            "trainerName": contract.get("trainerName"),
+            "httpStatus": http_status,
+            "durationMs": round((time.perf_counter() - started) * 1000),
+            **result,
+        }
+
+    if to_send:
+        with ThreadPoolExecutor(max_workers=max(1, min(YOUSIGN_BULK_SEND_WORKERS, len(to_send)))) as executor:
+            results.extend(executor.map(send_one, to_send))
+        fresh = load_sessions(); fresh_session = find_session(fresh, sid)
+        if fresh_session:
+            sent_contracts = {contract.get("id"): contract for contract in to_send}
+            for contract in fresh_session.get("apsTrainerContracts", []):
+                sent_contract = sent_contracts.get(contract.get("id"))
+                if not sent_contract:
+                    continue
+                contract["pdfFilename"] = sent_contract.get("pdfFilename")
+                if sent_contract.get("yousign") is not None:
+                    contract["yousign"] = sent_contract["yousign"]
+                    mirror_yousign_state_on_contract(contract)
+            save_sessions(fresh)
+    sent = sum(1 for result in results if result.get("ok") and not result.get("skipped"))
+    failed = sum(1 for result in results if not result.get("ok"))
+    app.logger.info("Envoi Yousign groupé session=%s envoyés=%s échecs=%s ignorés=%s", sid, sent, failed, len(results) - sent - failed)
+    return jsonify({"ok": failed == 0, "sent": sent, "failed": failed, "skipped": len(results) - sent - failed, "results": results}), 200 if failed == 0 else 207
 
 
 @app.post("/api/sessions/<sid>/aps-trainer-contracts/<contract_id>/yousign/sync")
@@ -7661,29 +8213,65 @@ def sync_aps_trainer_contract_yousign(sid, contract_id):
         return jsonify({"ok": False, "error": f"Erreur de synchronisation Yousign: {exc}"}), 502
 
 
-def save_yousign_signed_document(content, target_dir, base_filename):
+def _copy_with_sha256(source, target):
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: source.read(YOUSIGN_DOWNLOAD_CHUNK_SIZE), b""):
+        target.write(chunk)
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def save_yousign_signed_document(client, signature_request_id, target_dir, base_filename):
+    """Télécharge les documents signés en flux vers `target_dir` et renvoie `(nom de fichier, sha256)`.
+
+    Yousign renvoie soit le PDF signé, soit une archive ZIP : dans ce cas le PDF
+    signé est extrait (sans charger l'archive en mémoire) et l'archive supprimée.
+    Le téléchargement passe par un fichier temporaire propre à l'appel : deux
+    téléchargements simultanés du même contrat ne s'écrasent pas.
+    """
     os.makedirs(target_dir, exist_ok=True)
-    pdf_bytes = None
-    if content.startswith(b"%PDF"):
-        pdf_bytes = content
-    else:
-        try:
-            with zipfile.ZipFile(BytesIO(content)) as archive:
+    with tempfile.NamedTemporaryFile(dir=target_dir, prefix=f".{base_filename}-", suffix=".download", delete=False) as placeholder:
+        download_name = os.path.basename(placeholder.name)
+    download_path = os.path.join(target_dir, download_name)
+    try:
+        download = client.download_signed_documents_to_file(signature_request_id, target_dir, download_name)
+        with open(download.path, "rb") as fh:
+            is_pdf = fh.read(4) == b"%PDF"
+        if is_pdf:
+            filename = f"{base_filename}.pdf"
+            os.replace(download.path, os.path.join(target_dir, filename))
+            return filename, download.sha256
+        if zipfile.is_zipfile(download.path):
+            with zipfile.ZipFile(download.path) as archive:
                 pdf_names = [name for name in archive.namelist() if name.lower().endswith(".pdf") and not name.endswith("/")]
                 if pdf_names:
                     pdf_names.sort(key=lambda name: ("signed" not in name.lower() and "signe" not in name.lower(), name.lower()))
-                    pdf_bytes = archive.read(pdf_names[0])
-        except zipfile.BadZipFile:
-            pdf_bytes = None
-    if pdf_bytes:
-        filename = f"{base_filename}.pdf"
-        with open(os.path.join(target_dir, filename), "wb") as fh:
-            fh.write(pdf_bytes)
-        return filename
-    filename = f"{base_filename}.zip"
-    with open(os.path.join(target_dir, filename), "wb") as fh:
-        fh.write(content)
-    return filename
+                    filename = f"{base_filename}.pdf"
+                    with tempfile.NamedTemporaryFile(dir=target_dir, prefix=".yousign-", suffix=".part", delete=False) as part:
+                        tmp_path = part.name
+                        with archive.open(pdf_names[0]) as member:
+                            sha256 = _copy_with_sha256(member, part)
+                    try:
+                        os.replace(tmp_path, os.path.join(target_dir, filename))
+                    finally:
+                        if os.path.exists(tmp_path):
+                            os.remove(tmp_path)
+                    return filename, sha256
+        filename = f"{base_filename}.zip"
+        os.replace(download.path, os.path.join(target_dir, filename))
+        return filename, download.sha256
+    finally:
+        if os.path.exists(download_path):
+            os.remove(download_path)
+
+
+def send_yousign_signed_file(directory, filename, as_attachment=True):
+    """Renvoie un document signé stocké en flux, avec ETag et requêtes partielles (Range)."""
+    path = safe_join(directory, os.path.basename(filename or ""))
+    if not path or not os.path.isfile(path):
+        abort(404)
+    mimetype = "application/pdf" if path.lower().endswith(".pdf") else "application/zip"
+    return send_file(path, mimetype=mimetype, as_attachment=as_attachment, download_name=os.path.basename(path), conditional=True, etag=True, max_age=0)
 
 
 @app.route("/api/sessions/<sid>/aps-trainer-contracts/<contract_id>/yousign/download", methods=["GET", "POST"])
@@ -7694,20 +8282,23 @@ def download_aps_trainer_signed_yousign(sid, contract_id):
     if not contract: return jsonify({"ok": False, "error": "Contrat introuvable."}), 404
     state = normalize_yousign_state(contract.get("yousign"))
     if not state.get("signatureRequestId"): return jsonify({"ok": False, "error": "Aucune demande Yousign disponible."}), 400
+    stored = os.path.basename(state.get("signedDocumentFilename") or "")
+    if request.method == "GET" and stored and state.get("status") in {"done", "signed"} and os.path.isfile(os.path.join(APS_CONTRACT_SIGNED_DIR, stored)):
+        # Document déjà rapatrié : on le sert depuis le disque (avec Range) sans rappeler Yousign.
+        return send_yousign_signed_file(APS_CONTRACT_SIGNED_DIR, stored, as_attachment=request.args.get("inline") != "1")
     try:
-        content = YousignClient().download_signed_documents(state["signatureRequestId"])
-        filename = save_yousign_signed_document(content, APS_CONTRACT_SIGNED_DIR, f"contrat_aps_signe_yousign_{state['signatureRequestId']}")
-        contract["yousign"] = normalize_yousign_state({**state, "signedDocumentFilename": filename, "signedDocumentUrl": url_for("download_aps_trainer_signed_yousign_file", filename=filename), "lastSyncedAt": datetime.now().isoformat(timespec="seconds"), "error": None})
+        filename, sha256 = save_yousign_signed_document(YousignClient(), state["signatureRequestId"], APS_CONTRACT_SIGNED_DIR, f"contrat_aps_signe_yousign_{state['signatureRequestId']}")
+        contract["yousign"] = normalize_yousign_state({**state, "signedDocumentFilename": filename, "signedDocumentSha256": sha256, "signedDocumentUrl": url_for("download_aps_trainer_signed_yousign_file", filename=filename), "lastSyncedAt": datetime.now().isoformat(timespec="seconds"), "error": None})
         mirror_yousign_state_on_contract(contract)
         save_sessions(data)
-        return send_from_directory(APS_CONTRACT_SIGNED_DIR, filename, as_attachment=request.args.get("inline") != "1")
+        return send_yousign_signed_file(APS_CONTRACT_SIGNED_DIR, filename, as_attachment=request.args.get("inline") != "1")
     except Exception as exc:
         return jsonify({"ok": False, "error": f"Téléchargement Yousign impossible: {exc}"}), 502
 
 
 @app.get("/aps-trainer-contracts/yousign/signed/<path:filename>")
 def download_aps_trainer_signed_yousign_file(filename):
-    return send_from_directory(APS_CONTRACT_SIGNED_DIR, os.path.basename(filename), as_attachment=True)
+    return send_yousign_signed_file(APS_CONTRACT_SIGNED_DIR, filename, as_attachment=request.args.get("inline") != "1")
 
 
 @app.patch("/api/sessions/<sid>/aps-trainer-contracts/<contract_id>/email")
@@ -7770,16 +8361,16 @@ def import_aps_attendance_students(sid):
     if formation not in {"APS", "A3P", "DESP", "DIRIGEANT", "AFC_APS_SSIAP"} and not is_ssiap1_session(session_data): return jsonify({"ok": False, "error": "Cette action est réservée aux sessions APS, A3P, SSIAP 1 et DESP."}), 400
     uploaded = request.files.get("file")
     if not uploaded or not uploaded.filename:
-        return jsonify({"ok": False, "error": "Veuillez importer un fichier PDF."}), 400
-    if not uploaded.filename.lower().endswith(".pdf"):
-        return jsonify({"ok": False, "error": "Le fichier doit être un PDF."}), 400
+        return jsonify({"ok": False, "error": "Veuillez importer un fichier PDF, CSV ou Excel."}), 400
+    if not uploaded.filename.lower().endswith(trainee_lists.SUPPORTED_EXTENSIONS):
+        return jsonify({"ok": False, "error": "Le fichier doit être un PDF, un CSV ou un classeur Excel (.xlsx)."}), 400
     try:
         students, has_text = aps_extract_students_from_pdf(uploaded)
     except Exception as exc:
         return jsonify({"ok": False, "error": str(exc)}), 500
     message = None
     if not has_text or not students:
-        message = "Impossible d’extraire automatiquement les noms depuis ce PDF. Merci de saisir ou corriger la liste manuellement."
+        message = "Impossible d’extraire automatiquement les noms depuis ce fichier. Merci de saisir ou corriger la liste manuellement."
     if formation == "AFC_APS_SSIAP":
         default_start = session_data.get("date_debut") or ""
         for student in students:
@@ -7869,6 +8460,10 @@ def generate_afc_france_travail_attendance_route(sid):
         app.logger.exception("Génération France Travail impossible session=%s", sid)
         return jsonify({"ok": False, "error": str(exc)}), 500
 
+def attendance_fragment_dir(output_dir, sid):
+    return os.path.join(output_dir, "_pages", os.path.basename(str(sid)))
+
+
 @app.post("/api/sessions/<sid>/aps-attendance/generate")
 def generate_aps_attendance_sheets(sid):
     data = load_sessions(); session_data = find_session(data, sid)
@@ -7897,8 +8492,10 @@ def generate_aps_attendance_sheets(sid):
     output_dir = A3P_DOC_DIR if training_code == "A3P" else APS_ATTENDANCE_DIR
     output_path = os.path.join(output_dir, filename)
     temp_path = f"{output_path}.tmp"
+    fragment_dir = attendance_fragment_dir(output_dir, sid)
     try:
-        generate_a3p_attendance_pdf(session_data, temp_path) if training_code == "A3P" else generate_aps_attendance_pdf(session_data, temp_path)
+        stats = generate_a3p_attendance_pdf(session_data, temp_path, fragment_dir) if training_code == "A3P" else generate_aps_attendance_pdf(session_data, temp_path, fragment_dir)
+        app.logger.info("Feuilles de présence %s session=%s pages=%s", formation, sid, stats)
         if not os.path.exists(temp_path) or os.path.getsize(temp_path) <= 0:
             raise ValueError("Le PDF généré est vide.")
         os.replace(temp_path, output_path)
@@ -7935,6 +8532,7 @@ def reset_aps_attendance_sheets(sid):
     if filename:
         try: os.remove(os.path.join(A3P_DOC_DIR if formation == "A3P" else APS_ATTENDANCE_DIR, os.path.basename(filename)))
         except FileNotFoundError: pass
+    shutil.rmtree(attendance_fragment_dir(A3P_DOC_DIR if formation == "A3P" else APS_ATTENDANCE_DIR, sid), ignore_errors=True)
     keys = ("a3pAttendanceSheetsPdfUrl", "a3pAttendanceSheetsFilename", "a3pAttendanceSheetsGeneratedAt", "a3pAttendanceSheetsUpdatedAt") if formation == "A3P" else ("apsAttendanceSheetsPdfUrl", "apsAttendanceSheetsFilename", "apsAttendanceSheetsGeneratedAt", "apsAttendanceSheetsUpdatedAt")
     for key in keys:
         session_data.pop(key, None)
@@ -7957,6 +8555,151 @@ def view_aps_attendance_sheets(sid):
     return send_file(path, mimetype="application/pdf", as_attachment=False)
 
 
+# Champs de session qui ne changent aucun document de l'export groupé
+# (contrats et DSF ont leurs propres tâches, les dates de génération n'y figurent pas).
+DOCUMENT_BUNDLE_IGNORED_KEYS = {
+    "apsTrainerContracts", "afcDsfs", "planning_pdf_refreshed_at", "planning_generated_at",
+    "apsAttendanceSheetsGeneratedAt", "apsAttendanceSheetsUpdatedAt", "a3pAttendanceSheetsGeneratedAt", "a3pAttendanceSheetsUpdatedAt",
+}
+
+
+def bundle_stored_files(directory, folder, *paths):
+    """Entrées d'archive pour des documents déjà enregistrés ; erreur si l'un d'eux a disparu."""
+    missing = [os.path.basename(str(path or "")) or "?" for path in paths if not path or not os.path.exists(path)]
+    if missing:
+        raise FileNotFoundError("Document introuvable : " + ", ".join(missing))
+    return [(f"{folder}/{os.path.basename(path)}", path) for path in paths]
+
+
+# Tâches de l'export groupé : fonctions de module (et non fermetures) pour pouvoir
+# être exécutées dans un processus `forkserver`/`spawn` quand le pool est activé.
+def bundle_planning(directory, session_data, sid):
+    # Même rendu que l'affichage du planning, sans toucher au fichier ni à la session.
+    planning_mode, document_profile = aps_planning_refresh_options(session_data)
+    path = os.path.join(directory, aps_planning_refresh_filename(session_data, sid))
+    generate_aps_planning_pdf(copy.deepcopy(session_data), "", path, planning_data=session_data["apsPlanningData"], planning_mode=planning_mode, document_profile=document_profile)
+    return [(f"planning/{os.path.basename(path)}", path)]
+
+
+def bundle_attendance(directory, session_data, sid, training_code, fragment_dir):
+    path = os.path.join(directory, f"feuilles_presence_{training_code.lower()}_{sid}.pdf")
+    generator = generate_a3p_attendance_pdf if training_code == "A3P" else generate_aps_attendance_pdf
+    generator(session_data, path, fragment_dir)
+    return [(f"feuilles_presence/{os.path.basename(path)}", path)]
+
+
+def bundle_france_travail(directory, session_data, sid):
+    path = os.path.join(directory, ft_safe_filename(session_data.get("display_name") or session_data.get("formation") or sid))
+    with open(path, "wb") as handle:
+        handle.write(generate_france_travail_workbook(session_data, app.root_path).getvalue())
+    return [(f"france_travail/{os.path.basename(path)}", path)]
+
+
+def bundle_trainer_contracts(directory, session_data, contracts):
+    # Les contrats existants sont repris tels quels ; un PDF disparu est régénéré.
+    paths = [ensure_aps_trainer_contract_pdf(session_data, contract) for contract in contracts]
+    return [(f"contrats_formateurs/{os.path.basename(path)}", path) for path in paths]
+
+
+def bundle_dsfs(directory, dsfs):
+    entries = []
+    for dsf in dsfs:
+        pdf_path = os.path.join(DSF_DIR, os.path.basename(dsf.get("pdfFilename") or ""))
+        if dsf.get("pdfFilename") and os.path.exists(pdf_path):
+            entries.append((f"dsf/{os.path.basename(pdf_path)}", pdf_path))
+        snapshot = dsf.get("franceTravailExcelSnapshot")
+        if snapshot:
+            excel_path = os.path.join(directory, dsf_excel_filename(snapshot))
+            with open(excel_path, "wb") as handle:
+                handle.write(generate_dsf_excel_from_snapshot(snapshot, app.root_path).getvalue())
+            entries.append((f"dsf/{os.path.basename(excel_path)}", excel_path))
+    return entries
+
+
+def session_bundle_tasks(session_data, sid):
+    """Documents de la session pour l'export groupé, avec leurs dépendances.
+
+    Seuls les documents déjà préparés sont repris : planning généré, liste
+    de stagiaires importée, contrats, convocations et DSF existants.
+    """
+    try:
+        training_code = normalize_training_code(session_data)
+    except ValueError:
+        training_code = (session_data.get("formation") or "").upper()
+    is_a3p = training_code == "A3P"
+    inputs = [
+        {key: value for key, value in session_data.items() if key not in DOCUMENT_BUNDLE_IGNORED_KEYS},
+        pdf_fragments.file_signature(aps_pdf_logo_path()),
+    ]
+    tasks = []
+
+    if is_a3p:
+        planning_path = a3p_document_path(session_data, "planning")
+        if planning_path:
+            tasks.append(document_bundle.BundleTask("planning", bundle_stored_files, args=("planning", planning_path)))
+    elif training_code in {"APS", "SSIAP1"} and session_data.get("apsPlanningData"):
+        tasks.append(document_bundle.BundleTask("planning", bundle_planning, args=(session_data, sid), key=pdf_fragments.page_key(pdf_fragments.code_fingerprint(generate_aps_planning_pdf), inputs)))
+    elif session_data.get("planning_pdf"):
+        planning_path = os.path.join(PLANNING_DIR, os.path.basename(session_data["planning_pdf"]))
+        tasks.append(document_bundle.BundleTask("planning", bundle_stored_files, args=("planning", planning_path)))
+
+    student_key = "a3pAttendanceStudents" if is_a3p else "apsAttendanceStudents"
+    if session_data.get("a3pPlanningData" if is_a3p else "apsPlanningData") and session_data.get(student_key):
+        fragment_dir = attendance_fragment_dir(A3P_DOC_DIR if is_a3p else APS_ATTENDANCE_DIR, sid)
+        tasks.append(document_bundle.BundleTask("feuilles_presence", bundle_attendance, args=(session_data, sid, training_code, fragment_dir), depends=("planning",), key=pdf_fragments.page_key(pdf_fragments.code_fingerprint(generate_attendance_pdf_common), inputs)))
+
+    if ft_is_afc_session(session_data) and session_data.get("apsPlanningData") and session_data.get("apsAttendanceStudents"):
+        tasks.append(document_bundle.BundleTask("france_travail", bundle_france_travail, args=(session_data, sid), depends=("planning",), key=pdf_fragments.page_key(pdf_fragments.code_fingerprint(generate_france_travail_workbook), inputs)))
+
+    contracts = [contract for contract in session_data.get("apsTrainerContracts") or [] if contract.get("pdfFilename")]
+    if is_a3p and (contracts or a3p_document_path(session_data, "contract")):
+        tasks.append(document_bundle.BundleTask("contrats_formateurs", bundle_stored_files, args=("contrats_formateurs", a3p_document_path(session_data, "contract")), depends=("planning",)))
+    elif contracts:
+        tasks.append(document_bundle.BundleTask("contrats_formateurs", bundle_trainer_contracts, args=(session_data, contracts), depends=("planning",)))
+
+    convocation_prefix = secure_filename(f"convocation_aps_session_{sid}") + "_"
+    convocations = sorted(entry.path for entry in os.scandir(CONVOCATION_DIR) if entry.name.startswith(convocation_prefix) and entry.name.endswith(".pdf"))
+    if convocations:
+        tasks.append(document_bundle.BundleTask("convocations", bundle_stored_files, args=("convocations", *convocations)))
+
+    dsfs = [dsf for dsf in session_data.get("afcDsfs") or [] if dsf.get("status") != AFC_DSF_STATUS_CANCELLED]
+    if dsfs:
+        tasks.append(document_bundle.BundleTask("dsf", bundle_dsfs, args=(dsfs,), key=pdf_fragments.page_key(pdf_fragments.code_fingerprint(generate_dsf_excel_from_snapshot), dsfs)))
+    return tasks
+
+
+@app.get("/sessions/<sid>/documents/bundle.zip")
+def download_session_document_bundle(sid):
+    data = load_sessions(); session_data = find_session(data, sid)
+    if not session_data: abort(404)
+    tasks = session_bundle_tasks(session_data, sid)
+    if not tasks: abort(404, description="Aucun document à exporter pour cette session.")
+    started = time.perf_counter()
+    work_dir = tempfile.mkdtemp(prefix="session-bundle-")
+    try:
+        results = document_bundle.run(tasks, os.path.join(DOCUMENT_BUNDLE_DIR, secure_filename(str(sid)) or "session"), work_dir)
+    except Exception:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+    manifest = {
+        "sessionId": sid,
+        "sessionName": session_data.get("display_name") or session_data.get("formation") or sid,
+        "generatedAt": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "durationMs": round((time.perf_counter() - started) * 1000),
+        "documents": [{**result, "files": [arcname for arcname, _ in result["files"]]} for result in results],
+    }
+    app.logger.info("Export groupé session=%s durée=%sms documents=%s", sid, manifest["durationMs"], [(result["task"], result["status"], result["cached"], result["durationMs"]) for result in results])
+
+    def stream():
+        try:
+            yield from document_bundle.stream_zip(results, manifest)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    filename = f"documents_session_{secure_filename(str(sid)) or 'session'}.zip"
+    return Response(stream(), mimetype="application/zip", headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
 
 @app.get("/api/admin/sessions/<sid>/a3p-planning-builder")
 def get_a3p_planning_builder(sid):
@@ -8128,14 +8871,13 @@ def send_a3p_trainer_link(sid):
     url=a3p_trainer_public_url(session_data["a3pTrainerPublicToken"])
     first=(cfg.get("trainerFirstName") or session_data.get("a3pTrainerName") or "formateur").split()[0]
     body=f"Bonjour {first},\n\nDans le cadre de la préparation de la session A3P, merci de compléter les dates des modules imposés dont vous avez la charge.\n\nVous pouvez accéder au formulaire via le lien sécurisé ci-dessous :\n{url}\n\nDates de formation : du {format_date(cfg.get('startDate') or session_data.get('date_debut'))} au {format_date(cfg.get('endDate') or session_data.get('date_fin'))}.\nDate d’examen : {format_date(cfg.get('examDate') or session_data.get('date_exam'))}.\n\nMerci de compléter les 4 modules puis de cliquer sur “J’ai terminé” afin que nous puissions finaliser le planning.\n\nBien cordialement,\nIntégrale Academy"
-    smtp_config=get_smtp_config()
-    if not smtp_config.get("login") or not smtp_config.get("password"):
+    if not email_transport_configured():
         return jsonify({"ok":False,"error":"Email non configuré.","url":url}),400
-    msg=MIMEText(body,"plain",_charset="utf-8"); msg["Subject"]="Modules imposés A3P à compléter"; msg["From"]=smtp_config["from_email"]; msg["To"]=email
-    with smtplib.SMTP(smtp_config["server"], smtp_config["port"]) as server:
-        server.starttls(); server.login(smtp_config["login"], smtp_config["password"]); server.sendmail(smtp_config["from_email"],[email],msg.as_string())
+    result=send_outbound_email(email,"Modules imposés A3P à compléter",body,subtype="plain",category="a3p-trainer-link")
+    if not result.ok and not result.queued:
+        return jsonify({"ok":False,"error":email_delivery_error(result),"url":url}),502
     session_data["a3pTrainerModulesStatus"]="sent"; session_data["a3pTrainerPublicLinkSentAt"]=datetime.now().strftime("%Y-%m-%d %H:%M:%S"); save_sessions(data)
-    return jsonify({"ok":True,"url":url,"status":a3p_trainer_status(session_data)})
+    return jsonify({"ok":True,"url":url,"status":a3p_trainer_status(session_data),"emailQueued":result.queued})
 
 @app.post("/api/admin/sessions/<sid>/a3p/trainer-modules/validate")
 def validate_a3p_trainer_modules_admin(sid):
@@ -8499,23 +9241,75 @@ def healthz():
 
 @app.route("/cron-check")
 def cron_check():
-    data = load_sessions()
-    for session in data["sessions"]:
-        auto_archive_if_all_done(session)
-    reminded = send_jury_reminders(data, request.url_root.rstrip("/"))
-    expired_alerts = send_formateur_expiration_alerts()
-    save_sessions(data)
-    message = "Cron check terminé"
-    if reminded:
-        message = f"{message} | Rappels jury envoyés: {', '.join(reminded)}"
-    if expired_alerts:
-        message = f"{message} | Alertes expiration formateurs: {expired_alerts}"
-    return message, 200
+    enqueue_scheduled_job("sessions_check", {"base_url": request.url_root.rstrip("/")})
+    enqueue_scheduled_job("formateur_expiration_alerts")
+    return "Cron check planifié (archivage, rappels jury, alertes expiration formateurs)", 202
 
 @app.route("/cron-daily-summary")
 def cron_daily_summary():
-    send_daily_overdue_summary()
-    return "Mail récapitulatif envoyé", 200
+    enqueue_scheduled_job("daily_overdue_summary")
+    return "Mail récapitulatif planifié", 202
+
+@app.route("/cron-mail-outbox")
+def cron_mail_outbox():
+    processed = process_mail_outbox()
+    return f"Boîte d'envoi traitée ({processed} message(s))", 200
+
+
+@app.get("/api/mail/outbox")
+def list_mail_outbox():
+    status = (request.args.get("status") or "").strip()
+    limit = min(max(request.args.get("limit", 50, type=int) or 50, 1), 500)
+    return jsonify({"ok": True, "messages": outbound_mail.list_entries(MAIL_OUTBOX_DB, status, limit)})
+
+
+@app.post("/api/mail/outbox/<int:entry_id>/retry")
+def retry_mail_outbox_entry(entry_id):
+    if not outbound_mail.retry(MAIL_OUTBOX_DB, entry_id):
+        return jsonify({"ok": False, "error": "Message introuvable dans la boîte d'envoi."}), 404
+    _mail_outbox_wakeup.set()
+    return jsonify({"ok": True, "id": entry_id, "status": outbound_mail.STATUS_PENDING})
+
+
+@app.get("/api/scheduler/jobs")
+def list_scheduler_jobs():
+    job = (request.args.get("job") or "").strip()
+    limit = min(max(request.args.get("limit", 50, type=int) or 50, 1), 500)
+    return jsonify({
+        "ok": True,
+        "lease": job_scheduler.lease(SCHEDULER_DB),
+        "queue": job_scheduler.list_queue(SCHEDULER_DB),
+        "history": job_scheduler.list_history(SCHEDULER_DB, job, limit),
+    })
+
+
+@app.get("/api/planning/feasibility")
+def planning_feasibility_api():
+    """Vérifie une période (début, fin, examen) et suggère les dates valides les plus proches."""
+    kind = (request.args.get("type") or "").strip()
+    if not kind:
+        formation = (request.args.get("formation") or "").strip().upper()
+        kind = PLANNING_FEASIBILITY_FORMATIONS.get(formation, "")
+        if formation == "APS" and request.args.get("planningMode") == "elearning_presentiel":
+            kind = "aps_elearning_presentiel"
+    requirement = PLANNING_REQUIREMENTS.get(kind)
+    if requirement is None:
+        return jsonify({"ok": False, "error": "Type de planning inconnu."}), 400
+    dates = {}
+    for key in ("start", "end", "exam"):
+        value = (request.args.get(key) or "").strip()
+        parsed = parse_date(value) if value else None
+        if value and parsed is None:
+            return jsonify({"ok": False, "error": f"Date invalide : {value}"}), 400
+        dates[key] = parsed.date() if parsed else None
+    exam_iso = dates["exam"].isoformat() if dates["exam"] else ""
+    end = dates["end"]
+    if end is None and dates["exam"]:
+        # Sans date de fin, la formation doit se terminer avant le jour d'examen.
+        end = dates["exam"] - timedelta(days=1)
+    calendar = planning_feasibility_calendar(kind, exam_iso, request.args.get("allowSaturday") in ("1", "true", "on"), request.args.getlist("excluded"))
+    result = planning_feasibility.suggest_dates(requirement, calendar, dates["start"], end, exam_calendar=FRENCH_CALENDAR)
+    return jsonify({"ok": True, "type": kind, **result})
 
 # ------------------------------------------------------------
 # ✅ Route publique pour le suivi auto sur la plateforme principale
@@ -8604,47 +9398,40 @@ def save_dotations(data):
         json.dump(data, f, ensure_ascii=False, indent=2)
 
 
-# ✉️ Fonction d’envoi d’email (réutilise la conf SMTP)
+# ✉️ Fonction d’envoi d’email (service d'envoi commun, boîte d'envoi en cas d'échec)
 def send_email(to, subject, body):
-    if not FROM_EMAIL or not EMAIL_PASSWORD:
+    # Envoyé depuis la boîte FROM_EMAIL, comme avant le service d'envoi commun.
+    if not email_transport_configured(outbound_mail.TRANSPORT_MAILBOX):
         print("⚠️ Email non configuré")
         return
-    msg = MIMEText(body, "html", "utf-8")
-    msg["From"] = FROM_EMAIL
-    msg["To"] = to
-    msg["Subject"] = subject
-    try:
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as s:
-            s.starttls()
-            s.login(FROM_EMAIL, EMAIL_PASSWORD)
-            s.sendmail(FROM_EMAIL, [to], msg.as_string())
+    result = send_outbound_email(to, subject, body, category="notification", transport=outbound_mail.TRANSPORT_MAILBOX)
+    if result.ok:
         print(f"✅ Mail envoyé à {to}")
-    except Exception as e:
-        print("❌ Erreur envoi mail dotation :", e)
+    elif result.queued:
+        print(f"⏳ Mail pour {to} en boîte d'envoi :", result.error)
+    else:
+        print("❌ Erreur envoi mail dotation :", result.error)
+
+
+def build_price_adaptator_email(to, subject, html):
+    return outbound_mail.OutboundEmail(
+        to=[to],
+        subject=subject,
+        body=html,
+        cc=["clement@integraleacademy.com"],
+        category="price-adaptator",
+    )
 
 
 def send_price_adaptator_email(to, subject, html):
-    smtp_config = get_smtp_config()
-    if not smtp_config["login"] or not smtp_config["password"]:
+    if not email_transport_configured():
         return False, "SMTP non configuré"
-    msg = MIMEText(html, "html", "utf-8")
-    msg["From"] = smtp_config["from_email"]
-    msg["To"] = to
-    msg["Cc"] = "clement@integraleacademy.com"
-    msg["Subject"] = subject
-    try:
-        with smtplib.SMTP(smtp_config["server"], smtp_config["port"]) as server:
-            server.starttls()
-            server.login(smtp_config["login"], smtp_config["password"])
-            server.sendmail(
-                smtp_config["from_email"],
-                [to, "clement@integraleacademy.com"],
-                msg.as_string(),
-            )
-        return True, None
-    except Exception as e:
-        print("❌ Erreur envoi mail price adaptator :", e)
-        return False, str(e)
+    # Pas de boîte d'envoi : la relance automatique rejoue elle-même les prospects non envoyés.
+    result = send_outbound_emails([build_price_adaptator_email(to, subject, html)], queue_on_failure=False)[0]
+    if not result.ok:
+        print("❌ Erreur envoi mail price adaptator :", result.error)
+        return False, result.error
+    return True, None
 
 
 def send_price_adaptator_sms(phone, message):
@@ -8663,7 +9450,7 @@ def send_price_adaptator_sms(phone, message):
             "type": "transactional",
         }).encode("utf-8")
 
-        req = urllib.request.Request("https://api.brevo.com/v3/transactionalSMS/sms")
+        req = urllib.request.Request(f"{BREVO_API_BASE_URL}/v3/transactionalSMS/sms")
         req.add_header("Content-Type", "application/json")
         req.add_header("api-key", BREVO_API_KEY)
 
@@ -8909,12 +9696,13 @@ def normalize_lookup_text(value):
 def formateur_full_name(formateur):
     return " ".join(part for part in [(formateur.get("prenom") or "").strip(), (formateur.get("nom") or "").strip()] if part).strip()
 
-def find_formateur_by_identity(name="", email=""):
+def find_formateur_by_identity(name="", email="", formateurs=None):
+    """`formateurs` : liste déjà chargée, pour éviter de relire le fichier à chaque recherche."""
     wanted_email = normalize_lookup_text(email)
     wanted_name = normalize_lookup_text(name)
     if not wanted_email and not wanted_name:
         return None
-    for formateur in load_formateurs():
+    for formateur in load_formateurs() if formateurs is None else formateurs:
         if wanted_email and normalize_lookup_text(formateur.get("email")) == wanted_email:
             return formateur
         full_name = normalize_lookup_text(formateur_full_name(formateur))
@@ -9127,7 +9915,7 @@ def normalize_yousign_state(state=None):
         "signatureUrl": "", "sentAt": "", "signedAt": "", "declinedAt": "", "expiredAt": "", "canceledAt": "",
         "lastEvent": "", "lastEventAt": "", "lastSyncedAt": "", "lastWebhookAt": "",
         "apiStatus": "", "apiSignerStatus": "", "apiHttpStatus": "", "apiError": "", "apiRawResponse": "",
-        "recipientEmail": "", "signedDocumentFilename": "", "signedDocumentUrl": "", "error": None, "errorPayload": None,
+        "recipientEmail": "", "signedDocumentFilename": "", "signedDocumentSha256": "", "signedDocumentUrl": "", "error": None, "errorPayload": None,
     }
     legacy = {
         "yousign_signature_request_id": "signatureRequestId", "yousign_signer_id": "signerId", "yousign_document_id": "documentId",
@@ -9241,7 +10029,9 @@ def build_yousign_api_sync_updates(signature_request_payload, signers_payload=No
     if internal_status == "canceled": updates["canceledAt"] = now
     return updates
 
-def sync_yousign_signature_request_from_api(signature_request_id, now=None):
+def sync_yousign_signature_request_from_api(signature_request_id, now=None, raise_transient=False):
+    """Relit la demande et ses signataires chez Yousign. Une erreur API est renvoyée dans les
+    champs `api*`, sauf panne transitoire avec `raise_transient` (elle est alors relevée)."""
     now = now or datetime.now().isoformat(timespec="seconds")
     client = YousignClient()
     env = detect_yousign_environment(client.config.base_url)
@@ -9267,6 +10057,8 @@ def sync_yousign_signature_request_from_api(signature_request_id, now=None):
         status = exc.status_code or "network"
         body = exc.payload if exc.payload is not None else str(exc)
         logger.error("YOUSIGN SYNC ERROR signature_request_id=%s http_status=%s body=%s error=%s", signature_request_id, status, body, exc)
+        if raise_transient and exc.retryable:
+            raise
         return {
             "apiStatus": f"erreur {status}",
             "apiHttpStatus": str(status),
@@ -9856,69 +10648,71 @@ def download_formateur_signed_yousign(fid):
         flash("Aucune demande Yousign disponible.", "error")
         return redirect(url_for("formateur_detail", fid=fid))
     try:
-        content = YousignClient().download_signed_documents(state["signatureRequestId"])
         signed_dir = os.path.join(FORMATEUR_FILES_DIR, fid, "_yousign")
-        os.makedirs(signed_dir, exist_ok=True)
-        filename = f"contrat_signe_yousign_{state['signatureRequestId']}.zip"
-        with open(os.path.join(signed_dir, filename), "wb") as f:
-            f.write(content)
-        update_formateur_yousign_state(formateur, {"signedDocumentFilename": filename, "lastSyncedAt": datetime.now().isoformat(timespec="seconds"), "error": None})
+        filename, sha256 = save_yousign_signed_document(YousignClient(), state["signatureRequestId"], signed_dir, f"contrat_signe_yousign_{state['signatureRequestId']}")
+        update_formateur_yousign_state(formateur, {"signedDocumentFilename": filename, "signedDocumentSha256": sha256, "lastSyncedAt": datetime.now().isoformat(timespec="seconds"), "error": None})
         save_formateurs(formateurs)
-        return send_from_directory(signed_dir, filename, as_attachment=True)
+        return send_yousign_signed_file(signed_dir, filename, as_attachment=True)
     except Exception as exc:
         flash(f"Téléchargement Yousign impossible: {exc}", "error")
         return redirect(url_for("formateur_detail", fid=fid))
 
 
-@app.route("/webhooks/yousign", methods=["POST"])
-def yousign_webhook():
-    raw_body = request.get_data()
-    yousign_signature_header_names = [
-        "X-Yousign-Signature-256",
-        "X-Yousign-Signature",
-        "Yousign-Signature",
-        "X-Hub-Signature-256",
-    ]
-    important_headers = {
-        key: request.headers.get(key)
-        for key in ["Content-Type", "User-Agent", *yousign_signature_header_names]
-        if request.headers.get(key)
-    }
-    payload = request.get_json(silent=True) or {}
-    event_name = payload.get("event_name") or payload.get("event") or payload.get("type") or "unknown"
+YOUSIGN_WEBHOOK_SIGNATURE_HEADERS = [
+    "X-Yousign-Signature-256",
+    "X-Yousign-Signature",
+    "Yousign-Signature",
+    "X-Hub-Signature-256",
+]
+YOUSIGN_WEBHOOK_INBOX_DB = os.path.join(os.environ.get("PERSIST_DIR") or DATA_DIR, yousign_inbox.INBOX_DB_NAME)
+YOUSIGN_WEBHOOK_POLL_SECONDS = int(os.environ.get("YOUSIGN_WEBHOOK_POLL_SECONDS", "15"))
+YOUSIGN_WEBHOOK_MAX_ATTEMPTS = int(os.environ.get("YOUSIGN_WEBHOOK_MAX_ATTEMPTS", str(yousign_inbox.DEFAULT_MAX_ATTEMPTS)))
+_yousign_webhook_wakeup = threading.Event()
+_yousign_webhook_worker_lock = threading.Lock()
+_yousign_webhook_worker_pid = None
+
+
+class YousignWebhookTargetNotFound(LookupError):
+    """Aucun formateur ni contrat APS ne correspond encore à l'événement (nouvelle tentative prévue)."""
+
+
+def parse_yousign_webhook_payload(payload):
+    payload = payload if isinstance(payload, dict) else {}
     data_payload = payload.get("data") if isinstance(payload.get("data"), dict) else {}
     signature_request = data_payload.get("signature_request") if isinstance(data_payload.get("signature_request"), dict) else {}
     signer = data_payload.get("signer") if isinstance(data_payload.get("signer"), dict) else {}
-    signature_request_id = (signature_request or {}).get("id") or data_payload.get("signature_request_id") or payload.get("signature_request_id") or (signer.get("signature_request") or {}).get("id")
-    signer_id = signer.get("id") or data_payload.get("signer_id") or payload.get("signer_id")
-    external_id = extract_yousign_external_id(payload)
-    logger.info(
-        "YOUSIGN WEBHOOK RECEIVED event=%s signature_request_id=%s external_id=%s",
-        event_name, signature_request_id or "missing", external_id or "missing",
-    )
-    logger.info(
-        "Yousign webhook diagnostic method=%s url=%s headers=%s body=%s signer_id=%s",
-        request.method, request.url, important_headers, raw_body.decode("utf-8", errors="replace"), signer_id or "missing",
-    )
-
-    webhook_secret = get_yousign_config().webhook_secret
-    signature_header = next((request.headers.get(key) for key in yousign_signature_header_names if request.headers.get(key)), None)
-    if webhook_secret:
-        if not signature_header:
-            logger.warning("YOUSIGN WEBHOOK IGNORED event=%s reason=missing_signature", event_name)
-            return {"ok": True, "ignored": True}
-        expected = hmac.new(webhook_secret.encode("utf-8"), raw_body, hashlib.sha256).hexdigest()
-        provided = signature_header.split("=", 1)[-1].strip()
-        if not hmac.compare_digest(expected, provided):
-            logger.warning("YOUSIGN WEBHOOK IGNORED event=%s reason=invalid_signature", event_name)
-            return {"ok": True, "ignored": True}
+    return {
+        "event_name": payload.get("event_name") or payload.get("event") or payload.get("type") or "unknown",
+        "signature_request": signature_request,
+        "signature_request_id": (signature_request or {}).get("id") or data_payload.get("signature_request_id") or payload.get("signature_request_id") or (signer.get("signature_request") or {}).get("id") or "",
+        "signer_id": signer.get("id") or data_payload.get("signer_id") or payload.get("signer_id") or "",
+        "external_id": extract_yousign_external_id(payload),
+    }
 
-    if event_name not in YOUSIGN_HANDLED_WEBHOOK_EVENTS:
-        logger.info("YOUSIGN WEBHOOK IGNORED event=%s", event_name)
-        return {"ok": True, "ignored": True}
 
-    status = YOUSIGN_EVENT_STATUS.get(event_name) or extract_yousign_status(signature_request or payload)
-    now = datetime.now().isoformat(timespec="seconds")
+def verify_yousign_webhook_signature(raw_body, headers, webhook_secret):
+    if not webhook_secret:
+        return True, ""
+    signature_header = next((headers.get(key) for key in YOUSIGN_WEBHOOK_SIGNATURE_HEADERS if headers.get(key)), None)
+    if not signature_header:
+        return False, "missing_signature"
+    expected = hmac.new(webhook_secret.encode("utf-8"), raw_body, hashlib.sha256).hexdigest()
+    provided = signature_header.split("=", 1)[-1].strip()
+    if not hmac.compare_digest(expected, provided):
+        return False, "invalid_signature"
+    return True, ""
+
+
+def apply_yousign_webhook_event(payload, now=None):
+    """Applique un événement Yousign enregistré : synchronisation API puis mise à jour du formateur ou du contrat APS."""
+    parsed = parse_yousign_webhook_payload(payload)
+    event_name = parsed["event_name"]
+    signature_request_id = parsed["signature_request_id"]
+    signer_id = parsed["signer_id"]
+    external_id = parsed["external_id"]
+
+    status = YOUSIGN_EVENT_STATUS.get(event_name) or extract_yousign_status(parsed["signature_request"] or payload)
+    now = now or datetime.now().isoformat(timespec="seconds")
     updates = {"status": status, "externalId": external_id, "lastWebhookAt": now, "lastEvent": event_name, "lastEventAt": now, "error": None}
     if signer_id:
         updates["signerId"] = signer_id
@@ -9929,9 +10723,12 @@ def yousign_webhook():
 
     try:
         if signature_request_id:
-            updates.update(sync_yousign_signature_request_from_api(signature_request_id, now))
+            updates.update(sync_yousign_signature_request_from_api(signature_request_id, now, raise_transient=True))
             updates.update({"lastWebhookAt": now, "lastEvent": event_name, "lastEventAt": now})
     except YousignError as exc:
+        # Panne Yousign : l'événement reste en file et sera réappliqué après le délai de reprise.
+        if exc.retryable:
+            raise
         logger.warning("Yousign webhook API sync failed signature_request_id=%s error=%s", signature_request_id, exc)
         updates["error"] = str(exc)
 
@@ -9949,7 +10746,7 @@ def yousign_webhook():
         update_formateur_yousign_state(formateur, updates)
         save_formateurs(formateurs)
         logger.info("Webhook Yousign appliqué au formateur id=%s status=%s", formateur.get("id"), updates.get("status"))
-        return {"ok": True, "target": "formateur"}
+        return {"ok": True, "target": "formateur", "status": updates.get("status")}
 
     sessions_data = load_sessions()
     for session_data in sessions_data.get("sessions", []):
@@ -9959,10 +10756,99 @@ def yousign_webhook():
                 mirror_yousign_state_on_contract(contract)
                 save_sessions(sessions_data)
                 logger.info("Webhook Yousign appliqué au contrat APS session=%s contract=%s status=%s", session_data.get("id"), contract.get("id"), updates.get("status"))
-                return {"ok": True, "target": "aps_trainer_contract"}
+                return {"ok": True, "target": "aps_trainer_contract", "status": updates.get("status")}
+
+    # L'événement peut précéder l'enregistrement local de la demande (activation
+    # suivie d'un webhook immédiat) : on laisse le worker réessayer plus tard.
+    raise YousignWebhookTargetNotFound(
+        f"Contrat introuvable event={event_name} signature_request_id={signature_request_id} signer_id={signer_id} external_id={external_id}"
+    )
+
+
+def process_yousign_webhook_inbox(limit=20, db_path=None):
+    """Traite les événements échus de la file Yousign. Renvoie le nombre d'événements réservés."""
+    db_path = db_path or YOUSIGN_WEBHOOK_INBOX_DB
+    events = yousign_inbox.claim_due_events(db_path, limit=limit)
+    for event in events:
+        try:
+            result = apply_yousign_webhook_event(event["payload"])
+        except Exception as exc:
+            status = yousign_inbox.mark_failed(db_path, event["id"], event["attempts"], str(exc), YOUSIGN_WEBHOOK_MAX_ATTEMPTS)
+            log = logger.error if status == yousign_inbox.STATUS_FAILED else logger.warning
+            log("YOUSIGN WEBHOOK APPLY FAILED id=%s event=%s attempts=%s status=%s error=%s", event["id"], event["event_name"], event["attempts"], status, exc)
+            continue
+        yousign_inbox.mark_done(db_path, event["id"], result)
+    return len(events)
+
+
+def yousign_webhook_worker_loop(db_path):
+    # Vide d'abord la file au démarrage : les événements reçus avant un redéploiement
+    # ou en attente de reprise n'attendent pas le prochain webhook.
+    while True:
+        try:
+            while process_yousign_webhook_inbox(db_path=db_path):
+                pass
+        except Exception as exc:
+            logging.exception("[yousign-webhooks] Worker error: %s", exc)
+        _yousign_webhook_wakeup.wait(YOUSIGN_WEBHOOK_POLL_SECONDS)
+        _yousign_webhook_wakeup.clear()
+
+
+def start_yousign_webhook_worker():
+    """Démarre (une fois par processus gunicorn) le thread qui applique les webhooks en file."""
+    global _yousign_webhook_worker_pid
+    with _yousign_webhook_worker_lock:
+        if _yousign_webhook_worker_pid == os.getpid():
+            return
+        _yousign_webhook_worker_pid = os.getpid()
+    thread = threading.Thread(target=yousign_webhook_worker_loop, args=(YOUSIGN_WEBHOOK_INBOX_DB,), name="yousign-webhooks", daemon=True)
+    thread.start()
+
 
-    logger.error("YOUSIGN WEBHOOK CONTRACT NOT FOUND event=%s signature_request_id=%s signer_id=%s external_id=%s", event_name, signature_request_id, signer_id, external_id)
-    return {"ok": True, "ignored": True}
+@app.route("/webhooks/yousign", methods=["POST"])
+def yousign_webhook():
+    raw_body = request.get_data()
+    payload = request.get_json(silent=True) or {}
+    parsed = parse_yousign_webhook_payload(payload)
+    event_name = parsed["event_name"]
+    logger.info(
+        "YOUSIGN WEBHOOK RECEIVED event=%s signature_request_id=%s external_id=%s signer_id=%s",
+        event_name, parsed["signature_request_id"] or "missing", parsed["external_id"] or "missing", parsed["signer_id"] or "missing",
+    )
+
+    valid, reason = verify_yousign_webhook_signature(raw_body, request.headers, get_yousign_config().webhook_secret)
+    if not valid:
+        logger.warning("YOUSIGN WEBHOOK IGNORED event=%s reason=%s", event_name, reason)
+        return {"ok": True, "ignored": True}
+
+    if event_name not in YOUSIGN_HANDLED_WEBHOOK_EVENTS:
+        logger.info("YOUSIGN WEBHOOK IGNORED event=%s", event_name)
+        return {"ok": True, "ignored": True}
+
+    key = yousign_inbox.idempotency_key(payload, raw_body)
+    event_id, created = yousign_inbox.enqueue(YOUSIGN_WEBHOOK_INBOX_DB, key, payload, event_name, parsed["signature_request_id"])
+    if not created:
+        logger.info("YOUSIGN WEBHOOK DUPLICATE event=%s id=%s key=%s", event_name, event_id, key)
+        return {"ok": True, "duplicate": True, "eventId": event_id}
+
+    _yousign_webhook_wakeup.set()
+    return {"ok": True, "queued": True, "eventId": event_id}
+
+
+@app.get("/api/yousign/webhooks")
+def list_yousign_webhook_events():
+    status = (request.args.get("status") or "").strip()
+    limit = min(max(request.args.get("limit", 50, type=int) or 50, 1), 500)
+    return jsonify({"ok": True, "events": yousign_inbox.list_events(YOUSIGN_WEBHOOK_INBOX_DB, status, limit)})
+
+
+@app.post("/api/yousign/webhooks/<int:event_id>/replay")
+def replay_yousign_webhook_event(event_id):
+    if not yousign_inbox.replay(YOUSIGN_WEBHOOK_INBOX_DB, event_id):
+        return jsonify({"ok": False, "error": "Événement Yousign introuvable."}), 404
+    logger.info("YOUSIGN WEBHOOK REPLAY id=%s", event_id)
+    _yousign_webhook_wakeup.set()
+    return jsonify({"ok": True, "eventId": event_id, "status": yousign_inbox.STATUS_PENDING})
 
 
 @app.route("/formateurs/<fid>/delete", methods=["POST"])
@@ -10705,7 +11591,17 @@ def distributeur_reassort_valider(ligne_id, produit_id):
 
     return redirect(url_for("distributeur_reassort"))
 
-start_price_adaptator_scheduler()
+def start_background_workers():
+    """Threads de fond d'un worker gunicorn (planificateur, webhooks Yousign, boîte d'envoi, préchargement Excel).
+
+    Appelé par le hook `post_worker_init` de `gunicorn.conf.py`, jamais à
+    l'import : les tests et les scripts qui importent `app` n'ouvrent pas les
+    files de `DATA_DIR` et n'exécutent aucune tâche.
+    """
+    start_job_scheduler()
+    start_yousign_webhook_worker()
+    start_mail_outbox_worker()
+    start_excel_templates_warm_up()
 
 import xml.etree.ElementTree as ET
 from flask import Response, request
@@ -10740,9 +11636,7 @@ def salesforce_lead_outbound():
     except Exception as e:
         return Response(f"Bad XML: {e}", status=400)
 
-    # On récupère TON format de stockage (dict)
-    data = load_price_adaptator_data()
-
+    prospects = []
     now_iso = datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
     added = 0
 
@@ -10781,10 +11675,11 @@ def salesforce_lead_outbound():
 
         # on n’ajoute que si formation ok + nom/prénom ok
         if prospect["nom"] and prospect["prenom"] and prospect["formation"]:
-            data["prospects"].insert(0, prospect)
+            prospects.append(prospect)
             added += 1
 
-    save_price_adaptator_data(data)
+    if prospects:
+        add_price_adaptator_prospects(prospects)
 
     soap_response = """<?xml version="1.0" encoding="UTF-8"?>
 <soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/">
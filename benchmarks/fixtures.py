@@ -0,0 +1,209 @@
+"""Sessions synthétiques pour les benchmarks.
+
+Les fixtures passent par les vrais générateurs de planning du dépôt : une
+session de benchmark a donc la même forme qu'une session réelle enregistrée
+dans `sessions.json`. Tout est déterministe (dates fixes, noms numérotés) pour
+que deux exécutions sur deux commits mesurent exactement le même travail.
+"""
+from __future__ import annotations
+
+import copy
+from datetime import date, timedelta
+from functools import lru_cache
+
+import app as application
+from a3p_program import generateA3pSchedule
+from desp_program import desp_summary_from_planning, generate_desp_planning
+
+TRAINER = "Jean Dupont"
+ROOM = "Salle 1"
+TRAINEE_COUNTS = (5, 15, 30, 60)
+# La feuille d'émargement tient sur une page par jour : au-delà d'environ 15
+# stagiaires (AFC) la mise en page refuse de chevaucher le pied de page.
+ATTENDANCE_TRAINEE_COUNTS = (5, 10, 15)
+AFC_CONTRACTUAL_END = date(2027, 2, 15)
+AFC_INTERRUPTIONS = [(date(2026, 12, 23), date(2027, 1, 4))]
+
+
+def trainees(count: int, start_iso: str) -> list[dict]:
+    students = []
+    for index in range(count):
+        students.append({
+            "id": f"st{index:03d}",
+            "lastName": f"NOM{index:03d}",
+            "firstName": f"Prenom{index:03d}",
+            "startDate": start_iso,
+            "france_travail_id": f"{index:07d}A",
+            "status": "inscrit",
+        })
+    return students
+
+
+def _with_trainees(session: dict, count: int) -> dict:
+    session = copy.deepcopy(session)
+    session["apsAttendanceStudents"] = trainees(count, session["date_debut"])
+    return session
+
+
+@lru_cache(maxsize=None)
+def _aps_base(planning_mode: str) -> dict:
+    planning, _, _ = application.build_aps_planning_data(
+        date(2026, 3, 2), TRAINER, ROOM, planning_mode, end_date=date(2026, 4, 10), exam_iso="2026-04-13",
+    )
+    return {
+        "id": f"bench-aps-{planning_mode}",
+        "formation": "APS",
+        "training_code": "APS",
+        "display_name": "Session APS benchmark",
+        "date_debut": "2026-03-02",
+        "date_fin": "2026-04-10",
+        "date_exam": "2026-04-13",
+        "salle": ROOM,
+        "apsPlanningMode": planning_mode,
+        "apsPlanningData": planning,
+    }
+
+
+def aps_session(planning_mode: str = "full_presentiel", trainee_count: int = 15) -> dict:
+    return _with_trainees(_aps_base(planning_mode), trainee_count)
+
+
+@lru_cache(maxsize=None)
+def _ssiap1_base() -> dict:
+    exam = {"date": "2026-01-21", "start": "08:30", "end": "12:30", "room": "Salle Examen", "durationMinutes": 240}
+    planning, _, _ = application.build_ssiap1_planning_data(
+        date(2026, 1, 5), TRAINER, ROOM, end_date=date(2026, 1, 20), exam_iso="2026-01-21", exam_payload=exam,
+    )
+    return {
+        "id": "bench-ssiap1", "formation": "SSIAP", "training_code": "SSIAP1", "display_name": "Session SSIAP 1 benchmark",
+        "date_debut": "2026-01-05", "date_fin": "2026-01-20", "date_exam": "2026-01-21", "salle": ROOM,
+        "apsPlanningData": planning,
+    }
+
+
+def ssiap1_session(trainee_count: int = 15) -> dict:
+    return _with_trainees(_ssiap1_base(), trainee_count)
+
+
+@lru_cache(maxsize=None)
+def _desp_base() -> dict:
+    planning = generate_desp_planning(date(2026, 6, 12), date(2026, 7, 17), date(2026, 7, 20), date(2026, 7, 30), TRAINER, ROOM, exam_iso="2026-07-31", allow_saturday=False)
+    return {
+        "id": "bench-desp", "formation": "DESP", "display_name": "Session DESP benchmark",
+        "date_debut": "2026-06-12", "date_fin": "2026-07-30", "date_exam": "2026-07-31", "salle": ROOM,
+        "apsPlanningMode": "desp", "apsPlanningData": planning,
+    }
+
+
+def desp_session(trainee_count: int = 15) -> dict:
+    return _with_trainees(_desp_base(), trainee_count)
+
+
+def a3p_config() -> dict:
+    days = []
+    day = date(2026, 1, 5)
+    while len(days) < 48:
+        if day.weekday() < 5:
+            days.append({"date": day.isoformat(), "dayStart": "08:30", "dayEnd": "16:30"})
+        day += timedelta(days=1)
+    days[10]["dayEnd"] = "12:30"
+    days[-1].update(dayStart="10:00", dayEnd="14:00")
+    return {
+        "trainerFirstName": "Jean", "trainerLastName": "Dupont", "room": ROOM, "examDate": "2026-04-30", "days": days,
+        "lockedModules": {
+            "UV1": [days[0]["date"], days[1]["date"]],
+            "UV5": [
+                {"date": days[2]["date"], "start": "08:30", "end": "12:00", "durationMinutes": 210},
+                {"date": days[2]["date"], "start": "13:00", "end": "16:30", "durationMinutes": 210},
+                {"date": days[3]["date"], "start": "08:30", "end": "12:00", "durationMinutes": 210},
+                {"date": days[3]["date"], "start": "13:00", "end": "15:30", "durationMinutes": 150},
+            ],
+            "UV6A": [d["date"] for d in days[4:11]],
+            "UV9": [days[11]["date"], days[12]["date"]],
+        },
+    }
+
+
+@lru_cache(maxsize=None)
+def _a3p_base() -> dict:
+    config = a3p_config()
+    result = generateA3pSchedule(config)
+    return {
+        "id": "bench-a3p", "formation": "A3P", "display_name": "Session A3P benchmark",
+        "date_debut": config["days"][0]["date"], "date_fin": config["days"][-1]["date"], "date_exam": config["examDate"], "salle": ROOM,
+        "a3pConfig": config, "a3pPlanningData": result["planning"], "a3pTrainerName": TRAINER,
+    }
+
+
+def a3p_session(trainee_count: int = 15) -> dict:
+    return _with_trainees(_a3p_base(), trainee_count)
+
+
+@lru_cache(maxsize=None)
+def _afc_base() -> dict:
+    planning = application.build_afc_aps_ssiap_planning_data(date(2026, 11, 16), TRAINER, ROOM, AFC_INTERRUPTIONS, contractual_end_date=AFC_CONTRACTUAL_END)
+    summary = application.afc_aps_ssiap_summary_from_data(planning, AFC_INTERRUPTIONS, contractual_end_date=AFC_CONTRACTUAL_END)
+    return {
+        "id": "bench-afc", "formation": "AFC_APS_SSIAP", "training_code": "AFC_APS_SSIAP",
+        "display_name": "AFC France Travail APS + SSIAP benchmark",
+        "date_debut": planning[0]["date"], "date_fin": planning[-1]["date"], "date_exam": planning[-1]["date"], "salle": ROOM,
+        "contractual_end_date": AFC_CONTRACTUAL_END.isoformat(), "apsPlanningMode": "full_presentiel",
+        "apsPlanningData": planning, "apsPlanningSummary": summary, "afcDsfs": [],
+        "france_travail": {"marche_afc": "M2026", "brs": "BRS1", "convention": "C2026", "bon_commande": "BC1", "type_session": "ESF", "intitule": "AFC APS + SSIAP", "engagement_kairos": "123456789"},
+    }
+
+
+def afc_session(trainee_count: int = 15, billed_dsfs: int = 0) -> dict:
+    """Session AFC de 57 jours ; `billed_dsfs` DSF finalisées couvrent le début du planning."""
+    session = _with_trainees(_afc_base(), trainee_count)
+    planning = session["apsPlanningData"]
+    step = max(1, len(planning) // (billed_dsfs + 2)) if billed_dsfs else 0
+    for number in range(1, billed_dsfs + 1):
+        period_start = planning[(number - 1) * step]["date"]
+        period_end = planning[number * step - 1]["date"]
+        result = application.afc_dsf_compute(session, period_start, period_end, ["FT", "RAN"])
+        session["afcDsfs"].append({"id": f"dsf{number}", "number": number, "label": f"DSF {number}", "status": application.AFC_DSF_STATUS_FINALIZED, **result})
+    return session
+
+
+def afc_dsf_with_snapshot(session: dict) -> dict:
+    """DSF finalisée sur tout le planning, avec le snapshot Excel France Travail attendu par la facture."""
+    result = application.afc_dsf_compute(session, session["date_debut"], session["date_fin"], ["FT", "RAN"])
+    number = application.afc_dsf_next_number(session)
+    snapshot = application.afc_dsf_session_snapshot(session, result, number, None)
+    return {"id": f"dsf{number}", "number": number, "label": f"DSF {number}", "status": application.AFC_DSF_STATUS_FINALIZED, "modules": ["FT", "RAN"], **result, "franceTravailExcelSnapshot": snapshot}
+
+
+def trainer_contract(session: dict) -> dict:
+    interventions = []
+    for day in session.get("apsPlanningData") or []:
+        for slot in day.get("slots") or []:
+            if slot.get("modality") == "elearning":
+                continue
+            interventions.append({
+                "date": day["date"], "dateLabel": date.fromisoformat(day["date"]).strftime("%d/%m/%Y"),
+                "start": slot["start"], "end": slot["end"], "hours": float(slot.get("duration") or 0),
+                "module": slot.get("uv") or "", "modality": "Présentiel",
+            })
+    hours = round(sum(item["hours"] for item in interventions), 2)
+    days = len({item["date"] for item in interventions})
+    return {
+        "trainerName": TRAINER, "trainerEmail": "jean@example.com", "trainerPhone": "0600000000",
+        "status": "Formateur indépendant", "siret": "12345678900010", "activityDeclaration": "", "address": "1 rue Test",
+        "calculatedHours": hours, "calculatedDays": days, "billedDays": days, "dailyRate": 300,
+        "totalHT": days * 300, "totalTTC": days * 300, "interventions": interventions,
+    }
+
+
+def desp_document_profile(session: dict) -> dict:
+    summary = desp_summary_from_planning(session["apsPlanningData"])
+    return {"validate": "desp", "summary": summary, "planning_title": "PLANNING DE FORMATION DESP", "short_label": "DESP"}
+
+
+def ssiap1_document_profile(session: dict) -> dict:
+    summary = application.ssiap1_summary_from_data(session["apsPlanningData"])
+    return {"validate": "ssiap1", "summary": summary, "planning_title": "PLANNING DE FORMATION SSIAP 1", "short_label": "SSIAP 1"}
+
+
+def afc_document_profile(session: dict) -> dict:
+    return {"validate": "afc_aps_ssiap", "summary": session["apsPlanningSummary"], "planning_title": "PLANNING AFC FRANCE TRAVAIL APS + SSIAP", "short_label": "AFC APS + SSIAP"}
@@ -0,0 +1,449 @@
+"""Test de charge local de bout en bout.
+
+Usage (depuis la racine du dépôt) :
+
+    python benchmarks/loadtest.py --users 10 --duration 60
+    python benchmarks/loadtest.py --sessions 600 --users 20 --mix sessions_list=50,data_json=50 --output charge.json
+    python benchmarks/loadtest.py --server werkzeug --mail-transport smtp --stub-latency-ms 80
+
+Le harnais :
+
+1. remplit un `DATA_DIR` jetable (sessions avec plannings réels, formateurs,
+   prospects price adaptator et prospection) ;
+2. démarre les faux services (`stubs.py`) : Brevo, Yousign, SMTP, flux
+   stagiaires et Annuaire des Entreprises ;
+3. lance l'application comme en production (`gunicorn --workers 2`) pointée
+   sur ces stubs ;
+4. fait tourner `--users` administrateurs virtuels connectés, chacun tirant
+   ses requêtes selon le mélange pondéré `--mix` ;
+5. affiche par route les percentiles de latence, le débit et le taux
+   d'erreur (statut >= 400, exception réseau ou renvoi vers /login).
+"""
+from __future__ import annotations
+
+import argparse
+import http.cookiejar
+import json
+import logging
+import math
+import os
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from stubs import StubHTTPServer, StubSMTPServer, self_signed_certificate  # noqa: E402
+
+ADMIN_USER = "admin@integrale.test"
+ADMIN_PASSWORD = "charge"
+TRAINER = "Jean Dupont"
+DEFAULT_MIX = {
+    "sessions_list": 30,
+    "session_detail": 25,
+    "data_json": 20,
+    "planning_edit": 8,
+    "planning_pdf": 4,
+    "dashboard": 5,
+    "stagiaires_docs": 4,
+    "formateurs": 2,
+    "price_adaptator": 2,
+}
+PERCENTILES = (50, 90, 95, 99)
+
+
+# --------------------------------------------------------------------------
+# Jeu de données
+# --------------------------------------------------------------------------
+def seed_data_dir(data_dir: Path, sessions: int, trainers: int, prospects: int, seed: int = 1) -> dict[str, list[dict]]:
+    """Remplit `data_dir` via les générateurs de l'application ; renvoie les cibles des scénarios."""
+    os.environ["DATA_DIR"] = str(data_dir)
+    os.environ["PERSIST_DIR"] = str(data_dir)
+    import app as application
+    import prospecting
+
+    rng = random.Random(seed)
+    today = date.today()
+    formations = ["APS"] * 8 + ["SSIAP"] * 3 + ["A3P"] * 2 + ["DIRIGEANT"] * 2 + ["AFC_APS_SSIAP"] + ["GENERAL"] * 4
+    data: dict[str, Any] = {"sessions": [], "jurys": []}
+    targets: dict[str, list[dict]] = {"sessions": [], "aps_planned": []}
+    for index in range(sessions):
+        formation = rng.choice(formations)
+        start = application.FRENCH_CALENDAR.nth_working_day(today + timedelta(days=rng.randint(-150, 150)), 1)
+        end = application.FRENCH_CALENDAR.nth_working_day(start, 30)
+        exam = application.FRENCH_CALENDAR.next_working_day(end)
+        sid = f"lt{index:05d}"
+        session = {
+            "id": sid, "formation": formation,
+            "date_debut": start.isoformat(), "date_fin": end.isoformat(), "date_exam": exam.isoformat(),
+            "color": application.FORMATION_COLORS.get(formation, "#555"),
+            "steps": application.default_steps_for(formation),
+            "archived": rng.random() < 0.1,
+            "jurys": [{"id": f"{sid}-j{j}", "prenom": f"Jury{j}", "nom": "TEST", "email": f"jury{j}@integrale.test"} for j in range(rng.randint(0, 3))],
+            "jury_notification_status": "to_notify",
+            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "apsAttendanceStudents": [
+                {"id": f"{sid}-s{k}", "lastName": f"NOM{k:02d}", "firstName": f"Prenom{k:02d}", "startDate": start.isoformat()}
+                for k in range(rng.randint(5, 15))
+            ],
+        }
+        for step in session["steps"]:
+            step["done"] = rng.random() < 0.5
+        if formation == "DIRIGEANT":
+            session["dirigeant_location"] = "PUGET"
+            session["dirigeant_location_label"] = application.DIRIGEANT_LOCATIONS["PUGET"]
+        try:
+            if formation == "APS":
+                mode = rng.choice(["full_presentiel", "elearning_presentiel"])
+                planning, _, _ = application.build_aps_planning_data(start, TRAINER, "Salle 1", mode, end_date=end, exam_iso=exam.isoformat())
+                session.update(apsPlanningMode=mode, apsPlanningData=planning, salle="Salle 1")
+                targets["aps_planned"].append({"id": sid, "mode": mode})
+            elif formation == "AFC_APS_SSIAP":
+                interruptions = application.parse_interruption_ranges("")
+                contractual_end = application.afc_nth_working_day(start, interruptions, 57)
+                planning = application.build_afc_aps_ssiap_planning_data(start, TRAINER, "Salle 1", interruptions, contractual_end_date=contractual_end)
+                session.update(
+                    training_code="AFC_APS_SSIAP", display_name="AFC France Travail APS + SSIAP", interruptions="",
+                    contractual_end_date=contractual_end.isoformat(), date_fin=contractual_end.isoformat(), date_exam=planning[-1]["date"],
+                    apsPlanningMode="full_presentiel", apsPlanningData=planning, salle="Salle 1",
+                    apsPlanningSummary=application.afc_aps_ssiap_summary_from_data(planning, interruptions, contractual_end_date=contractual_end),
+                )
+        except ValueError:
+            pass
+        data["sessions"].append(session)
+        targets["sessions"].append({"id": sid})
+    application.save_sessions(data)
+
+    formateurs = []
+    for index in range(trainers):
+        formateurs.append({
+            "id": f"f{index:05d}", "nom": f"FORMATEUR{index:03d}", "prenom": f"Prenom{index:03d}", "nub": "",
+            "email": f"formateur{index}@integrale.test", "telephone": "0600000000", "siret": "", "adresse_postale": "",
+            "nda": "", "tarif_journalier_ht": "300", "profils": [rng.choice(["APS", "SSIAP", "A3P", "SST"])],
+            "cle": {"attribuee": False, "numero": "", "statut": "non_attribuee"},
+            "badge": {"attribue": False, "numero": "", "statut": "non_attribue"},
+            "documents": application.build_default_documents(),
+        })
+    application.save_formateurs(formateurs)
+
+    application.add_price_adaptator_prospects([
+        {
+            "id": f"pa{index:05d}", "nom": f"PROSPECT{index:04d}", "prenom": "Test", "cpf": float(rng.randint(300, 2500)),
+            "email": f"prospect{index}@integrale.test", "telephone": "0600000000", "formation": rng.choice(["APS", "SSIAP1", "A3P"]),
+            "sent": rng.random() < 0.3, "sentAt": None, "proposed_price": None, "last_error": None, "last_attempt_at": None,
+            "created_at": datetime.now().isoformat(),
+        }
+        for index in range(prospects)
+    ])
+
+    with application.app.app_context():
+        prospecting.init_prospect_db()
+    now = datetime.now().isoformat(timespec="seconds")
+    with sqlite3.connect(data_dir / "prospects.db") as connection:
+        connection.executemany(
+            "INSERT OR IGNORE INTO prospects(fingerprint, score, name, city, department, source, detected_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(f"lt-{index}", rng.randint(0, 100), f"CENTRE FORMATION {index}", "TOULON", "83", "Annuaire des Entreprises", now, now) for index in range(prospects)],
+        )
+    return targets
+
+
+# --------------------------------------------------------------------------
+# Serveur applicatif
+# --------------------------------------------------------------------------
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_app_server(kind: str, port: int, workers: int, env: dict[str, str], log_path: Path) -> subprocess.Popen:
+    if kind == "gunicorn":
+        command = [sys.executable, "-m", "gunicorn", "app:app", "-c", "gunicorn.conf.py", "-b", f"127.0.0.1:{port}", "--workers", str(workers), "--timeout", "120"]
+    else:
+        command = [sys.executable, "-c", f"from werkzeug.serving import run_simple; from app import app, start_background_workers; start_background_workers(); run_simple('127.0.0.1', {port}, app, threaded=True)"]
+    log = open(log_path, "wb")
+    return subprocess.Popen(command, cwd=ROOT, env={**os.environ, **env}, stdout=log, stderr=subprocess.STDOUT)
+
+
+def wait_until_ready(base_url: str, process: subprocess.Popen, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Le serveur applicatif s'est arrêté (code {process.returncode}).")
+        try:
+            with urllib.request.urlopen(f"{base_url}/login", timeout=2) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            time.sleep(0.25)
+    raise RuntimeError("Le serveur applicatif n'a pas répondu à temps.")
+
+
+# --------------------------------------------------------------------------
+# Trafic
+# --------------------------------------------------------------------------
+@dataclass
+class Sample:
+    route: str
+    status: int
+    latency: float
+    error: str = ""
+
+
+class VirtualAdmin:
+    def __init__(self, base_url: str, targets: dict[str, list[dict]], rng: random.Random):
+        self.base_url = base_url
+        self.targets = targets
+        self.rng = rng
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+        self._planning_cache: dict[str, list] = {}
+
+    def request(self, route: str, path: str, method: str = "GET", payload: Any = None, form: dict | None = None) -> Sample:
+        data, headers = None, {}
+        if payload is not None:
+            data, headers = json.dumps(payload).encode("utf-8"), {"Content-Type": "application/json"}
+        elif form is not None:
+            data, headers = urllib.parse.urlencode(form).encode("utf-8"), {"Content-Type": "application/x-www-form-urlencoded"}
+        request_obj = urllib.request.Request(f"{self.base_url}{path}", data=data, method=method, headers=headers)
+        started = time.perf_counter()
+        try:
+            with self.opener.open(request_obj, timeout=120) as response:
+                body = response.read()
+                status = response.status
+                final_url = response.geturl()
+        except urllib.error.HTTPError as exc:
+            exc.read()
+            return Sample(route, exc.code, time.perf_counter() - started, f"HTTP {exc.code}")
+        except OSError as exc:
+            return Sample(route, 0, time.perf_counter() - started, type(exc).__name__)
+        latency = time.perf_counter() - started
+        if route != "login" and urllib.parse.urlparse(final_url).path.startswith("/login"):
+            return Sample(route, status, latency, "redirigé vers /login")
+        self.last_body = body
+        return Sample(route, status, latency)
+
+    def login(self) -> Sample:
+        return self.request("login", "/login", "POST", form={"email": ADMIN_USER, "password": ADMIN_PASSWORD})
+
+    def _pick(self, key: str) -> dict | None:
+        items = self.targets.get(key) or []
+        return self.rng.choice(items) if items else None
+
+    def run(self, scenario: str) -> list[Sample]:
+        """Joue un scénario ; renvoie toutes les requêtes effectuées (une édition de planning en fait deux)."""
+        if scenario == "planning_edit":
+            target = self._pick("aps_planned")
+            if target is None:
+                return [self.request("sessions_list", "/sessions")]
+            load = self.request("planning_edit_load", f"/api/sessions/{target['id']}/aps-planning")
+            if load.error:
+                return [load]
+            planning = json.loads(self.last_body).get("apsPlanningData") or []
+            return [load, self.request(scenario, f"/api/sessions/{target['id']}/aps-planning", "PUT", payload={"planningData": planning})]
+        return [self._run_single(scenario)]
+
+    def _run_single(self, scenario: str) -> Sample:
+        if scenario == "sessions_list":
+            return self.request(scenario, "/sessions")
+        if scenario == "session_detail":
+            target = self._pick("sessions")
+            return self.request(scenario, f"/sessions/{target['id']}")
+        if scenario == "data_json":
+            return self.request(scenario, "/data.json")
+        if scenario == "dashboard":
+            return self.request(scenario, "/")
+        if scenario == "stagiaires_docs":
+            return self.request(scenario, "/stagiaires/docs-to-control.json")
+        if scenario == "formateurs":
+            return self.request(scenario, "/formateurs")
+        if scenario == "price_adaptator":
+            return self.request(scenario, "/price-adaptator/prospects?per_page=50")
+        if scenario == "planning_pdf":
+            target = self._pick("aps_planned")
+            if target is None:
+                return self.request("sessions_list", "/sessions")
+            return self.request(scenario, f"/api/sessions/{target['id']}/generate-aps-planning", "POST", payload={"planningMode": target["mode"], "trainer": TRAINER})
+        raise ValueError(f"Scénario inconnu : {scenario}")
+
+
+def run_traffic(base_url: str, targets: dict[str, list[dict]], users: int, duration: float, mix: dict[str, int], think_ms: float, seed: int) -> tuple[list[Sample], float]:
+    samples: list[Sample] = []
+    lock = threading.Lock()
+    scenarios, weights = zip(*[(name, weight) for name, weight in mix.items() if weight > 0])
+    start_barrier = threading.Barrier(users + 1)
+    deadline_holder: list[float] = []
+
+    def worker(index: int):
+        admin = VirtualAdmin(base_url, targets, random.Random(seed + index))
+        login = admin.login()
+        local = [login]
+        start_barrier.wait()
+        deadline = deadline_holder[0]
+        while time.monotonic() < deadline:
+            local.extend(admin.run(admin.rng.choices(scenarios, weights)[0]))
+            if think_ms:
+                time.sleep(admin.rng.expovariate(1000 / think_ms))
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(index,), daemon=True) for index in range(users)]
+    for thread in threads:
+        thread.start()
+    deadline_holder.append(time.monotonic() + duration)
+    started = time.monotonic()
+    start_barrier.wait()
+    for thread in threads:
+        thread.join()
+    return samples, time.monotonic() - started
+
+
+def percentile(sorted_values: list[float], rank: float) -> float:
+    """Percentile au rang le plus proche sur une liste déjà triée."""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, math.ceil(rank / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples: list[Sample], elapsed: float) -> dict[str, Any]:
+    routes: dict[str, list[Sample]] = {}
+    for sample in samples:
+        routes.setdefault(sample.route, []).append(sample)
+    summary = {}
+    for route, items in sorted(routes.items()):
+        latencies = sorted(item.latency for item in items)
+        errors = [item for item in items if item.error or item.status >= 400]
+        error_kinds: dict[str, int] = {}
+        for item in errors:
+            error_kinds[item.error or f"HTTP {item.status}"] = error_kinds.get(item.error or f"HTTP {item.status}", 0) + 1
+        summary[route] = {
+            "requests": len(items),
+            "throughput_rps": round(len(items) / elapsed, 2) if elapsed else 0.0,
+            "error_rate": round(len(errors) / len(items), 4),
+            "errors": error_kinds,
+            "latency_ms": {
+                **{f"p{rank}": round(percentile(latencies, rank) * 1000, 1) for rank in PERCENTILES},
+                "mean": round(sum(latencies) / len(latencies) * 1000, 1),
+                "max": round(latencies[-1] * 1000, 1),
+            },
+        }
+    total = len(samples)
+    total_errors = sum(1 for item in samples if item.error or item.status >= 400)
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "requests": total,
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "error_rate": round(total_errors / total, 4) if total else 0.0,
+        "routes": summary,
+    }
+
+
+def print_summary(summary: dict[str, Any]) -> None:
+    print(f"\n{'route':<20} {'req':>6} {'req/s':>7} {'err%':>6} {'p50':>8} {'p90':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for route, stats in summary["routes"].items():
+        latency = stats["latency_ms"]
+        print(f"{route:<20} {stats['requests']:>6} {stats['throughput_rps']:>7.2f} {stats['error_rate'] * 100:>5.1f}% "
+              f"{latency['p50']:>6.0f}ms {latency['p90']:>6.0f}ms {latency['p95']:>6.0f}ms {latency['p99']:>6.0f}ms {latency['max']:>6.0f}ms")
+        for kind, count in stats["errors"].items():
+            print(f"{'':<20}   ↳ {count} × {kind}")
+    print(f"\nTotal : {summary['requests']} requêtes en {summary['elapsed_s']}s — {summary['throughput_rps']} req/s, {summary['error_rate'] * 100:.1f}% d'erreurs")
+
+
+def parse_mix(value: str) -> dict[str, int]:
+    mix = {}
+    for part in filter(None, (item.strip() for item in value.split(","))):
+        name, _, weight = part.partition("=")
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"Scénario inconnu : {name} (disponibles : {', '.join(DEFAULT_MIX)})")
+        mix[name] = int(weight or 1)
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("Le mélange doit contenir au moins un scénario de poids > 0.")
+    return mix
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Test de charge local avec services externes simulés.")
+    parser.add_argument("--sessions", type=int, default=300)
+    parser.add_argument("--trainers", type=int, default=120)
+    parser.add_argument("--prospects", type=int, default=500)
+    parser.add_argument("--users", type=int, default=10, help="Administrateurs virtuels simultanés.")
+    parser.add_argument("--duration", type=float, default=60, help="Durée de la phase de charge (secondes).")
+    parser.add_argument("--think-ms", type=float, default=0, help="Temps de réflexion moyen entre deux requêtes.")
+    parser.add_argument("--mix", type=parse_mix, default=dict(DEFAULT_MIX), help="Ex. sessions_list=30,session_detail=25,data_json=20")
+    parser.add_argument("--server", choices=("gunicorn", "werkzeug"), default="gunicorn")
+    parser.add_argument("--workers", type=int, default=2, help="Workers gunicorn (2 en production).")
+    parser.add_argument("--mail-transport", choices=("brevo", "smtp"), default="brevo")
+    parser.add_argument("--stub-latency-ms", type=float, default=0, help="Latence simulée des services externes.")
+    parser.add_argument("--data-dir", help="DATA_DIR à utiliser (par défaut un dossier temporaire).")
+    parser.add_argument("--keep-data", action="store_true", help="Ne pas supprimer le DATA_DIR temporaire.")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Fichier JSON du rapport.")
+    args = parser.parse_args(argv)
+
+    data_dir = Path(args.data_dir) if args.data_dir else Path(tempfile.mkdtemp(prefix="charge-data-"))
+    data_dir.mkdir(parents=True, exist_ok=True)
+    http_stub = StubHTTPServer(latency_ms=args.stub_latency_ms).start()
+    certfile, keyfile = self_signed_certificate(data_dir) or (None, None)
+    smtp_stub = StubSMTPServer(certfile=certfile, keyfile=keyfile).start()
+    process = None
+    try:
+        print(f"Préparation de {data_dir} : {args.sessions} sessions, {args.trainers} formateurs, {args.prospects} prospects…", flush=True)
+        logging.disable(logging.INFO)
+        try:
+            targets = seed_data_dir(data_dir, args.sessions, args.trainers, args.prospects, args.seed)
+        finally:
+            logging.disable(logging.NOTSET)
+        env = {
+            "DATA_DIR": str(data_dir), "PERSIST_DIR": str(data_dir), "ADMIN_USER": ADMIN_USER, "ADMIN_PASSWORD": ADMIN_PASSWORD,
+            "SECRET_KEY": "charge-locale", "PYTHONUNBUFFERED": "1", **smtp_stub.env(), **http_stub.env(),
+        }
+        if args.mail_transport == "smtp":
+            env.pop("BREVO_API_KEY")
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        process = start_app_server(args.server, port, args.workers, env, data_dir / "server.log")
+        wait_until_ready(base_url, process)
+        print(f"Serveur {args.server} prêt sur {base_url} ; {args.users} utilisateurs pendant {args.duration:g}s…", flush=True)
+        samples, elapsed = run_traffic(base_url, targets, args.users, args.duration, args.mix, args.think_ms, args.seed)
+        summary = summarize(samples, elapsed)
+        print_summary(summary)
+        print(f"Stubs : {dict(http_stub.requests)} ; SMTP : {smtp_stub.messages} message(s)")
+        if args.output:
+            report = {
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+                "config": {key: value for key, value in vars(args).items() if key not in ("output",)},
+                "stubs": {"http": dict(http_stub.requests), "smtp_messages": smtp_stub.messages},
+                **summary,
+            }
+            Path(args.output).write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+        return 0
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        http_stub.stop()
+        smtp_stub.stop()
+        if not args.data_dir and not args.keep_data:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,284 @@
+"""Benchmarks des générateurs de planning, PDF, DSF et Excel.
+
+Usage (depuis la racine du dépôt) :
+
+    python benchmarks/run.py --output bench.json
+    python benchmarks/run.py --filter pdf --repeat 3
+    python benchmarks/run.py --output new.json --compare bench.json --threshold 1.15
+
+Chaque cas est préparé hors chronomètre, puis exécuté `--warmup` fois (non
+mesurées) et `--repeat` fois (temps mur via `perf_counter`). Le pic mémoire est
+mesuré par `tracemalloc` sur une exécution séparée, pour ne pas fausser les
+temps. La sortie JSON est stable d'un commit à l'autre : `--compare` affiche le
+rapport des médianes et sort en erreur si un cas dépasse le seuil.
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+SCHEMA_VERSION = 1
+
+
+@dataclass
+class Case:
+    name: str
+    group: str
+    # Prépare les données (non chronométré) et renvoie la fonction à mesurer.
+    setup: Callable[[Path], Callable[[], Any]]
+    params: dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def key(self) -> str:
+        suffix = ",".join(f"{k}={v}" for k, v in sorted(self.params.items()))
+        return f"{self.name}[{suffix}]" if suffix else self.name
+
+
+def build_cases() -> list[Case]:
+    import app as application
+    import fixtures
+    from a3p_program import generateA3pSchedule
+    from desp_program import generate_desp_planning
+    from services.afc_dsf_france_travail_excel import generate_dsf_excel_from_snapshot
+    from services.afc_france_travail_attendance import generate_france_travail_workbook
+    from services.afc_france_travail_invoice_excel import build_invoice_snapshot, generate_invoice_excel_from_snapshot
+    from services import pdf_parallel
+
+    from datetime import date
+
+    cases: list[Case] = []
+
+    # --- Générateurs de planning -------------------------------------------------
+    for mode in ("full_presentiel", "elearning_presentiel"):
+        cases.append(Case("build_aps_planning_data", "planning", lambda tmp, mode=mode: (lambda: application.build_aps_planning_data(
+            date(2026, 3, 2), fixtures.TRAINER, fixtures.ROOM, mode, end_date=date(2026, 4, 10), exam_iso="2026-04-13")), {"mode": mode}))
+    cases.append(Case("build_ssiap1_planning_data", "planning", lambda tmp: (lambda: application.build_ssiap1_planning_data(
+        date(2026, 1, 5), fixtures.TRAINER, fixtures.ROOM, end_date=date(2026, 1, 20), exam_iso="2026-01-21",
+        exam_payload={"date": "2026-01-21", "start": "08:30", "end": "12:30", "room": "Salle Examen", "durationMinutes": 240}))))
+    cases.append(Case("generate_desp_planning", "planning", lambda tmp: (lambda: generate_desp_planning(
+        date(2026, 6, 12), date(2026, 7, 17), date(2026, 7, 20), date(2026, 7, 30), fixtures.TRAINER, fixtures.ROOM, exam_iso="2026-07-31", allow_saturday=False))))
+    cases.append(Case("generateA3pSchedule", "planning", lambda tmp: (lambda config=fixtures.a3p_config(): generateA3pSchedule(config))))
+    cases.append(Case("build_afc_aps_ssiap_planning_data", "planning", lambda tmp: (lambda: application.build_afc_aps_ssiap_planning_data(
+        date(2026, 11, 16), fixtures.TRAINER, fixtures.ROOM, []))))
+
+    # --- PDF ----------------------------------------------------------------------
+    def planning_pdf(session_factory, mode, profile_factory=None):
+        def setup(tmp):
+            session = session_factory()
+            profile = profile_factory(session) if profile_factory else None
+            output = str(tmp / f"planning_{session['id']}.pdf")
+            return lambda: application.generate_aps_planning_pdf(session, fixtures.TRAINER, output, planning_data=session["apsPlanningData"], planning_mode=mode, document_profile=profile)
+        return setup
+
+    cases.append(Case("generate_aps_planning_pdf", "pdf", planning_pdf(lambda: fixtures.aps_session("full_presentiel"), "full_presentiel"), {"kind": "aps_full_presentiel"}))
+    cases.append(Case("generate_aps_planning_pdf", "pdf", planning_pdf(lambda: fixtures.aps_session("elearning_presentiel"), "elearning_presentiel"), {"kind": "aps_elearning_presentiel"}))
+    cases.append(Case("generate_aps_planning_pdf", "pdf", planning_pdf(fixtures.ssiap1_session, "ssiap1", fixtures.ssiap1_document_profile), {"kind": "ssiap1"}))
+    cases.append(Case("generate_aps_planning_pdf", "pdf", planning_pdf(fixtures.desp_session, "desp", fixtures.desp_document_profile), {"kind": "desp"}))
+    cases.append(Case("generate_aps_planning_pdf", "pdf", planning_pdf(fixtures.afc_session, "full_presentiel", fixtures.afc_document_profile), {"kind": "afc_aps_ssiap"}))
+    cases.append(Case("generate_a3p_planning_pdf", "pdf", lambda tmp: (lambda session=fixtures.a3p_session(): application.generate_a3p_planning_pdf(session, str(tmp / "planning_a3p.pdf")))))
+
+    for count in fixtures.ATTENDANCE_TRAINEE_COUNTS:
+        for kind, factory in (("aps", fixtures.aps_session), ("afc_aps_ssiap", fixtures.afc_session)):
+            def setup(tmp, factory=factory, count=count, kind=kind):
+                session = factory(trainee_count=count)
+                output = str(tmp / f"emargement_{kind}_{count}.pdf")
+                return lambda: application.generate_attendance_pdf_common(session, output)
+            cases.append(Case("generate_attendance_pdf_common", "pdf", setup, {"kind": kind, "trainees": count}))
+
+    # Rendu par plages de pages en parallèle (services/pdf_parallel.py) : le gain
+    # n'apparaît que sur un hôte multicœur ; workers=1 force le rendu séquentiel.
+    for workers in (1, 2, 4):
+        def parallel_planning_setup(tmp, workers=workers):
+            session = fixtures.afc_session()
+            profile = fixtures.afc_document_profile(session)
+            output = str(tmp / f"planning_afc_{workers}.pdf")
+            return lambda: application.generate_aps_planning_pdf(session, fixtures.TRAINER, output, planning_data=session["apsPlanningData"], planning_mode="full_presentiel", document_profile=profile, workers=workers)
+        cases.append(Case("generate_aps_planning_pdf", "pdf", parallel_planning_setup, {"kind": "afc_aps_ssiap", "workers": workers}))
+
+        def parallel_attendance_setup(tmp, workers=workers):
+            session = fixtures.afc_session(trainee_count=15)
+            output = str(tmp / f"emargement_afc_{workers}.pdf")
+            return lambda: application.generate_attendance_pdf_common(session, output, workers=workers)
+        cases.append(Case("generate_attendance_pdf_common", "pdf", parallel_attendance_setup, {"kind": "afc_aps_ssiap", "trainees": 15, "workers": workers}))
+
+    def contract_setup(tmp):
+        session = fixtures.aps_session()
+        contract = fixtures.trainer_contract(session)
+        return lambda: application.generate_aps_trainer_contract_pdf(session, contract, str(tmp / "contrat.pdf"))
+    cases.append(Case("generate_aps_trainer_contract_pdf", "pdf", contract_setup))
+
+    # Lot de six contrats (une session AFC) rendus par services/pdf_parallel.render_each.
+    for workers in (1, 4):
+        def contract_batch_setup(tmp, workers=workers):
+            session = fixtures.aps_session()
+            calls = [(session, fixtures.trainer_contract(session), str(tmp / f"contrat_{index}.pdf")) for index in range(6)]
+            return lambda: pdf_parallel.render_each(application.generate_aps_trainer_contract_pdf, calls, workers=workers)
+        cases.append(Case("generate_aps_trainer_contract_pdf", "pdf", contract_batch_setup, {"contracts": 6, "workers": workers}))
+
+    # --- Facturation DSF et Excel -------------------------------------------------
+    for count in fixtures.TRAINEE_COUNTS:
+        cases.append(Case("afc_dsf_build_invoice_state", "billing", lambda tmp, count=count: (
+            lambda session=fixtures.afc_session(count, billed_dsfs=3): application.afc_dsf_build_invoice_state(session)), {"trainees": count, "billedDsfs": 3}))
+        cases.append(Case("afc_dsf_compute", "billing", lambda tmp, count=count: (
+            lambda session=fixtures.afc_session(count, billed_dsfs=3): application.afc_dsf_compute(session, session["date_debut"], session["date_fin"], ["FT", "RAN"])), {"trainees": count}))
+        cases.append(Case("generate_france_travail_workbook", "excel", lambda tmp, count=count: (
+            lambda session=fixtures.afc_session(count): generate_france_travail_workbook(session, ROOT)), {"trainees": count}))
+        cases.append(Case("generate_france_travail_workbook", "excel", lambda tmp, count=count: (
+            lambda session=fixtures.afc_session(count): generate_france_travail_workbook(session, ROOT, writer="openpyxl")), {"trainees": count, "writer": "openpyxl"}))
+
+        def dsf_excel_setup(tmp, count=count):
+            dsf = fixtures.afc_dsf_with_snapshot(fixtures.afc_session(count))
+            return lambda: generate_dsf_excel_from_snapshot(dsf["franceTravailExcelSnapshot"], ROOT)
+        cases.append(Case("generate_dsf_excel_from_snapshot", "excel", dsf_excel_setup, {"trainees": count}))
+
+        def invoice_excel_setup(tmp, count=count):
+            session = fixtures.afc_session(count)
+            dsf = fixtures.afc_dsf_with_snapshot(session)
+            snapshot = build_invoice_snapshot(session, dsf, {"invoice_number": "FA-2026-001", "invoice_date": "2027-02-15", "invoice_place": "Puget-sur-Argens", "invoice_type": "intermediate"}, "benchmark")
+            return lambda: generate_invoice_excel_from_snapshot(snapshot, ROOT)
+        cases.append(Case("generate_invoice_excel_from_snapshot", "excel", invoice_excel_setup, {"trainees": count}))
+
+    return cases
+
+
+def measure(case: Case, tmp: Path, repeat: int, warmup: int, track_memory: bool) -> dict[str, Any]:
+    func = case.setup(tmp)
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    result: dict[str, Any] = {
+        "key": case.key,
+        "name": case.name,
+        "group": case.group,
+        "params": case.params,
+        "repeat": repeat,
+        "wall_s": {
+            "min": min(timings),
+            "median": statistics.median(timings),
+            "mean": statistics.fmean(timings),
+            "max": max(timings),
+        },
+        "peak_kib": None,
+    }
+    if track_memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            func()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        result["peak_kib"] = round(peak / 1024, 1)
+    return result
+
+
+def git_revision() -> dict[str, Any]:
+    def run(*args):
+        try:
+            return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True, timeout=10).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return ""
+    return {"commit": run("rev-parse", "HEAD"), "subject": run("log", "-1", "--format=%s"), "dirty": bool(run("status", "--porcelain", "--untracked-files=no"))}
+
+
+def compare(current: dict[str, Any], baseline: dict[str, Any], threshold: float) -> list[str]:
+    """Affiche l'évolution des médianes et renvoie les cas dont le rapport dépasse `threshold`."""
+    previous = {item["key"]: item for item in baseline.get("results", [])}
+    regressions = []
+    print(f"\n{'cas':<72} {'avant':>10} {'après':>10} {'ratio':>7}")
+    for item in current["results"]:
+        old = previous.get(item["key"])
+        new_median = item["wall_s"]["median"]
+        if not old:
+            print(f"{item['key']:<72} {'—':>10} {new_median * 1000:>8.1f}ms {'nouveau':>7}")
+            continue
+        old_median = old["wall_s"]["median"]
+        ratio = new_median / old_median if old_median else float("inf")
+        flag = " ⚠️" if ratio > threshold else ""
+        print(f"{item['key']:<72} {old_median * 1000:>8.1f}ms {new_median * 1000:>8.1f}ms {ratio:>6.2f}x{flag}")
+        if ratio > threshold:
+            regressions.append(item["key"])
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks des générateurs (planning, PDF, DSF, Excel).")
+    parser.add_argument("--output", help="Fichier JSON de résultats.")
+    parser.add_argument("--compare", help="Fichier JSON d'une exécution précédente à comparer.")
+    parser.add_argument("--threshold", type=float, default=1.2, help="Rapport de médianes au-delà duquel un cas est signalé (défaut 1.2).")
+    parser.add_argument("--filter", action="append", default=[], help="Sous-chaîne de nom, groupe ou paramètres (répétable).")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--no-memory", action="store_true", help="Ne pas mesurer le pic mémoire.")
+    parser.add_argument("--list", action="store_true", help="Lister les cas sans les exécuter.")
+    args = parser.parse_args(argv)
+    # Les générateurs journalisent leurs diagnostics en INFO : on ne garde que les avertissements.
+    previous_disable = logging.root.manager.disable
+    logging.disable(logging.INFO)
+    try:
+        return _run(args)
+    finally:
+        logging.disable(previous_disable)
+
+
+def _run(args: argparse.Namespace) -> int:
+    cases = [case for case in build_cases() if not args.filter or any(f in case.key or f == case.group for f in args.filter)]
+    if args.list:
+        for case in cases:
+            print(f"{case.group:<9} {case.key}")
+        return 0
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bench-") as tmp:
+        for case in cases:
+            result = measure(case, Path(tmp), max(1, args.repeat), max(0, args.warmup), not args.no_memory)
+            results.append(result)
+            peak = f"{result['peak_kib']:>10.0f} KiB" if result["peak_kib"] is not None else ""
+            print(f"{case.group:<9} {case.key:<72} {result['wall_s']['median'] * 1000:>9.1f} ms {peak}", flush=True)
+
+    report = {
+        "schema": SCHEMA_VERSION,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "git": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "repeat": args.repeat,
+        "warmup": args.warmup,
+        "results": results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    if args.compare:
+        regressions = compare(report, json.loads(Path(args.compare).read_text(encoding="utf-8")), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} cas au-delà de {args.threshold:.2f}x : {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,233 @@
+"""Faux services externes pour les tests de charge locaux.
+
+Un seul serveur HTTP répond pour Brevo, Yousign, le flux JSON des stagiaires
+et l'Annuaire des Entreprises, chacun sous son préfixe (`/brevo`, `/yousign`,
+`/stagiaires`, `/annuaire`) ; `env()` donne les variables à passer à
+l'application pour qu'elle les appelle à la place des vrais services. Un faux
+serveur SMTP (STARTTLS si un certificat est fourni) accepte tous les messages.
+Chaque stub compte ses requêtes et peut simuler une latence réseau.
+"""
+from __future__ import annotations
+
+import base64
+import itertools
+import json
+import socketserver
+import ssl
+import subprocess
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any
+
+PDF_BYTES = b"%PDF-1.4\n1 0 obj<<>>endobj\ntrailer<<>>\n%%EOF\n"
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    server: "StubHTTPServer"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):  # noqa: A002 - signature imposée par BaseHTTPRequestHandler
+        pass
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send(self, status: int, payload: Any = None, body: bytes | None = None, content_type: str = "application/json"):
+        if body is None:
+            body = json.dumps(payload if payload is not None else {}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _dispatch(self):
+        body = self._read_body()
+        service = self.path.strip("/").split("/", 1)[0]
+        self.server.count(service)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        handler = getattr(self, f"_handle_{service}", None)
+        if handler is None:
+            return self._send(404, {"message": "stub: service inconnu"})
+        return handler(body)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _dispatch
+
+    def _handle_brevo(self, body: bytes):
+        payload = json.loads(body or b"{}")
+        if self.path.endswith("/transactionalSMS/sms"):
+            return self._send(201, {"messageId": next(self.server.ids)})
+        versions = payload.get("messageVersions")
+        if versions:
+            return self._send(201, {"messageIds": [f"<stub-{next(self.server.ids)}@brevo>" for _ in versions]})
+        return self._send(201, {"messageId": f"<stub-{next(self.server.ids)}@brevo>"})
+
+    def _handle_yousign(self, body: bytes):
+        if self.command == "GET" and "/documents/download" in self.path:
+            return self._send(200, body=PDF_BYTES, content_type="application/pdf")
+        if self.path.endswith("/activate"):
+            return self._send(201, {"id": self.path.split("/")[-2], "status": "ongoing"})
+        if self.command == "GET":
+            return self._send(200, {"id": self.path.rstrip("/").split("/")[-1], "status": "ongoing", "signers": []})
+        return self._send(201, {"id": str(uuid.uuid4()), "status": "draft"})
+
+    def _handle_stagiaires(self, body: bytes):
+        return self._send(200, {"pending_count": self.server.pending_documents})
+
+    def _handle_annuaire(self, body: bytes):
+        results = [
+            {
+                "siren": f"9{index:08d}",
+                "nom_complet": f"SECURITE FORMATION STUB {index}",
+                "date_creation": "2026-09-01",
+                "activite_principale": "85.59A",
+                "siege": {"siret": f"9{index:08d}00010", "libelle_commune": "TOULON", "departement": "83", "date_creation": "2026-09-01"},
+                "dirigeants": [],
+            }
+            for index in range(5)
+        ]
+        return self._send(200, {"results": results, "total_results": len(results), "page": 1, "per_page": 25, "total_pages": 1})
+
+
+class StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0, pending_documents: int = 7):
+        super().__init__((host, port), _StubHandler)
+        self.latency = latency_ms / 1000
+        self.pending_documents = pending_documents
+        self.ids = itertools.count(1)
+        self.requests: Counter[str] = Counter()
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def count(self, service: str):
+        with self._lock:
+            self.requests[service] += 1
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def env(self) -> dict[str, str]:
+        return {
+            "BREVO_API_BASE_URL": f"{self.base_url}/brevo",
+            "BREVO_API_KEY": "stub-brevo-key",
+            "BREVO_SENDER_EMAIL": "noreply@integrale.test",
+            "BREVO_SMS_SENDER": "Integrale",
+            "YOUSIGN_BASE_URL": f"{self.base_url}/yousign/v3",
+            "YOUSIGN_API_KEY": "stub-yousign-key",
+            "STAGIAIRES_DOCS_TO_CONTROL_URL": f"{self.base_url}/stagiaires/docs_to_control.json",
+            "RNE_SEARCH_API_URL": f"{self.base_url}/annuaire/search",
+        }
+
+    def start(self) -> "StubHTTPServer":
+        self._thread = threading.Thread(target=self.serve_forever, kwargs={"poll_interval": 0.1}, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _SmtpHandler(socketserver.StreamRequestHandler):
+    server: "StubSMTPServer"
+
+    def _reply(self, line: str):
+        self.wfile.write(f"{line}\r\n".encode("ascii"))
+        self.wfile.flush()
+
+    def handle(self):
+        self._reply("220 stub ESMTP")
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                return
+            command = raw.decode("utf-8", "replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+            if verb in ("EHLO", "HELO"):
+                extensions = ["AUTH PLAIN LOGIN", "8BITMIME"]
+                if self.server.tls_context and not isinstance(self.connection, ssl.SSLSocket):
+                    extensions.append("STARTTLS")
+                # la première ligne est le salut, les extensions suivent
+                for line in ["stub", *extensions[:-1]]:
+                    self.wfile.write(f"250-{line}\r\n".encode("ascii"))
+                self._reply(f"250 {extensions[-1]}")
+            elif verb == "STARTTLS" and self.server.tls_context:
+                self._reply("220 Ready to start TLS")
+                self.connection = self.server.tls_context.wrap_socket(self.connection, server_side=True)
+                self.rfile = self.connection.makefile("rb")
+                self.wfile = self.connection.makefile("wb")
+            elif verb == "AUTH":
+                parts = command.split()
+                if len(parts) == 2 and parts[1].upper() == "LOGIN":
+                    self._reply("334 " + base64.b64encode(b"Username:").decode())
+                    self.rfile.readline()
+                    self._reply("334 " + base64.b64encode(b"Password:").decode())
+                    self.rfile.readline()
+                self._reply("235 Authentication successful")
+            elif verb == "DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                    pass
+                self.server.count_message()
+                self._reply(f"250 OK queued as stub-{next(self.server.ids)}")
+            elif verb == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                # MAIL, RCPT, RSET, NOOP…
+                self._reply("250 OK")
+
+
+class StubSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, certfile: str | None = None, keyfile: str | None = None):
+        super().__init__((host, port), _SmtpHandler)
+        self.tls_context = None
+        if certfile:
+            self.tls_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            self.tls_context.load_cert_chain(certfile, keyfile)
+        self.ids = itertools.count(1)
+        self.messages = 0
+        self._lock = threading.Lock()
+
+    def count_message(self):
+        with self._lock:
+            self.messages += 1
+
+    def env(self) -> dict[str, str]:
+        host, port = self.server_address[:2]
+        return {"SMTP_SERVER": host, "SMTP_PORT": str(port), "FROM_EMAIL": "noreply@integrale.test", "EMAIL_PASSWORD": "stub-password"}
+
+    def start(self) -> "StubSMTPServer":
+        threading.Thread(target=self.serve_forever, kwargs={"poll_interval": 0.1}, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def self_signed_certificate(directory: Path) -> tuple[str, str] | None:
+    """Certificat jetable pour le STARTTLS du faux SMTP (nécessite la commande `openssl`)."""
+    certfile, keyfile = directory / "stub-smtp.crt", directory / "stub-smtp.key"
+    try:
+        subprocess.run(
+            ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=localhost",
+             "-keyout", str(keyfile), "-out", str(certfile)],
+            check=True, capture_output=True, timeout=30,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return str(certfile), str(keyfile)
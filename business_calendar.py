@@ -0,0 +1,217 @@
+"""Calendrier des jours ouvrés partagé par les générateurs de planning.
+
+Les jours fériés français sont calculés une seule fois par année. Un
+`WorkingDayCalendar` (samedi travaillé ou non, plages d'interruption, jours
+exclus comme la date d'examen) précalcule sur une plage d'années un tableau
+d'un octet par jour et les sommes préfixes correspondantes :
+
+- « ce jour est-il ouvré ? » et « combien de jours ouvrés entre A et B ? » : O(1) ;
+- « Nième jour ouvré à partir de D » : recherche dichotomique, O(log n) ;
+- « semaines ISO avec activité » : une recherche dichotomique par semaine.
+
+La plage d'années s'étend automatiquement si une requête en sort. Les
+calendriers sont mémoïsés par configuration via `get_calendar`.
+"""
+from __future__ import annotations
+
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date, timedelta
+from functools import lru_cache
+from typing import Iterable
+
+DateRange = tuple[date, date]
+
+
+@lru_cache(maxsize=None)
+def easter_date(year: int) -> date:
+    """Dimanche de Pâques (algorithme de Meeus/Jones/Butcher)."""
+    a = year % 19
+    b = year // 100
+    c = year % 100
+    d = b // 4
+    e = b % 4
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i = c // 4
+    k = c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month = (h + l - 7 * m + 114) // 31
+    day = ((h + l - 7 * m + 114) % 31) + 1
+    return date(year, month, day)
+
+
+@lru_cache(maxsize=None)
+def french_public_holidays(year: int) -> frozenset[date]:
+    easter = easter_date(year)
+    return frozenset({
+        date(year, 1, 1), date(year, 5, 1), date(year, 5, 8), date(year, 7, 14),
+        date(year, 8, 15), date(year, 11, 1), date(year, 11, 11), date(year, 12, 25),
+        easter + timedelta(days=1), easter + timedelta(days=39), easter + timedelta(days=50),
+    })
+
+
+def is_public_holiday(day: date) -> bool:
+    return day in french_public_holidays(day.year)
+
+
+def is_working_day(day: date, allow_saturday: bool = False) -> bool:
+    """Jour ouvré français : lundi-vendredi (et samedi si demandé), hors jours fériés."""
+    return day.weekday() <= (5 if allow_saturday else 4) and day not in french_public_holidays(day.year)
+
+
+def normalize_ranges(ranges: Iterable[DateRange] | None) -> tuple[DateRange, ...]:
+    """Trie et fusionne des plages de dates inclusives (chevauchantes ou contiguës)."""
+    merged: list[list[date]] = []
+    for start, end in sorted((min(s, e), max(s, e)) for s, e in (ranges or [])):
+        if merged and start <= merged[-1][1] + timedelta(days=1):
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return tuple((start, end) for start, end in merged)
+
+
+class _Span:
+    """Jours ouvrés précalculés de `first_year` à `last_year` (octet par jour + sommes préfixes)."""
+
+    __slots__ = ("first_year", "last_year", "origin", "bitmap", "prefix")
+
+    def __init__(self, first_year: int, last_year: int, origin: int, bitmap: bytearray, prefix: array):
+        self.first_year = first_year
+        self.last_year = last_year
+        self.origin = origin
+        self.bitmap = bitmap
+        self.prefix = prefix
+
+    def covers(self, first_year: int, last_year: int) -> bool:
+        return self.first_year <= first_year and last_year <= self.last_year
+
+
+class WorkingDayCalendar:
+    def __init__(self, interruptions: Iterable[DateRange] | None = None, allow_saturday: bool = False, excluded_days: Iterable[date] = ()):
+        self.allow_saturday = allow_saturday
+        self.interruptions = normalize_ranges(interruptions)
+        self.excluded_days = frozenset(excluded_days or ())
+        self._interruption_starts = [start for start, _ in self.interruptions]
+        self._lock = threading.Lock()
+        self._span: _Span | None = None
+
+    def _build(self, first_year: int, last_year: int) -> _Span:
+        origin = date(first_year, 1, 1).toordinal()
+        size = date(last_year, 12, 31).toordinal() - origin + 1
+        max_weekday = 5 if self.allow_saturday else 4
+        bitmap = bytearray(size)
+        weekday = date(first_year, 1, 1).weekday()
+        for index in range(size):
+            if weekday <= max_weekday:
+                bitmap[index] = 1
+            weekday = 0 if weekday == 6 else weekday + 1
+        for year in range(first_year, last_year + 1):
+            for holiday in french_public_holidays(year):
+                bitmap[holiday.toordinal() - origin] = 0
+        for day in self.excluded_days:
+            if 0 <= day.toordinal() - origin < size:
+                bitmap[day.toordinal() - origin] = 0
+        for start, end in self.interruptions:
+            lo = max(start.toordinal() - origin, 0)
+            hi = min(end.toordinal() - origin, size - 1)
+            if lo <= hi:
+                bitmap[lo:hi + 1] = bytes(hi - lo + 1)
+        prefix = array("l", bytes(array("l").itemsize * (size + 1)))
+        running = 0
+        for index, flag in enumerate(bitmap):
+            running += flag
+            prefix[index + 1] = running
+        return _Span(first_year, last_year, origin, bitmap, prefix)
+
+    def _covering(self, first_year: int, last_year: int) -> _Span:
+        """Instantané couvrant les années demandées ; les lecteurs n'utilisent qu'un seul instantané."""
+        span = self._span
+        if span is not None and span.covers(first_year, last_year):
+            return span
+        with self._lock:
+            span = self._span
+            if span is None:
+                span = self._build(first_year - 1, last_year + 2)
+            elif not span.covers(first_year, last_year):
+                span = self._build(min(first_year, span.first_year), max(last_year, span.last_year))
+            self._span = span
+            return span
+
+    def is_interrupted(self, day: date) -> bool:
+        position = bisect_right(self._interruption_starts, day) - 1
+        return position >= 0 and day <= self.interruptions[position][1]
+
+    def is_working_day(self, day: date) -> bool:
+        span = self._covering(day.year, day.year)
+        return bool(span.bitmap[day.toordinal() - span.origin])
+
+    def count_between(self, start: date, end: date) -> int:
+        """Nombre de jours ouvrés dans [start, end], bornes incluses."""
+        if end < start:
+            return 0
+        span = self._covering(start.year, end.year)
+        return span.prefix[end.toordinal() - span.origin + 1] - span.prefix[start.toordinal() - span.origin]
+
+    def working_days(self, start: date, end: date) -> list[date]:
+        if end < start:
+            return []
+        span = self._covering(start.year, end.year)
+        bitmap, origin = span.bitmap, span.origin
+        return [date.fromordinal(origin + index) for index in range(start.toordinal() - origin, end.toordinal() - origin + 1) if bitmap[index]]
+
+    def nth_working_day(self, start: date, count: int) -> date | None:
+        """Nième jour ouvré à partir de `start` inclus (`count=1` : premier jour ouvré >= start)."""
+        if count <= 0:
+            return None
+        last_year = start.year
+        while last_year - start.year <= 200:
+            span = self._covering(start.year, last_year)
+            target = span.prefix[start.toordinal() - span.origin] + count
+            if span.prefix[-1] >= target:
+                return date.fromordinal(span.origin + bisect_left(span.prefix, target) - 1)
+            last_year = span.last_year + 5
+        return None
+
+    def next_working_day(self, day: date) -> date | None:
+        """Premier jour ouvré strictement après `day`."""
+        return self.nth_working_day(day + timedelta(days=1), 1)
+
+    def active_weeks(self, start: date, count: int) -> list[tuple[int, int]]:
+        """Les `count` premières semaines ISO (année, semaine) contenant un jour ouvré à partir de `start`."""
+        weeks: list[tuple[int, int]] = []
+        cursor = start
+        while len(weeks) < count:
+            day = self.nth_working_day(cursor, 1)
+            if day is None:
+                break
+            iso = day.isocalendar()
+            weeks.append((iso[0], iso[1]))
+            cursor = day + timedelta(days=7 - day.weekday())
+        return weeks
+
+    def week_working_days(self, day: date) -> int:
+        """Nombre de jours ouvrés de la semaine ISO contenant `day`."""
+        monday = day - timedelta(days=day.weekday())
+        return self.count_between(monday, monday + timedelta(days=6))
+
+
+@lru_cache(maxsize=128)
+def _cached_calendar(interruptions: tuple[DateRange, ...], allow_saturday: bool, excluded_days: frozenset[date]) -> WorkingDayCalendar:
+    return WorkingDayCalendar(interruptions, allow_saturday, excluded_days)
+
+
+def get_calendar(interruptions: Iterable[DateRange] | None = None, allow_saturday: bool = False, excluded_days: Iterable[date] = ()) -> WorkingDayCalendar:
+    """Calendrier mémoïsé pour une configuration donnée (les plages sont normalisées avant la clé)."""
+    return _cached_calendar(normalize_ranges(interruptions), bool(allow_saturday), frozenset(excluded_days or ()))
+
+
+def exam_excluded_days(exam_iso: str = "") -> frozenset[date]:
+    """Jour d'examen (ISO `YYYY-MM-DD`) à retirer des jours de formation, s'il est valide."""
+    try:
+        return frozenset({date.fromisoformat(exam_iso[:10])}) if exam_iso else frozenset()
+    except ValueError:
+        return frozenset()
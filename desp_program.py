@@ -1,6 +1,8 @@
 from __future__ import annotations
 from datetime import date, datetime, timedelta, time as dt_time
 
+from business_calendar import exam_excluded_days, french_public_holidays, get_calendar, is_working_day
+
 DESP_CODE = "DESP"
 DESP_LABEL = "Dirigeant d’une société de sécurité privée (DESP)"
 DESP_ELEARNING_HOURS = 174
@@ -87,25 +89,11 @@ def desp_program_totals():
 
 assert desp_program_totals() == {"elearning": DESP_ELEARNING_HOURS, "presentiel": DESP_PRESENTIEL_HOURS, "total": DESP_TOTAL_HOURS}
 
-def _easter_date(year: int) -> date:
-    a=year%19; b=year//100; c=year%100; d=b//4; e=b%4; f=(b+8)//25; g=(b-f+1)//3; h=(19*a+b-d-g+15)%30; i=c//4; k=c%4; l=(32+2*e+2*i-h-k)%7; m=(a+11*h+22*l)//451
-    month=(h+l-7*m+114)//31; day=((h+l-7*m+114)%31)+1
-    return date(year, month, day)
-
-def french_public_holidays(year: int) -> set[date]:
-    easter = _easter_date(year)
-    return {date(year,1,1), date(year,5,1), date(year,5,8), date(year,7,14), date(year,8,15), date(year,11,1), date(year,11,11), date(year,12,25), easter + timedelta(days=1), easter + timedelta(days=39), easter + timedelta(days=50)}
-
 def is_desp_training_day(day: date, exam_iso: str = "", allow_saturday: bool = False) -> bool:
-    max_weekday = 5 if allow_saturday else 4
-    return day.isoformat() != exam_iso and day.weekday() <= max_weekday and day not in french_public_holidays(day.year)
+    return day.isoformat() != exam_iso and is_working_day(day, allow_saturday)
 
 def desp_working_days_between(start: date, end: date, exam_iso: str = "", allow_saturday: bool = False):
-    days=[]; cur=start
-    while cur <= end:
-        if is_desp_training_day(cur, exam_iso, allow_saturday): days.append(cur)
-        cur += timedelta(days=1)
-    return days
+    return get_calendar(allow_saturday=allow_saturday, excluded_days=exam_excluded_days(exam_iso)).working_days(start, end)
 
 def _hhmm(t): return t.strftime("%H:%M")
 def _add(t, minutes): return (datetime.combine(date(2000,1,1), t) + timedelta(minutes=minutes)).time()
@@ -0,0 +1,11 @@
+"""Configuration gunicorn : les threads de fond démarrent dans chaque worker, une fois l'application chargée."""
+
+import multiprocessing
+
+
+def post_worker_init(worker):
+    from app import start_background_workers
+
+    # Les rendus PDF parallèles partent d'un forkserver qui a déjà importé l'application.
+    multiprocessing.set_forkserver_preload(["app"])
+    start_background_workers()
@@ -0,0 +1,113 @@
+"""Contrôle de faisabilité des périodes de formation.
+
+Chaque type de planning se ramène à un besoin en jours ouvrés (nombre minimal,
+et éventuellement maximal, de journées disponibles). Avec les sommes préfixes
+de `business_calendar`, une fenêtre (début, fin, examen) se valide en temps
+constant, et la date de fin au plus tôt ou la date de début au plus tard se
+trouvent par recherche dichotomique sur cet oracle.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Any
+
+from business_calendar import WorkingDayCalendar
+
+DEFAULT_HORIZON_DAYS = 3 * 366
+
+
+def days_for(required_minutes: int, max_daily_minutes: int) -> int:
+    """Nombre minimal de journées pour placer `required_minutes` à `max_daily_minutes` par jour."""
+    return -(-int(required_minutes) // int(max_daily_minutes))
+
+
+@dataclass(frozen=True)
+class PeriodRequirement:
+    label: str
+    min_days: int
+    max_days: int | None = None
+    # SSIAP 1 : la dernière journée ouvrée doit être la date de fin, et les
+    # `lead_days` premiers jours doivent se suivre (SST puis SSIAP dès J+2).
+    exact: bool = False
+    lead_days: int = 0
+
+
+def check_period(requirement: PeriodRequirement, start: date, end: date, calendar: WorkingDayCalendar) -> dict[str, Any]:
+    available = calendar.count_between(start, end)
+    reason = ""
+    if available < requirement.min_days:
+        reason = f"{available} journée(s) disponible(s), {requirement.min_days} nécessaire(s)."
+    elif requirement.max_days is not None and available > requirement.max_days:
+        reason = f"{available} journées disponibles, {requirement.max_days} au maximum."
+    elif requirement.exact and not (available == requirement.min_days and calendar.is_working_day(end)):
+        reason = f"La période doit compter exactement {requirement.min_days} journées et se terminer un jour ouvré."
+    elif requirement.lead_days and calendar.count_between(start, start + timedelta(days=requirement.lead_days - 1)) != requirement.lead_days:
+        reason = f"Les {requirement.lead_days} premiers jours de la période doivent être ouvrés et consécutifs."
+    return {
+        "feasible": not reason,
+        "availableDays": available,
+        "requiredDays": requirement.min_days,
+        "maxDays": requirement.max_days,
+        "reason": reason,
+    }
+
+
+def _first_offset(predicate, horizon: int) -> int | None:
+    """Plus petit décalage de [0, horizon] vérifiant un prédicat monotone (faux… puis vrai)."""
+    if not predicate(horizon):
+        return None
+    lo, hi = 0, horizon
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if predicate(mid):
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+
+def earliest_feasible_end(requirement: PeriodRequirement, start: date, calendar: WorkingDayCalendar, horizon_days: int = DEFAULT_HORIZON_DAYS) -> date | None:
+    offset = _first_offset(lambda n: calendar.count_between(start, start + timedelta(days=n)) >= requirement.min_days, horizon_days)
+    if offset is None:
+        return None
+    end = start + timedelta(days=offset)
+    return end if check_period(requirement, start, end, calendar)["feasible"] else None
+
+
+def latest_feasible_end(requirement: PeriodRequirement, start: date, calendar: WorkingDayCalendar, horizon_days: int = DEFAULT_HORIZON_DAYS) -> date | None:
+    """Date de fin au plus tard (uniquement si le besoin fixe un maximum de journées)."""
+    if requirement.max_days is None:
+        return None
+    offset = _first_offset(lambda n: calendar.count_between(start, start + timedelta(days=n)) > requirement.max_days, horizon_days)
+    if offset is None or offset == 0:
+        return None
+    end = start + timedelta(days=offset - 1)
+    return end if check_period(requirement, start, end, calendar)["feasible"] else None
+
+
+def latest_feasible_start(requirement: PeriodRequirement, end: date, calendar: WorkingDayCalendar, horizon_days: int = DEFAULT_HORIZON_DAYS) -> date | None:
+    # count(end - n, end) croît avec n : on cherche le plus petit recul suffisant.
+    offset = _first_offset(lambda n: calendar.count_between(end - timedelta(days=n), end) >= requirement.min_days, horizon_days)
+    if offset is None:
+        return None
+    start = end - timedelta(days=offset)
+    return start if check_period(requirement, start, end, calendar)["feasible"] else None
+
+
+def suggest_dates(requirement: PeriodRequirement, calendar: WorkingDayCalendar, start: date | None = None, end: date | None = None, exam_calendar: WorkingDayCalendar | None = None) -> dict[str, Any]:
+    """Vérification de la fenêtre fournie et dates valides les plus proches, au format JSON."""
+    result: dict[str, Any] = {"label": requirement.label, "requiredDays": requirement.min_days, "maxDays": requirement.max_days}
+    if start and end:
+        result["check"] = check_period(requirement, start, end, calendar)
+    if start:
+        earliest_end = earliest_feasible_end(requirement, start, calendar)
+        result["earliestEnd"] = earliest_end.isoformat() if earliest_end else None
+        exam_day = (exam_calendar or calendar).next_working_day(earliest_end) if earliest_end else None
+        result["earliestExam"] = exam_day.isoformat() if exam_day else None
+        latest_end = latest_feasible_end(requirement, start, calendar)
+        result["latestEnd"] = latest_end.isoformat() if latest_end else None
+    if end:
+        latest_start = latest_feasible_start(requirement, end, calendar)
+        result["latestStart"] = latest_start.isoformat() if latest_start else None
+    return result
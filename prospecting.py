@@ -55,7 +55,7 @@ SIGNAL_FILTERS = (
     ("all", "Tous les prospects"),
     ("archives", "Archives / anciens prospects"),
 )
-RNE_SEARCH_API = "https://recherche-entreprises.api.gouv.fr/search"
+RNE_SEARCH_API = os.environ.get("RNE_SEARCH_API_URL", "https://recherche-entreprises.api.gouv.fr/search")
 SCAN_STALE_MINUTES = 5
 DOWNLOAD_MAX_SECONDS = 45
 
@@ -635,7 +635,11 @@ def cron_scan_prospects():
     expected = os.environ.get("CRON_SECRET")
     provided = request.headers.get("Authorization", "").removeprefix("Bearer ") or request.args.get("key")
     if not expected or provided != expected: return jsonify({"ok": False, "error": "unauthorized"}), 401
-    return jsonify({"ok": True, **run_scan()})
+    scheduler = current_app.extensions.get("job_scheduler")
+    if scheduler is None:
+        return jsonify({"ok": True, **run_scan()})
+    entry_id, created = scheduler.enqueue("prospect_scan", source="cron")
+    return jsonify({"ok": True, "queued": True, "id": entry_id, "created": created}), 202
 
 
 @prospecting_bp.post("/admin/scan")
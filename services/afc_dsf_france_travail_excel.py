@@ -10,9 +10,10 @@ from datetime import datetime
 from pathlib import Path
 from typing import Any
 
-from openpyxl import load_workbook
 from openpyxl.utils import get_column_letter
 
+from services import xlsx_templates
+
 TRAINEE_COLUMNS = list(range(3, 19))  # C:R
 MODULE_ROWS = {
     "FT": (11, 12, 13, 14),
@@ -33,7 +34,7 @@ def load_dsf_template(app_root: str | Path):
     path = Path(app_root) / "static" / "upload" / "dsf.xlsx"
     if not path.exists():
         raise FileNotFoundError(f"Modèle DSF France Travail introuvable : {path}")
-    return load_workbook(path)
+    return xlsx_templates.load_template(path)
 
 
 def _parse_date(value):
@@ -1,14 +1,18 @@
 from __future__ import annotations
 
-import copy, io, logging, re, time, unicodedata
+import copy, hashlib, io, json, logging, os, re, threading, time, unicodedata
+from collections import OrderedDict
+from bisect import bisect_left
 from dataclasses import dataclass
+from functools import lru_cache
 from datetime import date, datetime, timedelta
 from pathlib import Path
 from typing import Any
 
-from openpyxl import load_workbook
 from openpyxl.styles import PatternFill
 
+from services import xlsx_templates, xlsx_xml_writer
+
 WEEK_RE = re.compile(r"^\d{4} au \d{4}$")
 FT_KEYS = ("marche_afc", "brs", "convention", "bon_commande", "type_session", "intitule")
 DAY_COLS = [("Lundi", 3, 4), ("Mardi", 5, 6), ("Mercredi", 7, 8), ("Jeudi", 9, 10), ("Vendredi", 11, 12)]
@@ -20,6 +24,10 @@ GREY_FILL = PatternFill("solid", fgColor="D9D9D9")
 WHITE_FILL = PatternFill(fill_type=None)
 AFC_CODE_MAP = {"SP": "S", "S": "S", "RAN": "RAN", "PAF": "PAF", "E": "E", "DIS": "DIS"}
 FT_CATEGORIES = {"ACCUEIL", "APS", "EXAM_APS", "H0B0", "SSIAP1", "EXAM_SSIAP1", "BILAN", "FT"}
+REVISION_KEYS = ("id", "training_code", "formation", "display_name", "date_debut", "date_fin", "apsPlanningData", "apsAttendanceStudents", "france_travail")
+PREVIEW_CACHE_SIZE = 32
+_preview_cache: OrderedDict[str, dict[str, Any]] = OrderedDict()
+_preview_cache_lock = threading.Lock()
 
 @dataclass
 class SlotInfo:
@@ -34,12 +42,16 @@ def template_path(app_root: str | Path) -> Path:
     return Path(app_root) / "static" / "upload" / "tableau.xlsx"
 
 
-def load_france_travail_template(app_root: str | Path):
+def existing_template_path(app_root: str | Path) -> Path:
     path = template_path(app_root)
     if not path.exists():
         logging.getLogger(__name__).error("Modèle France Travail introuvable: %s", path)
         raise FileNotFoundError(f"Modèle Excel introuvable : {path}")
-    return load_workbook(path)
+    return path
+
+
+def load_france_travail_template(app_root: str | Path):
+    return xlsx_templates.load_template(existing_template_path(app_root))
 
 
 def get_afc_france_travail_settings(session: dict[str, Any]) -> dict[str, str]:
@@ -76,10 +88,14 @@ def save_france_travail_ids(session, ids: dict[str, Any]):
     return attendance_students(session)
 
 
+@lru_cache(maxsize=4096)
+def _parse_iso_date(text):
+    return datetime.strptime(text, "%Y-%m-%d").date()
+
 def parse_date(v):
     if isinstance(v, date): return v
     if not v: return None
-    return datetime.strptime(str(v)[:10], "%Y-%m-%d").date()
+    return _parse_iso_date(str(v)[:10])
 
 def build_session_weeks(session):
     dates = [parse_date(d.get("date")) for d in session.get("apsPlanningData") or [] if d.get("date")]
@@ -111,32 +127,31 @@ def slot_applies_to_student(slot_info, student):
     return not slot_info.student_ids or str(student.get("id")) in slot_info.student_ids or str(student.get("index")) in slot_info.student_ids
 def fmt_hours(h): return int(h) if abs(h-int(h))<0.001 else str(round(h,2)).replace('.', ',')
 
-def build_week_schedule(session, week):
-    day_to_col = {week["monday"]+timedelta(days=i): cols for i, cols in enumerate(DAY_COLS)}; slots=[]
-    morning_end = 12 * 60 + 30; afternoon_start = 13 * 60 + 30
-    for day in session.get("apsPlanningData") or []:
-        d=parse_date(day.get("date"))
-        if d not in day_to_col: continue
-        for sl in day.get("slots") or []:
-            start_min, end_min = time_to_minutes(sl.get("start")), time_to_minutes(sl.get("end"))
-            if end_min <= start_min:
-                m=minutes(sl)
-                if m<=0: raise ValueError("Créneau AFC incohérent (durée négative ou nulle).")
-                end_min = start_min + m
-            pieces=[]
-            if start_min < morning_end and end_min > start_min:
-                pieces.append((start_min, min(end_min, morning_end), "am"))
-            if end_min > afternoon_start:
-                pieces.append((max(start_min, afternoon_start), end_min, "pm"))
-            if not pieces and start_min >= morning_end and end_min <= afternoon_start:
-                pieces.append((start_min, end_min, half(sl.get("start"))))
-            for piece_start, piece_end, part in pieces:
-                m = piece_end - piece_start
-                if m<=0: continue
-                col = day_to_col[d][1 if part=="am" else 2]
-                slots.append(SlotInfo(d,col,part,minutes_to_time(piece_start),minutes_to_time(piece_end),m,slot_module(sl),sl.get("trainer") or sl.get("formateur") or "",slot_student_ids(sl)))
+def day_slot_infos(day, d, cols):
+    slots=[]; morning_end = 12 * 60 + 30; afternoon_start = 13 * 60 + 30
+    for sl in day.get("slots") or []:
+        start_min, end_min = time_to_minutes(sl.get("start")), time_to_minutes(sl.get("end"))
+        if end_min <= start_min:
+            m=minutes(sl)
+            if m<=0: raise ValueError("Créneau AFC incohérent (durée négative ou nulle).")
+            end_min = start_min + m
+        pieces=[]
+        if start_min < morning_end and end_min > start_min:
+            pieces.append((start_min, min(end_min, morning_end), "am"))
+        if end_min > afternoon_start:
+            pieces.append((max(start_min, afternoon_start), end_min, "pm"))
+        if not pieces and start_min >= morning_end and end_min <= afternoon_start:
+            pieces.append((start_min, end_min, half(sl.get("start"))))
+        for piece_start, piece_end, part in pieces:
+            m = piece_end - piece_start
+            if m<=0: continue
+            col = cols[1 if part=="am" else 2]
+            slots.append(SlotInfo(d,col,part,minutes_to_time(piece_start),minutes_to_time(piece_end),m,slot_module(sl),sl.get("trainer") or sl.get("formateur") or "",slot_student_ids(sl)))
     return slots
 
+def build_week_schedule(session, week):
+    return build_planning_index(session, [week]).schedule(week)
+
 def applicable(student, d):
     entry=parse_date(student.get("entryDate")); exit=parse_date(student.get("exitDate"))
     return (not entry or d>=entry) and (not exit or d<=exit)
@@ -148,6 +163,41 @@ def get_week_trainees(session, week, schedule=None):
         if any(applicable(st, sl.date) for sl in schedule): result.append(st)
     return result
 
+@dataclass
+class PlanningIndex:
+    """Planning AFC indexé en un seul passage : semaine (lundi) → jour → demi-journée → créneaux."""
+    weeks: list[dict[str, Any]]
+    schedules: dict[date, list[SlotInfo]]
+    days: dict[date, dict[date, dict[str, list[SlotInfo]]]]
+    students: list[dict[str, Any]]
+
+    def schedule(self, week):
+        return self.schedules.get(week["monday"], [])
+
+    def trainees(self, week):
+        """Stagiaires présents (dates d'entrée et de sortie) sur au moins un jour de cours de la semaine."""
+        dates = sorted(d for d, parts in self.days.get(week["monday"], {}).items() if parts["am"] or parts["pm"])
+        if not dates: return []
+        result = []
+        for st in self.students:
+            entry=parse_date(st.get("entryDate")); exit=parse_date(st.get("exitDate"))
+            i = bisect_left(dates, entry) if entry else 0
+            if i < len(dates) and (not exit or dates[i] <= exit): result.append(st)
+        return result
+
+def build_planning_index(session, weeks=None):
+    weeks = build_session_weeks(session) if weeks is None else weeks
+    schedules = {w["monday"]: [] for w in weeks}; days = {w["monday"]: {} for w in weeks}
+    for day in session.get("apsPlanningData") or []:
+        d=parse_date(day.get("date"))
+        if d is None or d.weekday() >= len(DAY_COLS): continue
+        monday = d - timedelta(days=d.weekday())
+        if monday not in schedules: continue
+        parts = days[monday].setdefault(d, {"am": [], "pm": []})
+        for sl in day_slot_infos(day, d, DAY_COLS[d.weekday()]):
+            schedules[monday].append(sl); parts[sl.part].append(sl)
+    return PlanningIndex(weeks, schedules, days, attendance_students(session))
+
 def get_week_trainers(schedule):
     seen={};
     for sl in schedule:
@@ -155,8 +205,26 @@ def get_week_trainers(schedule):
         if name and name not in seen: seen[name]=sl
     return [(n, s) for n,s in seen.items()]
 
+def session_revision(session):
+    """Empreinte des champs de la session utilisés par la prévisualisation et la génération."""
+    payload = json.dumps([session.get(k) for k in REVISION_KEYS], sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
 def preview(session):
-    weeks=build_session_weeks(session); schedules=[build_week_schedule(session,w) for w in weeks]; students=attendance_students(session); settings=get_afc_france_travail_settings(session)
+    """Prévisualisation, mise en cache par révision de session (voir `session_revision`)."""
+    key = session_revision(session)
+    with _preview_cache_lock:
+        cached = _preview_cache.get(key)
+        if cached is not None: _preview_cache.move_to_end(key)
+    if cached is None:
+        cached = compute_preview(session)
+        with _preview_cache_lock:
+            _preview_cache[key] = cached
+            while len(_preview_cache) > PREVIEW_CACHE_SIZE: _preview_cache.popitem(last=False)
+    return copy.deepcopy(cached)
+
+def compute_preview(session, index=None):
+    index=index or build_planning_index(session); weeks=index.weeks; schedules=[index.schedule(w) for w in weeks]; students=index.students; settings=get_afc_france_travail_settings(session)
     trainers={sl.trainer.strip() for sch in schedules for sl in sch if sl.trainer.strip()}
     missing_ids=[s["displayName"] for s in students if not s.get("france_travail_id")]
     total=sum(sl.minutes/60 for sch in schedules for sl in sch)*len(students)
@@ -166,12 +234,15 @@ def preview(session):
 def copy_row_style(ws, src, dst):
     ws.row_dimensions[dst].height = ws.row_dimensions[src].height
     for c in range(1,14):
-        a,b=ws.cell(src,c),ws.cell(dst,c); b._style=copy.copy(a._style); b.font=copy.copy(a.font); b.fill=copy.copy(a.fill); b.border=copy.copy(a.border); b.alignment=copy.copy(a.alignment); b.number_format=a.number_format
+        ws.cell(dst,c)._style=copy.copy(ws.cell(src,c)._style)
+
+def week_template_name(sheetnames):
+    name = "0604 au 1004" if "0604 au 1004" in sheetnames else next((n for n in sheetnames if WEEK_RE.match(n)), None)
+    if name is None: raise ValueError("Aucun onglet hebdomadaire utilisable dans le modèle.")
+    return name
 
 def clone_week_template(wb):
-    src = wb["0604 au 1004"] if "0604 au 1004" in wb.sheetnames else next((wb[n] for n in wb.sheetnames if WEEK_RE.match(n)), None)
-    if src is None: raise ValueError("Aucun onglet hebdomadaire utilisable dans le modèle.")
-    return src
+    return wb[week_template_name(wb.sheetnames)]
 
 def prepare_sheet(ws, student_count, trainer_count):
     need=max(student_count,1); extra=max(0,need-BASE_STUDENT_PAIRS)
@@ -188,21 +259,21 @@ def populate_week_header(ws, session, week, settings, student_count):
 
 def populate_week_slots(ws, week, schedule):
     for _, c1, c2 in DAY_COLS:
-        for c in (c1,c2): ws.cell(12,c).value=None; ws.cell(13,c).value=None; ws.cell(12,c).fill=copy.copy(GREY_FILL); ws.cell(13,c).fill=copy.copy(GREY_FILL)
+        for c in (c1,c2): ws.cell(12,c).value=None; ws.cell(13,c).value=None; ws.cell(12,c).fill=GREY_FILL; ws.cell(13,c).fill=GREY_FILL
     for col in range(3,13):
         ss=[s for s in schedule if s.col==col]
         if ss:
-            ws.cell(12,col).value=fmt_slot(minutes_to_time(min(time_to_minutes(s.start) for s in ss)), minutes_to_time(max(time_to_minutes(s.end) for s in ss))); ws.cell(13,col).value=" / ".join(dict.fromkeys(s.module for s in ss)); ws.cell(12,col).fill=copy.copy(WHITE_FILL); ws.cell(13,col).fill=copy.copy(WHITE_FILL)
+            ws.cell(12,col).value=fmt_slot(minutes_to_time(min(time_to_minutes(s.start) for s in ss)), minutes_to_time(max(time_to_minutes(s.end) for s in ss))); ws.cell(13,col).value=" / ".join(dict.fromkeys(s.module for s in ss)); ws.cell(12,col).fill=WHITE_FILL; ws.cell(13,col).fill=WHITE_FILL
 
 def populate_week_trainees(ws, trainees, schedule):
-    totals=[0]*10
+    totals=[0]*10; by_col={c:[s for s in schedule if s.col==c] for c in range(3,13)}
     for idx, st in enumerate(trainees,1):
         r=STUDENT_START_ROW+(idx-1)*2; ws.cell(r,1).value=f"{idx} {st['displayName']}"; ws.cell(r,2).value=st.get('france_travail_id') or ""; ws.cell(r,2).number_format='@'; ws.cell(r+1,1).value="Soutien personnalisé"; main_hours=0; sp_hours=0; total_hours=0
         for c in range(3,13):
-            day_slots=[s for s in schedule if s.col==c and applicable(st,s.date) and slot_applies_to_student(s, st)]; classic=sum(s.minutes for s in day_slots if s.module!='S'); support=sum(s.minutes for s in day_slots if s.module=='S')
+            day_slots=[s for s in by_col[c] if applicable(st,s.date) and slot_applies_to_student(s, st)]; classic=sum(s.minutes for s in day_slots if s.module!='S'); support=sum(s.minutes for s in day_slots if s.module=='S')
             main_hours+=classic/60; sp_hours+=support/60; total_hours+=(classic+support)/60; totals[c-3]+=(classic+support)/60
-            ws.cell(r,c).value=None; ws.cell(r,c).fill=copy.copy(WHITE_FILL if classic else GREY_FILL)
-            ws.cell(r+1,c).value=None; ws.cell(r+1,c).fill=copy.copy(WHITE_FILL if support else GREY_FILL)
+            ws.cell(r,c).value=None; ws.cell(r,c).fill=WHITE_FILL if classic else GREY_FILL
+            ws.cell(r+1,c).value=None; ws.cell(r+1,c).fill=WHITE_FILL if support else GREY_FILL
             if support:
                 ws.cell(r+1,c).value=support/60; ws.cell(r+1,c).number_format='0,## "h"'
         ws.cell(r,13).value=fmt_hours(main_hours) if main_hours else None; ws.cell(r+1,13).value=sp_hours if sp_hours else 0; ws.cell(r+1,13).number_format='0,## "h"'
@@ -223,26 +294,44 @@ def populate_week_trainers(ws, trainer_row, trainers, schedule):
         for c in range(2, 14):
             ws.cell(r, c).value = None
             if 3 <= c <= 12:
-                ws.cell(r, c).fill = copy.copy(GREY_FILL)
+                ws.cell(r, c).fill = GREY_FILL
     for i,(name,_) in enumerate(trainers):
         r=trainer_row+i; ws.cell(r,1).value=f"Formateur {name}"
-        for c in range(3,13): ws.cell(r,c).value=None; ws.cell(r,c).fill=copy.copy(WHITE_FILL if any(s.col==c and s.trainer.strip()==name for s in schedule) else GREY_FILL)
+        for c in range(3,13): ws.cell(r,c).value=None; ws.cell(r,c).fill=WHITE_FILL if any(s.col==c and s.trainer.strip()==name for s in schedule) else GREY_FILL
 
 def configure_print_settings(ws, last_row):
     ws.sheet_properties.pageSetUpPr.fitToPage=True; ws.page_setup.orientation='landscape'; ws.page_setup.fitToWidth=1; ws.page_setup.fitToHeight=0; ws.print_area=f"A1:M{last_row}"; ws.freeze_panes="C14"
 
-def generate_france_travail_workbook(session, app_root):
-    start_time=time.time()
-    if not is_afc_session(session): raise PermissionError("Génération réservée aux sessions AFC APS + SSIAP.")
-    wb=load_france_travail_template(app_root); template=clone_week_template(wb); copied=[]; settings=get_afc_france_travail_settings(session); weeks=build_session_weeks(session); all_students=attendance_students(session)
-    for week in weeks:
+def populate_week(ws, session, index, week, settings):
+    student_count=len(index.students); schedule=index.schedule(week); trainees=index.trainees(week); trainers=get_week_trainers(schedule); total_row, trainer_row=prepare_sheet(ws, len(trainees), len(trainers)); populate_week_header(ws, session, week, settings, student_count); populate_week_slots(ws, week, schedule); totals=populate_week_trainees(ws, trainees, schedule); populate_week_totals(ws,total_row,totals); populate_week_trainers(ws,trainer_row,trainers,schedule); configure_print_settings(ws, max(ws.max_row, trainer_row+len(trainers)+2))
+
+def generate_france_travail_workbook_openpyxl(session, app_root, index=None):
+    index=index or build_planning_index(session); wb=load_france_travail_template(app_root); template=clone_week_template(wb); copied=[]; settings=get_afc_france_travail_settings(session)
+    for week in index.weeks:
         ws=wb.copy_worksheet(template); ws.title=week['name']; copied.append(ws)
-        schedule=build_week_schedule(session, week); trainees=get_week_trainees(session, week, schedule); trainers=get_week_trainers(schedule); total_row, trainer_row=prepare_sheet(ws, len(trainees), len(trainers)); populate_week_header(ws, session, week, settings, len(all_students)); populate_week_slots(ws, week, schedule); totals=populate_week_trainees(ws, trainees, schedule); populate_week_totals(ws,total_row,totals); populate_week_trainers(ws,trainer_row,trainers,schedule); configure_print_settings(ws, max(ws.max_row, trainer_row+len(trainers)+2))
+        populate_week(ws, session, index, week, settings)
     for ws in list(wb.worksheets):
         if ws not in copied: wb.remove(ws)
     wb.active=0
     bio=io.BytesIO(); wb.save(bio); bio.seek(0)
-    logging.getLogger(__name__).info("France Travail AFC généré session=%s semaines=%s stagiaires=%s onglets=%s durée=%.2fs", session.get('id'), len(weeks), len(all_students), len(copied), time.time()-start_time)
+    return bio
+
+def generate_france_travail_workbook_xml(session, app_root, index=None):
+    """Même classeur que la version openpyxl, écrit directement en XML à partir de l'archive du modèle."""
+    index=index or build_planning_index(session); package=xlsx_xml_writer.load_package(existing_template_path(app_root)); template=week_template_name(package.sheetnames); wb=xlsx_xml_writer.XmlWorkbook(package); settings=get_afc_france_travail_settings(session)
+    for week in index.weeks:
+        populate_week(wb.copy_worksheet(template, week['name']), session, index, week, settings)
+    return wb.save(active=0)
+
+WRITERS = {"xml": generate_france_travail_workbook_xml, "openpyxl": generate_france_travail_workbook_openpyxl}
+
+def generate_france_travail_workbook(session, app_root, writer=None):
+    start_time=time.time()
+    if not is_afc_session(session): raise PermissionError("Génération réservée aux sessions AFC APS + SSIAP.")
+    writer=(writer or os.environ.get("FRANCE_TRAVAIL_EXCEL_WRITER") or "xml").lower()
+    if writer not in WRITERS: raise ValueError(f"Générateur Excel France Travail inconnu : {writer}")
+    index=build_planning_index(session); bio=WRITERS[writer](session, app_root, index)
+    logging.getLogger(__name__).info("France Travail AFC généré session=%s semaines=%s stagiaires=%s writer=%s durée=%.2fs", session.get('id'), len(index.weeks), len(index.students), writer, time.time()-start_time)
     return bio
 
 def safe_filename(session_name, today=None):
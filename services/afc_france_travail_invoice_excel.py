@@ -8,9 +8,10 @@ from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
 from pathlib import Path
 from typing import Any
 
-from openpyxl import load_workbook
 from openpyxl.cell.cell import MergedCell
 
+from services import xlsx_templates
+
 MODULE_ORDER = ["FT", "SP", "RAN", "PAF", "FESTE"]
 MODULE_LABELS = {
     "FT": "Formation professionnelle ou technique",
@@ -35,7 +36,7 @@ def load_invoice_template(app_root: str | Path):
     path = Path(app_root) / "static" / "upload" / "facture.xlsx"
     if not path.exists():
         raise FileNotFoundError(f"Modèle de facture France Travail introuvable : {path}")
-    return load_workbook(path)
+    return xlsx_templates.load_template(path)
 
 
 def select_invoice_template_sheet(wb):
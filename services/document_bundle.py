@@ -0,0 +1,250 @@
+"""Export groupé des documents d'une session dans une seule archive ZIP.
+
+Chaque document (planning, feuilles de présence, contrats, convocations,
+DSF, feuilles France Travail) est une `BundleTask` : une fonction de module
+qui écrit ses fichiers dans un dossier et renvoie les couples
+`(nom dans l'archive, chemin)`. Une tâche attend celles dont elle dépend et
+est ignorée si l'une d'elles échoue. Quand le pool PDF est activé
+(`PDF_PARALLEL_WORKERS`), les tâches indépendantes tournent dans des
+processus `forkserver`/`spawn` (jamais `fork`) ; une tâche qui dépasse
+`PDF_PARALLEL_TIMEOUT` est arrêtée et refaite dans le processus appelant.
+
+Une tâche qui porte une empreinte (`key`) de ses entrées est mise en cache
+sous `cache_dir` : tant que l'empreinte ne change pas, ses fichiers sont
+réutilisés sans rien régénérer. Les anciennes empreintes ne sont supprimées
+qu'après `CACHE_GRACE_SECONDS` sans utilisation, pour ne pas retirer les
+fichiers d'une archive encore en cours d'envoi. L'archive est produite au fil
+de l'eau avec un `manifest.json` (statut, durée et fichiers de chaque
+document).
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import shutil
+import time
+import uuid
+import zipfile
+from dataclasses import dataclass
+from multiprocessing.connection import wait
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+from services import pdf_parallel
+
+logger = logging.getLogger(__name__)
+
+ENTRIES_FILE = "entries.json"
+# PDF et classeurs sont déjà compressés : recompresser ne ferait que coûter du CPU.
+STORED_SUFFIXES = {".pdf", ".xlsx", ".docx", ".zip", ".png", ".jpg", ".jpeg"}
+CHUNK_SIZE = 256 * 1024
+# Délai sans utilisation avant qu'une ancienne empreinte en cache soit supprimée.
+CACHE_GRACE_SECONDS = 6 * 3600
+
+
+@dataclass
+class BundleTask:
+    name: str
+    # `build(dossier, *args)` écrit les fichiers générés dans le dossier ; renvoie
+    # [(nom dans l'archive, chemin)]. Fonction de module : elle peut partir dans un autre processus.
+    build: Callable[..., list[tuple[str, str]]]
+    args: tuple = ()
+    depends: tuple[str, ...] = ()
+    # Empreinte des entrées : les fichiers en cache sont réutilisés tant qu'elle ne change pas.
+    key: str | None = None
+
+
+def _slug(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", name).strip("._") or "document"
+
+
+def _cached_entries(task_dir: Path) -> list[tuple[str, str]] | None:
+    try:
+        raw = json.loads((task_dir / ENTRIES_FILE).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    entries = [(arcname, path if os.path.isabs(path) else str(task_dir / path)) for arcname, path in raw]
+    return entries if all(os.path.exists(path) for _, path in entries) else None
+
+
+def _touch(path: Path) -> None:
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def _evict_stale(task_root: Path, keep: str, now: float | None = None) -> None:
+    """Supprime les autres empreintes inutilisées depuis `CACHE_GRACE_SECONDS`.
+
+    Une empreinte servie récemment peut encore être lue par une archive en
+    cours d'envoi : elle est gardée même si elle n'est plus la dernière.
+    """
+    limit = (now or time.time()) - CACHE_GRACE_SECONDS
+    for entry in os.scandir(task_root):
+        if entry.name == keep:
+            continue
+        try:
+            stale = entry.stat().st_mtime < limit
+        except OSError:
+            continue
+        if stale:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def _build_cached(task: BundleTask, cache_dir: Path) -> list[tuple[str, str]]:
+    task_root = cache_dir / _slug(task.name)
+    target = task_root / task.key
+    building = task_root / f".{task.key}.{uuid.uuid4().hex}"
+    building.mkdir(parents=True)
+    try:
+        entries = task.build(building, *task.args)
+        stored = [(arcname, os.path.relpath(path, building) if Path(path).resolve().is_relative_to(building.resolve()) else path) for arcname, path in entries]
+        (building / ENTRIES_FILE).write_text(json.dumps(stored, ensure_ascii=False), encoding="utf-8")
+        # Même document produit en même temps par un autre export : on garde le sien,
+        # que cet export est peut-être déjà en train d'envoyer.
+        if _cached_entries(target) is None:
+            shutil.rmtree(target, ignore_errors=True)
+            try:
+                os.replace(building, target)
+            except OSError:
+                if _cached_entries(target) is None:
+                    raise
+    finally:
+        shutil.rmtree(building, ignore_errors=True)
+    _evict_stale(task_root, task.key)
+    return _cached_entries(target) or []
+
+
+def _execute(task: BundleTask, cache_dir: Path, work_dir: Path) -> dict[str, Any]:
+    started = time.perf_counter()
+    result: dict[str, Any] = {"task": task.name, "status": "ok", "cached": False, "files": [], "error": None}
+    try:
+        entries = _cached_entries(cache_dir / _slug(task.name) / task.key) if task.key else None
+        if entries is not None:
+            result["cached"] = True
+            _touch(cache_dir / _slug(task.name) / task.key)
+        elif task.key:
+            entries = _build_cached(task, cache_dir)
+        else:
+            directory = work_dir / _slug(task.name)
+            directory.mkdir(parents=True, exist_ok=True)
+            entries = task.build(directory, *task.args)
+        result["files"] = [[arcname, str(path)] for arcname, path in entries]
+    except Exception as exc:
+        logger.exception("Export groupé : document %s impossible", task.name)
+        result.update(status="error", error=str(exc) or exc.__class__.__name__)
+    result["durationMs"] = round((time.perf_counter() - started) * 1000)
+    return result
+
+
+def _child(task: BundleTask, cache_dir: Path, work_dir: Path, conn) -> None:
+    conn.send(_execute(task, cache_dir, work_dir))
+    conn.close()
+
+
+def run(tasks: list[BundleTask], cache_dir, work_dir, workers: int | None = None, timeout: float | None = None) -> list[dict[str, Any]]:
+    """Exécute le graphe de tâches et renvoie un résultat par tâche, dans l'ordre de `tasks`."""
+    cache_dir, work_dir = Path(cache_dir), Path(work_dir)
+    workers = pdf_parallel.PDF_PARALLEL_WORKERS if workers is None else workers
+    timeout = pdf_parallel.PDF_PARALLEL_TIMEOUT if timeout is None else timeout
+    names = {task.name for task in tasks}
+    depends = {task.name: [name for name in task.depends if name in names] for task in tasks}
+    use_processes = workers > 1
+    context = pdf_parallel.context() if use_processes else None
+    results: dict[str, dict[str, Any]] = {}
+    pending = list(tasks)
+    running: dict[Any, tuple[BundleTask, Any, float]] = {}
+    while pending or running:
+        done_before = len(results)
+        for task in list(pending):
+            failed = [name for name in depends[task.name] if name in results and results[name]["status"] != "ok"]
+            if failed:
+                results[task.name] = {"task": task.name, "status": "skipped", "cached": False, "files": [], "error": f"Dépend de : {', '.join(failed)}", "durationMs": 0}
+                pending.remove(task)
+            elif all(name in results for name in depends[task.name]) and (not use_processes or len(running) < workers):
+                pending.remove(task)
+                if not use_processes:
+                    results[task.name] = _execute(task, cache_dir, work_dir)
+                    continue
+                receiver, sender = context.Pipe(duplex=False)
+                process = context.Process(target=_child, args=(task, cache_dir, work_dir, sender))
+                process.start()
+                sender.close()
+                running[receiver] = (task, process, time.monotonic() + timeout)
+        if not running:
+            if len(results) == done_before:
+                # Dépendances circulaires : rien ne pourra plus démarrer.
+                for task in pending:
+                    results[task.name] = {"task": task.name, "status": "error", "cached": False, "files": [], "error": "Dépendances circulaires.", "durationMs": 0}
+                pending.clear()
+            continue
+        next_deadline = min(deadline for _, _, deadline in running.values())
+        for receiver in wait(list(running), timeout=max(next_deadline - time.monotonic(), 0)):
+            task, process, _ = running.pop(receiver)
+            try:
+                results[task.name] = receiver.recv()
+            except EOFError:
+                results[task.name] = {"task": task.name, "status": "error", "cached": False, "files": [], "error": "Processus de génération interrompu.", "durationMs": 0}
+            receiver.close()
+            _stop(process, timeout)
+        now = time.monotonic()
+        for receiver, (task, process, deadline) in list(running.items()):
+            if deadline > now:
+                continue
+            # Processus bloqué : il est arrêté et le document est refait ici.
+            del running[receiver]
+            receiver.close()
+            _stop(process, 0)
+            logger.warning("Export groupé : document %s trop long dans un processus, reprise dans le worker", task.name)
+            results[task.name] = _execute(task, cache_dir, work_dir)
+    return [results[task.name] for task in tasks]
+
+
+def _stop(process, timeout: float) -> None:
+    process.join(timeout)
+    if process.is_alive():
+        process.terminate()
+        process.join()
+
+
+class _ChunkSink:
+    """Flux en écriture seule : `zipfile` y écrit, le générateur récupère les octets."""
+
+    def __init__(self):
+        self.chunks: list[bytes] = []
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def stream_zip(results: list[dict[str, Any]], manifest: dict[str, Any]) -> Iterator[bytes]:
+    """Produit l'archive ZIP morceau par morceau : fichiers des documents puis `manifest.json`."""
+    sink = _ChunkSink()
+    seen: set[str] = set()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for result in results:
+            for arcname, path in result["files"]:
+                if arcname in seen:
+                    continue
+                seen.add(arcname)
+                info = zipfile.ZipInfo(arcname, date_time=time.localtime(os.path.getmtime(path))[:6])
+                info.compress_type = zipfile.ZIP_STORED if Path(arcname).suffix.lower() in STORED_SUFFIXES else zipfile.ZIP_DEFLATED
+                with open(path, "rb") as source, archive.open(info, "w", force_zip64=True) as target:
+                    while chunk := source.read(CHUNK_SIZE):
+                        target.write(chunk)
+                        yield sink.take()
+        archive.writestr("manifest.json", json.dumps(manifest, ensure_ascii=False, indent=2))
+    yield sink.take()
@@ -0,0 +1,156 @@
+"""Registre persistant des numéros de facture AFC.
+
+Les numéros sont réservés dans une base SQLite partagée par les workers
+gunicorn : index unique sur le numéro et transaction `BEGIN IMMEDIATE`, donc
+deux processus ne peuvent pas attribuer le même numéro. La séquence garde le
+prochain numéro numérique, ce qui évite de parcourir toutes les sessions pour
+le proposer.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Iterable
+
+from services import sqlite_store
+
+INVOICE_NUMBERS_DB_NAME = "invoice_numbers.db"
+SEQUENCE_NAME = "afc_invoice"
+
+
+class InvoiceNumberTaken(ValueError):
+    pass
+
+
+def _now() -> str:
+    return datetime.now().replace(microsecond=0).isoformat(timespec="seconds")
+
+
+def _numeric(number: str) -> int | None:
+    return int(number) if number.isdigit() else None
+
+
+def default_first_number(today: datetime | None = None) -> int:
+    """Premier numéro de l'année quand aucune facture numérique n'existe (ex. 20260001)."""
+    return int((today or datetime.now()).strftime("%Y0001"))
+
+
+def _create_tables(connection: sqlite3.Connection) -> None:
+    connection.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS invoice_numbers (
+            number TEXT PRIMARY KEY,
+            numeric_value INTEGER,
+            session_id TEXT NOT NULL DEFAULT '',
+            dsf_id TEXT NOT NULL DEFAULT '',
+            reserved_at TEXT NOT NULL
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_invoice_numbers_owner ON invoice_numbers(session_id, dsf_id);
+        CREATE INDEX IF NOT EXISTS idx_invoice_numbers_numeric ON invoice_numbers(numeric_value) WHERE numeric_value IS NOT NULL;
+        CREATE TABLE IF NOT EXISTS invoice_sequences (
+            name TEXT PRIMARY KEY,
+            next_value INTEGER NOT NULL
+        );
+        """
+    )
+
+
+def connect(db_path: str | Path) -> sqlite3.Connection:
+    return sqlite_store.connect(db_path, _create_tables)
+
+
+def _connection(db_path: str | Path):
+    return sqlite_store.connection(db_path, _create_tables)
+
+
+def _advance_sequence(connection: sqlite3.Connection, numeric_value: int | None) -> None:
+    if numeric_value is None:
+        return
+    connection.execute(
+        """INSERT INTO invoice_sequences(name, next_value) VALUES (?, ?)
+           ON CONFLICT(name) DO UPDATE SET next_value=MAX(next_value, excluded.next_value)""",
+        (SEQUENCE_NAME, numeric_value + 1),
+    )
+
+
+def _next_value(connection: sqlite3.Connection) -> int:
+    row = connection.execute("SELECT next_value FROM invoice_sequences WHERE name=?", (SEQUENCE_NAME,)).fetchone()
+    return int(row["next_value"]) if row else default_first_number()
+
+
+def next_number(db_path: str | Path) -> str:
+    """Numéro proposé pour la prochaine facture (lecture seule, sans réservation)."""
+    with _connection(db_path) as connection:
+        return str(_next_value(connection))
+
+
+def reserve(db_path: str | Path, session_id: str, dsf_id: str, number: str | None = None) -> str:
+    """Réserve `number` (ou le prochain numéro de la séquence) pour la DSF `dsf_id`.
+
+    Réserver à nouveau le numéro déjà attribué à la même DSF est sans effet ;
+    un numéro attribué à une autre DSF lève `InvoiceNumberTaken`.
+    """
+    number = str(number or "").strip()
+    with _connection(db_path) as connection, sqlite_store.transaction(connection):
+        if not number:
+            number = str(_next_value(connection))
+        row = connection.execute("SELECT session_id, dsf_id FROM invoice_numbers WHERE number=?", (number,)).fetchone()
+        if row and (row["session_id"], row["dsf_id"]) != (str(session_id), str(dsf_id)):
+            raise InvoiceNumberTaken("Ce numéro de facture est déjà utilisé.")
+        if not row:
+            connection.execute("DELETE FROM invoice_numbers WHERE session_id=? AND dsf_id=?", (str(session_id), str(dsf_id)))
+            connection.execute(
+                "INSERT INTO invoice_numbers(number, numeric_value, session_id, dsf_id, reserved_at) VALUES (?, ?, ?, ?, ?)",
+                (number, _numeric(number), str(session_id), str(dsf_id), _now()),
+            )
+            _advance_sequence(connection, _numeric(number))
+    return number
+
+
+def release(db_path: str | Path, session_id: str, dsf_id: str) -> bool:
+    """Libère le numéro d'une DSF (facture non créée ou DSF supprimée). La séquence ne recule pas."""
+    with _connection(db_path) as connection:
+        cursor = connection.execute("DELETE FROM invoice_numbers WHERE session_id=? AND dsf_id=?", (str(session_id), str(dsf_id)))
+        return bool(cursor.rowcount)
+
+
+def is_taken(db_path: str | Path, number: str, session_id: str = "", dsf_id: str = "") -> bool:
+    with _connection(db_path) as connection:
+        row = connection.execute("SELECT session_id, dsf_id FROM invoice_numbers WHERE number=?", (str(number).strip(),)).fetchone()
+    return bool(row) and (row["session_id"], row["dsf_id"]) != (str(session_id), str(dsf_id))
+
+
+def sync(db_path: str | Path, invoices: Iterable[tuple[str, str, str]]) -> int:
+    """Enregistre les factures `(numéro, session_id, dsf_id)` déjà présentes dans sessions.json.
+
+    Sert à initialiser le registre puis à rattraper une écriture manquée ;
+    renvoie le nombre de numéros ajoutés.
+    """
+    added = 0
+    with _connection(db_path) as connection, sqlite_store.transaction(connection):
+        for number, session_id, dsf_id in invoices:
+            number = str(number or "").strip()
+            if not number:
+                continue
+            cursor = connection.execute(
+                "INSERT OR IGNORE INTO invoice_numbers(number, numeric_value, session_id, dsf_id, reserved_at) VALUES (?, ?, ?, ?, ?)",
+                (number, _numeric(number), str(session_id), str(dsf_id), _now()),
+            )
+            added += cursor.rowcount
+            _advance_sequence(connection, _numeric(number))
+    return added
+
+
+def gaps(db_path: str | Path, limit: int = 100) -> list[dict[str, Any]]:
+    """Trous dans la numérotation numérique : `[{"from": 20260003, "to": 20260004, "count": 2}, …]`."""
+    with _connection(db_path) as connection:
+        rows = connection.execute(
+            """SELECT numeric_value + 1 AS gap_from, next_value - 1 AS gap_to FROM (
+                   SELECT numeric_value, LEAD(numeric_value) OVER (ORDER BY numeric_value) AS next_value
+                   FROM invoice_numbers WHERE numeric_value IS NOT NULL
+               ) WHERE next_value > numeric_value + 1 ORDER BY numeric_value LIMIT ?""",
+            (int(limit),),
+        ).fetchall()
+    return [{"from": row["gap_from"], "to": row["gap_to"], "count": row["gap_to"] - row["gap_from"] + 1} for row in rows]
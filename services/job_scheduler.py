@@ -0,0 +1,450 @@
+"""Planificateur de tâches persistant, exécuté par un seul processus à la fois.
+
+Les tâches (relances du price adaptator, rappels jury, alertes d'expiration,
+récapitulatif quotidien, scan de prospection) sont placées dans une file
+SQLite triée par échéance. Les workers gunicorn se disputent un bail
+(`scheduler_lease`) : seul le détenteur du bail réserve et exécute les
+tâches échues, dans un pool de threads de taille bornée, et une même tâche
+ne tourne jamais deux fois en parallèle : pendant qu'une tâche tourne, son
+exécution et le bail sont prolongés à intervalles réguliers. Si le détenteur
+disparaît, le bail expire et un autre worker reprend la file, y compris les
+tâches en cours qui ne sont plus signalées. Chaque exécution est consignée
+dans `scheduler_history`.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable
+
+from services import sqlite_store
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_DB_NAME = "scheduler.db"
+LEASE_NAME = "scheduler"
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+DEFAULT_LEASE_SECONDS = 90
+DEFAULT_POLL_SECONDS = 30
+DEFAULT_MAX_WORKERS = 2
+HISTORY_RETENTION_DAYS = 60
+
+
+def _now() -> datetime:
+    return datetime.now().replace(microsecond=0)
+
+
+def _iso(value: datetime) -> str:
+    return value.isoformat(timespec="seconds")
+
+
+def _create_tables(connection: sqlite3.Connection) -> None:
+    connection.execute(
+        """
+        CREATE TABLE IF NOT EXISTS scheduler_lease (
+            name TEXT PRIMARY KEY,
+            holder TEXT NOT NULL,
+            acquired_at TEXT NOT NULL,
+            expires_at TEXT NOT NULL
+        )
+        """
+    )
+    connection.execute(
+        """
+        CREATE TABLE IF NOT EXISTS scheduler_queue (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job TEXT NOT NULL,
+            due_at TEXT NOT NULL,
+            payload TEXT NOT NULL DEFAULT '{}',
+            source TEXT NOT NULL DEFAULT '',
+            enqueued_at TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            claimed_by TEXT DEFAULT '',
+            claimed_at TEXT DEFAULT '',
+            heartbeat_at TEXT DEFAULT ''
+        )
+        """
+    )
+    columns = {row[1] for row in connection.execute("PRAGMA table_info(scheduler_queue)")}
+    if "heartbeat_at" not in columns:
+        connection.execute("ALTER TABLE scheduler_queue ADD COLUMN heartbeat_at TEXT DEFAULT ''")
+    connection.execute("CREATE INDEX IF NOT EXISTS idx_scheduler_queue_due ON scheduler_queue(status, due_at)")
+    connection.execute("CREATE INDEX IF NOT EXISTS idx_scheduler_queue_job ON scheduler_queue(job, status)")
+    connection.execute(
+        """
+        CREATE TABLE IF NOT EXISTS scheduler_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            queue_id INTEGER NOT NULL,
+            job TEXT NOT NULL,
+            source TEXT NOT NULL DEFAULT '',
+            holder TEXT NOT NULL DEFAULT '',
+            enqueued_at TEXT NOT NULL,
+            due_at TEXT NOT NULL,
+            started_at TEXT NOT NULL,
+            finished_at TEXT NOT NULL,
+            duration_ms INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL,
+            result TEXT DEFAULT '',
+            error TEXT DEFAULT ''
+        )
+        """
+    )
+    connection.execute("CREATE INDEX IF NOT EXISTS idx_scheduler_history_job ON scheduler_history(job, finished_at)")
+    connection.execute("CREATE INDEX IF NOT EXISTS idx_scheduler_history_finished ON scheduler_history(finished_at)")
+
+
+def connect(db_path: str | Path) -> sqlite3.Connection:
+    return sqlite_store.connect(db_path, _create_tables)
+
+
+def _connection(db_path: str | Path):
+    return sqlite_store.connection(db_path, _create_tables)
+
+
+# --- Bail du processus meneur ---------------------------------------------------
+
+def acquire_lease(db_path: str | Path, holder: str, ttl_seconds: int = DEFAULT_LEASE_SECONDS, now: datetime | None = None) -> bool:
+    """Prend ou prolonge le bail ; échoue tant qu'un autre processus le détient sans l'avoir laissé expirer."""
+    now = now or _now()
+    with _connection(db_path) as connection, sqlite_store.transaction(connection):
+        row = connection.execute("SELECT holder, expires_at FROM scheduler_lease WHERE name=?", (LEASE_NAME,)).fetchone()
+        if row and row["holder"] != holder and row["expires_at"] > _iso(now):
+            return False
+        acquired_at = _iso(now) if not row or row["holder"] != holder else None
+        connection.execute(
+            """INSERT INTO scheduler_lease (name, holder, acquired_at, expires_at) VALUES (?, ?, ?, ?)
+               ON CONFLICT(name) DO UPDATE SET holder=excluded.holder, expires_at=excluded.expires_at,
+               acquired_at=COALESCE(?, scheduler_lease.acquired_at)""",
+            (LEASE_NAME, holder, _iso(now), _iso(now + timedelta(seconds=ttl_seconds)), acquired_at),
+        )
+        return True
+
+
+def release_lease(db_path: str | Path, holder: str) -> None:
+    with _connection(db_path) as connection:
+        connection.execute("DELETE FROM scheduler_lease WHERE name=? AND holder=?", (LEASE_NAME, holder))
+
+
+def lease(db_path: str | Path) -> dict[str, Any] | None:
+    with _connection(db_path) as connection:
+        row = connection.execute("SELECT holder, acquired_at, expires_at FROM scheduler_lease WHERE name=?", (LEASE_NAME,)).fetchone()
+    return dict(row) if row else None
+
+
+# --- File des tâches -------------------------------------------------------------
+
+def enqueue(db_path: str | Path, job: str, due_at: datetime | None = None, payload: dict[str, Any] | None = None, source: str = "") -> tuple[int, bool]:
+    """Ajoute une exécution de `job`. Renvoie `(id, created)`.
+
+    Une exécution déjà en attente pour la même tâche n'est pas dupliquée : son
+    échéance est avancée si besoin et `created` vaut faux.
+    """
+    now = _now()
+    due = _iso(due_at or now)
+    with _connection(db_path) as connection, sqlite_store.transaction(connection):
+        row = connection.execute("SELECT id, due_at FROM scheduler_queue WHERE job=? AND status=? ORDER BY id LIMIT 1", (job, STATUS_PENDING)).fetchone()
+        if row:
+            if due < row["due_at"]:
+                connection.execute("UPDATE scheduler_queue SET due_at=?, payload=?, source=? WHERE id=?", (due, json.dumps(payload or {}, ensure_ascii=False), source, row["id"]))
+            return int(row["id"]), False
+        cursor = connection.execute(
+            "INSERT INTO scheduler_queue (job, due_at, payload, source, enqueued_at, status) VALUES (?, ?, ?, ?, ?, ?)",
+            (job, due, json.dumps(payload or {}, ensure_ascii=False), source, _iso(now), STATUS_PENDING),
+        )
+        return int(cursor.lastrowid), True
+
+
+def has_entry(db_path: str | Path, job: str) -> bool:
+    with _connection(db_path) as connection:
+        return connection.execute("SELECT 1 FROM scheduler_queue WHERE job=? LIMIT 1", (job,)).fetchone() is not None
+
+
+def last_finished_at(db_path: str | Path, job: str) -> datetime | None:
+    with _connection(db_path) as connection:
+        row = connection.execute("SELECT MAX(finished_at) FROM scheduler_history WHERE job=?", (job,)).fetchone()
+    return datetime.fromisoformat(row[0]) if row and row[0] else None
+
+
+def claim_due(db_path: str | Path, holder: str, limit: int, now: datetime | None = None, stale_seconds: int = DEFAULT_LEASE_SECONDS) -> list[dict[str, Any]]:
+    """Réserve au plus `limit` exécutions échues, par échéance croissante, une seule par tâche.
+
+    Rien n'est réservé si `holder` ne détient pas un bail encore valide, vérifié
+    dans la même transaction. Une exécution restée « en cours » au nom d'un
+    autre processus n'est reprise que si ce processus ne l'a plus signalée
+    (`heartbeat`) depuis `stale_seconds` : une tâche longue encore active n'est
+    jamais relancée en double.
+    """
+    if limit <= 0:
+        return []
+    now = now or _now()
+    stale_before = _iso(now - timedelta(seconds=stale_seconds))
+    with _connection(db_path) as connection, sqlite_store.transaction(connection):
+        if not connection.execute("SELECT 1 FROM scheduler_lease WHERE name=? AND holder=? AND expires_at>?", (LEASE_NAME, holder, _iso(now))).fetchone():
+            return []
+        rows = connection.execute(
+            """SELECT * FROM scheduler_queue
+               WHERE ((status=? AND due_at<=?) OR (status=? AND claimed_by!=? AND heartbeat_at<=?))
+                 AND job NOT IN (SELECT job FROM scheduler_queue WHERE status=? AND (claimed_by=? OR heartbeat_at>?))
+               ORDER BY due_at, id""",
+            (STATUS_PENDING, _iso(now), STATUS_RUNNING, holder, stale_before, STATUS_RUNNING, holder, stale_before),
+        ).fetchall()
+        claimed, jobs = [], set()
+        for row in rows:
+            if row["job"] in jobs:
+                continue
+            jobs.add(row["job"])
+            claimed.append(row)
+            if len(claimed) >= limit:
+                break
+        for row in claimed:
+            connection.execute(
+                "UPDATE scheduler_queue SET status=?, claimed_by=?, claimed_at=?, heartbeat_at=? WHERE id=? AND status=? AND claimed_by IS ?",
+                (STATUS_RUNNING, holder, _iso(now), _iso(now), row["id"], row["status"], row["claimed_by"]),
+            )
+    entries = []
+    for row in claimed:
+        entry = dict(row)
+        entry["payload"] = json.loads(entry["payload"] or "{}")
+        entries.append(entry)
+    return entries
+
+
+def heartbeat(db_path: str | Path, holder: str, entry_ids: list[int], now: datetime | None = None) -> None:
+    """Signale que les exécutions `entry_ids` de `holder` tournent encore."""
+    if not entry_ids:
+        return
+    placeholders = ",".join("?" * len(entry_ids))
+    with _connection(db_path) as connection:
+        connection.execute(
+            f"UPDATE scheduler_queue SET heartbeat_at=? WHERE claimed_by=? AND status=? AND id IN ({placeholders})",
+            (_iso(now or _now()), holder, STATUS_RUNNING, *entry_ids),
+        )
+
+
+def next_due_at(db_path: str | Path) -> datetime | None:
+    with _connection(db_path) as connection:
+        row = connection.execute("SELECT MIN(due_at) FROM scheduler_queue WHERE status=?", (STATUS_PENDING,)).fetchone()
+    return datetime.fromisoformat(row[0]) if row and row[0] else None
+
+
+def finish(db_path: str | Path, entry: dict[str, Any], holder: str, started_at: datetime, result: Any = None, error: str = "") -> None:
+    """Retire l'exécution de la file et la consigne dans l'historique."""
+    finished = _now()
+    with _connection(db_path) as connection, sqlite_store.transaction(connection):
+        connection.execute("DELETE FROM scheduler_queue WHERE id=? AND claimed_by=?", (entry["id"], holder))
+        connection.execute(
+            """INSERT INTO scheduler_history
+               (queue_id, job, source, holder, enqueued_at, due_at, started_at, finished_at, duration_ms, status, result, error)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (
+                entry["id"], entry["job"], entry.get("source") or "", holder, entry["enqueued_at"], entry["due_at"],
+                _iso(started_at), _iso(finished), max(int((finished - started_at).total_seconds() * 1000), 0),
+                STATUS_FAILED if error else STATUS_DONE,
+                json.dumps(result, ensure_ascii=False, default=str) if result is not None else "", (error or "")[:2000],
+            ),
+        )
+        connection.execute("DELETE FROM scheduler_history WHERE finished_at<?", (_iso(finished - timedelta(days=HISTORY_RETENTION_DAYS)),))
+
+
+def list_queue(db_path: str | Path) -> list[dict[str, Any]]:
+    with _connection(db_path) as connection:
+        rows = connection.execute("SELECT id, job, due_at, source, enqueued_at, status, claimed_by, claimed_at, heartbeat_at FROM scheduler_queue ORDER BY due_at, id").fetchall()
+    return [dict(row) for row in rows]
+
+
+def list_history(db_path: str | Path, job: str = "", limit: int = 50) -> list[dict[str, Any]]:
+    query = "SELECT * FROM scheduler_history"
+    params: list[Any] = []
+    if job:
+        query += " WHERE job=?"
+        params.append(job)
+    query += " ORDER BY id DESC LIMIT ?"
+    params.append(int(limit))
+    with _connection(db_path) as connection:
+        return [dict(row) for row in connection.execute(query, params).fetchall()]
+
+
+# --- Récurrences ---------------------------------------------------------------------
+
+@dataclass(frozen=True)
+class Every:
+    """Toutes les `seconds` secondes ; la première exécution a lieu tout de suite."""
+
+    seconds: int
+
+    def next_due(self, now: datetime, last_run: datetime | None) -> datetime:
+        return now if last_run is None else max(now, last_run + timedelta(seconds=self.seconds))
+
+
+@dataclass(frozen=True)
+class DailyAt:
+    """Chaque jour à `hour:minute`. Un créneau manqué (aucun processus actif) est rattrapé dès
+    que possible, sauf au tout premier démarrage."""
+
+    hour: int
+    minute: int = 0
+
+    def next_due(self, now: datetime, last_run: datetime | None) -> datetime:
+        slot = now.replace(hour=self.hour, minute=self.minute, second=0, microsecond=0)
+        if slot > now:
+            previous = slot - timedelta(days=1)
+            return now if last_run is not None and last_run < previous else slot
+        if last_run is not None and last_run < slot:
+            return now
+        return slot + timedelta(days=1)
+
+
+def parse_recurrence(value: str) -> Every | DailyAt:
+    """`HH:MM` pour une heure quotidienne, `30m` / `2h` / `90s` pour un intervalle."""
+    value = (value or "").strip().lower()
+    if ":" in value:
+        hour, minute = value.split(":", 1)
+        return DailyAt(int(hour) % 24, int(minute) % 60)
+    units = {"s": 1, "m": 60, "h": 3600}
+    if value and value[-1] in units:
+        return Every(max(int(value[:-1]) * units[value[-1]], 1))
+    return Every(max(int(value), 1))
+
+
+# --- Boucle du planificateur ----------------------------------------------------------
+
+class Scheduler:
+    """Boucle qui, tant qu'elle détient le bail, planifie les tâches récurrentes et exécute
+    les tâches échues dans un pool de `max_workers` threads."""
+
+    def __init__(
+        self,
+        db_path: str | Path,
+        jobs: dict[str, Callable[[dict[str, Any]], Any]],
+        recurrences: dict[str, Every | DailyAt] | None = None,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        lease_seconds: int = DEFAULT_LEASE_SECONDS,
+        poll_seconds: int = DEFAULT_POLL_SECONDS,
+    ):
+        self.db_path = db_path
+        self.jobs = jobs
+        self.recurrences = {job: recurrence for job, recurrence in (recurrences or {}).items() if job in jobs}
+        self.max_workers = max(int(max_workers), 1)
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self._executor: ThreadPoolExecutor | None = None
+        self._heartbeat: threading.Thread | None = None
+        self._running: set[int] = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+
+    def enqueue(self, job: str, payload: dict[str, Any] | None = None, source: str = "", due_at: datetime | None = None) -> tuple[int, bool]:
+        if job not in self.jobs:
+            raise KeyError(f"Tâche inconnue : {job}")
+        entry = enqueue(self.db_path, job, due_at=due_at, payload=payload, source=source)
+        self._wakeup.set()
+        return entry
+
+    def schedule_recurring(self, now: datetime | None = None) -> None:
+        now = now or _now()
+        for job, recurrence in self.recurrences.items():
+            if not has_entry(self.db_path, job):
+                enqueue(self.db_path, job, due_at=recurrence.next_due(now, last_finished_at(self.db_path, job)), source="schedule")
+
+    def run_once(self, now: datetime | None = None) -> list[dict[str, Any]]:
+        """Renouvelle le bail puis lance les tâches échues. Renvoie les exécutions démarrées."""
+        self.is_leader = acquire_lease(self.db_path, self.holder, self.lease_seconds, now)
+        if not self.is_leader:
+            return []
+        self.schedule_recurring(now)
+        with self._lock:
+            free = self.max_workers - len(self._running)
+        entries = claim_due(self.db_path, self.holder, free, now, self.lease_seconds)
+        if entries and self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="scheduler-job")
+            self._heartbeat = threading.Thread(target=self._heartbeat_loop, name="scheduler-heartbeat", daemon=True)
+            self._heartbeat.start()
+        for entry in entries:
+            with self._lock:
+                self._running.add(entry["id"])
+            self._executor.submit(self._execute, entry)
+        return entries
+
+    def _heartbeat_loop(self) -> None:
+        # Indépendant de la boucle principale : le bail et les exécutions en cours sont
+        # prolongés même si la boucle est lente ou bloquée sur la base.
+        while not self._stop.wait(max(self.lease_seconds / 3, 1)):
+            with self._lock:
+                running = sorted(self._running)
+            if not running:
+                continue
+            try:
+                if not acquire_lease(self.db_path, self.holder, self.lease_seconds):
+                    logger.warning("Planificateur : bail perdu pendant l'exécution de %s tâche(s)", len(running))
+                heartbeat(self.db_path, self.holder, running)
+            except Exception:
+                logger.exception("Planificateur : impossible de prolonger les tâches en cours")
+
+    def _execute(self, entry: dict[str, Any]) -> None:
+        started = _now()
+        result, error = None, ""
+        try:
+            result = self.jobs[entry["job"]](entry["payload"])
+        except Exception as exc:
+            logger.exception("Planificateur : tâche %s (#%s) en échec", entry["job"], entry["id"])
+            error = f"{type(exc).__name__}: {exc}"
+        try:
+            finish(self.db_path, entry, self.holder, started, result, error)
+        except Exception:
+            logger.exception("Planificateur : impossible d'enregistrer la fin de la tâche #%s", entry["id"])
+        finally:
+            with self._lock:
+                self._running.discard(entry["id"])
+            self._wakeup.set()
+
+    def wait_idle(self, timeout: float = 30) -> bool:
+        """Attend la fin des exécutions en cours (utile aux tests et à l'arrêt)."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                if not self._running:
+                    return True
+            time.sleep(0.02)
+        return False
+
+    def _sleep_seconds(self) -> float:
+        if not self.is_leader:
+            return self.poll_seconds
+        due = next_due_at(self.db_path)
+        if due is None:
+            return self.poll_seconds
+        return min(max((due - _now()).total_seconds(), 1), self.poll_seconds)
+
+    def loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+                delay = self._sleep_seconds()
+            except Exception:
+                logger.exception("Planificateur : erreur de la boucle")
+                delay = self.poll_seconds
+            self._wakeup.wait(delay)
+            self._wakeup.clear()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wakeup.set()
+        if self.is_leader:
+            release_lease(self.db_path, self.holder)
@@ -0,0 +1,576 @@
+"""Service unique d'envoi des emails sortants.
+
+Regroupe les trois briques utilisées par l'application :
+
+- un pool de connexions SMTP authentifiées : STARTTLS et login ne sont faits
+  qu'à l'ouverture, une connexion inactive est vérifiée par `NOOP` avant d'être
+  réutilisée et rouverte si le serveur l'a fermée ;
+- l'API transactionnelle Brevo, où les messages d'un même lot partent dans un
+  seul appel grâce à `messageVersions` ;
+- une boîte d'envoi SQLite où sont replanifiés, avec un délai exponentiel, les
+  messages dont l'envoi a échoué pour une raison transitoire.
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+import mimetypes
+import os
+import smtplib
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.request
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from pathlib import Path
+from typing import Any, Callable
+
+from services import sqlite_store
+
+BREVO_EMAIL_API_URL = "https://api.brevo.com/v3/smtp/email"
+BREVO_BATCH_SIZE = 500
+TRANSPORT_SMTP = "smtp"
+TRANSPORT_BREVO = "brevo"
+TRANSPORT_MAILBOX = "mailbox"
+OUTBOX_DB_NAME = "mail_outbox.db"
+STATUS_PENDING = "pending"
+STATUS_SENDING = "sending"
+STATUS_SENT = "sent"
+STATUS_FAILED = "failed"
+DEFAULT_MAX_ATTEMPTS = 8
+BACKOFF_BASE_SECONDS = 60
+BACKOFF_MAX_SECONDS = 6 * 3600
+SENDING_STALE_MINUTES = 15
+
+
+# ---------------------------------------------------------------------------
+# Messages et paramètres de transport
+# ---------------------------------------------------------------------------
+
+
+@dataclass
+class OutboundEmail:
+    to: list[str]
+    subject: str
+    body: str
+    subtype: str = "html"
+    cc: list[str] = field(default_factory=list)
+    attachments: list[tuple[str, str]] = field(default_factory=list)
+    category: str = ""
+    # Transport demandé par l'appelant : `brevo` passe par l'API Brevo quand elle est
+    # configurée (sinon SMTP), `smtp` par le SMTP configuré (relais Brevo compris),
+    # `mailbox` par le SMTP de la boîte de l'expéditeur, avec son adresse.
+    transport: str = TRANSPORT_SMTP
+
+    @property
+    def recipients(self) -> list[str]:
+        return [*self.to, *self.cc]
+
+    def to_dict(self) -> dict[str, Any]:
+        data = asdict(self)
+        data["attachments"] = [list(item) for item in self.attachments]
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "OutboundEmail":
+        return cls(
+            to=list(data.get("to") or []),
+            subject=data.get("subject") or "",
+            body=data.get("body") or "",
+            subtype=data.get("subtype") or "html",
+            cc=list(data.get("cc") or []),
+            attachments=[(path, filename) for path, filename in data.get("attachments") or []],
+            category=data.get("category") or "",
+            transport=data.get("transport") or TRANSPORT_SMTP,
+        )
+
+    def as_mime(self, from_email: str):
+        text = MIMEText(self.body, self.subtype, "utf-8")
+        if self.attachments:
+            msg = MIMEMultipart()
+            msg.attach(text)
+            for path, filename in self.attachments:
+                maintype, _, subtype = (mimetypes.guess_type(filename)[0] or "application/octet-stream").partition("/")
+                with open(path, "rb") as handle:
+                    part = MIMEApplication(handle.read(), _subtype=subtype if maintype == "application" else "octet-stream")
+                part.add_header("Content-Disposition", "attachment", filename=filename)
+                msg.attach(part)
+        else:
+            msg = text
+        msg["From"] = from_email
+        msg["To"] = ", ".join(self.to)
+        if self.cc:
+            msg["Cc"] = ", ".join(self.cc)
+        msg["Subject"] = self.subject
+        return msg
+
+
+@dataclass
+class SmtpSettings:
+    server: str
+    port: int
+    login: str
+    password: str
+    from_email: str
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.server and self.login and self.password)
+
+    @property
+    def key(self) -> tuple[str, int, str]:
+        return (self.server, int(self.port), self.login)
+
+
+@dataclass
+class BrevoSettings:
+    api_key: str
+    sender_email: str
+    sender_name: str = ""
+    api_url: str = BREVO_EMAIL_API_URL
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.api_key and self.sender_email)
+
+
+@dataclass
+class DeliveryResult:
+    ok: bool
+    error: str = ""
+    transport: str = ""
+    message_id: str = ""
+    retryable: bool = True
+    queued: bool = False
+    outbox_id: int | None = None
+
+
+# ---------------------------------------------------------------------------
+# Pool SMTP
+# ---------------------------------------------------------------------------
+
+
+class SmtpConnectionPool:
+    """Connexions SMTP authentifiées réutilisables, par (serveur, port, login) et par processus."""
+
+    def __init__(
+        self,
+        max_idle: int = 2,
+        idle_timeout: float = 240,
+        check_after: float = 30,
+        timeout: float = 20,
+        smtp_factory: Callable[..., smtplib.SMTP] = smtplib.SMTP,
+    ):
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.check_after = check_after
+        self.timeout = timeout
+        self.smtp_factory = smtp_factory
+        self._idle: dict[tuple[str, int, str], list[tuple[smtplib.SMTP, float]]] = {}
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self.opened = 0
+
+    def _open(self, settings: SmtpSettings) -> smtplib.SMTP:
+        connection = self.smtp_factory(settings.server, int(settings.port), timeout=self.timeout)
+        try:
+            connection.starttls()
+            connection.login(settings.login, settings.password)
+        except Exception:
+            self.discard(connection)
+            raise
+        self.opened += 1
+        return connection
+
+    @staticmethod
+    def _alive(connection: smtplib.SMTP) -> bool:
+        try:
+            return connection.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def acquire(self, settings: SmtpSettings, fresh: bool = False) -> tuple[smtplib.SMTP, bool]:
+        """Renvoie `(connexion, réutilisée)`. `fresh=True` force une nouvelle connexion."""
+        while not fresh:
+            with self._lock:
+                if self._pid != os.getpid():
+                    # Connexions héritées d'un fork : elles appartiennent au processus parent.
+                    self._idle = {}
+                    self._pid = os.getpid()
+                idle = self._idle.get(settings.key) or []
+                if not idle:
+                    break
+                connection, last_used = idle.pop()
+            age = time.monotonic() - last_used
+            if age > self.idle_timeout:
+                self.discard(connection)
+                continue
+            if age > self.check_after and not self._alive(connection):
+                self.discard(connection)
+                continue
+            return connection, True
+        return self._open(settings), False
+
+    def release(self, settings: SmtpSettings, connection: smtplib.SMTP) -> None:
+        with self._lock:
+            idle = self._idle.setdefault(settings.key, [])
+            if self._pid == os.getpid() and len(idle) < self.max_idle:
+                idle.append((connection, time.monotonic()))
+                return
+        self.discard(connection)
+
+    @staticmethod
+    def discard(connection: smtplib.SMTP) -> None:
+        try:
+            connection.quit()
+        except Exception:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def clear(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection, _ in connections:
+                self.discard(connection)
+
+
+def send_smtp(settings: SmtpSettings, messages: list[OutboundEmail], pool: SmtpConnectionPool) -> list[DeliveryResult]:
+    """Envoie les messages sur une même connexion du pool ; une connexion coupée est rouverte une fois."""
+    results: list[DeliveryResult] = []
+    connection = None
+    try:
+        for message in messages:
+            try:
+                raw = message.as_mime(settings.from_email).as_string()
+            except OSError as exc:
+                results.append(DeliveryResult(False, f"Pièce jointe illisible: {exc}", "smtp", retryable=False))
+                continue
+            for attempt in range(2):
+                try:
+                    if connection is None:
+                        connection, _ = pool.acquire(settings, fresh=attempt > 0)
+                    connection.sendmail(settings.from_email, message.recipients, raw)
+                except smtplib.SMTPAuthenticationError as exc:
+                    results.append(DeliveryResult(False, str(exc), "smtp", retryable=False))
+                except smtplib.SMTPRecipientsRefused as exc:
+                    results.append(DeliveryResult(False, f"Destinataire refusé: {', '.join(exc.recipients)}", "smtp", retryable=False))
+                except (smtplib.SMTPServerDisconnected, OSError) as exc:
+                    if connection is not None:
+                        pool.discard(connection)
+                        connection = None
+                    if attempt == 0:
+                        continue
+                    results.append(DeliveryResult(False, str(exc) or exc.__class__.__name__, "smtp"))
+                except smtplib.SMTPException as exc:
+                    results.append(DeliveryResult(False, str(exc), "smtp"))
+                else:
+                    results.append(DeliveryResult(True, transport="smtp"))
+                break
+    finally:
+        if connection is not None:
+            pool.release(settings, connection)
+    return results
+
+
+# ---------------------------------------------------------------------------
+# API Brevo
+# ---------------------------------------------------------------------------
+
+
+def _brevo_content(message: OutboundEmail) -> dict[str, str]:
+    key = "htmlContent" if message.subtype == "html" else "textContent"
+    return {key: message.body}
+
+
+def _brevo_addresses(addresses: list[str]) -> list[dict[str, str]]:
+    return [{"email": address} for address in addresses]
+
+
+def _brevo_post(settings: BrevoSettings, payload: dict[str, Any], timeout: float, urlopen: Callable) -> tuple[int, dict[str, Any] | str]:
+    request_obj = urllib.request.Request(settings.api_url, data=json.dumps(payload).encode("utf-8"), method="POST")
+    request_obj.add_header("Content-Type", "application/json")
+    request_obj.add_header("Accept", "application/json")
+    request_obj.add_header("api-key", settings.api_key)
+    try:
+        with urlopen(request_obj, timeout=timeout) as response:
+            status, body = response.status, response.read().decode("utf-8", "replace")
+    except urllib.error.HTTPError as exc:
+        status, body = exc.code, exc.read().decode("utf-8", "replace")
+    try:
+        return status, json.loads(body) if body else {}
+    except ValueError:
+        return status, body
+
+
+def _brevo_failure(status: int, body: Any) -> DeliveryResult:
+    detail = body if isinstance(body, str) else json.dumps(body, ensure_ascii=False)
+    # 4xx (hors 429) : requête refusée telle quelle, inutile de la rejouer.
+    retryable = status == 429 or status >= 500
+    return DeliveryResult(False, f"{status} {detail}".strip(), "brevo", retryable=retryable)
+
+
+def send_brevo(
+    settings: BrevoSettings,
+    messages: list[OutboundEmail],
+    timeout: float = 15,
+    batch_size: int = BREVO_BATCH_SIZE,
+    urlopen: Callable = urllib.request.urlopen,
+) -> list[DeliveryResult]:
+    """Envoie via l'API Brevo ; les messages sans pièce jointe sont regroupés par `messageVersions`."""
+    sender = {"email": settings.sender_email}
+    if settings.sender_name:
+        sender["name"] = settings.sender_name
+    results: list[DeliveryResult | None] = [None] * len(messages)
+    # Un lot ne mélange pas HTML et texte : chaque version porte son sujet et son contenu
+    # sous la même clé que le contenu de base, qu'elle remplace donc toujours.
+    batchable: dict[str, list[int]] = {}
+    singles = []
+    for index, message in enumerate(messages):
+        if message.attachments:
+            singles.append(index)
+        else:
+            batchable.setdefault(message.subtype, []).append(index)
+
+    chunks = [indexes[start:start + batch_size] for indexes in batchable.values() for start in range(0, len(indexes), batch_size)]
+    for chunk in chunks:
+        if len(chunk) == 1:
+            singles.append(chunk[0])
+            continue
+        first = messages[chunk[0]]
+        versions = []
+        for index in chunk:
+            message = messages[index]
+            version = {"to": _brevo_addresses(message.to), "subject": message.subject, **_brevo_content(message)}
+            if message.cc:
+                version["cc"] = _brevo_addresses(message.cc)
+            versions.append(version)
+        payload = {"sender": sender, "subject": first.subject, **_brevo_content(first), "messageVersions": versions}
+        try:
+            status, body = _brevo_post(settings, payload, timeout, urlopen)
+        except OSError as exc:
+            for index in chunk:
+                results[index] = DeliveryResult(False, str(exc), "brevo")
+            continue
+        if 200 <= status < 300:
+            ids = body.get("messageIds") if isinstance(body, dict) else None
+            for position, index in enumerate(chunk):
+                message_id = ids[position] if isinstance(ids, list) and position < len(ids) else ""
+                results[index] = DeliveryResult(True, transport="brevo", message_id=message_id)
+        else:
+            for index in chunk:
+                results[index] = _brevo_failure(status, body)
+
+    for index in sorted(singles):
+        message = messages[index]
+        payload = {"sender": sender, "to": _brevo_addresses(message.to), "subject": message.subject, **_brevo_content(message)}
+        if message.cc:
+            payload["cc"] = _brevo_addresses(message.cc)
+        try:
+            if message.attachments:
+                attachments = []
+                for path, filename in message.attachments:
+                    with open(path, "rb") as handle:
+                        attachments.append({"name": filename, "content": base64.b64encode(handle.read()).decode("ascii")})
+                payload["attachment"] = attachments
+            status, body = _brevo_post(settings, payload, timeout, urlopen)
+        except OSError as exc:
+            results[index] = DeliveryResult(False, str(exc), "brevo", retryable=not isinstance(exc, FileNotFoundError))
+            continue
+        if 200 <= status < 300:
+            results[index] = DeliveryResult(True, transport="brevo", message_id=(body.get("messageId") or "") if isinstance(body, dict) else "")
+        else:
+            results[index] = _brevo_failure(status, body)
+    return [result for result in results if result is not None]
+
+
+def uses_brevo(transport: str, brevo: BrevoSettings, mail_transport: str = "") -> bool:
+    """Vrai si un message demandant `transport` part par l'API Brevo. `mail_transport` (`brevo` ou `smtp`) impose un transport à tous les messages."""
+    if not brevo.configured or mail_transport == TRANSPORT_SMTP:
+        return False
+    return mail_transport == TRANSPORT_BREVO or transport == TRANSPORT_BREVO
+
+
+def deliver(
+    messages: list[OutboundEmail],
+    smtp: SmtpSettings,
+    brevo: BrevoSettings,
+    pool: SmtpConnectionPool,
+    urlopen: Callable = urllib.request.urlopen,
+    mail_transport: str = "",
+    mailbox: SmtpSettings | None = None,
+) -> list[DeliveryResult]:
+    """Envoie un lot : les messages Brevo en appels groupés, les autres par le pool SMTP.
+
+    Les messages `mailbox` partent par `mailbox` (à défaut par `smtp`), avec
+    l'adresse d'expéditeur de ce compte.
+    """
+    if not messages:
+        return []
+    results: list[DeliveryResult | None] = [None] * len(messages)
+    by_brevo: list[int] = []
+    by_smtp: dict[tuple, tuple[SmtpSettings, list[int]]] = {}
+    for index, message in enumerate(messages):
+        if uses_brevo(message.transport, brevo, mail_transport):
+            by_brevo.append(index)
+            continue
+        settings = mailbox if message.transport == TRANSPORT_MAILBOX and mailbox is not None else smtp
+        by_smtp.setdefault((*settings.key, settings.from_email), (settings, []))[1].append(index)
+    if by_brevo:
+        for index, result in zip(by_brevo, send_brevo(brevo, [messages[index] for index in by_brevo], urlopen=urlopen)):
+            results[index] = result
+    for settings, indexes in by_smtp.values():
+        if settings.configured:
+            sent = send_smtp(settings, [messages[index] for index in indexes], pool)
+        else:
+            sent = [DeliveryResult(False, "EMAIL non configuré", retryable=False) for _ in indexes]
+        for index, result in zip(indexes, sent):
+            results[index] = result
+    return [result for result in results if result is not None]
+
+
+# ---------------------------------------------------------------------------
+# Boîte d'envoi
+# ---------------------------------------------------------------------------
+
+
+def _now() -> datetime:
+    return datetime.now().replace(microsecond=0)
+
+
+def _iso(value: datetime) -> str:
+    return value.isoformat(timespec="seconds")
+
+
+def backoff_seconds(attempts: int) -> int:
+    return min(BACKOFF_BASE_SECONDS * (2 ** max(attempts - 1, 0)), BACKOFF_MAX_SECONDS)
+
+
+def _create_tables(connection: sqlite3.Connection) -> None:
+    connection.execute(
+        """
+        CREATE TABLE IF NOT EXISTS mail_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            category TEXT NOT NULL DEFAULT '',
+            recipients TEXT NOT NULL DEFAULT '',
+            subject TEXT NOT NULL DEFAULT '',
+            message TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL,
+            next_attempt_at TEXT NOT NULL,
+            claimed_at TEXT DEFAULT '',
+            sent_at TEXT DEFAULT '',
+            transport TEXT DEFAULT '',
+            last_error TEXT DEFAULT ''
+        )
+        """
+    )
+    connection.execute("CREATE INDEX IF NOT EXISTS idx_mail_outbox_due ON mail_outbox(status, next_attempt_at)")
+
+
+def connect(db_path: str | Path) -> sqlite3.Connection:
+    return sqlite_store.connect(db_path, _create_tables)
+
+
+def _connection(db_path: str | Path):
+    return sqlite_store.connection(db_path, _create_tables)
+
+
+def enqueue(db_path: str | Path, message: OutboundEmail, attempts: int = 0, error: str = "") -> int:
+    """Met un message en boîte d'envoi. `attempts` compte les envois déjà tentés (délai en conséquence)."""
+    now = _now()
+    next_attempt = now + timedelta(seconds=backoff_seconds(attempts)) if attempts else now
+    with _connection(db_path) as connection:
+        cursor = connection.execute(
+            """INSERT INTO mail_outbox
+               (category, recipients, subject, message, status, attempts, created_at, next_attempt_at, last_error)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (
+                message.category,
+                ", ".join(message.recipients),
+                message.subject,
+                json.dumps(message.to_dict(), ensure_ascii=False),
+                STATUS_PENDING,
+                int(attempts),
+                _iso(now),
+                _iso(next_attempt),
+                (error or "")[:2000],
+            ),
+        )
+        return int(cursor.lastrowid)
+
+
+def claim_due(db_path: str | Path, limit: int = 50, now: datetime | None = None) -> list[dict[str, Any]]:
+    """Réserve les messages échus (et ceux restés bloqués en cours d'envoi) pour ce processus."""
+    now = now or _now()
+    stale_before = _iso(now - timedelta(minutes=SENDING_STALE_MINUTES))
+    with _connection(db_path) as connection, sqlite_store.transaction(connection):
+        rows = connection.execute(
+            """SELECT * FROM mail_outbox
+               WHERE (status=? AND next_attempt_at<=?) OR (status=? AND claimed_at<=?)
+               ORDER BY next_attempt_at, id LIMIT ?""",
+            (STATUS_PENDING, _iso(now), STATUS_SENDING, stale_before, int(limit)),
+        ).fetchall()
+        for row in rows:
+            connection.execute(
+                "UPDATE mail_outbox SET status=?, claimed_at=?, attempts=attempts+1 WHERE id=?",
+                (STATUS_SENDING, _iso(now), row["id"]),
+            )
+    entries = []
+    for row in rows:
+        entry = dict(row)
+        entry["attempts"] = int(entry["attempts"]) + 1
+        entry["message"] = OutboundEmail.from_dict(json.loads(entry["message"] or "{}"))
+        entries.append(entry)
+    return entries
+
+
+def mark_sent(db_path: str | Path, entry_id: int, transport: str = "") -> None:
+    with _connection(db_path) as connection:
+        connection.execute(
+            "UPDATE mail_outbox SET status=?, sent_at=?, transport=?, last_error='' WHERE id=?",
+            (STATUS_SENT, _iso(_now()), transport, entry_id),
+        )
+
+
+def mark_failed(db_path: str | Path, entry_id: int, attempts: int, error: str, max_attempts: int = DEFAULT_MAX_ATTEMPTS, retryable: bool = True) -> str:
+    """Replanifie le message avec un délai exponentiel, ou l'abandonne (échec définitif ou `max_attempts`)."""
+    now = _now()
+    status = STATUS_FAILED if not retryable or attempts >= max_attempts else STATUS_PENDING
+    with _connection(db_path) as connection:
+        connection.execute(
+            "UPDATE mail_outbox SET status=?, next_attempt_at=?, last_error=? WHERE id=?",
+            (status, _iso(now + timedelta(seconds=backoff_seconds(attempts))), (error or "")[:2000], entry_id),
+        )
+    return status
+
+
+def retry(db_path: str | Path, entry_id: int) -> bool:
+    """Remet un message en file pour un envoi immédiat, quel que soit son statut."""
+    with _connection(db_path) as connection:
+        cursor = connection.execute(
+            "UPDATE mail_outbox SET status=?, attempts=0, next_attempt_at=?, claimed_at='', last_error='' WHERE id=?",
+            (STATUS_PENDING, _iso(_now()), entry_id),
+        )
+        return bool(cursor.rowcount)
+
+
+def list_entries(db_path: str | Path, status: str = "", limit: int = 50) -> list[dict[str, Any]]:
+    query = "SELECT id, category, recipients, subject, status, attempts, created_at, next_attempt_at, sent_at, transport, last_error FROM mail_outbox"
+    params: list[Any] = []
+    if status:
+        query += " WHERE status=?"
+        params.append(status)
+    query += " ORDER BY id DESC LIMIT ?"
+    params.append(int(limit))
+    with _connection(db_path) as connection:
+        return [dict(row) for row in connection.execute(query, params).fetchall()]
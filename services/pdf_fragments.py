@@ -0,0 +1,184 @@
+"""Cache disque des pages de PDF, pour ne régénérer que les pages modifiées.
+
+Une feuille d'émargement compte une page par journée. Chaque page est
+enregistrée comme un petit PDF nommé par l'empreinte de tout ce qui la
+dessine (créneaux du jour, stagiaires du jour, en-tête, numéro de page,
+version du générateur). À la régénération, seules les pages dont
+l'empreinte a changé sont rendues — par plages contiguës, avec le
+`page_range` du générateur — puis toutes les pages sont assemblées avec
+pypdf. Une page qui ne sert plus n'est supprimée qu'après
+`FRAGMENT_GRACE_SECONDS` sans utilisation : un assemblage concurrent d'une
+autre version du document peut encore en avoir besoin.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import marshal
+import os
+import sysconfig
+import tempfile
+import threading
+import time
+import types
+from pathlib import Path
+from typing import Any, Callable, Iterable
+
+from services import pdf_parallel
+
+logger = logging.getLogger(__name__)
+
+_fingerprints: dict[object, str] = {}
+_LIBRARY_PATHS = tuple({sysconfig.get_paths()[name] for name in ("stdlib", "platstdlib", "purelib", "platlib")})
+# Identifiant du déploiement (commit) : couvre aussi les constantes de mise en page et les ressources.
+BUILD_ID = os.environ.get("BUILD_ID") or os.environ.get("RENDER_GIT_COMMIT") or ""
+FRAGMENT_GRACE_SECONDS = 3600
+_directory_locks: dict[str, threading.Lock] = {}
+_directory_locks_guard = threading.Lock()
+
+
+def _is_project_function(value: Any) -> bool:
+    if not isinstance(value, types.FunctionType):
+        return False
+    filename = value.__code__.co_filename
+    return not filename.startswith("<") and not filename.startswith(_LIBRARY_PATHS)
+
+
+def _code_objects(code: types.CodeType) -> Iterable[types.CodeType]:
+    yield code
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            yield from _code_objects(const)
+
+
+def _called_functions(func: types.FunctionType) -> Iterable[types.FunctionType]:
+    """Fonctions du projet que `func` peut appeler par un nom global ou `module.nom`."""
+    namespace = func.__globals__
+    for code in _code_objects(func.__code__):
+        modules = [value for value in (namespace.get(name) for name in code.co_names) if isinstance(value, types.ModuleType)]
+        for name in code.co_names:
+            candidates = [namespace.get(name)] + [getattr(module, name, None) for module in modules]
+            for value in candidates:
+                if _is_project_function(value):
+                    yield value
+
+
+def code_fingerprint(func: Callable[..., Any]) -> str:
+    """Empreinte du code de `func` et de toutes les fonctions du projet qu'elle appelle, directement ou non.
+
+    Un déploiement qui modifie une aide de dessin (`wrap_text_lines`…) invalide
+    donc le cache ; `BUILD_ID`/`RENDER_GIT_COMMIT`, si présent, y est ajouté.
+    """
+    code = func.__code__
+    if code not in _fingerprints:
+        digest = hashlib.blake2b(BUILD_ID.encode("utf-8"), digest_size=8)
+        seen, pending = {code}, [func]
+        while pending:
+            current = pending.pop()
+            digest.update(f"{current.__module__}.{current.__qualname__}".encode("utf-8"))
+            digest.update(marshal.dumps(current.__code__))
+            for called in _called_functions(current):
+                if called.__code__ not in seen:
+                    seen.add(called.__code__)
+                    pending.append(called)
+        _fingerprints[code] = digest.hexdigest()
+    return _fingerprints[code]
+
+
+def file_signature(path: str | None) -> list | None:
+    if not path:
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return [path, None, None]
+    return [path, stat.st_mtime_ns, stat.st_size]
+
+
+def page_key(*parts: Any) -> str:
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def missing_runs(missing: Iterable[int]) -> list[tuple[int, int]]:
+    """Regroupe des indices de pages (à partir de 0) en plages `page_range` contiguës."""
+    runs: list[list[int]] = []
+    for index in sorted(missing):
+        if runs and runs[-1][1] == index:
+            runs[-1][1] = index + 1
+        else:
+            runs.append([index, index + 1])
+    return [(start, stop) for start, stop in runs]
+
+
+def _store_pages(rendered: str, keys: list[str], fragment_dir: Path) -> None:
+    from pypdf import PdfReader, PdfWriter
+
+    reader = PdfReader(rendered)
+    if len(reader.pages) != len(keys):
+        raise ValueError(f"Rendu partiel incohérent : {len(reader.pages)} pages pour {len(keys)} attendues.")
+    for page, key in zip(reader.pages, keys):
+        writer = PdfWriter()
+        writer.add_page(page)
+        target = fragment_dir / f"{key}.pdf"
+        temp = fragment_dir / f"{key}.{os.getpid()}.{threading.get_ident()}.tmp"
+        writer.write(str(temp))
+        os.replace(temp, target)
+
+
+def _directory_lock(fragment_dir: Path) -> threading.Lock:
+    with _directory_locks_guard:
+        return _directory_locks.setdefault(str(fragment_dir.resolve()), threading.Lock())
+
+
+def _touch(path: Path) -> bool:
+    """Marque la page comme utilisée ; faux si elle n'existe pas (ou plus)."""
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def _evict_stale(fragment_dir: Path, keep: set[str], now: float | None = None) -> int:
+    """Supprime les pages hors de `keep` inutilisées depuis `FRAGMENT_GRACE_SECONDS`."""
+    limit = (now or time.time()) - FRAGMENT_GRACE_SECONDS
+    removed = 0
+    for entry in os.scandir(fragment_dir):
+        if not entry.name.endswith((".pdf", ".tmp")) or entry.name in keep:
+            continue
+        try:
+            if entry.stat().st_mtime < limit:
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def assemble(fragment_dir: str | Path, keys: list[str], output_path, render_range: Callable[[tuple[int, int], str], Any]) -> dict[str, int]:
+    """Assemble `output_path` à partir des pages en cache, en rendant les pages absentes.
+
+    `keys` donne l'empreinte de chaque page, dans l'ordre du document ;
+    `render_range((début, fin), chemin)` doit écrire les pages `début + 1` à
+    `fin` dans `chemin`. Dans un processus, les assemblages d'un même dossier
+    se suivent ; entre processus, chaque page utilisée est marquée (date de
+    modification) et les pages inutilisées ne sont supprimées qu'après le
+    délai de grâce.
+    """
+    fragment_dir = Path(fragment_dir)
+    fragment_dir.mkdir(parents=True, exist_ok=True)
+    with _directory_lock(fragment_dir):
+        missing = [index for index, key in enumerate(keys) if not _touch(fragment_dir / f"{key}.pdf")]
+        runs = missing_runs(missing)
+        with tempfile.TemporaryDirectory(prefix="pdf-fragments-") as tmp:
+            for start, stop in runs:
+                rendered = os.path.join(tmp, f"{start:04d}.pdf")
+                render_range((start, stop), rendered)
+                _store_pages(rendered, keys[start:stop], fragment_dir)
+        pdf_parallel.merge([str(fragment_dir / f"{key}.pdf") for key in keys], output_path)
+        _evict_stale(fragment_dir, {f"{key}.pdf" for key in keys})
+    logger.info("PDF assemblé depuis le cache pages=%s régénérées=%s plages=%s", len(keys), len(missing), runs)
+    return {"pages": len(keys), "rendered": len(missing), "reused": len(keys) - len(missing)}
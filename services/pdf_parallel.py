@@ -0,0 +1,173 @@
+"""Rendu parallèle des PDF longs par plages de pages.
+
+Un planning AFC APS + SSIAP ou ses feuilles de présence dépassent 50 pages,
+rendues une à une sur un seul canvas reportlab. Au-delà de
+`PDF_PARALLEL_MIN_PAGES`, le générateur découpe le document en plages de
+pages contiguës et les fait rendre par un pool de processus : chaque
+processus relance le même générateur limité à sa plage (`page_range`), donc
+avec la même pagination et la même numérotation « Page n / total ». Les
+morceaux sont ensuite assemblés avec pypdf.
+
+Le rendu parallèle est facultatif : `PDF_PARALLEL_WORKERS` vaut 1 par
+défaut (rendu séquentiel). Le pool n'utilise jamais `fork`, dangereux dans un
+worker gunicorn qui fait déjà tourner des threads : les processus partent
+d'un `forkserver` (ou de `spawn`) et réimportent le module du générateur.
+Un pool qui n'a pas tout rendu après `PDF_PARALLEL_TIMEOUT` secondes est
+arrêté et le document est rendu en séquentiel.
+
+`render_each` applique le même pool à une série de documents indépendants
+(contrats formateurs d'une session, par exemple).
+"""
+
+from __future__ import annotations
+
+import importlib.util
+import logging
+import multiprocessing
+import os
+import tempfile
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+
+def _available_cpus() -> int:
+    # Sur un conteneur, les CPU réellement attribués au processus.
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0)) or 1
+    return os.cpu_count() or 1
+
+
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get("PDF_PARALLEL_MIN_PAGES", "24"))
+# 1 (défaut) : rendu séquentiel ; 0 : autant de processus que de CPU, 4 au plus.
+PDF_PARALLEL_WORKERS = int(os.environ.get("PDF_PARALLEL_WORKERS", "1") or 1) or min(4, _available_cpus())
+PDF_PARALLEL_START_METHOD = os.environ.get("PDF_PARALLEL_START_METHOD", "forkserver")
+PDF_PARALLEL_TIMEOUT = float(os.environ.get("PDF_PARALLEL_TIMEOUT", "45"))
+
+
+def context():
+    """Contexte des pools de processus : `PDF_PARALLEL_START_METHOD` s'il existe, sinon `spawn`, jamais `fork`."""
+    method = PDF_PARALLEL_START_METHOD
+    if method == "fork" or method not in multiprocessing.get_all_start_methods():
+        method = "spawn"
+    return multiprocessing.get_context(method)
+
+
+def starmap(func: Callable[..., Any], calls: list[tuple], workers: int, timeout: float | None = None) -> list[Any] | None:
+    """`[func(*args) for args in calls]` dans un pool d'au plus `workers` processus.
+
+    Renvoie `None` si tout n'est pas rendu dans `timeout` secondes (processus
+    bloqué ou tué) : le pool est arrêté et l'appelant refait le travail en
+    séquentiel. Une exception levée par `func` est propagée.
+    """
+    timeout = PDF_PARALLEL_TIMEOUT if timeout is None else timeout
+    pool = context().Pool(processes=max(1, min(workers, len(calls))))
+    try:
+        return pool.starmap_async(func, calls, chunksize=1).get(timeout)
+    except multiprocessing.TimeoutError:
+        return None
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def available() -> bool:
+    return importlib.util.find_spec("pypdf") is not None
+
+
+def enabled(page_count: int, workers: int | None = None) -> bool:
+    """Vrai si un document de `page_count` pages doit être rendu en parallèle."""
+    workers = PDF_PARALLEL_WORKERS if workers is None else workers
+    return workers > 1 and page_count >= PDF_PARALLEL_MIN_PAGES and available()
+
+
+def split_pages(page_count: int, workers: int, splittable: int | None = None) -> list[tuple[int, int]]:
+    """Découpe les pages `[0, page_count)` en au plus `workers` plages `(début, fin)` contiguës.
+
+    Seules les `splittable` premières pages peuvent servir de frontière : les
+    suivantes (récapitulatif, calendrier) restent dans la dernière plage.
+    """
+    splittable = page_count if splittable is None else max(0, min(splittable, page_count))
+    chunks = max(1, min(workers, splittable))
+    bounds = [round(index * splittable / chunks) for index in range(chunks)] + [page_count]
+    return [(start, stop) for start, stop in zip(bounds, bounds[1:]) if stop > start]
+
+
+def in_range(page_range: tuple[int, int] | None, page_no: int) -> bool:
+    """Vrai si la page `page_no` (numérotée à partir de 1) est à dessiner."""
+    return page_range is None or page_range[0] < page_no <= page_range[1]
+
+
+def _render_chunk(generator: Callable[..., Any], kwargs: dict[str, Any], page_range: tuple[int, int], path: str) -> str:
+    generator(**kwargs, output_path=path, page_range=page_range)
+    return path
+
+
+def merge(paths: list[str], output_path) -> None:
+    """Assemble les PDF `paths` dans `output_path`.
+
+    reportlab nomme chaque image (`/FormXob.<empreinte>`) d'après son contenu :
+    une image déjà copiée depuis un morceau précédent est référencée au lieu
+    d'être recopiée, sinon le logo et le tampon seraient dupliqués par morceau.
+    """
+    from pypdf import PdfReader, PdfWriter
+    from pypdf.generic import NameObject
+
+    writer = PdfWriter()
+    shared = {}
+    for path in paths:
+        for page in PdfReader(path).pages:
+            resources = page.get("/Resources")
+            xobjects = resources.get_object().get("/XObject") if resources is not None else None
+            reused = {}
+            if xobjects is not None:
+                xobjects = xobjects.get_object()
+                for name in [name for name in xobjects if name in shared]:
+                    reused[name] = shared[name]
+                    del xobjects[name]
+            added = writer.add_page(page)
+            if xobjects is None:
+                continue
+            added_xobjects = added["/Resources"].get_object()["/XObject"].get_object()
+            for name in added_xobjects:
+                shared.setdefault(name, added_xobjects.raw_get(name))
+            for name, reference in reused.items():
+                added_xobjects[NameObject(name)] = reference
+    writer.write(output_path)
+
+
+def render(generator: Callable[..., Any], kwargs: dict[str, Any], output_path, page_count: int, splittable: int | None = None, workers: int | None = None, first_page: int = 0) -> None:
+    """Rend `generator(**kwargs, output_path=…, page_range=…)` par plages en parallèle puis assemble `output_path`.
+
+    `first_page` décale les plages pour ne rendre que les pages
+    `first_page + 1` à `first_page + page_count` du document.
+    """
+    workers = PDF_PARALLEL_WORKERS if workers is None else workers
+    ranges = [(start + first_page, stop + first_page) for start, stop in split_pages(page_count, workers, splittable)]
+    with tempfile.TemporaryDirectory(prefix="pdf-chunks-") as tmp:
+        paths = [os.path.join(tmp, f"{index:03d}.pdf") for index in range(len(ranges))]
+        if starmap(_render_chunk, [(generator, kwargs, page_range, path) for page_range, path in zip(ranges, paths)], len(ranges)) is None:
+            logger.warning("Rendu PDF parallèle trop long, reprise en séquentiel (%s pages)", page_count)
+            generator(**kwargs, output_path=output_path, page_range=(first_page, first_page + page_count))
+            return
+        merge(paths, output_path)
+    logger.info("PDF rendu en parallèle pages=%s plages=%s", page_count, ranges)
+
+
+def render_each(generator: Callable[..., Any], calls: list[tuple], workers: int | None = None) -> None:
+    """Appelle `generator(*args)` pour chaque `args` de `calls`, en parallèle si possible.
+
+    Les documents sont indépendants : pas d'assemblage. Une exception levée
+    par un rendu est propagée telle quelle.
+    """
+    workers = PDF_PARALLEL_WORKERS if workers is None else workers
+    if workers <= 1 or len(calls) < 2:
+        for args in calls:
+            generator(*args)
+        return
+    if starmap(generator, calls, workers) is None:
+        logger.warning("Rendu PDF parallèle trop long, reprise en séquentiel (%s documents)", len(calls))
+        for args in calls:
+            generator(*args)
+        return
+    logger.info("PDF rendus en parallèle documents=%s workers=%s", len(calls), min(workers, len(calls)))
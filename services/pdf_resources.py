@@ -0,0 +1,131 @@
+"""Cache des ressources des PDF reportlab (logo, signature, tampon).
+
+Chaque génération relisait et décodait les images du centre (logo PNG de
+2048 px, tampon, signature) puis reportlab les recompressait à pleine taille.
+Le cache garde, pour le processus, une image par fichier et par taille
+maximale, réduite à une résolution suffisante pour l'impression et déjà
+décodée ; elle est invalidée quand la date de modification ou la taille du
+fichier change. Les recherches de fichiers (`find_center_image`,
+`aps_pdf_logo_path`) sont mémorisées tant que les dossiers concernés ne
+changent pas.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from pathlib import Path
+from typing import Callable, Iterable
+
+from PIL import Image as PILImage
+from reportlab.lib.utils import ImageReader
+from reportlab.platypus import Image
+
+# Signature et tampon sont imprimés sur 9 cm au plus : 1024 px gardent plus de
+# 250 dpi. Le logo ne dépasse pas 4 cm de large.
+PDF_IMAGE_MAX_PX = 1024
+PDF_LOGO_MAX_PX = 512
+
+_images: dict[tuple[str, int], tuple[tuple[int, int], "PdfImage"]] = {}
+_lookups: dict[object, tuple[tuple, object]] = {}
+_lock = threading.Lock()
+
+
+def _signature(path: Path) -> tuple[int, int]:
+    stat = path.stat()
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _load_reader(path: Path, max_px: int) -> ImageReader:
+    with PILImage.open(path) as source:
+        image = source.copy()
+    if image.mode not in ("L", "LA", "RGB", "RGBA", "CMYK"):
+        image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+    if max_px and max(image.size) > max_px:
+        image.thumbnail((max_px, max_px), PILImage.LANCZOS)
+    reader = ImageReader(image)
+    # Décodage immédiat : les threads de génération ne font ensuite que lire.
+    reader.getRGBData()
+    if reader._dataA is not None:
+        reader._dataA.getRGBData()
+    return reader
+
+
+class PdfImage:
+    """Image décodée une fois, acceptée telle quelle par `canvas.drawImage`.
+
+    reportlab nomme un `ImageReader` par l'empreinte de tous ses pixels à
+    chaque dessin ; cet objet n'en hérite pas et se nomme par son chemin et sa
+    version, si bien qu'un logo répété sur chaque page n'est traité qu'une fois
+    par document. Les autres attributs sont ceux de l'`ImageReader` partagé.
+    """
+
+    def __init__(self, identity: str, reader: ImageReader):
+        self._identity = identity
+        self._reader = reader
+
+    def __str__(self) -> str:
+        return self._identity
+
+    def __getattr__(self, name):
+        return getattr(self._reader, name)
+
+
+def image(path: str | Path, max_px: int = PDF_IMAGE_MAX_PX) -> PdfImage:
+    """Image partagée du fichier `path`, réduite à `max_px` pixels de côté au plus."""
+    path = Path(path)
+    signature = _signature(path)
+    key = (str(path.resolve()), int(max_px or 0))
+    with _lock:
+        cached = _images.get(key)
+    if cached and cached[0] == signature:
+        return cached[1]
+    identity = "pdf-resource:%s:%d:%d:%d" % (key[0], signature[0], signature[1], key[1])
+    loaded = PdfImage(identity, _load_reader(path, max_px))
+    with _lock:
+        _images[key] = (signature, loaded)
+    return loaded
+
+
+def logo(path: str | Path) -> PdfImage:
+    return image(path, PDF_LOGO_MAX_PX)
+
+
+def image_flowable(path: str | Path, width=None, height=None, max_px: int = PDF_IMAGE_MAX_PX, **kwargs) -> Image:
+    """Flowable platypus `Image` alimenté par `image` (pas de relecture du fichier)."""
+    flowable = Image(str(path), width=width, height=height, **kwargs)
+    flowable._img = image(path, max_px)
+    return flowable
+
+
+def _directories_signature(directories: Iterable[str | Path]) -> tuple:
+    signature = []
+    for directory in directories:
+        try:
+            signature.append(os.stat(directory).st_mtime_ns)
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
+
+
+def locate(key, directories: Iterable[str | Path], finder: Callable[[], object]):
+    """Résultat de `finder()` mémorisé sous `key` tant que `directories` ne changent pas.
+
+    Ajouter, renommer ou supprimer un fichier modifie la date du dossier, ce
+    qui suffit à invalider la recherche sans reparcourir le dossier.
+    """
+    signature = _directories_signature(directories)
+    with _lock:
+        cached = _lookups.get(key)
+    if cached and cached[0] == signature:
+        return cached[1]
+    result = finder()
+    with _lock:
+        _lookups[key] = (signature, result)
+    return result
+
+
+def clear() -> None:
+    with _lock:
+        _images.clear()
+        _lookups.clear()
@@ -0,0 +1,369 @@
+"""Stockage SQLite des prospects du Price adaptator et suivi de leurs imports.
+
+Chaque prospect est une ligne de `price_adaptator_prospects` : l'enregistrement
+complet en JSON, plus les colonnes indexées qui servent aux recherches
+(clés de déduplication email / téléphone / nom + prénom + formation,
+formation, montant CPF, statut d'envoi, date de relance). Toute modification
+passe par une transaction et incrémente un numéro de révision global, que
+les routes renvoient avec le seul enregistrement modifié.
+
+Chaque import Excel est un job dont l'avancement et le résultat ligne à
+ligne sont enregistrés, pour être consultés page par page pendant et après
+le traitement.
+"""
+
+from __future__ import annotations
+
+import json
+import sqlite3
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Iterable
+
+from services import sqlite_store
+
+STORE_DB_NAME = "price_adaptator.db"
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+LINE_ADDED = "added"
+LINE_SKIPPED = "skipped"
+LINE_ERROR = "error"
+MAX_PER_PAGE = 500
+# Colonnes indexées d'un prospect, calculées par l'appelant à partir de l'enregistrement.
+INDEX_COLUMNS = ("email_key", "phone_key", "name_key", "formation", "cpf", "sort_name", "search", "sent", "followup_pending", "followup_due")
+DEDUP_COLUMNS = ("email_key", "phone_key", "name_key")
+
+Entry = tuple[dict[str, Any], dict[str, Any]]
+
+
+def _now() -> str:
+    return datetime.now().replace(microsecond=0).isoformat(timespec="seconds")
+
+
+def _create_tables(connection: sqlite3.Connection) -> None:
+    connection.execute(
+        """
+        CREATE TABLE IF NOT EXISTS price_adaptator_prospects (
+            id TEXT PRIMARY KEY,
+            email_key TEXT NOT NULL DEFAULT '',
+            phone_key TEXT NOT NULL DEFAULT '',
+            name_key TEXT NOT NULL DEFAULT '',
+            formation TEXT NOT NULL DEFAULT '',
+            cpf REAL NOT NULL DEFAULT 0,
+            sort_name TEXT NOT NULL DEFAULT '',
+            search TEXT NOT NULL DEFAULT '',
+            sent INTEGER NOT NULL DEFAULT 0,
+            followup_pending INTEGER NOT NULL DEFAULT 1,
+            followup_due TEXT,
+            revision INTEGER NOT NULL DEFAULT 0,
+            data TEXT NOT NULL
+        )
+        """
+    )
+    for column in DEDUP_COLUMNS:
+        connection.execute(f"CREATE INDEX IF NOT EXISTS idx_price_adaptator_prospects_{column} ON price_adaptator_prospects({column})")
+    connection.execute("CREATE INDEX IF NOT EXISTS idx_price_adaptator_prospects_list ON price_adaptator_prospects(formation, cpf DESC, sort_name)")
+    connection.execute("CREATE INDEX IF NOT EXISTS idx_price_adaptator_prospects_order ON price_adaptator_prospects(cpf DESC, sort_name)")
+    connection.execute("CREATE INDEX IF NOT EXISTS idx_price_adaptator_prospects_due ON price_adaptator_prospects(followup_due) WHERE followup_pending=1")
+    connection.execute("CREATE TABLE IF NOT EXISTS price_adaptator_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    # Index de déduplication séparé des premières versions, remplacé par les colonnes des prospects.
+    connection.execute("DROP TABLE IF EXISTS price_adaptator_dedup")
+    connection.execute(
+        """
+        CREATE TABLE IF NOT EXISTS price_adaptator_import_jobs (
+            id TEXT PRIMARY KEY,
+            filename TEXT NOT NULL DEFAULT '',
+            status TEXT NOT NULL DEFAULT 'pending',
+            total_rows INTEGER,
+            processed_rows INTEGER NOT NULL DEFAULT 0,
+            added INTEGER NOT NULL DEFAULT 0,
+            skipped INTEGER NOT NULL DEFAULT 0,
+            errors INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL,
+            started_at TEXT DEFAULT '',
+            finished_at TEXT DEFAULT '',
+            last_error TEXT DEFAULT ''
+        )
+        """
+    )
+    connection.execute(
+        """
+        CREATE TABLE IF NOT EXISTS price_adaptator_import_lines (
+            job_id TEXT NOT NULL,
+            line INTEGER NOT NULL,
+            outcome TEXT NOT NULL,
+            message TEXT NOT NULL DEFAULT '',
+            prospect_id TEXT DEFAULT '',
+            PRIMARY KEY (job_id, line)
+        )
+        """
+    )
+
+
+def connect(db_path: str | Path) -> sqlite3.Connection:
+    return sqlite_store.connect(db_path, _create_tables)
+
+
+def _connection(db_path: str | Path):
+    return sqlite_store.connection(db_path, _create_tables)
+
+
+# --- Révision et réglages ------------------------------------------------------
+
+def _meta(connection: sqlite3.Connection, key: str, default: str = "") -> str:
+    row = connection.execute("SELECT value FROM price_adaptator_meta WHERE key=?", (key,)).fetchone()
+    return row[0] if row else default
+
+
+def _set_meta(connection: sqlite3.Connection, key: str, value: str) -> None:
+    connection.execute(
+        "INSERT INTO price_adaptator_meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value=excluded.value",
+        (key, value),
+    )
+
+
+def _bump_revision(connection: sqlite3.Connection) -> int:
+    revision = int(_meta(connection, "revision", "0")) + 1
+    _set_meta(connection, "revision", str(revision))
+    return revision
+
+
+def current_revision(db_path: str | Path) -> int:
+    with _connection(db_path) as connection:
+        return int(_meta(connection, "revision", "0"))
+
+
+def get_dates(db_path: str | Path) -> dict[str, Any]:
+    with _connection(db_path) as connection:
+        return json.loads(_meta(connection, "dates", "{}"))
+
+
+def save_dates(db_path: str | Path, dates: dict[str, Any], followup_for: Callable[[str], str | None]) -> int:
+    """Enregistre les dates des formations et recalcule la relance des prospects encore en attente."""
+    with _connection(db_path) as connection, sqlite_store.transaction(connection):
+        _set_meta(connection, "dates", json.dumps(dates, ensure_ascii=False))
+        formations = [row[0] for row in connection.execute("SELECT DISTINCT formation FROM price_adaptator_prospects WHERE followup_pending=1")]
+        for formation in formations:
+            connection.execute(
+                "UPDATE price_adaptator_prospects SET followup_due=? WHERE formation=? AND followup_pending=1",
+                (followup_for(formation), formation),
+            )
+        return _bump_revision(connection)
+
+
+def migrate(db_path: str | Path, entries: Iterable[Entry], dates: dict[str, Any]) -> bool:
+    """Reprend une fois pour toutes les prospects et dates de l'ancien fichier JSON."""
+    with _connection(db_path) as connection, sqlite_store.transaction(connection):
+        if _meta(connection, "json_migrated"):
+            return False
+        revision = _bump_revision(connection)
+        _insert(connection, entries, revision)
+        _set_meta(connection, "dates", json.dumps(dates or {}, ensure_ascii=False))
+        _set_meta(connection, "json_migrated", _now())
+        return True
+
+
+def is_migrated(db_path: str | Path) -> bool:
+    with _connection(db_path) as connection:
+        return bool(_meta(connection, "json_migrated"))
+
+
+# --- Prospects -----------------------------------------------------------------
+
+def _insert(connection: sqlite3.Connection, entries: Iterable[Entry], revision: int) -> int:
+    rows = [
+        (prospect["id"], *(columns[name] for name in INDEX_COLUMNS), revision, json.dumps(prospect, ensure_ascii=False))
+        for prospect, columns in entries
+    ]
+    connection.executemany(
+        f"""INSERT OR REPLACE INTO price_adaptator_prospects (id, {", ".join(INDEX_COLUMNS)}, revision, data)
+            VALUES ({", ".join("?" * (len(INDEX_COLUMNS) + 3))})""",
+        rows,
+    )
+    return len(rows)
+
+
+def add_prospects(db_path: str | Path, entries: Iterable[Entry]) -> int:
+    """Ajoute (ou remplace) des prospects `(enregistrement, colonnes indexées)` ; renvoie la révision."""
+    with _connection(db_path) as connection, sqlite_store.transaction(connection):
+        revision = _bump_revision(connection)
+        _insert(connection, entries, revision)
+        return revision
+
+
+def update_prospect(db_path: str | Path, prospect: dict[str, Any], columns: dict[str, Any]) -> int | None:
+    """Remplace un prospect existant ; renvoie la révision, ou `None` s'il n'existe plus."""
+    with _connection(db_path) as connection, sqlite_store.transaction(connection):
+        if not connection.execute("SELECT 1 FROM price_adaptator_prospects WHERE id=?", (prospect["id"],)).fetchone():
+            return None
+        revision = _bump_revision(connection)
+        _insert(connection, [(prospect, columns)], revision)
+        return revision
+
+
+def delete_prospect(db_path: str | Path, prospect_id: str) -> int | None:
+    with _connection(db_path) as connection, sqlite_store.transaction(connection):
+        if not connection.execute("DELETE FROM price_adaptator_prospects WHERE id=?", (prospect_id,)).rowcount:
+            return None
+        return _bump_revision(connection)
+
+
+def clear_prospects(db_path: str | Path) -> int:
+    with _connection(db_path) as connection, sqlite_store.transaction(connection):
+        connection.execute("DELETE FROM price_adaptator_prospects")
+        return _bump_revision(connection)
+
+
+def get_prospect(db_path: str | Path, prospect_id: str) -> dict[str, Any] | None:
+    with _connection(db_path) as connection:
+        row = connection.execute("SELECT data FROM price_adaptator_prospects WHERE id=?", (prospect_id,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def find_duplicate(connection: sqlite3.Connection, columns: dict[str, Any]) -> str | None:
+    """Renvoie l'identifiant d'un prospect qui partage une clé de déduplication, sinon `None`."""
+    for column in DEDUP_COLUMNS:
+        key = columns.get(column)
+        if not key:
+            continue
+        row = connection.execute(f"SELECT id FROM price_adaptator_prospects WHERE {column}=? LIMIT 1", (key,)).fetchone()
+        if row:
+            return row[0]
+    return None
+
+
+def list_prospects(db_path: str | Path, formation: str = "", search: str = "", page: int = 1, per_page: int = 50) -> dict[str, Any]:
+    """Prospects par CPF décroissant puis nom, filtrés par formation et texte, page par page."""
+    page = max(int(page or 1), 1)
+    per_page = min(max(int(per_page or 50), 1), MAX_PER_PAGE)
+    where, params = [], []
+    if formation:
+        where.append("formation=?")
+        params.append(formation)
+    if search:
+        where.append("instr(search, ?) > 0")
+        params.append(search.strip().lower())
+    clause = f"WHERE {' AND '.join(where)}" if where else ""
+    with _connection(db_path) as connection:
+        total = connection.execute(f"SELECT COUNT(*) FROM price_adaptator_prospects {clause}", params).fetchone()[0]
+        rows = connection.execute(
+            f"SELECT data FROM price_adaptator_prospects {clause} ORDER BY cpf DESC, sort_name, id LIMIT ? OFFSET ?",
+            [*params, per_page, (page - 1) * per_page],
+        ).fetchall()
+        revision = int(_meta(connection, "revision", "0"))
+        count = total if not where else connection.execute("SELECT COUNT(*) FROM price_adaptator_prospects").fetchone()[0]
+    return {
+        "items": [json.loads(row[0]) for row in rows],
+        "page": page,
+        "perPage": per_page,
+        "total": int(total),
+        "count": int(count),
+        "revision": revision,
+    }
+
+
+def due_prospects(db_path: str | Path, today: str) -> list[dict[str, Any]]:
+    """Prospects sans envoi dont la date de relance (ISO) est atteinte."""
+    with _connection(db_path) as connection:
+        rows = connection.execute(
+            "SELECT data FROM price_adaptator_prospects WHERE followup_pending=1 AND followup_due IS NOT NULL AND followup_due<=? ORDER BY followup_due",
+            (today,),
+        ).fetchall()
+    return [json.loads(row[0]) for row in rows]
+
+
+# --- Jobs d'import -------------------------------------------------------------
+
+def create_job(db_path: str | Path, filename: str, total_rows: int | None = None, job_id: str | None = None) -> dict[str, Any]:
+    job_id = job_id or uuid.uuid4().hex
+    with _connection(db_path) as connection:
+        connection.execute(
+            "INSERT INTO price_adaptator_import_jobs (id, filename, status, total_rows, created_at) VALUES (?, ?, ?, ?, ?)",
+            (job_id, filename or "", JOB_PENDING, total_rows, _now()),
+        )
+        return _job(connection, job_id)
+
+
+def _job(connection: sqlite3.Connection, job_id: str) -> dict[str, Any] | None:
+    row = connection.execute("SELECT * FROM price_adaptator_import_jobs WHERE id=?", (job_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def get_job(db_path: str | Path, job_id: str) -> dict[str, Any] | None:
+    with _connection(db_path) as connection:
+        return _job(connection, job_id)
+
+
+def pending_jobs(db_path: str | Path) -> list[dict[str, Any]]:
+    """Jobs en attente, dans l'ordre d'envoi."""
+    with _connection(db_path) as connection:
+        rows = connection.execute("SELECT * FROM price_adaptator_import_jobs WHERE status=? ORDER BY created_at, rowid", (JOB_PENDING,)).fetchall()
+    return [dict(row) for row in rows]
+
+
+def fail_interrupted_jobs(db_path: str | Path, error: str) -> list[str]:
+    """Passe en échec les jobs restés « en cours » (processus arrêté pendant l'import). Renvoie leurs identifiants."""
+    with _connection(db_path) as connection, sqlite_store.transaction(connection):
+        job_ids = [row[0] for row in connection.execute("SELECT id FROM price_adaptator_import_jobs WHERE status=?", (JOB_RUNNING,))]
+        for job_id in job_ids:
+            finish_job(connection, job_id, error)
+    return job_ids
+
+
+def start_job(connection: sqlite3.Connection, job_id: str) -> None:
+    connection.execute("UPDATE price_adaptator_import_jobs SET status=?, started_at=? WHERE id=?", (JOB_RUNNING, _now(), job_id))
+
+
+def record_chunk(
+    connection: sqlite3.Connection,
+    job_id: str,
+    processed_rows: int,
+    lines: list[tuple[int, str, str, str]],
+    entries: Iterable[Entry] = (),
+) -> int:
+    """Enregistre, dans une même transaction, les prospects ajoutés par un lot, le
+    résultat de ses lignes `(numéro, issue, message, prospect)` et l'avancement du job."""
+    counts = {LINE_ADDED: 0, LINE_SKIPPED: 0, LINE_ERROR: 0}
+    for _, outcome, _, _ in lines:
+        counts[outcome] += 1
+    with sqlite_store.transaction(connection):
+        revision = _bump_revision(connection)
+        _insert(connection, entries, revision)
+        connection.executemany(
+            "INSERT OR REPLACE INTO price_adaptator_import_lines (job_id, line, outcome, message, prospect_id) VALUES (?, ?, ?, ?, ?)",
+            [(job_id, line, outcome, message, prospect_id or "") for line, outcome, message, prospect_id in lines],
+        )
+        connection.execute(
+            """UPDATE price_adaptator_import_jobs
+               SET processed_rows=?, added=added+?, skipped=skipped+?, errors=errors+?
+               WHERE id=?""",
+            (processed_rows, counts[LINE_ADDED], counts[LINE_SKIPPED], counts[LINE_ERROR], job_id),
+        )
+    return revision
+
+
+def finish_job(connection: sqlite3.Connection, job_id: str, error: str = "") -> None:
+    connection.execute(
+        "UPDATE price_adaptator_import_jobs SET status=?, finished_at=?, last_error=? WHERE id=?",
+        (JOB_FAILED if error else JOB_DONE, _now(), (error or "")[:2000], job_id),
+    )
+
+
+def job_lines(db_path: str | Path, job_id: str, outcome: str = "", page: int = 1, per_page: int = 50) -> dict[str, Any]:
+    """Résultat d'un import, page par page (filtrable par issue : ajoutée, ignorée, en erreur)."""
+    page = max(int(page or 1), 1)
+    per_page = min(max(int(per_page or 50), 1), MAX_PER_PAGE)
+    where, params = "job_id=?", [job_id]
+    if outcome:
+        where += " AND outcome=?"
+        params.append(outcome)
+    with _connection(db_path) as connection:
+        total = connection.execute(f"SELECT COUNT(*) FROM price_adaptator_import_lines WHERE {where}", params).fetchone()[0]
+        rows = connection.execute(
+            f"SELECT line, outcome, message, prospect_id FROM price_adaptator_import_lines WHERE {where} ORDER BY line LIMIT ? OFFSET ?",
+            [*params, per_page, (page - 1) * per_page],
+        ).fetchall()
+    return {"items": [dict(row) for row in rows], "page": page, "perPage": per_page, "total": int(total)}
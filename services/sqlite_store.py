@@ -0,0 +1,49 @@
+"""Connexions aux petites bases SQLite de `services/`.
+
+Files d'attente, registres et stores sont partagés par les workers gunicorn :
+mode WAL, attente de verrou de 5 s, pas de transaction implicite, et
+`BEGIN IMMEDIATE` pour les réservations qui ne doivent être faites que par un
+seul processus. Chaque module fournit la fonction qui crée ses tables.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator
+
+Initializer = Callable[[sqlite3.Connection], None]
+
+
+def connect(db_path: str | Path, init: Initializer | None = None) -> sqlite3.Connection:
+    """Ouvre la base (créée au besoin) et applique `init`, qui crée les tables manquantes."""
+    Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(str(db_path), timeout=10, isolation_level=None)
+    connection.row_factory = sqlite3.Row
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA busy_timeout=5000")
+    if init is not None:
+        init(connection)
+    return connection
+
+
+@contextmanager
+def connection(db_path: str | Path, init: Initializer | None = None) -> Iterator[sqlite3.Connection]:
+    opened = connect(db_path, init)
+    try:
+        yield opened
+    finally:
+        opened.close()
+
+
+@contextmanager
+def transaction(connection: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    """Transaction `BEGIN IMMEDIATE` : le verrou d'écriture est pris dès le début, validée ou annulée en bloc."""
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        yield connection
+        connection.execute("COMMIT")
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
@@ -0,0 +1,321 @@
+"""Extraction des listes de stagiaires importées pour les feuilles de présence.
+
+Trois formats sont acceptés :
+
+* PDF « Liste stagiaires » exporté de l'espace stagiaires : lu en mémoire,
+  texte extrait page par page, en parallèle au-delà de
+  `TRAINEE_PDF_PARALLEL_MIN_PAGES` pages si `PDF_PARALLEL_WORKERS` le permet
+  (pool `services.pdf_parallel`, repli séquentiel en cas de dépassement du
+  délai). Toutes les pages sont lues : une page sans stagiaire (annexe,
+  conditions) n'interrompt pas la liste ;
+* CSV (séparateur `;`, `,` ou tabulation, UTF-8 ou Windows-1252) et XLSX,
+  lus ligne à ligne sans charger tout le fichier : colonnes repérées par leur
+  en-tête (Nom, Prénom, Email, Téléphone, Date d'entrée), sinon dans cet ordre.
+
+Les expressions régulières sont compilées une fois au chargement du module.
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import logging
+import os
+import re
+import unicodedata
+from datetime import date, datetime
+from typing import IO, Any, Iterable
+
+from services import pdf_parallel
+
+logger = logging.getLogger(__name__)
+
+TRAINEE_PDF_PARALLEL_MIN_PAGES = int(os.environ.get("TRAINEE_PDF_PARALLEL_MIN_PAGES", "12"))
+PAGES_PER_TASK = 4
+SUPPORTED_EXTENSIONS = (".pdf", ".csv", ".xlsx")
+
+_WHITESPACE = re.compile(r"\s+")
+_NUMBERED_ROW = re.compile(r"^(\d{1,3})\s+(.+)$")
+_EMAIL = re.compile(r"[A-Z0-9._%+\-]+@[A-Z0-9.\-]+\.[A-Z]{2,}", re.IGNORECASE)
+_PHONE = re.compile(r"(?<!\d)((?:\+33|0)\s*[1-9](?:[\s.\-]*\d{2}){4})(?!\d)")
+_NON_DIGIT = re.compile(r"\D+")
+_NAME_FORBIDDEN = re.compile(r"[^A-Za-zÀ-ÿ' ,\-]")
+_NON_LETTER = re.compile(r"[^A-Za-zÀ-ÿ]")
+_HEADER_NOISE = re.compile(r"[^a-z]+")
+_IGNORED_FRAGMENTS = (
+    "numéros trouvés", "numero trouves", "numéro trouvé", "# nom", "nom prénom",
+    "email téléphone", "liste stagiaires", "http://", "https://", "page ",
+)
+
+# En-têtes de colonnes reconnus, comparés sans accents, casse ni ponctuation.
+_HEADER_ALIASES = {
+    "lastName": {"nom", "nomdefamille", "nomfamille", "lastname", "nomdusage"},
+    "firstName": {"prenom", "prenoms", "firstname"},
+    "fullName": {"nomprenom", "stagiaire", "nomcomplet", "identite", "fullname"},
+    "email": {"email", "mail", "courriel", "adresseemail", "adressemail", "emailaddress"},
+    "phone": {"telephone", "tel", "portable", "mobile", "phone", "numerodetelephone"},
+    "startDate": {"datedentree", "dateentree", "datedentreeenformation", "datededebut", "startdate", "entree"},
+}
+_POSITIONAL_COLUMNS = ("lastName", "firstName", "email", "phone")
+
+
+def normalize_name(value: str | None, uppercase: bool = False) -> str:
+    cleaned = _NAME_FORBIDDEN.sub("", value or "")
+    cleaned = _WHITESPACE.sub(" ", cleaned).strip(" ,\t;-')(")
+    return cleaned.upper() if uppercase else cleaned
+
+
+def extract_phone(line: str) -> tuple[str, str]:
+    """Premier numéro de téléphone français de `line` (formaté « 06 12 34 56 78 ») et le reste de la ligne."""
+    match = _PHONE.search(line)
+    if not match:
+        return "", line
+    phone = _NON_DIGIT.sub("", match.group(1))
+    if phone.startswith("33") and len(phone) == 11:
+        phone = "0" + phone[2:]
+    if len(phone) == 10:
+        phone = " ".join([phone[:2], phone[2:4], phone[4:6], phone[6:8], phone[8:]])
+    remaining = (line[:match.start()] + " " + line[match.end():]).strip()
+    return phone, remaining
+
+
+def _split_full_name(name_part: str) -> tuple[str, str] | None:
+    """« DUPONT Jean » -> (« DUPONT », « Jean ») : le nom est la suite de mots en majuscules."""
+    parts = name_part.split()
+    if len(parts) < 2:
+        return None
+    last_parts = []
+    for part in parts:
+        comparable = _NON_LETTER.sub("", part)
+        if comparable and comparable.upper() == comparable:
+            last_parts.append(part)
+        else:
+            break
+    if not last_parts or len(last_parts) >= len(parts):
+        return None
+    last = normalize_name(" ".join(last_parts), uppercase=True)
+    first = normalize_name(" ".join(parts[len(last_parts):]))
+    return (last, first) if last and first else None
+
+
+def _student_from_line(raw_line: str) -> dict[str, str] | None:
+    line = _WHITESPACE.sub(" ", raw_line).strip(" -\t;")
+    # Rejet rapide : seules les lignes numérotées (« 12 DUPONT Jean … ») sont des stagiaires.
+    if not line or not line[0].isdigit():
+        return None
+    numbered_match = _NUMBERED_ROW.match(line)
+    if not numbered_match:
+        return None
+    candidate = numbered_match.group(2).strip()
+    lowered = candidate.lower()
+    if any(fragment in lowered for fragment in _IGNORED_FRAGMENTS):
+        return None
+
+    email = ""
+    email_match = _EMAIL.search(candidate)
+    if email_match:
+        email = email_match.group(0).strip()
+        candidate = (candidate[:email_match.start()] + " " + candidate[email_match.end():]).strip()
+    phone, candidate = extract_phone(candidate)
+    names = _split_full_name(_WHITESPACE.sub(" ", candidate).strip(" -\t;"))
+    if not names:
+        return None
+    student = {"lastName": names[0], "firstName": names[1]}
+    if email:
+        student["email"] = email
+    if phone:
+        student["phone"] = phone
+    return student
+
+
+def _add_unique(students: list[dict[str, str]], seen: set, student: dict[str, str]) -> bool:
+    key = (student["lastName"], student["firstName"], student.get("email", ""), student.get("phone", ""))
+    if key in seen:
+        return False
+    seen.add(key)
+    students.append(student)
+    return True
+
+
+def students_from_text(text: str | None) -> list[dict[str, str]]:
+    """Stagiaires des lignes numérotées d'un texte de liste (« 1 DUPONT Jean email téléphone »)."""
+    students: list[dict[str, str]] = []
+    seen: set = set()
+    for raw_line in (text or "").splitlines():
+        student = _student_from_line(raw_line)
+        if student:
+            _add_unique(students, seen, student)
+    return students
+
+
+def _extract_pages(data: bytes, start: int, stop: int) -> list[str]:
+    from pypdf import PdfReader
+
+    reader = PdfReader(io.BytesIO(data))
+    return [reader.pages[index].extract_text() or "" for index in range(start, min(stop, len(reader.pages)))]
+
+
+def _page_texts(data: bytes, workers: int | None = None) -> list[str]:
+    """Texte de toutes les pages, dans l'ordre."""
+    try:
+        from pypdf import PdfReader
+    except ImportError as exc:
+        raise RuntimeError("La dépendance pypdf est requise pour lire le texte PDF.") from exc
+    reader = PdfReader(io.BytesIO(data))
+    page_count = len(reader.pages)
+    workers = pdf_parallel.PDF_PARALLEL_WORKERS if workers is None else workers
+    if workers > 1 and page_count >= TRAINEE_PDF_PARALLEL_MIN_PAGES:
+        calls = [(data, start, start + PAGES_PER_TASK) for start in range(0, page_count, PAGES_PER_TASK)]
+        chunks = pdf_parallel.starmap(_extract_pages, calls, workers)
+        if chunks is not None:
+            return [text for chunk in chunks for text in chunk]
+        logger.warning("Liste stagiaires PDF : extraction parallèle trop longue, reprise en séquentiel")
+    return [page.extract_text() or "" for page in reader.pages]
+
+
+def students_from_pdf(data: bytes, workers: int | None = None) -> tuple[list[dict[str, str]], bool]:
+    """Stagiaires d'un PDF de liste lu en mémoire, et vrai si le PDF contient du texte."""
+    students: list[dict[str, str]] = []
+    seen: set = set()
+    has_text = False
+    for text in _page_texts(data, workers):
+        has_text = has_text or bool(text.strip())
+        for student in map(_student_from_line, text.splitlines()):
+            if student:
+                _add_unique(students, seen, student)
+    return students, has_text
+
+
+def _header_key(value: Any) -> str:
+    text = unicodedata.normalize("NFKD", str(value or "")).encode("ascii", "ignore").decode("ascii").lower()
+    return _HEADER_NOISE.sub("", text)
+
+
+def _header_columns(row: Iterable[Any]) -> dict[str, int]:
+    columns: dict[str, int] = {}
+    for index, cell in enumerate(row):
+        key = _header_key(cell)
+        for field, aliases in _HEADER_ALIASES.items():
+            if key in aliases and field not in columns:
+                columns[field] = index
+    return columns if {"lastName", "fullName"} & columns.keys() else {}
+
+
+def _cell_text(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return _WHITESPACE.sub(" ", str(value)).strip()
+
+
+def _iso_date(value: Any) -> str:
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    text = _cell_text(value)
+    for pattern in ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%d/%m/%y"):
+        try:
+            return datetime.strptime(text[:10], pattern).date().isoformat()
+        except ValueError:
+            continue
+    return ""
+
+
+def students_from_rows(rows: Iterable[Iterable[Any]]) -> list[dict[str, str]]:
+    """Stagiaires d'un tableau (CSV, XLSX), parcouru une seule fois.
+
+    L'en-tête est cherché dans les dix premières lignes ; sans en-tête
+    reconnu, les colonnes sont lues dans l'ordre Nom, Prénom, Email, Téléphone.
+    """
+    students: list[dict[str, str]] = []
+    seen: set = set()
+    columns: dict[str, int] | None = None
+    for row_number, row in enumerate(rows):
+        row = list(row)
+        if not any(_cell_text(cell) for cell in row):
+            continue
+        if columns is None and row_number < 10:
+            columns = _header_columns(row) or None
+            if columns:
+                continue
+        mapping = columns or dict(zip(_POSITIONAL_COLUMNS, range(len(_POSITIONAL_COLUMNS))))
+
+        def cell(field):
+            index = mapping.get(field)
+            return row[index] if index is not None and index < len(row) else None
+
+        if "lastName" in mapping:
+            last, first = normalize_name(_cell_text(cell("lastName")), uppercase=True), normalize_name(_cell_text(cell("firstName")))
+        else:
+            last, first = _split_full_name(_cell_text(cell("fullName"))) or ("", "")
+        if not last or not first:
+            continue
+        student = {"lastName": last, "firstName": first}
+        email_match = _EMAIL.search(_cell_text(cell("email")))
+        if email_match:
+            student["email"] = email_match.group(0)
+        raw_phone = _cell_text(cell("phone"))
+        if raw_phone.isdigit() and len(raw_phone) == 9:
+            raw_phone = "0" + raw_phone  # numéro saisi comme nombre dans Excel : zéro initial perdu
+        phone, _ = extract_phone(raw_phone)
+        if phone:
+            student["phone"] = phone
+        start_date = _iso_date(cell("startDate")) if "startDate" in mapping else ""
+        if start_date:
+            student["startDate"] = start_date
+        _add_unique(students, seen, student)
+    return students
+
+
+def _csv_encoding(sample: bytes) -> str:
+    # Un caractère multi-octets peut être coupé en fin d'échantillon.
+    for cut in range(4):
+        try:
+            sample[:len(sample) - cut].decode("utf-8")
+            return "utf-8-sig"
+        except UnicodeDecodeError:
+            continue
+    return "cp1252"
+
+
+class _SemicolonDialect(csv.excel):
+    delimiter = ";"
+
+
+def students_from_csv(stream: IO[bytes]) -> list[dict[str, str]]:
+    sample = stream.read(64 * 1024)
+    stream.seek(0)
+    encoding = _csv_encoding(sample)
+    try:
+        dialect = csv.Sniffer().sniff(sample.decode(encoding, errors="ignore"), delimiters=";,\t")
+    except csv.Error:
+        dialect = _SemicolonDialect
+    text = io.TextIOWrapper(stream, encoding=encoding, errors="replace", newline="")
+    try:
+        return students_from_rows(csv.reader(text, dialect))
+    finally:
+        text.detach()
+
+
+def students_from_xlsx(stream: IO[bytes]) -> list[dict[str, str]]:
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        return students_from_rows(workbook.active.iter_rows(values_only=True))
+    finally:
+        workbook.close()
+
+
+def students_from_upload(filename: str, stream: IO[bytes]) -> tuple[list[dict[str, str]], bool]:
+    """Stagiaires d'un fichier importé selon son extension ; le booléen indique si du contenu a été lu."""
+    extension = os.path.splitext(filename or "")[-1].lower()
+    if extension == ".pdf":
+        return students_from_pdf(stream.read())
+    if extension == ".csv":
+        return students_from_csv(stream), True
+    if extension == ".xlsx":
+        return students_from_xlsx(stream), True
+    raise ValueError("Le fichier doit être un PDF, un CSV ou un classeur Excel (.xlsx).")
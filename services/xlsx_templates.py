@@ -0,0 +1,61 @@
+"""Cache des modèles Excel France Travail (`static/upload/*.xlsx`).
+
+Analyser un modèle avec openpyxl est l'étape la plus lente d'un petit export.
+Le cache garde, par chemin, une copie sérialisée (pickle) du classeur tel
+qu'analysé, invalidée quand la date de modification ou la taille du fichier
+change ; chaque appel reçoit un clone indépendant qu'il peut modifier
+librement.
+"""
+
+from __future__ import annotations
+
+import logging
+import pickle
+import threading
+from pathlib import Path
+from typing import Iterable
+
+from openpyxl import load_workbook
+
+logger = logging.getLogger(__name__)
+
+_templates: dict[str, tuple[tuple[int, int], bytes]] = {}
+_lock = threading.Lock()
+
+
+def _signature(path: Path) -> tuple[int, int]:
+    stat = path.stat()
+    return stat.st_mtime_ns, stat.st_size
+
+
+def load_template(path: str | Path):
+    """Classeur du modèle `path`, prêt à être modifié (clone du classeur en cache)."""
+    path = Path(path)
+    signature = _signature(path)
+    key = str(path.resolve())
+    with _lock:
+        cached = _templates.get(key)
+    if cached and cached[0] == signature:
+        return pickle.loads(cached[1])
+    workbook = load_workbook(path)
+    with _lock:
+        _templates[key] = (signature, pickle.dumps(workbook, protocol=pickle.HIGHEST_PROTOCOL))
+    return workbook
+
+
+def warm_up(paths: Iterable[str | Path]) -> int:
+    """Analyse à l'avance les modèles présents ; renvoie le nombre de modèles chargés."""
+    loaded = 0
+    for path in paths:
+        try:
+            if Path(path).exists():
+                load_template(path)
+                loaded += 1
+        except Exception:
+            logger.exception("Préchargement du modèle Excel impossible : %s", path)
+    return loaded
+
+
+def clear() -> None:
+    with _lock:
+        _templates.clear()
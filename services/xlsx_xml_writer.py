@@ -0,0 +1,551 @@
+"""Écriture directe (XML) de classeurs construits à partir d'un modèle xlsx.
+
+Le modèle est lu comme une archive zip : les onglets sont dupliqués au niveau
+XML (lignes et cellules gardées sous forme brute) et les valeurs sont écrites
+en flux dans `sheetData`, sans construire d'objets openpyxl. Les onglets
+exposent le petit sous-ensemble de l'API Worksheet d'openpyxl utilisé par les
+générateurs (`cell()`, `ws["A1"]`, `insert_rows`, `delete_rows`,
+`row_dimensions`, `max_row`, `print_area`, `freeze_panes`, mise en page),
+avec la même sémantique : insérer ou supprimer des lignes déplace les
+cellules mais ni les hauteurs de ligne ni les fusions.
+
+Comme `Workbook.copy_worksheet`, la copie ne reprend ni les dessins, ni les
+images, ni les paramètres d'imprimante du modèle.
+"""
+
+from __future__ import annotations
+
+import io
+import re
+import threading
+import zipfile
+from functools import lru_cache
+from pathlib import Path, PurePosixPath
+from typing import Any
+from xml.etree import ElementTree as ET
+from xml.sax.saxutils import escape, quoteattr, unescape
+
+from openpyxl.formula.translate import Translator
+from openpyxl.styles.fills import Fill
+from openpyxl.styles.numbers import BUILTIN_FORMATS, BUILTIN_FORMATS_REVERSE, is_date_format, is_timedelta_format
+from openpyxl.utils import column_index_from_string, get_column_letter
+from openpyxl.utils.datetime import from_excel
+from openpyxl.xml.functions import tostring
+
+MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+WORKSHEET_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"
+
+_ROW_RE = re.compile(r"<row\b([^>]*?)(?:/>|>(.*?)</row>)", re.S)
+_CELL_RE = re.compile(r"<c\b([^>]*?)(?:/>|>(.*?)</c>)", re.S)
+_ATTR_RE = re.compile(r'([\w:]+)="([^"]*)"')
+_REF_RE = re.compile(r"^([A-Z]+)(\d+)$")
+_SHARED_FORMULA_RE = re.compile(r'<f\b([^>]*\bt="shared"[^>]*)>(.+?)</f>', re.S)
+_XF_RE = re.compile(r"<xf\b[^>]*?(?:/>|>.*?</xf>)", re.S)
+_TEXT_TAG = f"{{{MAIN_NS}}}t"
+_ROW_ATTRS = ("ht", "customHeight", "hidden", "outlineLevel", "collapsed", "thickTop", "thickBot", "s", "customFormat")
+
+
+def _attrs(text: str) -> dict[str, str]:
+    return dict(_ATTR_RE.findall(text or ""))
+
+
+def _fragment(xml: str, tag: str) -> str:
+    match = re.search(rf"<{tag}\b[^>]*?(?:/>|>.*?</{tag}>)", xml, re.S)
+    return match.group(0) if match else ""
+
+
+def _set_attrs(element_xml: str, **values: Any) -> str:
+    """Remplace (ou ajoute) des attributs dans la balise ouvrante d'un élément XML brut."""
+    end = element_xml.index(">")
+    head, tail = element_xml[:end], element_xml[end:]
+    if head.endswith("/"):
+        head, tail = head[:-1], "/" + tail
+    for name, value in values.items():
+        pattern = re.compile(rf'\s{name}="[^"]*"')
+        if value is None:
+            head = pattern.sub("", head)
+        elif pattern.search(head):
+            head = pattern.sub(f' {name}="{value}"', head)
+        else:
+            head += f' {name}="{value}"'
+    return head + tail
+
+
+def _rich_text(node: ET.Element | None) -> str:
+    """Texte d'un `<si>` ou d'un `<is>` : `<t>` direct ou suite de `<r><t>`, sans les phonétiques."""
+    if node is None:
+        return ""
+    return "".join((child.text or "") if child.tag == _TEXT_TAG else (child.findtext(_TEXT_TAG) or "") for child in node)
+
+
+def _template_value(kind: str | None, inner: str, package: "TemplatePackage", template: "_SheetTemplate", ref: str) -> Any:
+    """Valeur brute de la cellule `ref` du modèle telle qu'openpyxl la lit : formule « =… »
+    (formule partagée traduite depuis sa cellule d'origine), dates en numéro de série."""
+    cell = ET.fromstring(f'<c xmlns="{MAIN_NS}">{inner}</c>')
+    formula = cell.find(f"{{{MAIN_NS}}}f")
+    if formula is not None and formula.text:
+        return "=" + formula.text
+    if formula is not None and formula.get("si") in template.shared_formulas:
+        origin, master = template.shared_formulas[formula.get("si")]
+        return Translator("=" + master, origin=origin).translate_formula(ref)
+    if kind == "inlineStr":
+        return _rich_text(cell.find(f"{{{MAIN_NS}}}is"))
+    text = cell.findtext(f"{{{MAIN_NS}}}v")
+    if text is None:
+        return None
+    if kind == "s":
+        return package.shared_strings[int(text)]
+    if kind == "b":
+        return text == "1"
+    if kind in ("str", "e", "d"):
+        return text
+    return int(text) if text.lstrip("-").isdigit() else float(text)
+
+
+def _absolute_range(ref: str) -> str:
+    return re.sub(r"\$?([A-Z]+)\$?(\d+)", r"$\1$\2", ref)
+
+
+def _quote_sheet(title: str) -> str:
+    return "'" + title.replace("'", "''") + "'"
+
+
+class TemplatePackage:
+    """Parties utiles d'un modèle xlsx, lues une fois et partagées (lecture seule)."""
+
+    def __init__(self, path: str | Path):
+        with zipfile.ZipFile(path) as archive:
+            self.parts = {name: archive.read(name) for name in archive.namelist()}
+        workbook = ET.fromstring(self.parts["xl/workbook.xml"])
+        rels = ET.fromstring(self.parts["xl/_rels/workbook.xml.rels"])
+        targets = {rel.get("Id"): rel.get("Target") for rel in rels.iter(f"{{{PKG_REL_NS}}}Relationship")}
+        self.sheet_parts: dict[str, str] = {}
+        for sheet in workbook.iter(f"{{{MAIN_NS}}}sheet"):
+            target = targets[sheet.get(f"{{{REL_NS}}}id")]
+            part = target.lstrip("/") if target.startswith("/") else str(PurePosixPath("xl") / target)
+            self.sheet_parts[sheet.get("name")] = part
+        self.styles = self.parts["xl/styles.xml"].decode("utf-8")
+        self._sheets: dict[str, _SheetTemplate] = {}
+        self._shared_strings: list[str] | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def sheetnames(self) -> list[str]:
+        return list(self.sheet_parts)
+
+    @property
+    def shared_strings(self) -> list[str]:
+        with self._lock:
+            if self._shared_strings is None:
+                sst = self.parts.get("xl/sharedStrings.xml")
+                self._shared_strings = [_rich_text(si) for si in ET.fromstring(sst)] if sst else []
+            return self._shared_strings
+
+    def sheet_template(self, name: str) -> "_SheetTemplate":
+        with self._lock:
+            if name not in self._sheets:
+                self._sheets[name] = _SheetTemplate(self.parts[self.sheet_parts[name]].decode("utf-8"))
+            return self._sheets[name]
+
+
+@lru_cache(maxsize=8)
+def _load_package(path: str, signature: tuple[int, int]) -> TemplatePackage:
+    return TemplatePackage(path)
+
+
+def load_package(path: str | Path) -> TemplatePackage:
+    """Modèle `path` analysé, en cache tant que le fichier ne change pas (date, taille)."""
+    stat = Path(path).stat()
+    return _load_package(str(Path(path).resolve()), (stat.st_mtime_ns, stat.st_size))
+
+
+class _SheetTemplate:
+    """Onglet du modèle découpé en fragments XML bruts et en cellules."""
+
+    def __init__(self, xml: str):
+        root_tag = re.search(r"<worksheet\b[^>]*>", xml).group(0)
+        self.root_tag = re.sub(r'\sxr:uid="[^"]*"', "", root_tag)
+        self.sheet_format = _fragment(xml, "sheetFormatPr")
+        self.cols = _fragment(xml, "cols")
+        self.merge_cells = _fragment(xml, "mergeCells")
+        self.page_margins = _fragment(xml, "pageMargins")
+        self.page_setup = _attrs(_fragment(xml, "pageSetup"))
+        self.page_setup.pop("r:id", None)
+        self.fit_to_page = 'fitToPage="1"' in _fragment(xml, "sheetPr")
+        # cellules : [style, (type, XML interne) ou None, référence d'origine dans le modèle]
+        self.rows: dict[int, dict[int, list]] = {}
+        self.shared_formulas: dict[str, tuple[str, str]] = {}
+        self.row_attrs: dict[int, dict[str, str]] = {}
+        sheet_data = _fragment(xml, "sheetData")
+        for row_match in _ROW_RE.finditer(sheet_data):
+            attrs = _attrs(row_match.group(1))
+            r = int(attrs["r"])
+            kept = {k: v for k, v in attrs.items() if k in _ROW_ATTRS}
+            if kept:
+                self.row_attrs[r] = kept
+            cells = {}
+            for cell_match in _CELL_RE.finditer(row_match.group(2) or ""):
+                cell_attrs = _attrs(cell_match.group(1))
+                column = column_index_from_string(_REF_RE.match(cell_attrs["r"]).group(1))
+                inner = cell_match.group(2) or ""
+                raw = (cell_attrs.get("t"), inner) if inner else None
+                cells[column] = [int(cell_attrs.get("s", 0)), raw, cell_attrs["r"]]
+                shared = _SHARED_FORMULA_RE.search(inner)
+                if shared and 'ref="' in shared.group(1):
+                    self.shared_formulas[_attrs(shared.group(1)).get("si")] = (cell_attrs["r"], unescape(shared.group(2)))
+            if cells:
+                self.rows[r] = cells
+
+
+class _Styles:
+    """styles.xml du modèle, complété à la demande par les remplissages et formats utilisés."""
+
+    def __init__(self, xml: str):
+        self.xml = xml
+        self.xfs = _XF_RE.findall(_fragment(xml, "cellXfs"))
+        fills = _fragment(xml, "fills")
+        self.fill_count = len(re.findall(r"<fill\b", fills))
+        self.new_fills: list[str] = []
+        # Les générateurs réutilisent les mêmes objets PatternFill : ils sont indexés
+        # par identité (et gardés en vie) pour ne pas hacher un style openpyxl par cellule.
+        self.fill_ids: dict[int, int] = {}
+        self.fills_seen: list[Any] = []
+        existing = re.findall(r'<numFmt\b[^>]*numFmtId="(\d+)"', xml)
+        self.next_numfmt = max([163, *map(int, existing)]) + 1
+        self.new_numfmts: list[str] = []
+        self.numfmt_ids: dict[str, int] = {}
+        self.derived: dict[tuple, int] = {}
+        self._template_fills: list[Any] | None = None
+
+    def fill_id(self, fill) -> int:
+        if id(fill) not in self.fill_ids:
+            self.fills_seen.append(fill)
+            self.new_fills.append(tostring(fill.to_tree()).decode("utf-8"))
+            self.fill_ids[id(fill)] = self.fill_count + len(self.new_fills) - 1
+        return self.fill_ids[id(fill)]
+
+    def numfmt_id(self, code: str) -> int:
+        if code in BUILTIN_FORMATS_REVERSE:
+            return BUILTIN_FORMATS_REVERSE[code]
+        if code not in self.numfmt_ids:
+            self.numfmt_ids[code] = self.next_numfmt
+            self.new_numfmts.append(f'<numFmt numFmtId="{self.next_numfmt}" formatCode={quoteattr(code)}/>')
+            self.next_numfmt += 1
+        return self.numfmt_ids[code]
+
+    def _xf_id(self, style: int, name: str) -> int:
+        xf = self.xfs[style]
+        return int(_attrs(xf[:xf.index(">")]).get(name, 0))
+
+    def fill(self, style: int):
+        """Remplissage (objet openpyxl) du style `style`."""
+        fill_id = self._xf_id(style, "fillId")
+        if fill_id >= self.fill_count:
+            return self.fills_seen[fill_id - self.fill_count]
+        if self._template_fills is None:
+            fills = ET.fromstring(_set_attrs(_fragment(self.xml, "fills"), xmlns=MAIN_NS))
+            self._template_fills = [Fill.from_tree(node) for node in fills]
+        return self._template_fills[fill_id]
+
+    def number_format(self, style: int) -> str:
+        """Code du format de nombre du style `style` (« General » par défaut, comme openpyxl)."""
+        numfmt_id = self._xf_id(style, "numFmtId")
+        if numfmt_id in BUILTIN_FORMATS:
+            return BUILTIN_FORMATS[numfmt_id]
+        for code, known_id in self.numfmt_ids.items():
+            if known_id == numfmt_id:
+                return code
+        for attrs in map(_attrs, re.findall(r"<numFmt\b[^>]*>", _fragment(self.xml, "numFmts"))):
+            if attrs.get("numFmtId") == str(numfmt_id):
+                return unescape(attrs.get("formatCode", ""), {"&quot;": '"', "&apos;": "'"})
+        return "General"
+
+    def derive(self, style: int, fill=None, number_format: str | None = None) -> int:
+        key = (style, id(fill), number_format)
+        if key not in self.derived:
+            xf = self.xfs[style]
+            if fill is not None:
+                xf = _set_attrs(xf, fillId=self.fill_id(fill), applyFill=1)
+            if number_format is not None:
+                xf = _set_attrs(xf, numFmtId=self.numfmt_id(number_format), applyNumberFormat=1)
+            self.xfs.append(xf)
+            self.derived[key] = len(self.xfs) - 1
+        return self.derived[key]
+
+    def render(self) -> str:
+        xml = self.xml
+        if self.new_fills:
+            fills = _fragment(xml, "fills")
+            patched = _set_attrs(fills, count=self.fill_count + len(self.new_fills)).replace("</fills>", "".join(self.new_fills) + "</fills>")
+            xml = xml.replace(fills, patched, 1)
+        if self.new_numfmts:
+            numfmts = _fragment(xml, "numFmts")
+            if numfmts:
+                count = len(re.findall(r"<numFmt\b", numfmts)) + len(self.new_numfmts)
+                xml = xml.replace(numfmts, _set_attrs(numfmts, count=count).replace("</numFmts>", "".join(self.new_numfmts) + "</numFmts>"), 1)
+            else:
+                head = re.search(r"<styleSheet\b[^>]*>", xml).group(0)
+                xml = xml.replace(head, f'{head}<numFmts count="{len(self.new_numfmts)}">{"".join(self.new_numfmts)}</numFmts>', 1)
+        cell_xfs = _fragment(xml, "cellXfs")
+        return xml.replace(cell_xfs, f'<cellXfs count="{len(self.xfs)}">{"".join(self.xfs)}</cellXfs>', 1)
+
+
+class XmlCell:
+    __slots__ = ("_data", "_styles", "_sheet")
+
+    def __init__(self, data: list, styles: _Styles, sheet: "XmlWorksheet"):
+        self._data = data
+        self._styles = styles
+        self._sheet = sheet
+
+    @property
+    def value(self):
+        raw = self._data[1]
+        if raw is None:
+            return None
+        kind, content = raw
+        if kind == "value":
+            return content
+        value = _template_value(kind, content, self._sheet._package, self._sheet._template, self._data[2])
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            number_format = self.number_format
+            if is_date_format(number_format):
+                return from_excel(value, timedelta=is_timedelta_format(number_format))
+        return value
+
+    @value.setter
+    def value(self, value):
+        if value is not None and not isinstance(value, (str, int, float)):
+            raise TypeError(f"Type de valeur non pris en charge : {type(value).__name__}")
+        self._data[1] = None if value is None else ("value", value)
+
+    @property
+    def _style(self) -> int:
+        return self._data[0]
+
+    @_style.setter
+    def _style(self, style: int):
+        self._data[0] = style
+
+    @property
+    def fill(self):
+        return self._styles.fill(self._data[0])
+
+    @fill.setter
+    def fill(self, fill):
+        self._data[0] = self._styles.derive(self._data[0], fill=fill)
+
+    @property
+    def number_format(self) -> str:
+        return self._styles.number_format(self._data[0])
+
+    @number_format.setter
+    def number_format(self, code: str):
+        self._data[0] = self._styles.derive(self._data[0], number_format=code)
+
+
+class _RowDimension:
+    __slots__ = ("attrs",)
+
+    def __init__(self, attrs: dict[str, str]):
+        self.attrs = attrs
+
+    @property
+    def height(self):
+        ht = self.attrs.get("ht")
+        return float(ht) if ht is not None else None
+
+    @height.setter
+    def height(self, value):
+        if value is None:
+            self.attrs.pop("ht", None)
+            self.attrs.pop("customHeight", None)
+        else:
+            self.attrs["ht"] = repr(float(value)).removesuffix(".0")
+            self.attrs["customHeight"] = "1"
+
+
+class _RowDimensions(dict):
+    def __missing__(self, row: int) -> _RowDimension:
+        self[row] = _RowDimension({})
+        return self[row]
+
+
+class _Bag:
+    def __init__(self, **values):
+        self.__dict__.update(values)
+
+
+class XmlWorksheet:
+    """Copie d'un onglet du modèle ; mêmes noms et même sémantique que l'API openpyxl."""
+
+    def __init__(self, template: _SheetTemplate, title: str, styles: _Styles, package: TemplatePackage):
+        self._template = template
+        self._styles = styles
+        self._package = package
+        self.title = title
+        self._rows = {r: {c: list(data) for c, data in cells.items()} for r, cells in template.rows.items()}
+        self.row_dimensions = _RowDimensions({r: _RowDimension(dict(attrs)) for r, attrs in template.row_attrs.items()})
+        self.sheet_properties = _Bag(pageSetUpPr=_Bag(fitToPage=template.fit_to_page))
+        self.page_setup = _Bag(**{"orientation": None, "fitToWidth": None, "fitToHeight": None, **template.page_setup})
+        self.print_area: str | None = None
+        self.freeze_panes: str | None = None
+
+    def cell(self, row: int, column: int) -> XmlCell:
+        cells = self._rows.setdefault(row, {})
+        data = cells.get(column)
+        if data is None:
+            data = cells[column] = [0, None]
+        return XmlCell(data, self._styles, self)
+
+    def __setitem__(self, ref: str, value):
+        letters, row = _REF_RE.match(ref).groups()
+        self.cell(int(row), column_index_from_string(letters)).value = value
+
+    @property
+    def max_row(self) -> int:
+        return max((r for r, cells in self._rows.items() if cells), default=1)
+
+    def insert_rows(self, idx: int, amount: int = 1):
+        self._rows = {(r + amount if r >= idx else r): cells for r, cells in self._rows.items()}
+
+    def delete_rows(self, idx: int, amount: int = 1):
+        self._rows = {(r - amount if r >= idx + amount else r): cells for r, cells in self._rows.items() if not idx <= r < idx + amount}
+
+    def _cell_xml(self, ref: str, data: list) -> str:
+        style, raw = data[0], data[1]
+        s = f' s="{style}"' if style else ""
+        if raw is None or raw[1] == "":
+            return f'<c r="{ref}"{s}/>'
+        kind, value = raw
+        if kind != "value":
+            t = f' t="{kind}"' if kind else ""
+            return f'<c r="{ref}"{s}{t}>{value}</c>'
+        if isinstance(value, bool):
+            return f'<c r="{ref}"{s} t="b"><v>{int(value)}</v></c>'
+        if isinstance(value, (int, float)):
+            return f'<c r="{ref}"{s}><v>{value!r}</v></c>'
+        if value.startswith("=") and len(value) > 1:
+            return f'<c r="{ref}"{s}><f>{escape(value[1:])}</f></c>'
+        return f'<c r="{ref}"{s} t="inlineStr"><is><t xml:space="preserve">{escape(value)}</t></is></c>'
+
+    def _sheet_view(self, selected: bool) -> str:
+        tab = ' tabSelected="1"' if selected else ""
+        if not self.freeze_panes:
+            return f'<sheetViews><sheetView{tab} workbookViewId="0"/></sheetViews>'
+        letters, row = _REF_RE.match(self.freeze_panes).groups()
+        x, y = column_index_from_string(letters) - 1, int(row) - 1
+        ref = self.freeze_panes
+        return (
+            f'<sheetViews><sheetView{tab} workbookViewId="0">'
+            f'<pane xSplit="{x}" ySplit="{y}" topLeftCell="{ref}" activePane="bottomRight" state="frozen"/>'
+            f'<selection pane="topRight"/><selection pane="bottomLeft"/>'
+            f'<selection pane="bottomRight" activeCell="{ref}" sqref="{ref}"/></sheetView></sheetViews>'
+        )
+
+    def write(self, stream, selected: bool = False):
+        """Écrit l'onglet en flux dans `stream` (fichier binaire ouvert dans l'archive)."""
+        t = self._template
+        rows = sorted(r for r, cells in self._rows.items() if cells)
+        columns = [c for r in rows for c in self._rows[r]]
+        dimension = f"A1:{get_column_letter(max(columns))}{rows[-1]}" if rows else "A1"
+        fit = '<pageSetUpPr fitToPage="1"/>' if self.sheet_properties.pageSetUpPr.fitToPage else ""
+        head = ['<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n', t.root_tag, f"<sheetPr>{fit}</sheetPr>" if fit else "", f'<dimension ref="{dimension}"/>',
+                self._sheet_view(selected), t.sheet_format, t.cols, "<sheetData>"]
+        stream.write("".join(head).encode("utf-8"))
+        letters = {}
+        buffer = []
+        for r in sorted(set(rows) | set(self.row_dimensions)):
+            attrs = "".join(f' {k}="{v}"' for k, v in self.row_dimensions[r].attrs.items()) if r in self.row_dimensions else ""
+            cells = self._rows.get(r) or {}
+            if not cells:
+                if attrs:
+                    buffer.append(f'<row r="{r}"{attrs}/>')
+                continue
+            parts = [f'<row r="{r}"{attrs}>']
+            for c in sorted(cells):
+                letter = letters.get(c) or letters.setdefault(c, get_column_letter(c))
+                parts.append(self._cell_xml(f"{letter}{r}", cells[c]))
+            parts.append("</row>")
+            buffer.append("".join(parts))
+            if len(buffer) >= 64:
+                stream.write("".join(buffer).encode("utf-8"))
+                buffer.clear()
+        setup = {k: v for k, v in vars(self.page_setup).items() if v is not None}
+        setup_xml = "<pageSetup" + "".join(f' {k}="{v}"' for k, v in setup.items()) + "/>" if setup else ""
+        buffer += ["</sheetData>", t.merge_cells, t.page_margins, setup_xml, "</worksheet>"]
+        stream.write("".join(buffer).encode("utf-8"))
+
+
+class XmlWorkbook:
+    """Classeur de sortie construit en copiant des onglets d'un `TemplatePackage`."""
+
+    def __init__(self, package: TemplatePackage):
+        self.package = package
+        self.styles = _Styles(package.styles)
+        self.worksheets: list[XmlWorksheet] = []
+
+    @property
+    def sheetnames(self) -> list[str]:
+        return self.package.sheetnames
+
+    def copy_worksheet(self, source: str, title: str) -> XmlWorksheet:
+        ws = XmlWorksheet(self.package.sheet_template(source), title, self.styles, self.package)
+        self.worksheets.append(ws)
+        return ws
+
+    def _workbook_xml(self, active: int) -> str:
+        sheets = "".join(f'<sheet name={quoteattr(ws.title)} sheetId="{i}" r:id="rId{i}"/>' for i, ws in enumerate(self.worksheets, 1))
+        names = "".join(
+            f'<definedName name="_xlnm.Print_Area" localSheetId="{i}">{escape(_quote_sheet(ws.title))}!{_absolute_range(ws.print_area)}</definedName>'
+            for i, ws in enumerate(self.worksheets) if ws.print_area
+        )
+        return (
+            f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<workbook xmlns="{MAIN_NS}" xmlns:r="{REL_NS}">'
+            f'<workbookPr/><bookViews><workbookView activeTab="{active}"/></bookViews><sheets>{sheets}</sheets>'
+            f'{f"<definedNames>{names}</definedNames>" if names else ""}<calcPr calcId="191029" fullCalcOnLoad="1"/></workbook>'
+        )
+
+    def save(self, active: int = 0) -> io.BytesIO:
+        parts = self.package.parts
+        extras = [(name, rel, content) for name, rel, content in (
+            ("xl/theme/theme1.xml", "theme", "application/vnd.openxmlformats-officedocument.theme+xml"),
+            ("xl/sharedStrings.xml", "sharedStrings", "application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"),
+        ) if name in parts]
+        count = len(self.worksheets)
+        rels = [f'<Relationship Id="rId{i}" Type="{REL_NS}/worksheet" Target="worksheets/sheet{i}.xml"/>' for i in range(1, count + 1)]
+        rels.append(f'<Relationship Id="rId{count + 1}" Type="{REL_NS}/styles" Target="styles.xml"/>')
+        rels += [f'<Relationship Id="rId{count + 2 + i}" Type="{REL_NS}/{rel}" Target="{name[3:]}"/>' for i, (name, rel, _) in enumerate(extras)]
+        overrides = [("/xl/workbook.xml", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"),
+                     ("/xl/styles.xml", "application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"),
+                     ("/docProps/app.xml", "application/vnd.openxmlformats-officedocument.extended-properties+xml")]
+        overrides += [(f"/xl/worksheets/sheet{i}.xml", WORKSHEET_TYPE) for i in range(1, count + 1)]
+        overrides += [(f"/{name}", content) for name, _, content in extras]
+        root_rels = [f'<Relationship Id="rId1" Type="{REL_NS}/officeDocument" Target="xl/workbook.xml"/>',
+                     f'<Relationship Id="rId2" Type="{REL_NS}/extended-properties" Target="docProps/app.xml"/>']
+        if "docProps/core.xml" in parts:
+            overrides.append(("/docProps/core.xml", "application/vnd.openxmlformats-package.core-properties+xml"))
+            root_rels.append(f'<Relationship Id="rId3" Type="{PKG_REL_NS}/metadata/core-properties" Target="docProps/core.xml"/>')
+        header = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        bio = io.BytesIO()
+        with zipfile.ZipFile(bio, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("[Content_Types].xml", header + '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                             '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                             '<Default Extension="xml" ContentType="application/xml"/>'
+                             + "".join(f'<Override PartName="{name}" ContentType="{content}"/>' for name, content in overrides) + "</Types>")
+            archive.writestr("_rels/.rels", header + f'<Relationships xmlns="{PKG_REL_NS}">{"".join(root_rels)}</Relationships>')
+            archive.writestr("docProps/app.xml", header + '<Properties xmlns="http://schemas.openxmlformats.org/officeDocument/2006/extended-properties"><Application>Microsoft Excel</Application></Properties>')
+            if "docProps/core.xml" in parts:
+                archive.writestr("docProps/core.xml", parts["docProps/core.xml"])
+            archive.writestr("xl/workbook.xml", self._workbook_xml(active))
+            archive.writestr("xl/_rels/workbook.xml.rels", header + f'<Relationships xmlns="{PKG_REL_NS}">{"".join(rels)}</Relationships>')
+            for i, ws in enumerate(self.worksheets, 1):
+                with archive.open(f"xl/worksheets/sheet{i}.xml", "w") as stream:
+                    ws.write(stream, selected=i - 1 == active)
+            archive.writestr("xl/styles.xml", self.styles.render())
+            for name, _, _ in extras:
+                archive.writestr(name, parts[name])
+        bio.seek(0)
+        return bio
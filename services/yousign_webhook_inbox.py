@@ -0,0 +1,169 @@
+"""File d'attente persistante des webhooks Yousign.
+
+Le webhook est acquitté dès que l'événement est vérifié et enregistré ; un
+worker applique ensuite les événements avec des tentatives espacées. La base
+SQLite est partagée entre les workers gunicorn : la réservation d'un événement
+se fait dans une transaction `BEGIN IMMEDIATE` pour qu'un seul processus le
+traite.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any
+
+from services import sqlite_store
+
+INBOX_DB_NAME = "yousign_webhooks.db"
+STATUS_PENDING = "pending"
+STATUS_PROCESSING = "processing"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+DEFAULT_MAX_ATTEMPTS = 6
+BACKOFF_BASE_SECONDS = 30
+BACKOFF_MAX_SECONDS = 3600
+PROCESSING_STALE_MINUTES = 10
+
+
+def _now() -> datetime:
+    return datetime.now().replace(microsecond=0)
+
+
+def _iso(value: datetime) -> str:
+    return value.isoformat(timespec="seconds")
+
+
+def _create_tables(connection: sqlite3.Connection) -> None:
+    connection.execute(
+        """
+        CREATE TABLE IF NOT EXISTS yousign_webhook_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            idempotency_key TEXT NOT NULL UNIQUE,
+            event_name TEXT NOT NULL DEFAULT '',
+            signature_request_id TEXT NOT NULL DEFAULT '',
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            received_at TEXT NOT NULL,
+            next_attempt_at TEXT NOT NULL,
+            claimed_at TEXT DEFAULT '',
+            processed_at TEXT DEFAULT '',
+            last_error TEXT DEFAULT '',
+            result TEXT DEFAULT ''
+        )
+        """
+    )
+    connection.execute(
+        "CREATE INDEX IF NOT EXISTS idx_yousign_webhook_events_due ON yousign_webhook_events(status, next_attempt_at)"
+    )
+
+
+def connect(db_path: str | Path) -> sqlite3.Connection:
+    return sqlite_store.connect(db_path, _create_tables)
+
+
+def _connection(db_path: str | Path):
+    return sqlite_store.connection(db_path, _create_tables)
+
+
+def idempotency_key(payload: dict[str, Any], raw_body: bytes) -> str:
+    """Identifiant de déduplication : `event_id` Yousign, sinon empreinte du corps brut."""
+    event_id = (payload.get("event_id") or payload.get("id")) if isinstance(payload, dict) else ""
+    if event_id:
+        return f"event:{event_id}"
+    return "sha256:" + hashlib.sha256(raw_body or b"").hexdigest()
+
+
+def backoff_seconds(attempts: int) -> int:
+    return min(BACKOFF_BASE_SECONDS * (2 ** max(attempts - 1, 0)), BACKOFF_MAX_SECONDS)
+
+
+def enqueue(db_path: str | Path, key: str, payload: dict[str, Any], event_name: str = "", signature_request_id: str = "") -> tuple[int, bool]:
+    """Enregistre un événement. Renvoie `(id, created)` ; `created` est faux pour un doublon."""
+    now = _iso(_now())
+    with _connection(db_path) as connection:
+        cursor = connection.execute(
+            """INSERT OR IGNORE INTO yousign_webhook_events
+               (idempotency_key, event_name, signature_request_id, payload, status, received_at, next_attempt_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            (key, event_name or "", signature_request_id or "", json.dumps(payload, ensure_ascii=False, default=str), STATUS_PENDING, now, now),
+        )
+        if cursor.rowcount:
+            return int(cursor.lastrowid), True
+        row = connection.execute("SELECT id FROM yousign_webhook_events WHERE idempotency_key=?", (key,)).fetchone()
+        return int(row["id"]), False
+
+
+def claim_due_events(db_path: str | Path, limit: int = 10, now: datetime | None = None) -> list[dict[str, Any]]:
+    """Réserve les événements échus (et ceux restés bloqués en traitement) pour ce processus."""
+    now = now or _now()
+    stale_before = _iso(now - timedelta(minutes=PROCESSING_STALE_MINUTES))
+    with _connection(db_path) as connection, sqlite_store.transaction(connection):
+        rows = connection.execute(
+            """SELECT * FROM yousign_webhook_events
+               WHERE (status=? AND next_attempt_at<=?) OR (status=? AND claimed_at<=?)
+               ORDER BY next_attempt_at, id LIMIT ?""",
+            (STATUS_PENDING, _iso(now), STATUS_PROCESSING, stale_before, int(limit)),
+        ).fetchall()
+        for row in rows:
+            connection.execute(
+                "UPDATE yousign_webhook_events SET status=?, claimed_at=?, attempts=attempts+1 WHERE id=?",
+                (STATUS_PROCESSING, _iso(now), row["id"]),
+            )
+    events = []
+    for row in rows:
+        event = dict(row)
+        event["attempts"] = int(event["attempts"]) + 1
+        event["payload"] = json.loads(event["payload"] or "{}")
+        events.append(event)
+    return events
+
+
+def mark_done(db_path: str | Path, event_id: int, result: dict[str, Any] | None = None) -> None:
+    with _connection(db_path) as connection:
+        connection.execute(
+            "UPDATE yousign_webhook_events SET status=?, processed_at=?, last_error='', result=? WHERE id=?",
+            (STATUS_DONE, _iso(_now()), json.dumps(result or {}, ensure_ascii=False, default=str), event_id),
+        )
+
+
+def mark_failed(db_path: str | Path, event_id: int, attempts: int, error: str, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> str:
+    """Replanifie l'événement avec un délai exponentiel, ou l'abandonne après `max_attempts`."""
+    now = _now()
+    status = STATUS_FAILED if attempts >= max_attempts else STATUS_PENDING
+    next_attempt = _iso(now + timedelta(seconds=backoff_seconds(attempts)))
+    with _connection(db_path) as connection:
+        connection.execute(
+            "UPDATE yousign_webhook_events SET status=?, next_attempt_at=?, last_error=?, processed_at=? WHERE id=?",
+            (status, next_attempt, (error or "")[:2000], _iso(now) if status == STATUS_FAILED else "", event_id),
+        )
+    return status
+
+
+def replay(db_path: str | Path, event_id: int) -> bool:
+    """Remet un événement en file pour un traitement immédiat, quel que soit son statut."""
+    now = _iso(_now())
+    with _connection(db_path) as connection:
+        cursor = connection.execute(
+            """UPDATE yousign_webhook_events
+               SET status=?, attempts=0, next_attempt_at=?, claimed_at='', processed_at='', last_error=''
+               WHERE id=?""",
+            (STATUS_PENDING, now, event_id),
+        )
+        return bool(cursor.rowcount)
+
+
+def list_events(db_path: str | Path, status: str = "", limit: int = 50) -> list[dict[str, Any]]:
+    query = "SELECT id, idempotency_key, event_name, signature_request_id, status, attempts, received_at, next_attempt_at, processed_at, last_error, result FROM yousign_webhook_events"
+    params: list[Any] = []
+    if status:
+        query += " WHERE status=?"
+        params.append(status)
+    query += " ORDER BY id DESC LIMIT ?"
+    params.append(int(limit))
+    with _connection(db_path) as connection:
+        return [dict(row) for row in connection.execute(query, params).fetchall()]
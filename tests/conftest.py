@@ -0,0 +1,7 @@
+import os
+import tempfile
+
+# `app` crée ses bases (planning, file des tâches, webhooks, numéros de facture) dans DATA_DIR
+# dès l'import : les tests travaillent dans un répertoire jetable, jamais sur /mnt/data.
+os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="tests-data-")
+os.environ.pop("PERSIST_DIR", None)
@@ -174,6 +174,7 @@ def test_a3p_attendance_pdf_draws_stamp_without_trainer_signature_image(tmp_path
     monkeypatch.setattr(reportlab_canvas, "Canvas", SpyCanvas)
     monkeypatch.setattr(app, "find_center_image", fake_center_image)
     monkeypatch.setattr(app, "aps_pdf_logo_path", lambda: None)
+    monkeypatch.setattr(app.pdf_resources, "image", lambda path, *args, **kwargs: path)
 
     result = generateA3pSchedule(config())
     result["planning"][0]["slots"][0]["trainer"] = "Jean Dupont"
@@ -5,7 +5,7 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 from app import (
     AFC_DSF_STATUS_CANCELLED, AFC_DSF_STATUS_FINALIZED,
-    afc_dsf_compute, afc_dsf_next_number, afc_dsf_summary, afc_dsf_session_snapshot,
+    afc_dsf_compute, afc_dsf_next_number, afc_dsf_summary, afc_dsf_session_revision, afc_dsf_session_snapshot,
     build_afc_aps_ssiap_planning_data, generate_afc_dsf_pdf,
     is_afc_aps_ssiap_session,
 )
@@ -92,6 +92,80 @@ def test_summary_does_not_crash_when_finalized_dsf_exceeds_current_planning():
     assert ran["overbilledTotal"] > 0
 
 
+
+def test_invoice_state_is_memoised_per_revision_and_invalidated_by_edits():
+    s = sample_session()
+    d = s["apsPlanningData"][0]["date"]
+    first = afc_dsf_summary(s, period_end=d)
+    assert afc_dsf_summary(s, period_end=d) is first
+    assert afc_dsf_summary(s, period_end=d, hourly_rate="10") is not first
+    assert first["total"]["toInvoice"] == 14
+
+    r = afc_dsf_compute(s, d, d, ["RAN"])
+    s["afcDsfs"].append({"id": "1", "number": 1, "label": "DSF 1", "status": AFC_DSF_STATUS_FINALIZED, **r})
+    billed = afc_dsf_summary(s, period_end=d)
+    assert billed is not first
+    assert billed["total"]["toInvoice"] == 0 and billed["total"]["billed"] == 14
+
+    s["apsPlanningData"][1]["slots"][0]["durationMinutes"] = 60
+    edited = afc_dsf_summary(s, period_end=d)
+    assert edited is not billed
+    assert edited["total"]["planned"] < billed["total"]["planned"]
+
+
+def test_revision_changes_when_a_middle_ledger_entry_or_slot_key_changes():
+    s = sample_session()
+    first, last = s["apsPlanningData"][0]["date"], s["apsPlanningData"][2]["date"]
+    r = afc_dsf_compute(s, first, last, ["RAN"])
+    s["afcDsfs"].append({"id": "1", "number": 1, "status": AFC_DSF_STATUS_FINALIZED, **r})
+    before = afc_dsf_session_revision(s)
+    spans = s["afcDsfs"][0]["billedLedger"]["a"]["RAN"][s["apsPlanningData"][1]["date"]]
+    spans[0] = "00:00-00:01"
+    assert afc_dsf_session_revision(s) != before
+
+    legacy = sample_session()
+    keys = [f"s1|a|{day['date']}|{slot['start']}|{slot['end']}|RAN" for day in legacy["apsPlanningData"][:3] for slot in day["slots"] if slot.get("afcCategory") == "RAN"]
+    legacy["afcDsfs"].append({"id": "old", "number": 1, "status": AFC_DSF_STATUS_FINALIZED, "billedSlotKeys": keys})
+    before = afc_dsf_session_revision(legacy)
+    keys[len(keys) // 2] = keys[len(keys) // 2].replace("|a|", "|b|")
+    assert afc_dsf_session_revision(legacy) != before
+
+
+def test_billed_ledger_is_compact_and_legacy_slot_keys_are_still_read():
+    s = sample_session()
+    first, last = s["apsPlanningData"][0]["date"], s["apsPlanningData"][2]["date"]
+    r = afc_dsf_compute(s, first, last, ["RAN"])
+    assert "billedSlotKeys" not in r
+    spans = {day["date"]: [f"{slot['start']}-{slot['end']}" for slot in day["slots"] if slot.get("afcCategory") == "RAN"] for day in s["apsPlanningData"][:3]}
+    assert r["billedLedger"] == {"a": {"RAN": spans}, "b": {"RAN": spans}}
+
+    legacy = sample_session()
+    keys = [f"s1|{sid}|{day['date']}|{slot['start']}|{slot['end']}|RAN" for sid in ("a", "b") for day in legacy["apsPlanningData"][:3] for slot in day["slots"] if slot.get("afcCategory") == "RAN"]
+    legacy_result = {k: v for k, v in r.items() if k != "billedLedger"}
+    legacy["afcDsfs"].append({"id": "old", "number": 1, "status": AFC_DSF_STATUS_FINALIZED, **legacy_result, "billedSlotKeys": keys, "billedSlots": [{}] * len(keys)})
+    summary = afc_dsf_summary(legacy, period_end=last)
+    assert summary["total"]["toInvoice"] == 0 and summary["total"]["billed"] == r["totalHours"]
+    assert legacy["afcDsfs"][0]["billedSlotKeys"] == keys and len(legacy["afcDsfs"][0]["billedSlots"]) == len(keys)
+
+
+def test_slots_added_after_billing_inside_a_billed_period_stay_billable():
+    s = sample_session()
+    r = afc_dsf_compute(s, "2026-12-04", "2026-12-11", ["SP"])
+    s["afcDsfs"].append({"id": "1", "number": 1, "status": AFC_DSF_STATUS_FINALIZED, **r})
+    sp_to_invoice = lambda: next(card for card in afc_dsf_summary(s, period_end="2026-12-11")["cards"] if card["code"] == "SP")["toInvoice"]
+    assert sp_to_invoice() == 0
+
+    days = {day["date"]: day for day in s["apsPlanningData"]}
+    billed_day = next(d for d in sorted(r["billedLedger"]["a"]["SP"]) if d in days)
+    gap_day = next(d for d in sorted(days) if "2026-12-04" < d < "2026-12-11" and d not in r["billedLedger"]["a"]["SP"])
+    for day, start, end in ((billed_day, "19:00", "20:00"), (gap_day, "19:00", "20:00")):
+        days[day]["slots"].append({"start": start, "end": end, "durationMinutes": 60, "afcCategory": "SP", "title": "SP ajouté"})
+
+    assert sp_to_invoice() == 4
+    extra = afc_dsf_compute(s, "2026-12-04", "2026-12-11", ["SP"])
+    assert extra["totalHours"] == 4
+    assert extra["billedLedger"]["a"]["SP"] == {billed_day: ["19:00-20:00"], gap_day: ["19:00-20:00"]}
+
 def test_period_without_hours_refused():
     s=sample_session()
     try: afc_dsf_compute(s,"2026-11-21","2026-11-22",["PAF"]); assert False
@@ -450,9 +524,10 @@ def test_afc_invoice_excel_snapshot_and_template_intact():
     assert not any(isinstance(c.value, str) and '#REF!' in c.value for row in ws.iter_rows() for c in row)
 
 
-def test_afc_invoice_routes_unique_and_historical_download(monkeypatch):
+def test_afc_invoice_routes_unique_and_historical_download(monkeypatch, tmp_path):
     import app as application
     application.app.config.update(TESTING=True, SECRET_KEY="test")
+    monkeypatch.setattr(application, "INVOICE_NUMBERS_DB", str(tmp_path / "invoices.db"))
     s=sample_session(); s["france_travail"]={"engagement_kairos":"41C32B061177","marche_afc":"51190"}
     d=s["apsPlanningData"][0]["date"]; r=afc_dsf_compute(s,d,d,["RAN"], hourly_rate="12.10")
     dsf={"id":"dsf1","number":"1","label":"DSF 1","status":AFC_DSF_STATUS_FINALIZED,"amountTotal":r["amountTotal"],"modules":["RAN"],"franceTravailExcelSnapshot":afc_dsf_session_snapshot(s,r,"1","12.10"), **r}
@@ -470,6 +545,62 @@ def test_afc_invoice_routes_unique_and_historical_download(monkeypatch):
         assert client.post('/api/sessions/s1/afc-dsf/dsf1/invoice', json=payload).status_code == 400
         assert client.get('/sessions/s1/afc-dsf/dsf1/invoice.xlsx').status_code == 200
 
+        other=dict(dsf, id="dsf2", invoice=None); s["afcDsfs"].append(other)
+        taken=client.post('/api/sessions/s1/afc-dsf/dsf2/invoice', json=payload)
+        assert taken.status_code == 400 and "déjà utilisé" in taken.json['error']
+        assert client.post('/api/sessions/s1/afc-dsf/dsf2/invoice', json={**payload, "invoice_number":"20260003"}).status_code == 200
+        assert client.get('/api/afc-invoices/numbering').json == {"ok": True, "nextNumber": "20260004", "gaps": []}
+
+
+def _invoice_client(monkeypatch, tmp_path):
+    import app as application
+    application.app.config.update(TESTING=True, SECRET_KEY="test")
+    monkeypatch.setattr(application, "INVOICE_NUMBERS_DB", str(tmp_path / "invoices.db"))
+    s=sample_session(); s["france_travail"]={"engagement_kairos":"41C32B061177","marche_afc":"51190"}
+    d=s["apsPlanningData"][0]["date"]; r=afc_dsf_compute(s,d,d,["RAN"], hourly_rate="12.10")
+    dsf={"id":"dsf1","number":"1","label":"DSF 1","status":AFC_DSF_STATUS_FINALIZED,"amountTotal":r["amountTotal"],"modules":["RAN"],"franceTravailExcelSnapshot":afc_dsf_session_snapshot(s,r,"1","12.10"), **r}
+    s["afcDsfs"].append(dsf); saved={"sessions":[s],"jurys":[]}
+    monkeypatch.setattr(application,"load_sessions",lambda: saved)
+    monkeypatch.setattr(application,"save_sessions",lambda data: saved.update(data))
+    client=application.app.test_client()
+    with client.session_transaction() as flask_session:
+        flask_session["admin_logged"] = True; flask_session["admin_session_version"] = application.ADMIN_SESSION_VERSION
+    return application, client, saved
+
+
+INVOICE_PAYLOAD={"invoice_number":"INV001","invoice_date":"2026-07-17","invoice_place":"PUGET SUR ARGENS","invoice_type":"intermediate"}
+
+
+def test_afc_invoice_created_by_another_worker_after_the_first_read_is_kept(monkeypatch, tmp_path):
+    from services import invoice_numbers
+    application, client, saved = _invoice_client(monkeypatch, tmp_path)
+    reserve=invoice_numbers.reserve
+
+    def reserve_while_another_worker_saves(db_path, sid, dsf_id, number=None):
+        result=reserve(db_path, sid, dsf_id, number)
+        if number == "INV001":
+            reserve(db_path, sid, dsf_id, "INV002")
+            saved["sessions"][0]["afcDsfs"][0]["invoice"]={"status":"generated","invoice_number":"INV002"}
+        return result
+
+    monkeypatch.setattr(application.invoice_numbers, "reserve", reserve_while_another_worker_saves)
+    resp=client.post('/api/sessions/s1/afc-dsf/dsf1/invoice', json=INVOICE_PAYLOAD)
+    assert resp.status_code == 400 and "existe déjà" in resp.json['error']
+    assert saved['sessions'][0]['afcDsfs'][0]['invoice']['invoice_number'] == 'INV002'
+    assert not invoice_numbers.is_taken(application.INVOICE_NUMBERS_DB, "INV001")
+    assert invoice_numbers.is_taken(application.INVOICE_NUMBERS_DB, "INV002")
+
+
+def test_deleting_a_session_releases_its_invoice_numbers(monkeypatch, tmp_path):
+    from services import invoice_numbers
+    application, client, saved = _invoice_client(monkeypatch, tmp_path)
+    assert client.post('/api/sessions/s1/afc-dsf/dsf1/invoice', json=INVOICE_PAYLOAD).status_code == 200
+    assert invoice_numbers.is_taken(application.INVOICE_NUMBERS_DB, "INV001")
+
+    assert client.post('/sessions/s1/delete').status_code == 302
+    assert saved["sessions"] == []
+    assert not invoice_numbers.is_taken(application.INVOICE_NUMBERS_DB, "INV001")
+
 
 def test_afc_invoice_button_visibility(monkeypatch):
     s=sample_session(); d=s["apsPlanningData"][0]["date"]; r=afc_dsf_compute(s,d,d,["RAN"])
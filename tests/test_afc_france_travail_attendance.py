@@ -4,6 +4,8 @@ import hashlib, sys
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 
 from openpyxl import load_workbook
+from openpyxl.cell.cell import MergedCell
+import services.afc_france_travail_attendance as attendance
 from services.afc_france_travail_attendance import (
     is_afc_session, update_afc_france_travail_settings, save_france_travail_ids,
     preview, generate_france_travail_workbook, build_session_weeks, build_week_schedule,
@@ -244,3 +246,76 @@ def test_france_travail_same_visual_slot_ft_and_sp_never_counts_six_hours():
     assert ws["M14"].value == 2
     assert ws["M15"].value == 2
     assert ws["M19"].value == 8
+
+
+def _workbook_signature(bio):
+    wb = load_workbook(bio); out = {"sheets": wb.sheetnames, "active": wb.active.title}
+    for ws in wb.worksheets:
+        cells = {}
+        for r in range(1, ws.max_row + 3):
+            for c in range(1, 15):
+                cell = ws.cell(r, c)
+                if isinstance(cell, MergedCell):
+                    continue
+                fill = cell.fill.fill_type if cell.fill.fill_type != "none" else None
+                cells[cell.coordinate] = (cell.value, cell.number_format, fill, fill and cell.fill.fgColor.rgb, *map(repr, (cell.font, cell.border, cell.alignment, cell.protection)))
+        out[ws.title] = {
+            "cells": cells, "max_row": ws.max_row, "heights": {r: ws.row_dimensions[r].height for r in range(1, ws.max_row + 3)},
+            "widths": {k: d.width for k, d in ws.column_dimensions.items()}, "merged": sorted(map(str, ws.merged_cells.ranges)),
+            "print": (ws.print_area, ws.freeze_panes, ws.page_setup.orientation, ws.page_setup.fitToWidth, ws.page_setup.fitToHeight, ws.sheet_properties.pageSetUpPr.fitToPage),
+        }
+    return out
+
+
+def test_xml_writer_matches_openpyxl_writer():
+    many_trainers = sample_session(5)
+    for i, day in enumerate(many_trainers["apsPlanningData"]):
+        for j, sl in enumerate(day["slots"]):
+            sl["trainer"] = f"Formateur {(i + j) % 6}"
+    for s in (sample_session(2), sample_session(4), sample_session(13), many_trainers):
+        expected = _workbook_signature(generate_france_travail_workbook(s, ROOT, writer="openpyxl"))
+        assert _workbook_signature(generate_france_travail_workbook(s, ROOT, writer="xml")) == expected
+
+
+def test_xml_cells_read_back_template_values_fills_and_formats_like_openpyxl():
+    from copy import copy
+
+    from openpyxl.styles import PatternFill
+    from services import xlsx_xml_writer
+
+    formats = set()
+    for path in (attendance.existing_template_path(ROOT), ROOT / "static" / "upload" / "facture.xlsx"):
+        package = xlsx_xml_writer.load_package(path)
+        workbook = xlsx_xml_writer.XmlWorkbook(package)
+        for reference in load_workbook(path):
+            ws = workbook.copy_worksheet(reference.title, "Copie")
+            for row in reference.iter_rows():
+                for cell in row:
+                    if isinstance(cell, MergedCell):
+                        continue
+                    xml_cell = ws.cell(cell.row, cell.column)
+                    assert (xml_cell.value, xml_cell.number_format, xml_cell.fill) == (cell.value, cell.number_format, copy(cell.fill)), cell.coordinate
+                    formats.add(cell.number_format)
+    assert len(formats) > 1
+    ws = workbook.worksheets[0]
+
+    grey = PatternFill("solid", fgColor="D9D9D9")
+    cell = ws.cell(40, 3)
+    cell.value, cell.fill, cell.number_format = 7.5, grey, "0.0"
+    assert (cell.value, cell.fill, cell.number_format) == (7.5, grey, "0.0")
+
+
+def test_planning_index_matches_per_week_scan_and_preview_is_cached_per_revision(monkeypatch):
+    s = sample_session(4); s["id"] = "index-cache"
+    index = attendance.build_planning_index(s)
+    for week in index.weeks:
+        assert index.schedule(week) == build_week_schedule(s, week)
+        assert index.trainees(week) == get_week_trainees(s, week)
+
+    calls = []
+    compute = attendance.compute_preview
+    monkeypatch.setattr(attendance, "compute_preview", lambda session: calls.append(session["id"]) or compute(session))
+    first = preview(s); first["weekCount"] = 99
+    assert preview(s)["weekCount"] == 3 and len(calls) == 1
+    s["apsAttendanceStudents"].append({"id": "s9", "lastName": "NOUVEAU", "firstName": "Stagiaire"})
+    assert preview(s)["studentCount"] == 5 and len(calls) == 2
@@ -61,3 +61,79 @@ def test_aps_attendance_pdf_text_parser_keeps_only_numbered_student_rows():
         "phone": "06 11 86 50 49",
     }
     assert all(student["lastName"] != "TROUVÉS" for student in students)
+
+
+def _list_pdf(pages):
+    import io
+
+    from reportlab.pdfgen import canvas
+
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer)
+    for lines in pages:
+        for index, line in enumerate(lines):
+            c.drawString(40, 800 - 14 * index, line)
+        c.showPage()
+    c.save()
+    return buffer.getvalue()
+
+
+def test_trainee_pdf_is_read_in_memory_in_parallel_or_not(monkeypatch):
+    from services import trainee_lists
+
+    rows = [line for line in APS_STUDENTS_TEXT.splitlines() if line[:1].isdigit() and "trouvés" not in line]
+    pages = [["Liste stagiaires - APS JUILLET 2026"]] + [rows[index:index + 2] for index in range(0, len(rows), 2)]
+    pages += [["Conditions générales"]]
+    data = _list_pdf(pages)
+
+    monkeypatch.setattr(trainee_lists, "TRAINEE_PDF_PARALLEL_MIN_PAGES", 2)
+    sequential, has_text = trainee_lists.students_from_pdf(data, workers=1)
+    assert has_text and sequential == aps_extract_students_from_text(APS_STUDENTS_TEXT)
+    assert trainee_lists.students_from_pdf(data, workers=3) == (sequential, True)
+
+
+def test_trainee_pdf_keeps_trainees_after_an_interleaved_page(monkeypatch):
+    from services import trainee_lists
+
+    pages = [
+        ["Liste stagiaires - APS JUILLET 2026", "1 DUPONT Jean jean.dupont@example.fr 06 12 34 56 78"],
+        ["2 MARTIN Claire claire.martin@example.fr 06 22 33 44 55"],
+        ["Informations pratiques", "Accès au centre de formation"],
+        ["3 BERNARD Luc luc.bernard@example.fr 07 11 22 33 44"],
+        ["4 PETIT Anne anne.petit@example.fr 06 99 88 77 66"],
+    ]
+    data = _list_pdf(pages)
+
+    monkeypatch.setattr(trainee_lists, "TRAINEE_PDF_PARALLEL_MIN_PAGES", 2)
+    monkeypatch.setattr(trainee_lists, "PAGES_PER_TASK", 2)
+    sequential, has_text = trainee_lists.students_from_pdf(data, workers=1)
+    assert has_text
+    assert [student["lastName"] for student in sequential] == ["DUPONT", "MARTIN", "BERNARD", "PETIT"]
+    assert sequential[2] == {
+        "lastName": "BERNARD", "firstName": "Luc", "email": "luc.bernard@example.fr", "phone": "07 11 22 33 44",
+    }
+    assert trainee_lists.students_from_pdf(data, workers=2) == (sequential, True)
+
+
+def test_trainee_csv_and_xlsx_lists_are_parsed_by_header():
+    import io
+
+    from openpyxl import Workbook
+
+    from services import trainee_lists
+
+    csv_data = "Liste APS;;\nPrénom;NOM;E-mail;Téléphone;Date d'entrée\nOcéane;Lassouag;oceane@example.fr;06.20.20.20.20;02/03/2026\n;;\nJean;DUPONT;;+33 6 11 22 33 44;\n".encode("cp1252")
+    students, has_text = trainee_lists.students_from_upload("liste.csv", io.BytesIO(csv_data))
+    assert has_text and students == [
+        {"lastName": "LASSOUAG", "firstName": "Océane", "email": "oceane@example.fr", "phone": "06 20 20 20 20", "startDate": "2026-03-02"},
+        {"lastName": "DUPONT", "firstName": "Jean", "phone": "06 11 22 33 44"},
+    ]
+
+    workbook = Workbook()
+    workbook.active.append(["Stagiaire", "Portable"])
+    workbook.active.append(["MARTIN Marie", 612345678])
+    workbook.active.append(["MARTIN Marie", 612345678])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    buffer.seek(0)
+    assert trainee_lists.students_from_upload("liste.xlsx", buffer) == ([{"lastName": "MARTIN", "firstName": "Marie", "phone": "06 12 34 56 78"}], True)
@@ -0,0 +1,26 @@
+import json
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+import run as benchmarks
+
+
+def test_benchmark_json_output_and_regression_compare(tmp_path):
+    output = tmp_path / "bench.json"
+    assert benchmarks.main(["--filter", "build_ssiap1_planning_data", "--repeat", "2", "--warmup", "0", "--output", str(output)]) == 0
+
+    report = json.loads(output.read_text(encoding="utf-8"))
+    [result] = report["results"]
+    assert report["schema"] == benchmarks.SCHEMA_VERSION
+    assert result["key"] == "build_ssiap1_planning_data" and result["group"] == "planning"
+    assert result["wall_s"]["min"] <= result["wall_s"]["median"] <= result["wall_s"]["max"]
+    assert result["peak_kib"] > 0
+
+    # Une référence 1000 fois plus rapide doit être signalée comme régression.
+    result["wall_s"]["median"] /= 1000
+    baseline = tmp_path / "baseline.json"
+    baseline.write_text(json.dumps(report), encoding="utf-8")
+    assert benchmarks.main(["--filter", "build_ssiap1_planning_data", "--repeat", "1", "--warmup", "0", "--no-memory", "--compare", str(baseline)]) == 1
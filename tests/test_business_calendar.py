@@ -0,0 +1,71 @@
+from datetime import date, timedelta
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from business_calendar import (
+    WorkingDayCalendar,
+    easter_date,
+    exam_excluded_days,
+    french_public_holidays,
+    get_calendar,
+    is_working_day,
+    normalize_ranges,
+)
+
+
+def _naive_working(day, interruptions=(), allow_saturday=False, excluded=()):
+    return (
+        day.weekday() <= (5 if allow_saturday else 4)
+        and day not in french_public_holidays(day.year)
+        and day not in excluded
+        and not any(start <= day <= end for start, end in interruptions)
+    )
+
+
+def test_french_public_holidays_2026():
+    assert easter_date(2026) == date(2026, 4, 5)
+    assert {date(2026, 1, 1), date(2026, 4, 6), date(2026, 5, 14), date(2026, 5, 25)} <= french_public_holidays(2026)
+    assert len(french_public_holidays(2026)) == 11
+    assert not is_working_day(date(2026, 5, 1))
+    assert is_working_day(date(2026, 5, 2), allow_saturday=True)
+
+
+def test_calendar_matches_day_by_day_walk():
+    interruptions = [(date(2026, 12, 23), date(2027, 1, 4)), (date(2027, 4, 10), date(2027, 4, 20))]
+    excluded = {date(2027, 3, 3)}
+    calendar = WorkingDayCalendar(interruptions, excluded_days=excluded)
+    start, end = date(2026, 9, 1), date(2027, 6, 30)
+    expected = [start + timedelta(days=n) for n in range((end - start).days + 1)]
+    expected = [day for day in expected if _naive_working(day, interruptions, excluded=excluded)]
+
+    assert calendar.working_days(start, end) == expected
+    assert calendar.count_between(start, end) == len(expected)
+    assert calendar.nth_working_day(start, 57) == expected[56]
+    assert calendar.next_working_day(date(2026, 12, 22)) == date(2027, 1, 5)
+    assert calendar.is_interrupted(date(2027, 1, 4)) and not calendar.is_interrupted(date(2027, 1, 5))
+    assert not calendar.is_working_day(date(2027, 3, 3))
+
+
+def test_nth_working_day_extends_beyond_precomputed_years():
+    calendar = WorkingDayCalendar()
+    day = calendar.nth_working_day(date(2026, 1, 1), 2000)
+    assert calendar.count_between(date(2026, 1, 1), day) == 2000
+    assert calendar.is_working_day(day)
+    assert calendar.count_between(date(2015, 1, 1), date(2015, 12, 31)) == 252
+
+
+def test_active_weeks_skip_interrupted_weeks():
+    calendar = get_calendar([(date(2026, 12, 21), date(2027, 1, 3))])
+    weeks = calendar.active_weeks(date(2026, 12, 14), 3)
+    assert weeks == [(2026, 51), (2027, 1), (2027, 2)]
+    assert calendar.week_working_days(date(2027, 1, 6)) == 5
+
+
+def test_get_calendar_is_memoised_per_configuration():
+    ranges = [(date(2027, 1, 4), date(2026, 12, 23)), (date(2026, 12, 1), date(2026, 12, 24))]
+    assert normalize_ranges(ranges) == ((date(2026, 12, 1), date(2027, 1, 4)),)
+    assert get_calendar(ranges) is get_calendar(list(reversed(ranges)))
+    assert get_calendar(excluded_days=exam_excluded_days("2026-07-31")) is not get_calendar()
+    assert exam_excluded_days("pas une date") == frozenset()
@@ -35,7 +35,7 @@ def _pdf(tmp_path):
 def test_desp_and_aps_share_the_same_pdf_renderer_components():
     src = inspect.getsource(app.generate_aps_planning_pdf)
     assert "planning_pdf_profile" in src
-    assert "planning_card_height" in src
+    assert "planning_card_layout" in src
     assert "planning_day_height" in src
     assert "draw_legend" in src
     assert "summary_table_header" in src
@@ -306,3 +306,16 @@ def test_desp_attendance_dynamic_layout_accepts_four_modules_and_wrapped_room(tm
     assert "DESP-P99" in last_page_text
     assert "DESP-P98" in last_page_text
     assert "Page 9 / 9" in last_page_text
+
+
+def test_planning_card_layout_wraps_once_for_pagination_and_drawing():
+    slot = {"partNumber": 1, "sequenceNumber": 2, "sequenceTitle": "Cadre juridique de la sécurité privée et déontologie professionnelle", "subpartItems": ["Code de la sécurité intérieure", "Livre VI et contrôle du CNAPS par les agents habilités"], "subpartProgressLabel": "Partie 1 / 2", "trainer": "Jean Dupont", "modality": "presentiel"}
+    printable_width = 523.2755905511812
+    app.text_width.cache_clear()
+    layout = app.planning_card_layout(slot, printable_width, "Salle A")
+    assert layout["height"] == app.planning_card_height(slot, printable_width)
+    assert layout["title"] == app.wrap_text_lines(app.planning_slot_title(slot), printable_width - 32, "Helvetica-Bold", 9.4)
+    assert layout["meta"] == ["Formateur : Jean Dupont • Salle : Salle A"]
+    misses = app.text_width.cache_info().misses
+    app.planning_card_layout(slot, printable_width, "Salle A")
+    assert app.text_width.cache_info().misses == misses
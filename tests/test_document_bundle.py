@@ -0,0 +1,109 @@
+import io
+import json
+import os
+import sys
+import time
+import zipfile
+from datetime import date
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import app
+from services import document_bundle
+
+
+def write_document(directory, calls, name, fail=False, block_in_child_of=None):
+    with open(calls, "a", encoding="utf-8") as handle:
+        handle.write(name + "\n")
+    if block_in_child_of is not None and os.getpid() != block_in_child_of:
+        time.sleep(60)  # Processus bloqué : la tâche doit être reprise dans le processus appelant.
+    if fail:
+        raise ValueError(f"{name} impossible")
+    path = Path(directory) / f"{name}.txt"
+    path.write_text(name, encoding="utf-8")
+    return [(f"{name}/{path.name}", str(path))]
+
+
+def test_task_graph_skips_dependents_of_failures_and_reuses_cached_outputs(tmp_path):
+    calls = str(tmp_path / "calls.log")
+    tasks = [
+        document_bundle.BundleTask("contrats", write_document, args=(calls, "contrats"), depends=("planning",)),
+        document_bundle.BundleTask("planning", write_document, args=(calls, "planning"), key="v1"),
+        document_bundle.BundleTask("dsf", write_document, args=(calls, "dsf", True)),
+        document_bundle.BundleTask("facture", write_document, args=(calls, "facture"), depends=("dsf",)),
+    ]
+    for workers in (2, 1):
+        results = {result["task"]: result for result in document_bundle.run(tasks, tmp_path / "cache", tmp_path / f"work{workers}", workers=workers)}
+        assert results["contrats"]["status"] == "ok" and results["dsf"]["status"] == "error"
+        assert results["facture"]["status"] == "skipped"
+    assert results["planning"]["cached"] is True
+    log = Path(calls).read_text(encoding="utf-8").split()
+    assert log.count("planning") == 1
+    assert "facture" not in log
+
+    manifest = {"documents": list(results)}
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(document_bundle.stream_zip(list(results.values()), manifest))))
+    assert sorted(archive.namelist()) == ["contrats/contrats.txt", "manifest.json", "planning/planning.txt"]
+    assert archive.read("planning/planning.txt") == b"planning"
+
+
+def test_a_stuck_task_process_is_stopped_and_rebuilt_in_the_caller(tmp_path):
+    calls = str(tmp_path / "calls.log")
+    tasks = [document_bundle.BundleTask("planning", write_document, args=(calls, "planning", False, os.getpid()), key="v1")]
+    started = time.monotonic()
+    [result] = document_bundle.run(tasks, tmp_path / "cache", tmp_path / "work", workers=2, timeout=2)
+    assert time.monotonic() - started < 30
+    assert result["status"] == "ok" and not result["cached"]
+    assert Path(result["files"][0][1]).read_text(encoding="utf-8") == "planning"
+
+
+def test_old_cache_keys_are_kept_while_they_may_still_be_streamed(tmp_path):
+    calls = str(tmp_path / "calls.log")
+    for key in ("v1", "v2"):
+        document_bundle.run([document_bundle.BundleTask("planning", write_document, args=(calls, "planning"), key=key)], tmp_path / "cache", tmp_path / "work", workers=1)
+    task_root = tmp_path / "cache" / "planning"
+    # Une archive servie avec v1 peut encore être en cours d'envoi : v1 reste.
+    assert sorted(entry.name for entry in task_root.iterdir()) == ["v1", "v2"]
+
+    old = time.time() - document_bundle.CACHE_GRACE_SECONDS - 60
+    os.utime(task_root / "v1", (old, old))
+    document_bundle.run([document_bundle.BundleTask("planning", write_document, args=(calls, "planning"), key="v3")], tmp_path / "cache", tmp_path / "work", workers=1)
+    assert sorted(entry.name for entry in task_root.iterdir()) == ["v2", "v3"]
+
+
+def test_session_bundle_route_streams_documents_and_manifest(tmp_path, monkeypatch):
+    planning, _, _ = app.build_aps_planning_data(date(2026, 3, 2), "Jean Dupont", "Salle 1", "full_presentiel", end_date=date(2026, 4, 10), exam_iso="2026-04-13")
+    for name in ("PLANNING_DIR", "APS_ATTENDANCE_DIR", "APS_CONTRACT_DIR", "CONVOCATION_DIR", "DOCUMENT_BUNDLE_DIR", "DSF_DIR"):
+        (tmp_path / name).mkdir()
+        monkeypatch.setattr(app, name, str(tmp_path / name))
+    (tmp_path / "CONVOCATION_DIR" / "convocation_aps_session_aps-test_t1.pdf").write_bytes(b"%PDF-1.4 convocation")
+    (tmp_path / "CONVOCATION_DIR" / "convocation_aps_session_autre_t1.pdf").write_bytes(b"%PDF-1.4 autre")
+    session_data = {
+        "id": "aps-test", "formation": "APS", "date_debut": "2026-03-02", "date_fin": "2026-04-10", "date_exam": "2026-04-13",
+        "planning_pdf": "planning_aps_session_aps-test.pdf", "apsPlanningMode": "full_presentiel", "apsPlanningData": planning,
+        "apsAttendanceStudents": [{"lastName": f"NOM{index}", "firstName": "Prénom"} for index in range(3)],
+        "apsTrainerContracts": [{"id": "c1", "trainerName": "Jean Dupont", "pdfFilename": "contrat_c1.pdf", "interventions": app.aps_trainer_interventions(planning, "Jean Dupont")["interventions"], "totalHT": 100}],
+    }
+    monkeypatch.setattr(app, "load_sessions", lambda: {"sessions": [session_data], "jurys": []})
+
+    app.app.config.update(TESTING=True, SECRET_KEY="test")
+    with app.app.test_client() as client:
+        with client.session_transaction() as session:
+            session["admin_logged"] = True
+            session["admin_session_version"] = app.ADMIN_SESSION_VERSION
+        responses = [client.get("/sessions/aps-test/documents/bundle.zip") for _ in range(2)]
+
+    for response in responses:
+        assert response.status_code == 200 and response.mimetype == "application/zip"
+    archive = zipfile.ZipFile(io.BytesIO(responses[1].data))
+    assert sorted(archive.namelist()) == [
+        "contrats_formateurs/contrat_c1.pdf", "convocations/convocation_aps_session_aps-test_t1.pdf",
+        "feuilles_presence/feuilles_presence_aps_aps-test.pdf", "manifest.json", "planning/planning_aps_session_aps-test.pdf",
+    ]
+    manifest = json.loads(archive.read("manifest.json"))
+    documents = {document["task"]: document for document in manifest["documents"]}
+    assert all(document["status"] == "ok" for document in documents.values())
+    assert documents["planning"]["cached"] and documents["feuilles_presence"]["cached"]
+    assert archive.read("planning/planning_aps_session_aps-test.pdf").startswith(b"%PDF")
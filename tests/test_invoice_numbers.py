@@ -0,0 +1,55 @@
+import multiprocessing
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from services import invoice_numbers
+
+
+def test_reserve_is_unique_idempotent_and_advances_the_sequence(tmp_path):
+    db = tmp_path / "invoices.db"
+    assert invoice_numbers.next_number(db) == str(invoice_numbers.default_first_number())
+
+    assert invoice_numbers.reserve(db, "s1", "dsf1", "20260010") == "20260010"
+    assert invoice_numbers.reserve(db, "s1", "dsf1", "20260010") == "20260010"
+    with pytest.raises(invoice_numbers.InvoiceNumberTaken):
+        invoice_numbers.reserve(db, "s1", "dsf2", "20260010")
+    assert invoice_numbers.is_taken(db, "20260010", "s1", "dsf2")
+    assert not invoice_numbers.is_taken(db, "20260010", "s1", "dsf1")
+
+    assert invoice_numbers.reserve(db, "s1", "dsf2", "FA-2026-A") == "FA-2026-A"
+    assert invoice_numbers.next_number(db) == "20260011"
+    assert invoice_numbers.reserve(db, "s2", "dsf1") == "20260011"
+
+    assert invoice_numbers.release(db, "s1", "dsf1")
+    assert not invoice_numbers.is_taken(db, "20260010")
+    assert invoice_numbers.next_number(db) == "20260012"
+
+
+def test_sync_and_gap_report(tmp_path):
+    db = tmp_path / "invoices.db"
+    assert invoice_numbers.sync(db, [("100", "s1", "a"), ("101", "s1", "b"), ("104", "s2", "a"), ("", "s2", "b"), ("INV-X", "s3", "a")]) == 4
+    assert invoice_numbers.sync(db, [("100", "s1", "a")]) == 0
+    assert invoice_numbers.next_number(db) == "105"
+    assert invoice_numbers.gaps(db) == [{"from": 102, "to": 103, "count": 2}]
+
+
+def _reserve_many(args):
+    db, worker = args
+    return [invoice_numbers.reserve(db, f"s{worker}", f"dsf{index}") for index in range(10)]
+
+
+def test_concurrent_allocations_never_share_a_number(tmp_path):
+    db = str(tmp_path / "invoices.db")
+    invoice_numbers.sync(db, [("1000", "seed", "seed")])
+    with ThreadPoolExecutor(max_workers=4) as threads, ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("spawn")) as processes:
+        results = list(threads.map(_reserve_many, [(db, worker) for worker in range(4)]))
+        results += list(processes.map(_reserve_many, [(db, worker) for worker in range(4, 6)]))
+    numbers = [int(number) for batch in results for number in batch]
+    assert len(set(numbers)) == 60
+    assert sorted(numbers) == list(range(1001, 1061))
+    assert invoice_numbers.gaps(db) == []
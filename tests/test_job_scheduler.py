@@ -0,0 +1,151 @@
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import app
+from services import job_scheduler
+
+
+def test_lease_is_exclusive_and_orphaned_runs_are_reclaimed(tmp_path):
+    db = tmp_path / "scheduler.db"
+    now = datetime(2026, 3, 2, 8, 0)
+    assert job_scheduler.acquire_lease(db, "a", 60, now)
+    assert not job_scheduler.acquire_lease(db, "b", 60, now + timedelta(seconds=30))
+    assert job_scheduler.acquire_lease(db, "a", 60, now + timedelta(seconds=30))
+
+    job_scheduler.enqueue(db, "scan", due_at=now)
+    assert [entry["job"] for entry in job_scheduler.claim_due(db, "a", 5, now)] == ["scan"]
+    assert job_scheduler.claim_due(db, "a", 5, now) == []
+
+    # « a » disparaît : « b » obtient le bail après expiration et reprend l'exécution laissée en cours.
+    assert job_scheduler.acquire_lease(db, "b", 60, now + timedelta(seconds=91))
+    assert job_scheduler.lease(db)["holder"] == "b"
+    assert [entry["job"] for entry in job_scheduler.claim_due(db, "b", 5, now + timedelta(seconds=91))] == ["scan"]
+
+
+def test_a_running_job_that_keeps_reporting_is_not_claimed_twice(tmp_path):
+    db = tmp_path / "scheduler.db"
+    now = datetime(2026, 3, 2, 8, 0)
+    job_scheduler.enqueue(db, "relances", due_at=now)
+    # Sans bail valide, rien n'est réservé.
+    assert job_scheduler.claim_due(db, "a", 5, now) == []
+    assert job_scheduler.acquire_lease(db, "a", 90, now)
+    [entry] = job_scheduler.claim_due(db, "a", 5, now)
+
+    # « a » est lent : son bail expire, mais la tâche est toujours signalée comme active.
+    job_scheduler.heartbeat(db, "a", [entry["id"]], now + timedelta(seconds=80))
+    job_scheduler.enqueue(db, "relances", due_at=now + timedelta(seconds=85))
+    later = now + timedelta(seconds=120)
+    assert job_scheduler.acquire_lease(db, "b", 90, later)
+    assert job_scheduler.claim_due(db, "b", 5, later) == []
+    assert job_scheduler.claim_due(db, "a", 5, later) == []
+
+    # Plus aucun signal depuis la durée du bail : l'exécution est reprise.
+    assert [row["id"] for row in job_scheduler.claim_due(db, "b", 5, now + timedelta(seconds=171))] == [entry["id"]]
+
+
+def test_scheduler_extends_its_lease_while_a_long_job_runs(tmp_path):
+    db = tmp_path / "scheduler.db"
+    release = threading.Event()
+    runs = []
+
+    def slow(payload):
+        runs.append(payload)
+        release.wait(10)
+
+    a = job_scheduler.Scheduler(db, {"slow": slow}, lease_seconds=3)
+    b = job_scheduler.Scheduler(db, {"slow": slow}, lease_seconds=3)
+    a.enqueue("slow")
+    assert [entry["job"] for entry in a.run_once()] == ["slow"]
+    time.sleep(4.5)
+    assert job_scheduler.lease(db)["holder"] == a.holder
+    assert b.run_once() == [] and not b.is_leader
+    release.set()
+    assert a.wait_idle()
+    a.stop()
+    assert len(runs) == 1
+
+
+def test_queue_orders_by_due_time_coalesces_and_bounds_concurrency(tmp_path):
+    db = tmp_path / "scheduler.db"
+    now = datetime.now().replace(microsecond=0)
+    release = threading.Event()
+    started = []
+
+    def job(name):
+        def run(payload):
+            started.append((name, payload))
+            release.wait(10)
+            return {"name": name}
+        return run
+
+    def failing(payload):
+        release.wait(10)
+        raise ValueError("source indisponible")
+
+    scheduler = job_scheduler.Scheduler(db, {"a": job("a"), "b": job("b"), "c": job("c"), "boom": failing}, max_workers=2)
+    scheduler.enqueue("c", due_at=now - timedelta(minutes=1))
+    scheduler.enqueue("b", {"n": 1}, due_at=now - timedelta(minutes=5))
+    assert scheduler.enqueue("b", {"n": 2}, due_at=now - timedelta(minutes=10))[1] is False
+    scheduler.enqueue("a", due_at=now + timedelta(hours=1))
+    scheduler.enqueue("boom", due_at=now - timedelta(minutes=2))
+
+    assert [entry["job"] for entry in scheduler.run_once()] == ["b", "boom"]
+    assert scheduler.run_once() == []
+    assert scheduler.wait_idle(timeout=0.3) is False
+    release.set()
+    assert scheduler.wait_idle()
+    assert [entry["job"] for entry in scheduler.run_once()] == ["c"]
+    assert scheduler.wait_idle()
+
+    assert started[0] == ("b", {"n": 2})
+    assert [entry["job"] for entry in job_scheduler.list_queue(db)] == ["a"]
+    history = {entry["job"]: entry for entry in job_scheduler.list_history(db)}
+    assert history["boom"]["status"] == "failed" and "source indisponible" in history["boom"]["error"]
+    assert history["c"]["status"] == "done" and history["c"]["result"] == '{"name": "c"}'
+
+
+def test_recurrences_catch_up_missed_slots_only_after_a_first_run():
+    daily = job_scheduler.parse_recurrence("07:00")
+    now = datetime(2026, 3, 2, 9, 0)
+    assert daily.next_due(now, None) == datetime(2026, 3, 3, 7, 0)
+    assert daily.next_due(now, datetime(2026, 3, 1, 7, 0)) == now
+    assert daily.next_due(now, datetime(2026, 3, 2, 7, 0)) == datetime(2026, 3, 3, 7, 0)
+    every = job_scheduler.parse_recurrence("30m")
+    assert every.next_due(now, None) == now
+    assert every.next_due(now, datetime(2026, 3, 2, 8, 50)) == datetime(2026, 3, 2, 9, 20)
+
+
+def test_cron_routes_only_enqueue_and_the_leader_runs_the_job(tmp_path, monkeypatch):
+    db = tmp_path / "scheduler.db"
+    calls = []
+    scheduler = job_scheduler.Scheduler(db, {
+        "sessions_check": lambda payload: calls.append(("sessions_check", payload)),
+        "formateur_expiration_alerts": lambda payload: calls.append(("formateur_expiration_alerts", payload)),
+        "prospect_scan": lambda payload: calls.append(("prospect_scan", payload)),
+    })
+    monkeypatch.setattr(app, "job_scheduler_instance", scheduler)
+    monkeypatch.setattr(app, "start_job_scheduler", lambda: None)
+    monkeypatch.setitem(app.app.extensions, "job_scheduler", scheduler)
+    monkeypatch.setenv("CRON_SECRET", "secret")
+
+    with app.app.test_client() as client:
+        for _ in range(2):
+            assert client.get("/cron-check", base_url="https://gestion.example.com").status_code == 202
+        response = client.get("/cron-prospects-scan?key=secret")
+    assert response.status_code == 202 and response.get_json()["queued"] is True
+    assert calls == []
+    assert len(job_scheduler.list_queue(db)) == 3
+
+    scheduler.run_once()
+    assert scheduler.wait_idle()
+    scheduler.run_once()
+    assert scheduler.wait_idle()
+    assert sorted(name for name, _ in calls) == ["formateur_expiration_alerts", "prospect_scan", "sessions_check"]
+    assert ("sessions_check", {"base_url": "https://gestion.example.com"}) in calls
+    assert job_scheduler.list_queue(db) == []
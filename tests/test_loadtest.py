@@ -0,0 +1,59 @@
+import json
+import smtplib
+import ssl
+import sys
+import urllib.request
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+import loadtest
+from stubs import StubHTTPServer, StubSMTPServer, self_signed_certificate
+
+
+def test_summary_reports_percentiles_and_error_rates():
+    samples = [loadtest.Sample("sessions_list", 200, ms / 1000) for ms in range(1, 101)]
+    samples += [loadtest.Sample("data_json", 500, 0.01, "HTTP 500"), loadtest.Sample("data_json", 200, 0.02)]
+
+    summary = loadtest.summarize(samples, elapsed=2.0)
+
+    listing = summary["routes"]["sessions_list"]
+    assert listing["latency_ms"]["p50"] == 50.0 and listing["latency_ms"]["p99"] == 99.0 and listing["latency_ms"]["max"] == 100.0
+    assert listing["throughput_rps"] == 50.0 and listing["error_rate"] == 0
+    assert summary["routes"]["data_json"]["error_rate"] == 0.5
+    assert summary["routes"]["data_json"]["errors"] == {"HTTP 500": 1}
+    assert summary["requests"] == 102 and summary["throughput_rps"] == 51.0
+
+
+def test_stub_services_answer_like_the_real_apis(tmp_path):
+    http_stub = StubHTTPServer(pending_documents=3).start()
+    certfile, keyfile = self_signed_certificate(tmp_path) or (None, None)
+    smtp_stub = StubSMTPServer(certfile=certfile, keyfile=keyfile).start()
+    try:
+        env = http_stub.env()
+        request = urllib.request.Request(
+            f"{env['BREVO_API_BASE_URL']}/v3/smtp/email", method="POST",
+            data=json.dumps({"messageVersions": [{}, {}]}).encode(), headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request) as response:
+            assert response.status == 201 and len(json.load(response)["messageIds"]) == 2
+        with urllib.request.urlopen(env["STAGIAIRES_DOCS_TO_CONTROL_URL"]) as response:
+            assert json.load(response) == {"pending_count": 3}
+        with urllib.request.urlopen(f"{env['RNE_SEARCH_API_URL']}?q=formation") as response:
+            assert json.load(response)["results"]
+        assert http_stub.requests == {"brevo": 1, "stagiaires": 1, "annuaire": 1}
+
+        smtp_env = smtp_stub.env()
+        with smtplib.SMTP(smtp_env["SMTP_SERVER"], int(smtp_env["SMTP_PORT"]), timeout=10) as server:
+            if certfile:
+                context = ssl.create_default_context()
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+                server.starttls(context=context)
+            server.login(smtp_env["FROM_EMAIL"], smtp_env["EMAIL_PASSWORD"])
+            server.sendmail(smtp_env["FROM_EMAIL"], ["stagiaire@example.com"], "Subject: test\r\n\r\nBonjour")
+        assert smtp_stub.messages == 1
+    finally:
+        http_stub.stop()
+        smtp_stub.stop()
@@ -0,0 +1,317 @@
+import json
+import smtplib
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import app as application
+from services import outbound_mail
+from services.outbound_mail import (
+    BrevoSettings,
+    DeliveryResult,
+    OutboundEmail,
+    SmtpConnectionPool,
+    SmtpSettings,
+    send_brevo,
+    send_smtp,
+)
+
+
+class FakeSMTP:
+    """Connexion SMTP factice : journalise les commandes, peut simuler une coupure."""
+
+    instances = []
+
+    def __init__(self, server, port, timeout=None):
+        self.server = server
+        self.port = port
+        self.commands = []
+        self.sent = []
+        self.disconnect_next = False
+        self.noop_code = 250
+        FakeSMTP.instances.append(self)
+
+    def starttls(self):
+        self.commands.append("STARTTLS")
+
+    def login(self, login, password):
+        self.commands.append("LOGIN")
+        if password == "bad":
+            raise smtplib.SMTPAuthenticationError(535, b"Authentication failed")
+
+    def noop(self):
+        self.commands.append("NOOP")
+        return (self.noop_code, b"OK")
+
+    def sendmail(self, from_email, recipients, raw):
+        if self.disconnect_next:
+            self.disconnect_next = False
+            raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+        if "refuse@example.com" in recipients:
+            raise smtplib.SMTPRecipientsRefused({"refuse@example.com": (550, b"No such user")})
+        self.sent.append((from_email, list(recipients), raw))
+        return {}
+
+    def quit(self):
+        self.commands.append("QUIT")
+
+    def close(self):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def reset_fake_smtp():
+    FakeSMTP.instances = []
+
+
+def smtp_settings(password="secret"):
+    return SmtpSettings(server="smtp.example.com", port=587, login="user", password=password, from_email="noreply@example.com")
+
+
+def mail(to, subject="Sujet", **kwargs):
+    return OutboundEmail(to=[to], subject=subject, body=f"<p>{subject}</p>", **kwargs)
+
+
+def test_smtp_pool_logs_in_once_for_several_sends():
+    pool = SmtpConnectionPool(smtp_factory=FakeSMTP)
+
+    results = send_smtp(smtp_settings(), [mail("a@example.com"), mail("b@example.com", cc=["cc@example.com"])], pool)
+    results += send_smtp(smtp_settings(), [mail("c@example.com")], pool)
+
+    assert [result.ok for result in results] == [True, True, True]
+    assert len(FakeSMTP.instances) == 1
+    connection = FakeSMTP.instances[0]
+    assert connection.commands.count("LOGIN") == 1
+    assert connection.sent[1][1] == ["b@example.com", "cc@example.com"]
+    assert "Cc: cc@example.com" in connection.sent[1][2]
+
+
+def test_smtp_pool_reconnects_after_server_disconnect():
+    pool = SmtpConnectionPool(smtp_factory=FakeSMTP)
+    send_smtp(smtp_settings(), [mail("a@example.com")], pool)
+    FakeSMTP.instances[0].disconnect_next = True
+
+    results = send_smtp(smtp_settings(), [mail("b@example.com")], pool)
+
+    assert results[0].ok
+    assert len(FakeSMTP.instances) == 2
+    assert FakeSMTP.instances[1].sent[0][1] == ["b@example.com"]
+
+
+def test_smtp_pool_checks_idle_connection_with_noop(monkeypatch):
+    pool = SmtpConnectionPool(smtp_factory=FakeSMTP, check_after=0)
+    send_smtp(smtp_settings(), [mail("a@example.com")], pool)
+    FakeSMTP.instances[0].noop_code = 421
+
+    send_smtp(smtp_settings(), [mail("b@example.com")], pool)
+
+    assert "NOOP" in FakeSMTP.instances[0].commands
+    assert len(FakeSMTP.instances) == 2
+
+
+def test_smtp_refused_recipient_and_bad_login_are_not_retryable():
+    pool = SmtpConnectionPool(smtp_factory=FakeSMTP)
+
+    refused, delivered = send_smtp(smtp_settings(), [mail("refuse@example.com"), mail("ok@example.com")], pool)
+    assert not refused.ok and not refused.retryable
+    assert delivered.ok
+
+    [bad_login] = send_smtp(smtp_settings(password="bad"), [mail("a@example.com")], SmtpConnectionPool(smtp_factory=FakeSMTP))
+    assert not bad_login.ok and not bad_login.retryable
+
+
+class FakeResponse:
+    def __init__(self, status, payload):
+        self.status = status
+        self._body = json.dumps(payload).encode()
+
+    def read(self):
+        return self._body
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+def test_brevo_batches_messages_with_message_versions():
+    calls = []
+
+    def urlopen(request_obj, timeout=None):
+        calls.append(json.loads(request_obj.data))
+        return FakeResponse(201, {"messageIds": ["<m1>", "<m2>", "<m3>"]})
+
+    settings = BrevoSettings(api_key="key", sender_email="noreply@example.com", sender_name="Intégrale Academy")
+    messages = [mail("a@example.com", "Rappel A"), mail("b@example.com", "Rappel B"), mail("c@example.com", "Rappel C", cc=["cc@example.com"])]
+
+    results = send_brevo(settings, messages, urlopen=urlopen)
+
+    assert len(calls) == 1
+    versions = calls[0]["messageVersions"]
+    assert [version["to"] for version in versions] == [[{"email": "a@example.com"}], [{"email": "b@example.com"}], [{"email": "c@example.com"}]]
+    assert versions[1]["subject"] == "Rappel B" and versions[1]["htmlContent"] == "<p>Rappel B</p>"
+    assert versions[2]["cc"] == [{"email": "cc@example.com"}]
+    assert calls[0]["sender"] == {"email": "noreply@example.com", "name": "Intégrale Academy"}
+    assert [result.message_id for result in results] == ["<m1>", "<m2>", "<m3>"]
+
+
+def test_brevo_single_message_with_attachment(tmp_path):
+    calls = []
+    attachment = tmp_path / "contrat.pdf"
+    attachment.write_bytes(b"%PDF")
+
+    def urlopen(request_obj, timeout=None):
+        calls.append(json.loads(request_obj.data))
+        return FakeResponse(201, {"messageId": "<m1>"})
+
+    message = OutboundEmail(to=["a@example.com"], subject="Contrat", body="Bonjour", subtype="plain", attachments=[(str(attachment), "contrat.pdf")])
+    [result] = send_brevo(BrevoSettings(api_key="key", sender_email="noreply@example.com"), [message], urlopen=urlopen)
+
+    assert result.ok and result.message_id == "<m1>"
+    assert "messageVersions" not in calls[0]
+    assert calls[0]["textContent"] == "Bonjour"
+    assert calls[0]["attachment"] == [{"name": "contrat.pdf", "content": "JVBERg=="}]
+
+
+def test_only_messages_asking_for_brevo_use_it_unless_mail_transport_is_forced():
+    brevo_calls = []
+
+    def urlopen(request_obj, timeout=None):
+        payload = json.loads(request_obj.data)
+        brevo_calls.append([version["to"][0]["email"] for version in payload.get("messageVersions") or [{"to": payload["to"]}]])
+        return FakeResponse(201, {"messageIds": ["<m1>", "<m2>"], "messageId": "<m1>"})
+
+    brevo = BrevoSettings(api_key="key", sender_email="noreply@example.com")
+    messages = [mail("jury@example.com", transport=outbound_mail.TRANSPORT_BREVO), mail("formateur@example.com")]
+    pool = SmtpConnectionPool(smtp_factory=FakeSMTP)
+
+    results = outbound_mail.deliver(messages, smtp_settings(), brevo, pool, urlopen=urlopen)
+    assert [result.transport for result in results] == ["brevo", "smtp"]
+    assert brevo_calls == [["jury@example.com"]] and FakeSMTP.instances[0].sent[0][1] == ["formateur@example.com"]
+
+    forced = outbound_mail.deliver(messages, smtp_settings(), brevo, pool, urlopen=urlopen, mail_transport="brevo")
+    assert [result.transport for result in forced] == ["brevo", "brevo"]
+    assert [result.transport for result in outbound_mail.deliver(messages, smtp_settings(), brevo, pool, urlopen=urlopen, mail_transport="smtp")] == ["smtp", "smtp"]
+
+    restored = OutboundEmail.from_dict(messages[0].to_dict())
+    assert restored.transport == outbound_mail.TRANSPORT_BREVO
+    assert OutboundEmail.from_dict({"to": ["a@example.com"]}).transport == outbound_mail.TRANSPORT_SMTP
+
+
+def test_brevo_batches_never_mix_html_and_text_versions():
+    calls = []
+
+    def urlopen(request_obj, timeout=None):
+        calls.append(json.loads(request_obj.data))
+        return FakeResponse(201, {"messageIds": ["<m1>", "<m2>"], "messageId": "<m1>"})
+
+    messages = [
+        mail("a@example.com", "Invitation A"),
+        OutboundEmail(to=["b@example.com"], subject="Texte B", body="Bonjour B", subtype="plain"),
+        mail("c@example.com", "Invitation C"),
+        OutboundEmail(to=["d@example.com"], subject="Texte D", body="Bonjour D", subtype="plain"),
+    ]
+    assert all(result.ok for result in send_brevo(BrevoSettings(api_key="key", sender_email="noreply@example.com"), messages, urlopen=urlopen))
+
+    html, text = calls
+    assert [(version["subject"], version["htmlContent"]) for version in html["messageVersions"]] == [("Invitation A", "<p>Invitation A</p>"), ("Invitation C", "<p>Invitation C</p>")]
+    assert [(version["subject"], version["textContent"]) for version in text["messageVersions"]] == [("Texte B", "Bonjour B"), ("Texte D", "Bonjour D")]
+    assert "textContent" not in html and "htmlContent" not in text
+
+
+def test_mailbox_messages_keep_their_own_sender_when_a_relay_is_configured():
+    relay = SmtpSettings(server="smtp-relay.brevo.com", port=587, login="apikey", password="key", from_email="relay@example.com")
+    mailbox = SmtpSettings(server="smtp.gmail.com", port=587, login="contact@example.com", password="secret", from_email="contact@example.com")
+    pool = SmtpConnectionPool(smtp_factory=FakeSMTP)
+    messages = [mail("stagiaire@example.com", transport=outbound_mail.TRANSPORT_MAILBOX), mail("formateur@example.com")]
+
+    results = outbound_mail.deliver(messages, relay, BrevoSettings(api_key="", sender_email=""), pool, mailbox=mailbox)
+
+    assert all(result.ok for result in results)
+    sent = {instance.server: instance.sent[0][0] for instance in FakeSMTP.instances}
+    assert sent == {"smtp.gmail.com": "contact@example.com", "smtp-relay.brevo.com": "relay@example.com"}
+
+
+def test_outbox_retries_with_backoff_and_gives_up(tmp_path, monkeypatch):
+    db_path = tmp_path / "outbox.db"
+    monkeypatch.setattr(application, "MAIL_OUTBOX_DB", str(db_path))
+    monkeypatch.setattr(application, "MAIL_OUTBOX_MAX_ATTEMPTS", 2)
+    deliveries = []
+
+    def failing_delivery(messages):
+        deliveries.append([message.to[0] for message in messages])
+        return [DeliveryResult(False, "421 Service not available", "smtp") for _ in messages]
+
+    monkeypatch.setattr(application, "deliver_emails", failing_delivery)
+
+    result = application.send_outbound_email("a@example.com", "Sujet", "<p>Corps</p>", category="notification")
+
+    assert not result.ok and result.queued
+    [entry] = outbound_mail.list_entries(db_path)
+    assert entry["status"] == outbound_mail.STATUS_PENDING
+    assert entry["attempts"] == 1
+    assert entry["next_attempt_at"] > entry["created_at"]
+    assert application.process_mail_outbox() == 0
+
+    outbound_mail.retry(db_path, entry["id"])
+    assert application.process_mail_outbox() == 1
+    [entry] = outbound_mail.list_entries(db_path)
+    assert entry["status"] == outbound_mail.STATUS_PENDING and entry["attempts"] == 1
+
+    outbound_mail.retry(db_path, entry["id"])
+    monkeypatch.setattr(application, "MAIL_OUTBOX_MAX_ATTEMPTS", 1)
+    application.process_mail_outbox()
+    assert outbound_mail.list_entries(db_path)[0]["status"] == outbound_mail.STATUS_FAILED
+    assert deliveries == [["a@example.com"], ["a@example.com"], ["a@example.com"]]
+
+
+def test_outbox_delivers_due_messages_in_one_batch(tmp_path, monkeypatch):
+    db_path = tmp_path / "outbox.db"
+    monkeypatch.setattr(application, "MAIL_OUTBOX_DB", str(db_path))
+    for address in ("a@example.com", "b@example.com"):
+        outbound_mail.enqueue(db_path, mail(address))
+    batches = []
+    monkeypatch.setattr(application, "deliver_emails", lambda messages: batches.append(len(messages)) or [DeliveryResult(True, transport="brevo") for _ in messages])
+
+    assert application.process_mail_outbox() == 2
+
+    assert batches == [2]
+    assert {entry["status"] for entry in outbound_mail.list_entries(db_path)} == {outbound_mail.STATUS_SENT}
+
+
+def test_caller_tracked_sends_are_not_queued(tmp_path, monkeypatch):
+    monkeypatch.setattr(application, "MAIL_OUTBOX_DB", str(tmp_path / "outbox.db"))
+    monkeypatch.setattr(application, "email_transport_configured", lambda: True)
+    monkeypatch.setattr(application, "deliver_emails", lambda messages: [DeliveryResult(False, "timeout", "smtp") for _ in messages])
+
+    assert application.send_price_adaptator_email("a@example.com", "Offre", "<p>Offre</p>") == (False, "timeout")
+    assert not (tmp_path / "outbox.db").exists()
+
+
+def test_jury_reminders_are_sent_in_one_batch(monkeypatch):
+    application.app.config.update(TESTING=True, SERVER_NAME="localhost")
+    exam_date = (application.datetime.now() + application.timedelta(days=5)).strftime("%Y-%m-%d")
+    data = {"sessions": [{
+        "id": "s1",
+        "formation": "APS",
+        "date_exam": exam_date,
+        "jurys": [
+            {"id": "j1", "prenom": "Ana", "nom": "A", "email": "ana@example.com"},
+            {"id": "j2", "prenom": "Bob", "nom": "B", "email": "bob@example.com"},
+            {"id": "j3", "prenom": "Cid", "nom": "C", "email": ""},
+        ],
+    }]}
+    batches = []
+    monkeypatch.setattr(application, "deliver_emails", lambda messages: batches.append([m.to[0] for m in messages]) or [DeliveryResult(True, transport="brevo") for _ in messages])
+    monkeypatch.setattr(application, "send_jury_reminder_sms", lambda *args: (False, "SMS non configuré"))
+
+    with application.app.app_context():
+        reminded = application.send_jury_reminders(data, "https://example.com")
+
+    assert batches == [["ana@example.com", "bob@example.com"]]
+    assert reminded == ["Ana A", "Bob B"]
+    assert data["sessions"][0]["jurys"][2]["reminded_at"] is None
@@ -0,0 +1,110 @@
+import os
+import sys
+import time
+from datetime import date
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import app
+from services import pdf_fragments
+
+
+def _page_streams(path):
+    pypdf = pytest.importorskip("pypdf")
+    return [page.get_contents().get_data() for page in pypdf.PdfReader(str(path)).pages]
+
+
+def _afc_session(students):
+    planning, _, _ = app.build_aps_planning_data(date(2026, 3, 2), "Jean Dupont", "Salle 1", "full_presentiel", end_date=date(2026, 4, 10), exam_iso="2026-04-13")
+    return {"id": "afc-test", "formation": "AFC_APS_SSIAP", "date_debut": "2026-03-02", "date_fin": "2026-04-10", "date_exam": "2026-04-13", "apsPlanningMode": "full_presentiel", "apsPlanningData": planning, "apsAttendanceStudents": students}
+
+
+def test_missing_runs_groups_contiguous_pages():
+    assert pdf_fragments.missing_runs([7, 1, 2, 3, 9]) == [(1, 4), (7, 8), (9, 10)]
+    assert pdf_fragments.missing_runs([]) == []
+
+
+def _draw_helper():
+    return "v1"
+
+
+def _draw_helper_v2():
+    return "v2"
+
+
+def _renderer():
+    return _draw_helper() + os.sep
+
+
+def test_code_fingerprint_covers_the_helpers_a_renderer_calls(monkeypatch):
+    monkeypatch.setattr(pdf_fragments, "_fingerprints", {})
+    before = pdf_fragments.code_fingerprint(_renderer)
+
+    monkeypatch.setattr(pdf_fragments, "_fingerprints", {})
+    monkeypatch.setitem(globals(), "_draw_helper", _draw_helper_v2)
+    changed = pdf_fragments.code_fingerprint(_renderer)
+    assert changed != before
+
+    monkeypatch.setattr(pdf_fragments, "_fingerprints", {})
+    monkeypatch.setattr(pdf_fragments, "BUILD_ID", "abc123")
+    assert pdf_fragments.code_fingerprint(_renderer) not in (before, changed)
+
+
+def test_attendance_regeneration_only_renders_changed_days(tmp_path, monkeypatch):
+    pytest.importorskip("pypdf")
+    monkeypatch.setattr(app.pdf_parallel, "PDF_PARALLEL_WORKERS", 1)
+    fragments = tmp_path / "pages"
+    students = [{"lastName": f"NOM{index}", "firstName": "Prénom", "startDate": "2026-03-02"} for index in range(4)]
+    session = _afc_session(students)
+
+    first = app.generate_attendance_pdf_common(session, str(tmp_path / "first.pdf"), training_type="AFC_APS_SSIAP", fragment_dir=fragments)
+    app.generate_attendance_pdf_common(session, str(tmp_path / "full.pdf"), training_type="AFC_APS_SSIAP")
+    assert first["rendered"] == first["pages"] > 10
+    assert _page_streams(tmp_path / "first.pdf") == _page_streams(tmp_path / "full.pdf")
+    # Logo et tampon ne sont pas recopiés par page.
+    assert os.path.getsize(tmp_path / "first.pdf") < 1.5 * os.path.getsize(tmp_path / "full.pdf")
+
+    again = app.generate_attendance_pdf_common(session, str(tmp_path / "again.pdf"), training_type="AFC_APS_SSIAP", fragment_dir=fragments)
+    assert again["rendered"] == 0
+
+    late_days = [day["date"] for day in app._aps_presentiel_days(session["apsPlanningData"], "full_presentiel")][-3:]
+    session["apsAttendanceStudents"] = students + [{"lastName": "RETARD", "firstName": "Entrée", "startDate": late_days[0]}]
+    late = app.generate_attendance_pdf_common(session, str(tmp_path / "late.pdf"), training_type="AFC_APS_SSIAP", fragment_dir=fragments)
+    app.generate_attendance_pdf_common(session, str(tmp_path / "late_full.pdf"), training_type="AFC_APS_SSIAP")
+    assert late["rendered"] == 4  # trois journées + la synthèse
+    assert _page_streams(tmp_path / "late.pdf") == _page_streams(tmp_path / "late_full.pdf")
+    # les pages remplacées restent jusqu'à la fin du délai de grâce
+    assert len(list(fragments.glob("*.pdf"))) == late["pages"] + 4
+
+
+def _render_labels(labels):
+    def render(page_range, path):
+        from reportlab.pdfgen import canvas
+
+        c = canvas.Canvas(path)
+        for label in labels[page_range[0]:page_range[1]]:
+            c.drawString(40, 800, label)
+            c.showPage()
+        c.save()
+    return render
+
+
+def test_pages_of_another_version_are_kept_until_the_grace_period(tmp_path):
+    pytest.importorskip("pypdf")
+    fragments = tmp_path / "pages"
+    old, new = ["a", "b", "c"], ["a", "b", "d"]
+    pdf_fragments.assemble(fragments, old, tmp_path / "old.pdf", _render_labels(old))
+    assert pdf_fragments.assemble(fragments, new, tmp_path / "new.pdf", _render_labels(new))["rendered"] == 1
+
+    # une requête concurrente assemble encore l'ancienne version : sa page est toujours là
+    assert pdf_fragments.assemble(fragments, old, tmp_path / "old_again.pdf", _render_labels(old))["rendered"] == 0
+    assert _page_streams(tmp_path / "old_again.pdf") == _page_streams(tmp_path / "old.pdf")
+
+    stale = time.time() - pdf_fragments.FRAGMENT_GRACE_SECONDS - 1
+    os.utime(fragments / "c.pdf", (stale, stale))
+    pdf_fragments.assemble(fragments, new, tmp_path / "new_again.pdf", _render_labels(new))
+    assert sorted(path.name for path in fragments.iterdir()) == ["a.pdf", "b.pdf", "d.pdf"]
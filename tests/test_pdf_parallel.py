@@ -0,0 +1,101 @@
+import os
+import sys
+import time
+from datetime import date
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import app
+from desp_program import desp_summary_from_planning, generate_desp_planning
+from services import pdf_parallel
+
+
+def _page_streams(path):
+    pypdf = pytest.importorskip("pypdf")
+    return [page.get_contents().get_data() for page in pypdf.PdfReader(str(path)).pages]
+
+
+def test_split_pages_keeps_the_tail_in_the_last_range():
+    assert pdf_parallel.split_pages(10, 3) == [(0, 3), (3, 7), (7, 10)]
+    assert pdf_parallel.split_pages(10, 4, splittable=8) == [(0, 2), (2, 4), (4, 6), (6, 10)]
+    assert pdf_parallel.split_pages(5, 8, splittable=0) == [(0, 5)]
+    assert pdf_parallel.in_range((2, 4), 3) and not pdf_parallel.in_range((2, 4), 2)
+
+
+@pytest.mark.skipif(not pdf_parallel.available(), reason="pypdf indisponible")
+def test_parallel_planning_and_attendance_match_sequential_rendering(tmp_path, monkeypatch):
+    monkeypatch.setattr(pdf_parallel, "PDF_PARALLEL_MIN_PAGES", 2)
+    planning = generate_desp_planning(date(2026, 6, 12), date(2026, 7, 17), date(2026, 7, 20), date(2026, 7, 30), "BRUANT Christophe", "Salle DESP", exam_iso="2026-07-31", allow_saturday=False)
+    session = {"id": "desp-test", "formation": "DESP", "date_debut": "2026-06-12", "date_fin": "2026-07-30", "date_exam": "2026-07-31", "salle": "Salle DESP"}
+    profile = {"validate": "desp", "summary": desp_summary_from_planning(planning), "planning_title": "PLANNING DE FORMATION DESP", "short_label": "DESP"}
+    for workers in (1, 3):
+        app.generate_aps_planning_pdf(session, "BRUANT Christophe", str(tmp_path / f"planning_{workers}.pdf"), planning_data=planning, planning_mode="desp", document_profile=profile, workers=workers, edited_at="01/06/2026 à 09:00")
+    sequential = _page_streams(tmp_path / "planning_1.pdf")
+    assert len(sequential) > 3
+    assert _page_streams(tmp_path / "planning_3.pdf") == sequential
+
+    aps_planning, _, _ = app.build_aps_planning_data(date(2026, 3, 2), "Jean Dupont", "Salle 1", "full_presentiel", end_date=date(2026, 4, 10), exam_iso="2026-04-13")
+    aps_session = {"id": "aps-test", "formation": "APS", "date_debut": "2026-03-02", "date_fin": "2026-04-10", "date_exam": "2026-04-13", "apsPlanningMode": "full_presentiel", "apsPlanningData": aps_planning, "apsAttendanceStudents": [{"lastName": f"NOM{index}", "firstName": "Prénom"} for index in range(6)]}
+    for workers in (1, 4):
+        app.generate_attendance_pdf_common(aps_session, str(tmp_path / f"attendance_{workers}.pdf"), workers=workers)
+    sequential = _page_streams(tmp_path / "attendance_1.pdf")
+    assert len(sequential) > 4
+    assert _page_streams(tmp_path / "attendance_4.pdf") == sequential
+
+
+def _write_unless_child(path, parent_pid):
+    if os.getpid() != parent_pid:
+        time.sleep(60)  # Processus bloqué : le pool doit être abandonné.
+    Path(path).write_text("ok", encoding="utf-8")
+
+
+def test_a_stuck_pool_falls_back_to_serial_rendering(tmp_path, monkeypatch):
+    monkeypatch.setattr(pdf_parallel, "PDF_PARALLEL_TIMEOUT", 2)
+    assert pdf_parallel.context().get_start_method() != "fork"
+    paths = [tmp_path / f"contrat_{index}.pdf" for index in range(3)]
+    started = time.monotonic()
+    pdf_parallel.render_each(_write_unless_child, [(str(path), os.getpid()) for path in paths], workers=2)
+    assert time.monotonic() - started < 30
+    assert all(path.read_text(encoding="utf-8") == "ok" for path in paths)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_trainer_contracts_are_rendered_as_one_batch(tmp_path, monkeypatch, workers):
+    planning, _, _ = app.build_aps_planning_data(date(2026, 3, 2), "Jean Dupont", "Salle 1", "full_presentiel", end_date=date(2026, 4, 10), exam_iso="2026-04-13")
+    for day in planning[::2]:
+        for slot in day.get("slots", []):
+            if slot.get("trainer") == "Jean Dupont":
+                slot["trainer"] = "Marie Martin"
+    sessions_data = {"sessions": [{"id": "aps-test", "formation": "APS", "date_debut": "2026-03-02", "date_fin": "2026-04-10", "date_exam": "2026-04-13", "planning_pdf": "planning.pdf", "apsPlanningData": planning}], "jurys": []}
+    saves, formateur_loads = [], []
+    monkeypatch.setattr(app, "APS_CONTRACT_DIR", str(tmp_path))
+    monkeypatch.setattr(app, "load_sessions", lambda: sessions_data)
+    monkeypatch.setattr(app, "save_sessions", lambda data: saves.append(data))
+    monkeypatch.setattr(app, "load_formateurs", lambda: formateur_loads.append(1) or [{"prenom": "Marie", "nom": "Martin", "email": "marie@example.com", "siret": "123"}])
+    monkeypatch.setattr(pdf_parallel, "PDF_PARALLEL_WORKERS", workers)
+    pools = []
+    starmap = pdf_parallel.starmap
+    monkeypatch.setattr(pdf_parallel, "starmap", lambda *args, **kwargs: pools.append(1) or starmap(*args, **kwargs))
+
+    app.app.config.update(TESTING=True, SECRET_KEY="test")
+    with app.app.test_client() as client:
+        with client.session_transaction() as session:
+            session["admin_logged"] = True
+            session["admin_session_version"] = app.ADMIN_SESSION_VERSION
+        response = client.post("/api/sessions/aps-test/aps-trainer-contracts/generate", json={"trainers": [{"name": "Jean Dupont", "dailyRate": 300}, {"name": "Marie Martin", "dailyRate": 280}]})
+
+    body = response.get_json()
+    assert response.status_code == 200, body
+    contracts = {contract["trainerName"]: contract for contract in body["contracts"]}
+    assert contracts["Marie Martin"]["trainerEmail"] == "marie@example.com"
+    for name, contract in contracts.items():
+        assert contract == {**contract, **{key: value for key, value in app.aps_trainer_interventions(planning, name).items() if key != "totalHours"}}
+        assert (tmp_path / contract["pdfFilename"]).stat().st_size > 0
+    assert len(formateur_loads) == 1 and len(saves) == 1
+    assert len(sessions_data["sessions"][0]["apsTrainerContracts"]) == 2
+    # Sans PDF_PARALLEL_WORKERS, le lot est rendu dans le worker, sans pool de processus.
+    assert len(pools) == (workers > 1)
@@ -0,0 +1,53 @@
+import io
+import os
+import shutil
+import sys
+from pathlib import Path
+
+from PIL import Image as PILImage
+from reportlab.pdfgen import canvas
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from services import pdf_resources
+
+
+def test_image_is_shared_downscaled_and_reloaded_on_change(tmp_path):
+    logo = tmp_path / "logo.png"
+    shutil.copy(ROOT / "static" / "img" / "logo-integrale.png", logo)
+    pdf_resources.clear()
+
+    first = pdf_resources.image(logo, max_px=300)
+    assert pdf_resources.image(logo, max_px=300) is first
+    assert max(first.getSize()) == 300 and first._dataA is not None
+    assert pdf_resources.image(logo, max_px=600) is not first
+
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer)
+    c.drawImage(first, 10, 10, width=72, height=72, preserveAspectRatio=True, mask="auto")
+    c.drawImage(first, 100, 10, width=72, height=72, preserveAspectRatio=True, mask="auto")
+    c.save()
+    assert buffer.getvalue().count(b"/Subtype /Image") == 2  # image + masque alpha, une seule fois
+
+    PILImage.new("RGB", (40, 20), "red").save(logo)
+    stat = logo.stat()
+    os.utime(logo, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert pdf_resources.image(logo, max_px=300).getSize() == (40, 20)
+
+
+def test_locate_is_memoised_until_the_directory_changes(tmp_path):
+    pdf_resources.clear()
+    calls = []
+
+    def finder():
+        calls.append(1)
+        return sorted(entry.name for entry in os.scandir(tmp_path))
+
+    assert pdf_resources.locate("test", [tmp_path], finder) == []
+    assert pdf_resources.locate("test", [tmp_path], finder) == []
+    (tmp_path / "tampon.png").write_bytes(b"")
+    stat = tmp_path.stat()
+    os.utime(tmp_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert pdf_resources.locate("test", [tmp_path], finder) == ["tampon.png"]
+    assert len(calls) == 2
@@ -0,0 +1,69 @@
+from datetime import date
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import app as application
+from business_calendar import get_calendar
+from planning_feasibility import (
+    PeriodRequirement,
+    check_period,
+    earliest_feasible_end,
+    latest_feasible_end,
+    latest_feasible_start,
+)
+
+
+def test_earliest_end_and_latest_start_match_working_day_count():
+    calendar = get_calendar()
+    requirement = PeriodRequirement("Test", 25)
+
+    end = earliest_feasible_end(requirement, date(2026, 4, 1), calendar)
+    assert calendar.count_between(date(2026, 4, 1), end) == 25
+    assert not check_period(requirement, date(2026, 4, 1), end.replace(day=end.day - 1), calendar)["feasible"]
+
+    start = latest_feasible_start(requirement, date(2026, 6, 30), calendar)
+    assert calendar.count_between(start, date(2026, 6, 30)) == 25
+    assert calendar.is_working_day(start)
+
+
+def test_desp_presentiel_has_a_maximum_number_of_days():
+    calendar = get_calendar()
+    requirement = application.PLANNING_REQUIREMENTS["desp_presentiel"]
+    assert (requirement.min_days, requirement.max_days) == (9, 11)
+
+    latest_end = latest_feasible_end(requirement, date(2026, 9, 7), calendar)
+    assert calendar.count_between(date(2026, 9, 7), latest_end) == 11
+    check = check_period(requirement, date(2026, 9, 7), date(2026, 9, 30), calendar)
+    assert not check["feasible"] and "au maximum" in check["reason"]
+
+
+def test_aps_precheck_rejects_short_period_before_walking_days():
+    try:
+        application.build_aps_planning(date(2026, 3, 2), end_date=date(2026, 3, 20), exam_iso="2026-03-23")
+    except ValueError as exc:
+        assert "ne permet pas de placer toutes les heures" in str(exc)
+    else:
+        raise AssertionError("La période trop courte aurait dû être refusée.")
+
+
+def test_feasibility_api_suggests_dates():
+    application.app.config.update(TESTING=True)
+    client = application.app.test_client()
+    with client.session_transaction() as flask_session:
+        flask_session["admin_logged"] = True
+        flask_session["admin_session_version"] = application.ADMIN_SESSION_VERSION
+
+    response = client.get("/api/planning/feasibility?formation=APS&start=2026-03-02&end=2026-03-20&exam=2026-03-23")
+    payload = response.get_json()
+    assert response.status_code == 200
+    assert payload["type"] == "aps_full_presentiel" and payload["requiredDays"] == 25
+    assert payload["check"]["feasible"] is False
+    earliest_end = date.fromisoformat(payload["earliestEnd"])
+    assert application.aps_training_calendar("2026-03-23").count_between(date(2026, 3, 2), earliest_end) == 25
+    assert date.fromisoformat(payload["earliestExam"]) > earliest_end
+    assert payload["latestStart"] < "2026-03-02"
+
+    assert client.get("/api/planning/feasibility?type=inconnu&start=2026-03-02").status_code == 400
+    assert client.get("/api/planning/feasibility?formation=A3P&start=32/13/2026").status_code == 400
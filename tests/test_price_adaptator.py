@@ -0,0 +1,122 @@
+import io
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import app
+from services import job_scheduler, price_adaptator_store
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "PRICE_ADAPTATOR_FILE", str(tmp_path / "price_adaptator.json"))
+    monkeypatch.setattr(app, "PRICE_ADAPTATOR_DB", str(tmp_path / "price_adaptator.db"))
+    monkeypatch.setattr(app, "PRICE_ADAPTATOR_IMPORT_DIR", str(tmp_path / "imports"))
+    monkeypatch.setattr(app, "PRICE_ADAPTATOR_IMPORT_CHUNK_ROWS", 2)
+    app.app.config.update(TESTING=True, SECRET_KEY="test")
+    with app.app.test_client() as test_client:
+        with test_client.session_transaction() as session:
+            session["admin_logged"] = True
+            session["admin_session_version"] = app.ADMIN_SESSION_VERSION
+        yield test_client
+
+
+def _workbook(rows):
+    openpyxl = pytest.importorskip("openpyxl")
+    workbook = openpyxl.Workbook()
+    for row in rows:
+        workbook.active.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    buffer.seek(0)
+    return buffer
+
+
+def _import(client, rows):
+    response = client.post("/price-adaptator/import", data={"file": (_workbook(rows), "prospects.xlsx")}, content_type="multipart/form-data")
+    assert response.status_code == 202
+    job = response.get_json()["job"]
+    assert job["status"] == price_adaptator_store.JOB_PENDING
+    assert any(entry["job"] == "price_adaptator_imports" for entry in job_scheduler.list_queue(app.SCHEDULER_DB))
+    # exécution de la tâche mise en file, comme le ferait le planificateur
+    assert job["id"] in app.run_pending_price_adaptator_imports()["imported"]
+    job = client.get(f"/price-adaptator/import/{job['id']}").get_json()["job"]
+    assert job["status"] == price_adaptator_store.JOB_DONE
+    return job
+
+
+def test_import_runs_as_job_with_persistent_dedup_and_paginated_lines(client):
+    client.post("/price-adaptator/prospects", json={"nom": "martin", "prenom": "léa", "cpf": 100, "email": "Lea@Example.com", "formation": "APS"})
+    rows = [
+        ("APS", "Durand", "paul", 200, "paul@example.com", "612345678"),
+        ("A3P", "Petit", "Zoé", None, "lea@example.com", None),
+        ("DIRIGEANT", "Roux", "Ana", 50, "", "06 12 34 56 78"),
+        ("BTS", "Nom", "Prénom", 0, "", ""),
+        (None, None, None, None, None, None),
+        ("APS", "Leroy", "Max", 5000, "max@example.com", ""),
+        ("APS", "durand", "PAUL", 0, "autre@example.com", ""),
+    ]
+    job = _import(client, rows)
+    assert (job["processed_rows"], job["added"], job["skipped"], job["errors"]) == (7, 1, 4, 1)
+
+    prospects = client.get("/price-adaptator/prospects").get_json()["items"]
+    assert [prospect["nom"] for prospect in prospects] == ["DURAND", "MARTIN"]
+    assert prospects[0]["telephone"] == "0612345678"
+
+    page = client.get(f"/price-adaptator/import/{job['id']}?outcome=skipped&per_page=3&page=2").get_json()["lines"]
+    assert page["total"] == 4 and page["page"] == 2
+    assert [item["message"] for item in page["items"]] == ["Ligne 7: prospect déjà existant"]
+    added = client.get(f"/price-adaptator/import/{job['id']}?outcome=added").get_json()["lines"]["items"]
+    assert added[0]["prospect_id"] == prospects[0]["id"]
+
+    # Les clés de déduplication sont des colonnes indexées : un second import ne relit pas la liste.
+    again = _import(client, rows[:1])
+    assert (again["added"], again["skipped"]) == (0, 1)
+
+    client.delete(f"/price-adaptator/prospects/{prospects[0]['id']}")
+    assert _import(client, rows[:1])["added"] == 1
+
+
+def test_an_import_interrupted_by_a_restart_fails_and_its_file_is_removed(client, tmp_path):
+    db_path = app.PRICE_ADAPTATOR_DB
+    (tmp_path / "imports").mkdir()
+    interrupted = price_adaptator_store.create_job(db_path, "coupé.xlsx", 10)
+    connection = price_adaptator_store.connect(db_path)
+    price_adaptator_store.start_job(connection, interrupted["id"])
+    connection.close()
+    interrupted_file = Path(app.price_adaptator_import_path(interrupted["id"]))
+    interrupted_file.write_bytes(_workbook([("APS", "Durand", "Paul", 0, "", "")]).getvalue())
+
+    job = _import(client, [("APS", "Leroy", "Max", 200, "max@example.com", "")])
+    assert job["added"] == 1
+
+    failed = price_adaptator_store.get_job(db_path, interrupted["id"])
+    assert failed["status"] == price_adaptator_store.JOB_FAILED and "interrompu" in failed["last_error"]
+    assert not interrupted_file.exists()
+    assert list((tmp_path / "imports").iterdir()) == []
+    assert [prospect["nom"] for prospect in client.get("/price-adaptator/prospects").get_json()["items"]] == ["LEROY"]
+
+
+def test_legacy_json_is_migrated_and_mutations_return_only_the_changed_prospect(client, tmp_path):
+    legacy = [{"id": f"p{index}", "nom": f"NOM{index}", "prenom": "Jean", "cpf": index * 10, "email": f"p{index}@example.com", "telephone": "", "formation": "APS" if index % 2 else "A3P", "sent": index == 3} for index in range(5)]
+    (tmp_path / "price_adaptator.json").write_text(app.json.dumps({"prospects": legacy, "dates": {}}), encoding="utf-8")
+
+    page = client.get("/price-adaptator/prospects?formation=APS&per_page=1&page=2").get_json()
+    assert (page["total"], page["count"], [item["id"] for item in page["items"]]) == (2, 5, ["p1"])
+    assert [item["id"] for item in client.get("/price-adaptator/prospects?q=p4@").get_json()["items"]] == ["p4"]
+
+    dates = {"APS": {"start": "2000-01-01", "end": "2000-01-31", "discount": 30}}
+    revision = client.post("/price-adaptator/dates", json={"dates": dates}).get_json()["revision"]
+    assert [prospect["id"] for prospect in app.price_adaptator_store.due_prospects(app.PRICE_ADAPTATOR_DB, "2026-01-01")] == ["p1"]
+
+    response = client.post("/price-adaptator/prospects/p1/proposal", json={"price": 999}).get_json()
+    assert set(response) == {"ok", "prospect", "revision"} and response["revision"] == revision + 1
+    assert response["prospect"]["proposed_price"] == 999
+    assert client.delete("/price-adaptator/prospects/p1").get_json() == {"ok": True, "deleted": "p1", "revision": revision + 2}
+    assert client.delete("/price-adaptator/prospects/p1").status_code == 404
+    assert client.get("/price-adaptator/data").get_json() == {"dates": dates, "revision": revision + 2}
+    assert _import(client, [("APS", "Autre", "Nom", 0, "P2@example.com", "")])["skipped"] == 1
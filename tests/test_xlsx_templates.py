@@ -0,0 +1,53 @@
+import io
+import os
+import shutil
+import sys
+from pathlib import Path
+
+from openpyxl import load_workbook
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from services import xlsx_templates
+
+
+def _sheet_values(wb):
+    return {ws.title: [[cell.value for cell in row] for row in ws.iter_rows()] for ws in wb.worksheets}
+
+
+def test_clones_are_independent_and_match_a_fresh_parse(tmp_path, monkeypatch):
+    template = tmp_path / "tableau.xlsx"
+    shutil.copy(ROOT / "static" / "upload" / "tableau.xlsx", template)
+    xlsx_templates.clear()
+    parsed = []
+    original_load = xlsx_templates.load_workbook
+    monkeypatch.setattr(xlsx_templates, "load_workbook", lambda path: parsed.append(path) or original_load(path))
+
+    first = xlsx_templates.load_template(template)
+    first.worksheets[0]["A1"] = "modifié"
+    second = xlsx_templates.load_template(template)
+
+    assert len(parsed) == 1 and first is not second
+    assert second.worksheets[0]["A1"].value != "modifié"
+    fresh = load_workbook(template)
+    assert _sheet_values(second) == _sheet_values(fresh)
+    assert [ws.merged_cells.ranges for ws in second.worksheets] == [ws.merged_cells.ranges for ws in fresh.worksheets]
+    buffer = io.BytesIO()
+    second.save(buffer)
+    assert _sheet_values(load_workbook(io.BytesIO(buffer.getvalue()))) == _sheet_values(fresh)
+
+
+def test_template_change_on_disk_is_reparsed(tmp_path):
+    template = tmp_path / "dsf.xlsx"
+    shutil.copy(ROOT / "static" / "upload" / "dsf.xlsx", template)
+    xlsx_templates.clear()
+    assert xlsx_templates.warm_up([template, tmp_path / "absent.xlsx"]) == 1
+
+    wb = load_workbook(template)
+    wb.worksheets[0]["A1"] = "nouvelle version"
+    wb.save(template)
+    stat = template.stat()
+    os.utime(template, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    assert xlsx_templates.load_template(template).worksheets[0]["A1"].value == "nouvelle version"
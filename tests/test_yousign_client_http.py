@@ -0,0 +1,229 @@
+import base64
+import hashlib
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from yousign_service import (
+    YousignCallMetrics,
+    YousignClient,
+    YousignConfig,
+    YousignConnectionPool,
+    YousignError,
+    parse_retry_after,
+    yousign_operation_name,
+)
+
+
+class FakeYousign:
+    """Serveur Yousign local : file de réponses scriptées et journal des connexions."""
+
+    def __init__(self):
+        self.requests = []
+        self.connections = set()
+        self.scripted = []
+        self.drop_after_response = False
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _handle(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                fake.connections.add(self.client_address)
+                fake.requests.append((self.command, self.path, body, dict(self.headers)))
+                status, payload, headers = fake.scripted.pop(0) if fake.scripted else (200, {"id": f"obj_{len(fake.requests)}"}, {})
+                raw = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(raw)
+                if fake.drop_after_response:
+                    self.close_connection = True
+
+            do_GET = do_POST = _handle
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+        self.thread.start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}/v3"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def fake_yousign():
+    server = FakeYousign()
+    yield server
+    server.close()
+
+
+def make_client(server, **kwargs):
+    kwargs.setdefault("backoff_seconds", 0)
+    return YousignClient(
+        YousignConfig(api_key="secret", base_url=server.base_url),
+        timeout=5,
+        pool=YousignConnectionPool(),
+        metrics=YousignCallMetrics(),
+        **kwargs,
+    )
+
+
+def test_full_send_sequence_reuses_one_keep_alive_connection(fake_yousign):
+    client = make_client(fake_yousign)
+
+    request = client.create_signature_request("Contrat", "aps-trainer-contract-1")
+    document = client.upload_file(request["id"], b"%PDF-1.4 test", "contrat.pdf")
+    signer = client.add_signer(request["id"], "Jean", "Dupont", "jean@example.com", document["id"], use_text_tags=True)
+    client.add_signature_field(request["id"], document["id"], signer["id"], 1, 10, 10)
+    client.activate_signature_request(request["id"])
+
+    assert len(fake_yousign.requests) == 5
+    assert len(fake_yousign.connections) == 1
+    assert fake_yousign.requests[1][1] == f"/v3/signature_requests/{request['id']}/documents"
+    assert fake_yousign.requests[1][3]["Authorization"] == "Bearer secret"
+    metrics = client.metrics.snapshot()
+    assert metrics["operations"]["POST /signature_requests/{id}/activate"]["count"] == 1
+    assert [call["reusedConnection"] for call in metrics["recent"]] == [False, True, True, True, True]
+
+
+def test_retries_429_honouring_retry_after(fake_yousign, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr("yousign_service.time.sleep", sleeps.append)
+    fake_yousign.scripted = [(429, {"message": "Too many requests"}, {"Retry-After": "2"}), (200, {"id": "sr_1"}, {})]
+    client = make_client(fake_yousign)
+
+    assert client.create_signature_request("Contrat")["id"] == "sr_1"
+    assert sleeps == [2.0]
+    assert client.metrics.snapshot()["operations"]["POST /signature_requests"]["retries"] == 1
+
+
+def test_server_errors_are_retried_only_for_idempotent_methods(fake_yousign, monkeypatch):
+    monkeypatch.setattr("yousign_service.time.sleep", lambda delay: None)
+    fake_yousign.scripted = [(502, {}, {}), (200, {"id": "sr_1", "status": "ongoing"}, {})]
+    client = make_client(fake_yousign)
+    assert client.get_signature_request("sr_1")["status"] == "ongoing"
+
+    fake_yousign.scripted = [(500, {"message": "boom"}, {})]
+    with pytest.raises(YousignError) as excinfo:
+        client.create_signature_request("Contrat")
+    assert excinfo.value.status_code == 500
+    assert len(fake_yousign.requests) == 3
+
+
+def test_gives_up_after_max_retries(fake_yousign, monkeypatch):
+    monkeypatch.setattr("yousign_service.time.sleep", lambda delay: None)
+    fake_yousign.scripted = [(503, {"message": "busy"}, {})] * 3
+    client = make_client(fake_yousign, max_retries=2)
+
+    with pytest.raises(YousignError) as excinfo:
+        client.get_signature_request("sr_1")
+
+    assert excinfo.value.status_code == 503
+    assert excinfo.value.payload == {"message": "busy"}
+    assert len(fake_yousign.requests) == 3
+
+
+def test_reopens_keep_alive_connection_closed_by_server(fake_yousign):
+    fake_yousign.drop_after_response = True
+    client = make_client(fake_yousign)
+
+    client.get_signature_request("sr_1")
+    client.get_signature_request("sr_1")
+
+    assert len(fake_yousign.requests) == 2
+    assert len(fake_yousign.connections) == 2
+
+
+def test_download_signed_documents_returns_bytes(fake_yousign):
+    fake_yousign.scripted = [(200, b"%PDF-signed", {})]
+    client = make_client(fake_yousign)
+
+    assert client.download_signed_documents("sr_1") == b"%PDF-signed"
+
+
+def test_unreachable_api_raises_readable_error():
+    client = YousignClient(YousignConfig(api_key="secret", base_url="http://127.0.0.1:9/v3"), timeout=1, pool=YousignConnectionPool(), metrics=YousignCallMetrics())
+
+    with pytest.raises(YousignError, match="Impossible de joindre"):
+        client.get_signature_request("sr_1")
+
+
+def test_operation_name_and_retry_after_parsing():
+    assert yousign_operation_name("post", "signature_requests/sr_1/documents/doc_1/fields") == "POST /signature_requests/{id}/documents/{id}/fields"
+    assert yousign_operation_name("GET", "signature_requests?limit=1") == "GET /signature_requests"
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT", now=1445412470.0) == 10.0
+    assert parse_retry_after("n'importe quoi") is None
+
+
+def test_download_signed_documents_to_file_streams_and_renames_atomically(fake_yousign, tmp_path):
+    content = b"%PDF-1.7 " + b"x" * 200_000
+    fake_yousign.scripted = [(200, content, {})]
+    client = make_client(fake_yousign)
+
+    download = client.download_signed_documents_to_file("sr_1", str(tmp_path), "signed.pdf", expected_sha256=hashlib.sha256(content).hexdigest(), chunk_size=4096)
+
+    assert download.path == str(tmp_path / "signed.pdf")
+    assert download.size == len(content)
+    assert (tmp_path / "signed.pdf").read_bytes() == content
+    assert [p.name for p in tmp_path.iterdir()] == ["signed.pdf"]
+
+
+def test_download_signed_documents_to_file_rejects_hash_mismatch(fake_yousign, tmp_path):
+    content = b"%PDF-corrupted"
+    advertised = base64.b64encode(hashlib.sha256(b"%PDF-original").digest()).decode()
+    fake_yousign.scripted = [(200, content, {"Digest": f"sha-256={advertised}"})]
+    client = make_client(fake_yousign)
+
+    with pytest.raises(YousignError, match="SHA-256"):
+        client.download_signed_documents_to_file("sr_1", str(tmp_path), "signed.pdf")
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_download_signed_documents_to_file_follows_redirects_without_leaking_the_key(fake_yousign, tmp_path):
+    storage = FakeYousign()
+    try:
+        content = b"%PDF-1.7 signed"
+        fake_yousign.scripted = [(302, b"", {"Location": "/v3/relay"}), (307, b"", {"Location": f"{storage.base_url}/files/signed.pdf?sig=1"})]
+        storage.scripted = [(200, content, {})]
+        client = make_client(fake_yousign)
+
+        download = client.download_signed_documents_to_file("sr_1", str(tmp_path), "signed.pdf")
+
+        assert (tmp_path / "signed.pdf").read_bytes() == content and download.size == len(content)
+        assert [(path, headers.get("Authorization")) for _, path, _, headers in fake_yousign.requests] == [
+            ("/v3/signature_requests/sr_1/documents/download", "Bearer secret"),
+            ("/v3/relay", "Bearer secret"),
+        ]
+        assert [(path, headers.get("Authorization")) for _, path, _, headers in storage.requests] == [("/v3/files/signed.pdf?sig=1", None)]
+    finally:
+        storage.close()
+
+
+def test_download_signed_documents_to_file_refuses_redirect_loops_and_other_3xx(fake_yousign, tmp_path):
+    client = make_client(fake_yousign)
+    fake_yousign.scripted = [(302, b"", {"Location": "/v3/again"})] * 6
+    with pytest.raises(YousignError, match="Redirection"):
+        client.download_signed_documents_to_file("sr_1", str(tmp_path), "signed.pdf")
+
+    fake_yousign.scripted = [(304, b"", {})]
+    with pytest.raises(YousignError, match="304"):
+        client.download_signed_documents_to_file("sr_1", str(tmp_path), "signed.pdf")
+    assert list(tmp_path.iterdir()) == []
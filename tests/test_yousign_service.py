@@ -248,7 +248,7 @@ def test_aps_trainer_yousign_send_creates_manual_signature_field_before_activati
     import inspect
     import app
 
-    source = inspect.getsource(app.send_aps_trainer_contract_yousign)
+    source = inspect.getsource(app.send_aps_trainer_contract_to_yousign)
 
     assert "parse_anchors=False" in source
     assert "use_text_tags=True" in source
@@ -432,7 +432,14 @@ def test_extract_yousign_status_uses_webhook_signer_status_when_done():
     assert app.extract_yousign_status(payload) == "done"
 
 
-def test_yousign_webhook_signer_done_updates_aps_contract_without_manual_sync(monkeypatch):
+def use_temporary_webhook_inbox(monkeypatch, tmp_path):
+    import app
+
+    monkeypatch.setattr(app, "YOUSIGN_WEBHOOK_INBOX_DB", str(tmp_path / "yousign_webhooks.db"))
+    monkeypatch.setattr(app, "start_yousign_webhook_worker", lambda: None)
+
+
+def test_yousign_webhook_signer_done_updates_aps_contract_without_manual_sync(monkeypatch, tmp_path):
     import app
 
     sessions_data = {
@@ -462,7 +469,7 @@ def test_yousign_webhook_signer_done_updates_aps_contract_without_manual_sync(mo
     monkeypatch.setattr(
         app,
         "sync_yousign_signature_request_from_api",
-        lambda signature_request_id, now=None: {
+        lambda signature_request_id, now=None, **kwargs: {
             "status": "signed",
             "apiStatus": "done",
             "apiSignerStatus": "signed",
@@ -472,6 +479,7 @@ def test_yousign_webhook_signer_done_updates_aps_contract_without_manual_sync(mo
         },
     )
     monkeypatch.setenv("YOUSIGN_WEBHOOK_SECRET", "")
+    use_temporary_webhook_inbox(monkeypatch, tmp_path)
 
     payload = {
         "event_name": "signer.done",
@@ -484,7 +492,9 @@ def test_yousign_webhook_signer_done_updates_aps_contract_without_manual_sync(mo
     response = app.app.test_client().post("/webhooks/yousign", json=payload)
 
     assert response.status_code == 200
-    assert response.get_json()["target"] == "aps_trainer_contract"
+    assert response.get_json()["queued"] is True
+    assert saved == {}
+    assert app.process_yousign_webhook_inbox() == 1
     contract = saved["data"]["sessions"][0]["apsTrainerContracts"][0]
     assert contract["yousign"]["status"] == "signed"
     assert contract["yousign_status"] == "signed"
@@ -494,7 +504,7 @@ def test_yousign_webhook_signer_done_updates_aps_contract_without_manual_sync(mo
     assert contract["yousign_signed_at"]
 
 
-def test_yousign_webhook_signature_request_done_matches_aps_contract_by_external_id(monkeypatch):
+def test_yousign_webhook_signature_request_done_matches_aps_contract_by_external_id(monkeypatch, tmp_path):
     import app
 
     sessions_data = {
@@ -523,7 +533,7 @@ def test_yousign_webhook_signature_request_done_matches_aps_contract_by_external
     monkeypatch.setattr(
         app,
         "sync_yousign_signature_request_from_api",
-        lambda signature_request_id, now=None: {
+        lambda signature_request_id, now=None, **kwargs: {
             "status": "signed",
             "apiStatus": "done",
             "apiSignerStatus": "signed",
@@ -534,6 +544,7 @@ def test_yousign_webhook_signature_request_done_matches_aps_contract_by_external
         },
     )
     monkeypatch.setenv("YOUSIGN_WEBHOOK_SECRET", "")
+    use_temporary_webhook_inbox(monkeypatch, tmp_path)
 
     payload = {
         "event_name": "signature_request.done",
@@ -545,14 +556,16 @@ def test_yousign_webhook_signature_request_done_matches_aps_contract_by_external
     response = app.app.test_client().post("/webhooks/yousign", json=payload)
 
     assert response.status_code == 200
-    assert response.get_json()["target"] == "aps_trainer_contract"
+    assert response.get_json()["queued"] is True
+    assert saved == {}
+    assert app.process_yousign_webhook_inbox() == 1
     contract = saved["data"]["sessions"][0]["apsTrainerContracts"][0]
     assert contract["yousign"]["status"] == "signed"
     assert contract["yousign"]["externalId"] == "aps-trainer-contract-contract_1"
     assert contract["yousign_api_status"] == "done"
 
 
-def test_yousign_webhook_accepts_current_signature_256_header(monkeypatch):
+def test_yousign_webhook_accepts_current_signature_256_header(monkeypatch, tmp_path):
     import app
 
     sessions_data = {
@@ -581,7 +594,7 @@ def test_yousign_webhook_accepts_current_signature_256_header(monkeypatch):
     monkeypatch.setattr(
         app,
         "sync_yousign_signature_request_from_api",
-        lambda signature_request_id, now=None: {
+        lambda signature_request_id, now=None, **kwargs: {
             "status": "signed",
             "apiStatus": "done",
             "apiSignerStatus": "signed",
@@ -591,6 +604,7 @@ def test_yousign_webhook_accepts_current_signature_256_header(monkeypatch):
         },
     )
     monkeypatch.setenv("YOUSIGN_WEBHOOK_SECRET", "hook-secret")
+    use_temporary_webhook_inbox(monkeypatch, tmp_path)
 
     payload = {
         "event_name": "signature_request.done",
@@ -609,7 +623,300 @@ def test_yousign_webhook_accepts_current_signature_256_header(monkeypatch):
     )
 
     assert response.status_code == 200
-    assert response.get_json()["target"] == "aps_trainer_contract"
+    assert response.get_json()["queued"] is True
+    assert saved == {}
+    assert app.process_yousign_webhook_inbox() == 1
     contract = saved["data"]["sessions"][0]["apsTrainerContracts"][0]
     assert contract["yousign"]["status"] == "signed"
     assert contract["yousign_status"] == "signed"
+
+
+def test_yousign_webhook_drops_duplicate_deliveries(monkeypatch, tmp_path):
+    import app
+
+    applied = []
+    use_temporary_webhook_inbox(monkeypatch, tmp_path)
+    monkeypatch.setenv("YOUSIGN_WEBHOOK_SECRET", "")
+    monkeypatch.setattr(app, "apply_yousign_webhook_event", lambda payload, now=None: applied.append(payload) or {"ok": True})
+
+    payload = {"event_id": "evt_1", "event_name": "signer.done", "data": {"signature_request": {"id": "sr_1"}}}
+    client = app.app.test_client()
+    first = client.post("/webhooks/yousign", json=payload)
+    second = client.post("/webhooks/yousign", json=payload)
+
+    assert first.get_json()["queued"] is True
+    assert second.get_json() == {"ok": True, "duplicate": True, "eventId": first.get_json()["eventId"]}
+    assert app.process_yousign_webhook_inbox() == 1
+    assert app.process_yousign_webhook_inbox() == 0
+    assert len(applied) == 1
+
+
+def test_yousign_webhook_unknown_target_is_retried_with_backoff_then_replayed(monkeypatch, tmp_path):
+    import app
+    from services import yousign_webhook_inbox as inbox
+
+    use_temporary_webhook_inbox(monkeypatch, tmp_path)
+    monkeypatch.setenv("YOUSIGN_WEBHOOK_SECRET", "")
+    monkeypatch.setattr(app, "load_formateurs", lambda: [])
+    monkeypatch.setattr(app, "load_sessions", lambda: {"sessions": [], "jurys": []})
+    monkeypatch.setattr(app, "sync_yousign_signature_request_from_api", lambda signature_request_id, now=None, **kwargs: {})
+
+    payload = {"event_id": "evt_2", "event_name": "signature_request.done", "data": {"signature_request": {"id": "sr_missing"}}}
+    response = app.app.test_client().post("/webhooks/yousign", json=payload)
+    event_id = response.get_json()["eventId"]
+
+    assert app.process_yousign_webhook_inbox() == 1
+    event = inbox.list_events(app.YOUSIGN_WEBHOOK_INBOX_DB)[0]
+    assert event["status"] == "pending"
+    assert event["attempts"] == 1
+    assert event["next_attempt_at"] > event["received_at"]
+    assert "Contrat introuvable" in event["last_error"]
+    assert app.process_yousign_webhook_inbox() == 0
+
+    app.app.config.update(TESTING=True, SECRET_KEY="test")
+    with app.app.test_client() as client:
+        with client.session_transaction() as session:
+            session["admin_logged"] = True
+            session["admin_session_version"] = app.ADMIN_SESSION_VERSION
+        replay = client.post(f"/api/yousign/webhooks/{event_id}/replay")
+        missing = client.post("/api/yousign/webhooks/9999/replay")
+
+    assert replay.get_json()["ok"] is True
+    assert missing.status_code == 404
+    monkeypatch.setattr(app, "apply_yousign_webhook_event", lambda payload, now=None: {"ok": True, "target": "formateur"})
+    assert app.process_yousign_webhook_inbox() == 1
+    assert inbox.list_events(app.YOUSIGN_WEBHOOK_INBOX_DB)[0]["status"] == "done"
+
+
+def test_yousign_webhook_outage_keeps_event_queued_but_manual_errors_are_recorded(monkeypatch, tmp_path):
+    import app
+    from services import yousign_webhook_inbox as inbox
+    from yousign_service import YousignConfig, YousignError
+
+    class UnavailableClient:
+        config = YousignConfig(api_key="key", base_url="https://api-sandbox.yousign.app/v3")
+
+        def __init__(self, status):
+            self.status = status
+
+        def get_signature_request_with_http_status(self, signature_request_id):
+            raise YousignError("Erreur API Yousign", self.status)
+
+    use_temporary_webhook_inbox(monkeypatch, tmp_path)
+    monkeypatch.setenv("YOUSIGN_WEBHOOK_SECRET", "")
+    monkeypatch.setattr(app, "load_formateurs", lambda: [{"id": "f1", "yousign": {"signatureRequestId": "sr_1"}}])
+    monkeypatch.setattr(app, "save_formateurs", lambda formateurs: None)
+    monkeypatch.setattr(app, "YousignClient", lambda: UnavailableClient(503))
+    app.app.test_client().post("/webhooks/yousign", json={"event_id": "evt_3", "event_name": "signer.done", "data": {"signature_request": {"id": "sr_1"}}})
+
+    assert app.process_yousign_webhook_inbox() == 1
+    event = inbox.list_events(app.YOUSIGN_WEBHOOK_INBOX_DB)[0]
+    assert (event["status"], event["attempts"]) == ("pending", 1)
+    assert app.sync_yousign_signature_request_from_api("sr_1")["apiHttpStatus"] == "503"
+
+    monkeypatch.setattr(app, "YousignClient", lambda: UnavailableClient(404))
+    assert app.apply_yousign_webhook_event({"event_name": "signer.done", "data": {"signature_request": {"id": "sr_1"}}})["target"] == "formateur"
+
+
+def test_yousign_webhook_inbox_gives_up_after_max_attempts(tmp_path):
+    from services import yousign_webhook_inbox as inbox
+
+    db_path = tmp_path / "inbox.db"
+    event_id, created = inbox.enqueue(db_path, "event:x", {"event_name": "signer.done"}, "signer.done")
+
+    assert created is True
+    assert inbox.mark_failed(db_path, event_id, 1, "boom", max_attempts=2) == "pending"
+    assert inbox.mark_failed(db_path, event_id, 2, "boom", max_attempts=2) == "failed"
+    assert inbox.backoff_seconds(1) == inbox.BACKOFF_BASE_SECONDS
+    assert inbox.backoff_seconds(3) == inbox.BACKOFF_BASE_SECONDS * 4
+
+
+def test_send_all_aps_trainer_contracts_yousign_runs_pipelines_and_saves_once(monkeypatch):
+    import app
+
+    sessions_data = {
+        "sessions": [
+            {
+                "id": "session_1",
+                "apsTrainerContracts": [
+                    {"id": "c1", "trainerName": "Jean Dupont"},
+                    {"id": "c2", "trainerName": "Marie Martin"},
+                    {"id": "c3", "trainerName": "Déjà Signé", "yousign": {"signatureRequestId": "sr_old", "status": "signed"}},
+                    {"id": "c4", "trainerName": "Sans Email"},
+                ],
+            }
+        ],
+        "jurys": [],
+    }
+    saves = []
+    sent = []
+
+    def fake_send(session_data, contract, client=None, force=False):
+        if contract["id"] == "c4":
+            return {"ok": False, "error": "Email formateur invalide ou manquant."}, 400
+        sent.append(contract["id"])
+        contract["yousign"] = app.normalize_yousign_state({"signatureRequestId": f"sr_{contract['id']}", "status": "ongoing"})
+        return {"ok": True, "status": "ongoing"}, 200
+
+    monkeypatch.setattr(app, "load_sessions", lambda: sessions_data)
+    monkeypatch.setattr(app, "save_sessions", lambda data: saves.append(data))
+    monkeypatch.setattr(app, "is_yousign_configured", lambda: True)
+    monkeypatch.setattr(app, "send_aps_trainer_contract_to_yousign", fake_send)
+    monkeypatch.setattr(app, "ensure_aps_trainer_contract_pdf", lambda session_data, contract: f"/tmp/{contract['id']}.pdf")
+
+    app.app.config.update(TESTING=True, SECRET_KEY="test")
+    with app.app.test_client() as client:
+        with client.session_transaction() as session:
+            session["admin_logged"] = True
+            session["admin_session_version"] = app.ADMIN_SESSION_VERSION
+        response = client.post("/api/sessions/session_1/aps-trainer-contracts/yousign/send-all", json={})
+
+    body = response.get_json()
+    assert response.status_code == 207
+    assert (body["sent"], body["failed"], body["skipped"]) == (2, 1, 1)
+    assert sorted(sent) == ["c1", "c2"]
+    assert len(saves) == 1
+    results = {result["contractId"]: result for result in body["results"]}
+    assert results["c3"]["skipped"] is True
+    assert results["c4"]["error"] == "Email formateur invalide ou manquant."
+    assert saves[0]["sessions"][0]["apsTrainerContracts"][0]["yousign"]["signatureRequestId"] == "sr_c1"
+
+
+def _bulk_send_sessions():
+    contract = {
+        "trainerPhone": "0600000000", "status": "Formateur indépendant", "siret": "12345678900010", "activityDeclaration": "",
+        "address": "1 rue Test", "calculatedHours": 7, "calculatedDays": 1, "billedDays": 1, "dailyRate": 300, "totalHT": 300, "totalTTC": 300,
+        "interventions": [{"date": "2026-01-05", "dateLabel": "05/01/2026", "start": "09:00", "end": "17:00", "hours": 7, "module": "UV1", "modality": "Présentiel"}],
+    }
+    contracts = [dict(contract, id=f"c{index}", trainerName=f"Formateur{index} Nom", trainerEmail=f"f{index}@example.com") for index in range(4)]
+    session_data = {"id": "session_1", "formation": "APS", "display_name": "Session APS test", "date_debut": "2026-01-05", "date_fin": "2026-01-09",
+                    "date_exam": "2026-01-10", "apsPlanningMode": "presentiel", "apsTrainerContracts": contracts}
+    return {"sessions": [session_data], "jurys": []}
+
+
+def test_bulk_yousign_send_renders_serially_and_keeps_edits_made_during_the_send(tmp_path, monkeypatch):
+    pytest.importorskip("reportlab")
+    pypdf = pytest.importorskip("pypdf")
+    import copy
+    import threading
+    import app
+
+    monkeypatch.setattr(app, "is_yousign_configured", lambda: True)
+    rendering_threads = set()
+    generate = app.generate_aps_trainer_contract_pdf
+
+    def recording_generate(session_data, contract, output_path):
+        rendering_threads.add(threading.get_ident())
+        generate(session_data, contract, output_path)
+
+    monkeypatch.setattr(app, "generate_aps_trainer_contract_pdf", recording_generate)
+    app.app.config.update(TESTING=True, SECRET_KEY="test")
+
+    def run(workers):
+        contract_dir = tmp_path / f"contracts-{workers}"
+        disk = {"data": _bulk_send_sessions()}
+
+        def fake_send(session_data, contract, client=None, force=False):
+            # une autre requête modifie la session pendant l'envoi
+            disk["data"]["sessions"][0]["salle"] = "Salle B"
+            contract["yousign"] = app.normalize_yousign_state({"signatureRequestId": f"sr_{contract['id']}", "status": "ongoing"})
+            return {"ok": True, "status": "ongoing"}, 200
+
+        monkeypatch.setattr(app, "APS_CONTRACT_DIR", str(contract_dir))
+        monkeypatch.setattr(app, "YOUSIGN_BULK_SEND_WORKERS", workers)
+        monkeypatch.setattr(app, "load_sessions", lambda: copy.deepcopy(disk["data"]))
+        monkeypatch.setattr(app, "save_sessions", lambda data: disk.update(data=copy.deepcopy(data)))
+        monkeypatch.setattr(app, "send_aps_trainer_contract_to_yousign", fake_send)
+        rendering_threads.clear()
+        with app.app.test_client() as client:
+            with client.session_transaction() as session:
+                session["admin_logged"] = True
+                session["admin_session_version"] = app.ADMIN_SESSION_VERSION
+            body = client.post("/api/sessions/session_1/aps-trainer-contracts/yousign/send-all", json={}).get_json()
+        assert rendering_threads == {threading.get_ident()}
+        for result in body["results"]:
+            result.pop("durationMs")
+        texts = {path.name: [page.extract_text() for page in pypdf.PdfReader(str(path)).pages] for path in sorted(contract_dir.glob("*.pdf"))}
+        return body, disk["data"], texts
+
+    serial = run(1)
+    parallel = run(4)
+
+    assert parallel == serial
+    body, saved, texts = parallel
+    assert body["sent"] == 4 and len(texts) == 4
+    assert saved["sessions"][0]["salle"] == "Salle B"
+    assert [contract["yousign_signature_request_id"] for contract in saved["sessions"][0]["apsTrainerContracts"]] == ["sr_c0", "sr_c1", "sr_c2", "sr_c3"]
+
+
+def test_save_yousign_signed_document_extracts_signed_pdf_from_zip(tmp_path):
+    import io
+    import zipfile
+    import app
+
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("audit_trail.pdf", b"%PDF-audit")
+        zf.writestr("contrat_signed.pdf", b"%PDF-signed")
+
+    class FakeClient:
+        def download_signed_documents_to_file(self, signature_request_id, target_dir, filename):
+            path = tmp_path / filename
+            path.write_bytes(archive.getvalue())
+            return type("Download", (), {"path": str(path), "sha256": "zip-sha"})()
+
+    filename, sha256 = app.save_yousign_signed_document(FakeClient(), "sr_1", str(tmp_path), "contrat")
+
+    assert filename == "contrat.pdf"
+    assert (tmp_path / "contrat.pdf").read_bytes() == b"%PDF-signed"
+    assert sha256 == hashlib.sha256(b"%PDF-signed").hexdigest()
+    assert [p.name for p in tmp_path.iterdir()] == ["contrat.pdf"]
+
+
+def test_concurrent_signed_document_downloads_use_their_own_temporary_file(tmp_path):
+    import threading
+    import app
+
+    names, both_started = [], threading.Barrier(2)
+
+    class FakeClient:
+        def __init__(self, content):
+            self.content = content
+
+        def download_signed_documents_to_file(self, signature_request_id, target_dir, filename):
+            names.append(filename)
+            both_started.wait(timeout=5)
+            path = tmp_path / filename
+            path.write_bytes(self.content)
+            return type("Download", (), {"path": str(path), "sha256": hashlib.sha256(self.content).hexdigest()})()
+
+    results = []
+    threads = [threading.Thread(target=lambda content=content: results.append(app.save_yousign_signed_document(FakeClient(content), "sr_1", str(tmp_path), "contrat")))
+               for content in (b"%PDF-first", b"%PDF-second")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(names)) == 2 and len(results) == 2
+    assert (tmp_path / "contrat.pdf").read_bytes() in (b"%PDF-first", b"%PDF-second")
+    assert [p.name for p in tmp_path.iterdir()] == ["contrat.pdf"]
+
+
+def test_signed_yousign_file_route_supports_range_requests(tmp_path, monkeypatch):
+    import app
+
+    (tmp_path / "contrat.pdf").write_bytes(b"%PDF-0123456789")
+    monkeypatch.setattr(app, "APS_CONTRACT_SIGNED_DIR", str(tmp_path))
+    app.app.config.update(TESTING=True, SECRET_KEY="test")
+    with app.app.test_client() as client:
+        with client.session_transaction() as session:
+            session["admin_logged"] = True
+            session["admin_session_version"] = app.ADMIN_SESSION_VERSION
+        partial = client.get("/aps-trainer-contracts/yousign/signed/contrat.pdf", headers={"Range": "bytes=5-8"})
+        missing = client.get("/aps-trainer-contracts/yousign/signed/absent.pdf")
+
+    assert partial.status_code == 206
+    assert partial.data == b"0123"
+    assert partial.headers["Content-Type"] == "application/pdf"
+    assert missing.status_code == 404
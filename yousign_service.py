@@ -4,13 +4,20 @@ Ce module ne dépend pas de Flask afin de rester testable isolément. Les secret
 sont lus depuis l'environnement et ne doivent jamais être exposés au frontend.
 """
 
+import base64
+import binascii
+import email.utils
+import hashlib
+import http.client
 import json
 import logging
 import os
 import re
-import urllib.error
+import tempfile
+import threading
+import time
 import urllib.parse
-import urllib.request
+from collections import deque
 from dataclasses import dataclass
 from typing import Any, Dict, Optional
 
@@ -20,6 +27,17 @@ DEFAULT_YOUSIGN_API_BASE_URL = "https://api.yousign.app/v3"
 YOUSIGN_STATUSES = {"draft", "approval", "ongoing", "done", "declined", "expired", "canceled", "rejected", "error"}
 YOUSIGN_EXTERNAL_ID_MAX_LENGTH = 180
 YOUSIGN_EXTERNAL_ID_FALLBACK = "aps-trainer-contract"
+# 429 et 503 signifient que Yousign n'a pas traité la requête : on peut les
+# rejouer même pour un POST. Les autres 5xx ne sont rejoués que pour les
+# méthodes idempotentes afin de ne pas créer deux demandes de signature.
+YOUSIGN_RETRY_ANY_METHOD_STATUSES = {429, 503}
+YOUSIGN_RETRY_IDEMPOTENT_STATUSES = {500, 502, 504}
+YOUSIGN_IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}
+YOUSIGN_RESOURCE_SEGMENTS = {"signature_requests", "documents", "signers", "fields", "approvers", "followers"}
+YOUSIGN_DOWNLOAD_CHUNK_SIZE = 64 * 1024
+YOUSIGN_REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+YOUSIGN_MAX_REDIRECTS = 5
+_STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError, http.client.CannotSendRequest)
 
 
 def sanitize_yousign_external_id(value: str, fallback: str = YOUSIGN_EXTERNAL_ID_FALLBACK) -> str:
@@ -43,6 +61,13 @@ class YousignError(RuntimeError):
         self.status_code = status_code
         self.payload = payload
 
+    @property
+    def retryable(self) -> bool:
+        """Panne transitoire (réseau, 408, 429, 5xx) : le même appel peut réussir plus tard."""
+        if self.status_code is None:
+            return isinstance(self.__cause__, (OSError, http.client.HTTPException))
+        return self.status_code in (408, 429) or self.status_code >= 500
+
 
 @dataclass(frozen=True)
 class YousignConfig:
@@ -132,14 +157,181 @@ def yousign_service_access_message(status_code: Optional[int], payload: Any = No
         return "Yousign refuse l’accès au service de signature. Vérifiez la clé API, l’environnement sandbox/production, les droits de la clé, le workspace et l’abonnement Yousign."
     return message or (f"Erreur API Yousign ({status_code})" if status_code else "Erreur Yousign")
 
+class YousignConnectionPool:
+    """Connexions HTTP(S) keep-alive réutilisées entre les appels Yousign.
+
+    Une demande complète (création, upload, signataire, champ, activation)
+    enchaîne cinq appels : les réutiliser évite une poignée de main TLS par
+    appel. Les connexions inactives sont rangées par (schéma, hôte, port).
+    """
+
+    def __init__(self, max_idle_per_host: int = 4):
+        self.max_idle_per_host = max_idle_per_host
+        self._idle: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, scheme: str, host: str, port: Optional[int], timeout: float, fresh: bool = False) -> tuple[http.client.HTTPConnection, bool]:
+        key = (scheme, host, port)
+        with self._lock:
+            idle = self._idle.get(key) or []
+            if idle and not fresh:
+                connection = idle.pop()
+                connection.timeout = timeout
+                if connection.sock is not None:
+                    connection.sock.settimeout(timeout)
+                return connection, True
+        connection_class = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return connection_class(host, port, timeout=timeout), False
+
+    def release(self, scheme: str, host: str, port: Optional[int], connection: http.client.HTTPConnection) -> None:
+        key = (scheme, host, port)
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def clear(self) -> None:
+        with self._lock:
+            connections = [connection for idle in self._idle.values() for connection in idle]
+            self._idle.clear()
+        for connection in connections:
+            connection.close()
+
+
+class YousignCallMetrics:
+    """Latences des appels Yousign par opération (méthode + chemin sans identifiants)."""
+
+    def __init__(self, recent_size: int = 100):
+        self._lock = threading.Lock()
+        self._operations: Dict[str, Dict[str, Any]] = {}
+        self._recent: deque = deque(maxlen=recent_size)
+
+    def record(self, operation: str, status: int, duration_ms: float, attempts: int, reused: bool) -> None:
+        with self._lock:
+            stats = self._operations.setdefault(operation, {"count": 0, "errors": 0, "retries": 0, "totalMs": 0.0, "maxMs": 0.0})
+            stats["count"] += 1
+            stats["errors"] += 1 if not status or status >= 400 else 0
+            stats["retries"] += max(attempts - 1, 0)
+            stats["totalMs"] += duration_ms
+            stats["maxMs"] = max(stats["maxMs"], duration_ms)
+            self._recent.append({"operation": operation, "status": status, "durationMs": round(duration_ms, 1), "attempts": attempts, "reusedConnection": reused})
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            operations = {
+                name: {**stats, "totalMs": round(stats["totalMs"], 1), "maxMs": round(stats["maxMs"], 1), "avgMs": round(stats["totalMs"] / stats["count"], 1) if stats["count"] else 0.0}
+                for name, stats in self._operations.items()
+            }
+            return {"operations": operations, "recent": list(self._recent)}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._operations.clear()
+            self._recent.clear()
+
+
+YOUSIGN_CONNECTION_POOL = YousignConnectionPool()
+YOUSIGN_CALL_METRICS = YousignCallMetrics()
+
+
+def get_yousign_call_metrics() -> Dict[str, Any]:
+    return YOUSIGN_CALL_METRICS.snapshot()
+
+
+def yousign_operation_name(method: str, path: str) -> str:
+    segments = [segment for segment in urllib.parse.urlsplit(path).path.split("/") if segment]
+    normalized = []
+    for index, segment in enumerate(segments):
+        previous = segments[index - 1] if index else ""
+        normalized.append("{id}" if previous in YOUSIGN_RESOURCE_SEGMENTS and segment not in YOUSIGN_RESOURCE_SEGMENTS else segment)
+    return f"{method.upper()} /{'/'.join(normalized)}"
+
+
+def parse_retry_after(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """Délai en secondes d'un en-tête Retry-After (nombre de secondes ou date HTTP)."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if parsed is None:
+        return None
+    return max(parsed.timestamp() - (now if now is not None else time.time()), 0.0)
+
+
+def parse_sha256_digest_header(value: Optional[str]) -> str:
+    """Empreinte hexadécimale d'un en-tête `Digest: sha-256=<base64>` (ou `Repr-Digest`), sinon chaîne vide."""
+    for part in (value or "").split(","):
+        algorithm, _, encoded = part.strip().partition("=")
+        if algorithm.strip().lower() != "sha-256" or not encoded:
+            continue
+        try:
+            return base64.b64decode(encoded.strip().strip(":")).hex()
+        except (ValueError, binascii.Error):
+            return ""
+    return ""
+
+
+@dataclass(frozen=True)
+class YousignDownload:
+    path: str
+    size: int
+    sha256: str
+    content_type: str
+
+
+@dataclass
+class YousignHttpResponse:
+    status: int
+    headers: Any
+    body: bytes
+    url: str
+
+    def json(self) -> Any:
+        if not self.body:
+            return {}
+        charset = self.headers.get_content_charset() if hasattr(self.headers, "get_content_charset") else None
+        return json.loads(self.body.decode(charset or "utf-8"))
+
+    def text(self) -> str:
+        return self.body.decode("utf-8", errors="replace")
+
+
 def is_yousign_configured() -> bool:
     return bool(get_yousign_config().api_key)
 
 
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(_env(name, str(default)))
+    except ValueError:
+        return default
+
+
 class YousignClient:
-    def __init__(self, config: Optional[YousignConfig] = None, timeout: int = 20):
+    def __init__(
+        self,
+        config: Optional[YousignConfig] = None,
+        timeout: int = 20,
+        max_retries: Optional[int] = None,
+        backoff_seconds: float = 0.5,
+        max_retry_wait: float = 30.0,
+        pool: Optional[YousignConnectionPool] = None,
+        metrics: Optional[YousignCallMetrics] = None,
+    ):
         self.config = config or get_yousign_config()
         self.timeout = timeout
+        self.max_retries = _env_int("YOUSIGN_MAX_RETRIES", 2) if max_retries is None else max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_retry_wait = max_retry_wait
+        self.pool = pool or YOUSIGN_CONNECTION_POOL
+        self.metrics = metrics or YOUSIGN_CALL_METRICS
 
     def _headers(self, content_type: Optional[str] = "application/json") -> Dict[str, str]:
         if not self.config.api_key:
@@ -152,6 +344,85 @@ class YousignClient:
     def _url(self, path: str) -> str:
         return f"{self.config.base_url}/{path.lstrip('/')}"
 
+    def _should_retry(self, method: str, status: int, attempt: int) -> bool:
+        if attempt > self.max_retries:
+            return False
+        if status in YOUSIGN_RETRY_ANY_METHOD_STATUSES:
+            return True
+        return status in YOUSIGN_RETRY_IDEMPOTENT_STATUSES and method in YOUSIGN_IDEMPOTENT_METHODS
+
+    def _retry_delay(self, attempt: int, retry_after: Optional[str]) -> float:
+        delay = parse_retry_after(retry_after)
+        if delay is None:
+            delay = self.backoff_seconds * (2 ** (attempt - 1))
+        return min(delay, self.max_retry_wait)
+
+    def _open(self, method: str, url: str, body: Optional[bytes], headers: Dict[str, str]) -> tuple[http.client.HTTPConnection, http.client.HTTPResponse, bool]:
+        """Envoie la requête et renvoie la réponse non lue ; l'appelant doit appeler `_finish`."""
+        parts = urllib.parse.urlsplit(url)
+        target = parts.path or "/"
+        if parts.query:
+            target = f"{target}?{parts.query}"
+        connection, reused = self.pool.acquire(parts.scheme, parts.hostname or "", parts.port, self.timeout)
+        while True:
+            try:
+                connection.request(method, target, body=body, headers=headers)
+                return connection, connection.getresponse(), reused
+            except _STALE_CONNECTION_ERRORS:
+                connection.close()
+                if not reused:
+                    raise
+                # Connexion keep-alive fermée côté serveur entre deux appels : on en ouvre une neuve.
+                connection, reused = self.pool.acquire(parts.scheme, parts.hostname or "", parts.port, self.timeout, fresh=True)
+            except Exception:
+                connection.close()
+                raise
+
+    def _finish(self, url: str, connection: http.client.HTTPConnection, response: http.client.HTTPResponse) -> None:
+        """Rend la connexion au pool si la réponse a été lue entièrement et reste réutilisable."""
+        if response.will_close or not response.isclosed():
+            connection.close()
+            return
+        parts = urllib.parse.urlsplit(url)
+        self.pool.release(parts.scheme, parts.hostname or "", parts.port, connection)
+
+    def _send_once(self, method: str, url: str, body: Optional[bytes], headers: Dict[str, str]) -> tuple[YousignHttpResponse, bool]:
+        connection, response, reused = self._open(method, url, body, headers)
+        try:
+            data = response.read()
+        except Exception:
+            connection.close()
+            raise
+        self._finish(url, connection, response)
+        return YousignHttpResponse(response.status, response.headers, data, url), reused
+
+    def send(self, method: str, path: str, body: Optional[bytes] = None, headers: Optional[Dict[str, str]] = None) -> YousignHttpResponse:
+        """Envoie une requête brute avec réutilisation des connexions et nouvelles tentatives sur 429/5xx."""
+        method = method.upper()
+        url = self._url(path)
+        operation = yousign_operation_name(method, path)
+        started = time.perf_counter()
+        attempt = 0
+        reused = False
+        status = 0
+        try:
+            while True:
+                attempt += 1
+                response, reused = self._send_once(method, url, body, headers or {})
+                status = response.status
+                if not self._should_retry(method, status, attempt):
+                    return response
+                delay = self._retry_delay(attempt, response.headers.get("Retry-After"))
+                logger.warning("Yousign API retry status=%s operation=%s attempt=%s delay=%.2fs", status, operation, attempt, delay)
+                time.sleep(delay)
+        except (OSError, http.client.HTTPException) as exc:
+            logger.warning("Yousign network error operation=%s reason=%s", operation, exc)
+            raise YousignError("Impossible de joindre l'API Yousign.") from exc
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            self.metrics.record(operation, status, duration_ms, attempt, reused)
+            logger.debug("Yousign API call operation=%s status=%s duration_ms=%.1f attempts=%s reused=%s", operation, status, duration_ms, attempt, reused)
+
     def request_with_http_status(self, method: str, path: str, payload: Any = None, headers: Optional[Dict[str, str]] = None) -> tuple[Any, int, str]:
         body = None
         request_headers = self._headers()
@@ -159,28 +430,17 @@ class YousignClient:
             request_headers.update(headers)
         if payload is not None:
             body = json.dumps(payload).encode("utf-8")
-        url = self._url(path)
-        req = urllib.request.Request(url, data=body, headers=request_headers, method=method.upper())
-        try:
-            with urllib.request.urlopen(req, timeout=self.timeout) as response:
-                data = response.read()
-                payload = {}
-                if data:
-                    charset = response.headers.get_content_charset() or "utf-8"
-                    payload = json.loads(data.decode(charset))
-                return payload, response.status, url
-        except urllib.error.HTTPError as exc:
-            raw = exc.read().decode("utf-8", errors="replace")
+        response = self.send(method, path, body, request_headers)
+        if response.status >= 400:
+            raw = response.text()
             try:
                 error_payload = json.loads(raw) if raw else {}
             except json.JSONDecodeError:
                 error_payload = {"raw": raw[:500]}
-            logger.warning("Yousign API error status=%s path=%s response=%r", exc.code, path, error_payload)
+            logger.warning("Yousign API error status=%s path=%s response=%r", response.status, path, error_payload)
             message = error_payload.get("message") if isinstance(error_payload, dict) else None
-            raise YousignError(message or f"Erreur API Yousign ({exc.code})", exc.code, error_payload) from exc
-        except urllib.error.URLError as exc:
-            logger.warning("Yousign network error path=%s reason=%s", path, exc.reason)
-            raise YousignError("Impossible de joindre l'API Yousign.") from exc
+            raise YousignError(message or f"Erreur API Yousign ({response.status})", response.status, error_payload)
+        return response.json(), response.status, response.url
 
     def request(self, method: str, path: str, payload: Any = None, headers: Optional[Dict[str, str]] = None) -> Any:
         response_payload, _status, _url = self.request_with_http_status(method, path, payload, headers)
@@ -195,19 +455,17 @@ class YousignClient:
             f"\r\n--{boundary}\r\nContent-Disposition: form-data; name=\"nature\"\r\n\r\nsignable_document\r\n".encode(),
             f"--{boundary}\r\nContent-Disposition: form-data; name=\"parse_anchors\"\r\n\r\n{str(bool(parse_anchors)).lower()}\r\n--{boundary}--\r\n".encode(),
         ]
-        req = urllib.request.Request(
-            self._url(f"signature_requests/{urllib.parse.quote(signature_request_id)}/documents"),
-            data=b"".join(parts),
-            headers=self._headers(f"multipart/form-data; boundary={boundary}"),
-            method="POST",
+        response = self.send(
+            "POST",
+            f"signature_requests/{urllib.parse.quote(signature_request_id)}/documents",
+            b"".join(parts),
+            self._headers(f"multipart/form-data; boundary={boundary}"),
         )
-        try:
-            with urllib.request.urlopen(req, timeout=self.timeout) as response:
-                return json.loads(response.read().decode(response.headers.get_content_charset() or "utf-8"))
-        except urllib.error.HTTPError as exc:
-            raw = exc.read().decode("utf-8", errors="replace")
-            logger.warning("Yousign document upload failed status=%s response=%s", exc.code, raw[:2000])
-            raise YousignError("Échec de l'envoi du PDF à Yousign.", exc.code, raw[:2000]) from exc
+        if response.status >= 400:
+            raw = response.text()
+            logger.warning("Yousign document upload failed status=%s response=%s", response.status, raw[:2000])
+            raise YousignError("Échec de l'envoi du PDF à Yousign.", response.status, raw[:2000])
+        return response.json()
 
     def create_signature_request(self, name: str, external_id: str = "") -> Any:
         payload = {"name": name[:128], "delivery_mode": self.config.delivery_mode}
@@ -294,13 +552,104 @@ class YousignClient:
         return self.request_with_http_status("GET", f"signature_requests/{urllib.parse.quote(signature_request_id)}/signers")
 
     def download_signed_documents(self, signature_request_id: str) -> bytes:
-        req = urllib.request.Request(
-            self._url(f"signature_requests/{urllib.parse.quote(signature_request_id)}/documents/download"),
-            headers=self._headers(None),
-            method="GET",
-        )
-        with urllib.request.urlopen(req, timeout=self.timeout) as response:
-            return response.read()
+        response = self.send("GET", f"signature_requests/{urllib.parse.quote(signature_request_id)}/documents/download", headers=self._headers(None))
+        if not 200 <= response.status < 300:
+            logger.warning("Yousign signed documents download failed status=%s response=%s", response.status, response.text()[:500])
+            raise YousignError(f"Erreur API Yousign ({response.status})", response.status, response.text()[:500])
+        return response.body
+
+    def download_signed_documents_to_file(
+        self,
+        signature_request_id: str,
+        target_dir: str,
+        filename: str,
+        expected_sha256: str = "",
+        chunk_size: int = YOUSIGN_DOWNLOAD_CHUNK_SIZE,
+    ) -> YousignDownload:
+        """Télécharge les documents signés par morceaux vers `target_dir/filename`.
+
+        Le flux est écrit dans un fichier temporaire du même dossier, contrôlé
+        (taille annoncée, empreinte SHA-256 attendue ou en-tête Digest), puis
+        renommé atomiquement : un téléchargement interrompu ne laisse jamais de
+        fichier partiel à la place du document. Les redirections (au plus
+        `YOUSIGN_MAX_REDIRECTS`) sont suivies, sans la clé API si elles mènent
+        à un autre hôte ; toute autre réponse hors 2xx lève `YousignError`.
+        """
+        path = f"signature_requests/{urllib.parse.quote(signature_request_id)}/documents/download"
+        url = self._url(path)
+        api_host = urllib.parse.urlsplit(url).netloc
+        operation = yousign_operation_name("GET", path)
+        headers = self._headers(None)
+        os.makedirs(target_dir, exist_ok=True)
+        started = time.perf_counter()
+        attempt = 0
+        redirects = 0
+        reused = False
+        status = 0
+        try:
+            while True:
+                attempt += 1
+                connection, response, reused = self._open("GET", url, None, headers)
+                status = response.status
+                if 200 <= status < 300:
+                    break
+                raw = response.read()
+                self._finish(url, connection, response)
+                location = response.headers.get("Location")
+                if status in YOUSIGN_REDIRECT_STATUSES and location:
+                    redirects += 1
+                    target = urllib.parse.urljoin(url, location)
+                    if redirects > YOUSIGN_MAX_REDIRECTS or urllib.parse.urlsplit(target).scheme not in ("http", "https"):
+                        raise YousignError(f"Redirection Yousign refusée ({status}, {redirects} redirection(s)).", status)
+                    if urllib.parse.urlsplit(target).netloc != api_host:
+                        headers = {key: value for key, value in headers.items() if key != "Authorization"}
+                    url = target
+                    continue
+                if self._should_retry("GET", status, attempt - redirects):
+                    time.sleep(self._retry_delay(attempt, response.headers.get("Retry-After")))
+                    continue
+                text = raw.decode("utf-8", errors="replace")
+                logger.warning("Yousign signed documents download failed status=%s response=%s", status, text[:500])
+                raise YousignError(f"Erreur API Yousign ({status})", status, text[:500])
+
+            digest = hashlib.sha256()
+            size = 0
+            finished = False
+            fd, tmp_path = tempfile.mkstemp(prefix=".yousign-", suffix=".part", dir=target_dir)
+            try:
+                with os.fdopen(fd, "wb") as handle:
+                    while True:
+                        chunk = response.read(chunk_size)
+                        if not chunk:
+                            break
+                        handle.write(chunk)
+                        digest.update(chunk)
+                        size += len(chunk)
+                    handle.flush()
+                    os.fsync(handle.fileno())
+                self._finish(url, connection, response)
+                finished = True
+                sha256 = digest.hexdigest()
+                announced_length = response.headers.get("Content-Length")
+                if announced_length and announced_length.isdigit() and int(announced_length) != size:
+                    raise YousignError(f"Téléchargement Yousign incomplet ({size}/{announced_length} octets).", status)
+                expected = (expected_sha256 or parse_sha256_digest_header(response.headers.get("Digest") or response.headers.get("Repr-Digest"))).lower()
+                if expected and expected != sha256:
+                    raise YousignError("Empreinte SHA-256 du document signé Yousign invalide.", status)
+                final_path = os.path.join(target_dir, filename)
+                os.replace(tmp_path, final_path)
+            except BaseException:
+                if not finished:
+                    connection.close()
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            return YousignDownload(final_path, size, sha256, response.headers.get("Content-Type") or "")
+        except (OSError, http.client.HTTPException) as exc:
+            logger.warning("Yousign network error operation=%s reason=%s", operation, exc)
+            raise YousignError("Impossible de joindre l'API Yousign.") from exc
+        finally:
+            self.metrics.record(operation, status, (time.perf_counter() - started) * 1000, attempt, reused)
 
 
 def test_yousign_connection() -> Dict[str, Any]: